@@ -2,20 +2,309 @@
 FastAPI route handlers for Factur-X API.
 """
 import logging
-import json
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+import re
+import zipfile
+from contextlib import ExitStack
+from itertools import chain
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Type, TypeVar, Union
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 from io import BytesIO
+from pydantic import BaseModel, ValidationError
 
-from app.schemas.validation import InvoiceMetadata, ValidationResult, ErrorResponse
-from app.schemas.extraction import ExtractionResult
+from app.schemas.validation import (
+    CdarBatchItem, CdarBatchResult, ConvertRequest, InvoiceMetadata, ValidationResult, ErrorResponse
+)
+from app.schemas.extraction import ExtractionResult, InspectionResult
+from app.services.batch import BatchService, iter_ndjson_items, iter_zip_items, ndjson_stream, zip_stream
+from app.services.codelists import CodelistService
 from app.services.generator import GeneratorService
+from app.services.totals import TotalsError, TotalsService
 from app.services.validator import ValidationService
+from app.services.result_store import (
+    KIND_EXTRACT, KIND_VALIDATE, content_digest, is_content_addressable, result_store
+)
+from app.uploads import (
+    CDAR_BATCH_MAX_INFLATED_MB, CDAR_BATCH_MAX_INFLATED_SIZE, CDAR_BATCH_MAX_MESSAGES, MAX_UPLOAD_SIZE,
+    detached_upload, upload_buffer
+)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/v1", tags=["factur-x"])
 
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def _is_pro_license() -> bool:
+    """True when a valid Pro LICENSE_KEY is configured."""
+    import os
+    from app.license import is_licensed
+    
+    license_key = os.getenv("LICENSE_KEY", "").strip()
+    if license_key:
+        try:
+            if is_licensed():
+                logger.info("PRO License validated - Full compliance report enabled")
+                return True
+        except Exception as e:
+            logger.warning(f"License check failed: {e}")
+    return False
+
+
+def _validation_report(result: dict, is_pro: bool) -> ValidationResult:
+    """
+    Format a HybridValidationService result for the API and record metrics.
+    
+    Pro: full compliance report. Community (Teaser): first error + hidden count.
+    """
+    from app.metrics import metrics
+    
+    # Extract all errors from hybrid result
+    all_errors = result.get("errors", [])
+    total_error_count = len(all_errors)
+    
+    if is_pro:
+        # PRO MODE: Full compliance report
+        error_messages = [e.get("message", str(e)) for e in all_errors]
+        error_rules = [e.get("rule_id") for e in all_errors if e.get("rule_id")]
+        
+        # PRO-TIER METRICS
+        metrics.record_validation(
+            mode="pro",
+            is_valid=result["is_valid"],
+            profile=result.get("profile_detected"),
+            error_rules=error_rules
+        )
+        
+        return ValidationResult(
+            valid=result["is_valid"],
+            format=result.get("format_detected"),
+            flavor=result.get("profile_detected"),
+            errors=error_messages,
+            validation_mode="pro",
+            truncated=result.get("truncated", False)
+        )
+    else:
+        # TEASER MODE: Show first error + hidden count
+        if total_error_count == 0:
+            # No errors - valid file
+            metrics.record_validation(
+                mode="teaser",
+                is_valid=True,
+                profile=result.get("profile_detected")
+            )
+            return ValidationResult(
+                valid=True,
+                format=result.get("format_detected"),
+                flavor=result.get("profile_detected"),
+                errors=[],
+                validation_mode="teaser"
+            )
+        else:
+            # Show ONLY first error + teaser message
+            first_error = all_errors[0]
+            hidden_count = total_error_count - 1
+            
+            teaser_errors = [
+                f"[{first_error.get('rule_id', 'RULE')}] {first_error.get('message', 'Erreur de conformité détectée')}"
+            ]
+            
+            if hidden_count > 0:
+                teaser_errors.append(
+                    f"⚠️ {hidden_count} autres erreurs de conformité critique détectées. "
+                    f"Activez la version Pro pour le rapport complet et garantir l'acceptation par Chorus Pro/PPF."
+                )
+            
+            # TEASER CONVERSION METRICS
+            error_rules = [e.get("rule_id") for e in all_errors if e.get("rule_id")]
+            metrics.record_validation(
+                mode="teaser",
+                is_valid=False,
+                profile=result.get("profile_detected"),
+                error_rules=error_rules,
+                hidden_count=hidden_count
+            )
+            
+            return ValidationResult(
+                valid=False,
+                format=result.get("format_detected"),
+                flavor=result.get("profile_detected"),
+                errors=teaser_errors,
+                validation_mode="teaser",
+                truncated=result.get("truncated", False)
+            )
+
+
+def _compute_results(file_content, filename: str, kinds: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Run the services producing `kinds` (both at once through the single-pass inspector)."""
+    if set(kinds) == {KIND_EXTRACT, KIND_VALIDATE}:
+        from app.services.inspector import InspectionService
+        result = InspectionService.inspect(file_content, filename)
+        return {KIND_EXTRACT: result["extraction"], KIND_VALIDATE: result["validation"]}
+    if kinds == [KIND_EXTRACT]:
+        # Extraction: Always use the full ExtractionService (Open Core Policy)
+        # Pro features are now strictly on Validation and Metrics.
+        from app.services.extractor import ExtractionService
+        return {KIND_EXTRACT: ExtractionService.extract_invoice_data(file_content, filename)}
+    from app.services.hybrid_validation_service import HybridValidationService
+    return {KIND_VALIDATE: HybridValidationService.validate(file_content, filename)}
+
+
+def _stored_results(file_content, filename: str, kinds: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Results for `kinds`, served from the content-addressed store when the
+    same content was processed before (see /v1/probe). Raw validation
+    results are cached; Pro/Teaser formatting is applied per request.
+    """
+    from app.metrics import metrics
+    
+    if not is_content_addressable(file_content, filename):
+        return _compute_results(file_content, filename, kinds)
+    
+    digest = content_digest(file_content)
+    results = {kind: result_store.get(kind, digest) for kind in kinds}
+    missing = [kind for kind in kinds if results[kind] is None]
+    metrics.inc("result_store_hits", len(kinds) - len(missing))
+    metrics.inc("result_store_misses", len(missing))
+    
+    if missing:
+        computed = _compute_results(file_content, filename, missing)
+        for kind, result in computed.items():
+            result_store.put(kind, digest, result)
+        result_store.put_file(digest, file_content)
+        results.update(computed)
+    
+    return _with_filename(results, filename)
+
+
+def _capped_validation(file_content, filename: str, max_errors: int) -> Dict[str, Any]:
+    """
+    A validation stopped at `max_errors` errors. Served from a stored full
+    report when there is one; never stored itself, as it is incomplete.
+    """
+    from app.services.hybrid_validation_service import HybridValidationService, truncate_report
+    
+    if is_content_addressable(file_content, filename):
+        stored = result_store.get(KIND_VALIDATE, content_digest(file_content))
+        if stored is not None:
+            return truncate_report(stored, max_errors)
+    return HybridValidationService.validate(file_content, filename, max_errors=max_errors)
+
+
+def _with_filename(results: Dict[str, Dict[str, Any]], filename: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """Cached extractions carry the filename of the first upload: report the caller's."""
+    invoice_json = (results.get(KIND_EXTRACT) or {}).get("invoice_json")
+    if filename and invoice_json and "_meta" in invoice_json:
+        invoice_json["_meta"]["filename"] = filename
+    return results
+
+
+def _parse_json(model: Type[ModelT], raw: Union[str, bytes], what: str = "metadata") -> ModelT:
+    """
+    Parse and validate a JSON document in a single pass (pydantic-core),
+    without building an intermediate dict. Raises a 400 HTTPException.
+    """
+    try:
+        return model.model_validate_json(raw)
+    except ValidationError as e:
+        json_error = next((error for error in e.errors() if error["type"] == "json_invalid"), None)
+        if json_error is not None:
+            raise HTTPException(
+                status_code=400,
+                detail={"error": "INVALID_JSON", "message": f"Invalid JSON in {what}: {json_error['msg']}"}
+            )
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "INVALID_METADATA", "message": f"Invalid {what} structure: {str(e)}"}
+        )
+
+
+async def _json_body(request: Request) -> bytes:
+    """Raw body of an application/json request, left for _parse_json()."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.split(";")[0].strip().lower() != "application/json":
+        raise HTTPException(
+            status_code=415,
+            detail={"error": "UNSUPPORTED_MEDIA_TYPE", "message": "Expected an application/json body"}
+        )
+    return await request.body()
+
+
+def _json_request_body(description: str) -> dict:
+    # The body is parsed by the route itself: document it for OpenAPI clients
+    return {"requestBody": {"required": True, "description": description,
+                            "content": {"application/json": {"schema": {"type": "object"}}}}}
+
+
+def _with_totals(invoice_metadata: InvoiceMetadata) -> InvoiceMetadata:
+    # Complete (or, in strict mode, check) the totals before any generation work
+    try:
+        return TotalsService.apply(invoice_metadata)
+    except TotalsError as e:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "INCONSISTENT_TOTALS", "message": str(e), "details": {"errors": e.errors}}
+        )
+
+
+def _check_codes(invoice_metadata: InvoiceMetadata):
+    # Invalid codes would fail the quality gate (BR-CL rules): reject them before generating anything
+    errors = CodelistService.check(invoice_metadata)
+    if errors:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "INVALID_CODE", "message": errors[0]["message"], "details": {"errors": errors}}
+        )
+
+
+def _facturx_pdf_response(pdf_content, invoice_metadata: InvoiceMetadata) -> StreamingResponse:
+    _check_codes(invoice_metadata)
+    invoice_metadata = _with_totals(invoice_metadata)
+
+    # Generate Factur-X PDF
+    try:
+        facturx_pdf = GeneratorService.generate_facturx_pdf(pdf_content, invoice_metadata)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "GENERATION_FAILED", "message": str(e)}
+        )
+    
+    # Return as streaming response
+    return StreamingResponse(
+        BytesIO(facturx_pdf),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f"attachment; filename=facturx_{invoice_metadata.invoice_number}.pdf"
+        }
+    )
+
+
+def _xml_response(invoice_metadata: InvoiceMetadata) -> StreamingResponse:
+    invoice_metadata = _with_totals(invoice_metadata)
+
+    # Generate XML content. The first chunk is rendered here so that
+    # early failures still get a proper error response.
+    try:
+        xml_chunks = GeneratorService.iter_xml(invoice_metadata)
+        first_chunk = next(xml_chunks, b"")
+    except Exception as e:
+        logger.error(f"Failed to generate XML: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "GENERATION_FAILED", "message": f"XML generation failed: {str(e)}"}
+        )
+    
+    # Return as streaming response (the rest is rendered as it is sent)
+    return StreamingResponse(
+        chain([first_chunk], xml_chunks),
+        media_type="application/xml",
+        headers={
+            "Content-Disposition": f"attachment; filename=facturx_{invoice_metadata.invoice_number}.xml"
+        }
+    )
+
 
 @router.post("/convert", 
              response_class=StreamingResponse,
@@ -39,6 +328,7 @@ def convert_to_facturx(
     metrics.inc("requests_total")
     metrics.inc("requests_convert")
     metrics.inc_gauge("active_requests")
+    uploads = ExitStack()
     
     try:
         # Validate file type
@@ -48,8 +338,8 @@ def convert_to_facturx(
                 detail={"error": "INVALID_FILE_TYPE", "message": "Only PDF files are accepted"}
             )
         
-        # Read PDF content (Sync read for sync route)
-        pdf_content = pdf.file.read()
+        # Zero-copy view of the spooled upload (released in finally)
+        pdf_content = uploads.enter_context(upload_buffer(pdf))
         if not pdf_content:
             raise HTTPException(
                 status_code=400,
@@ -57,37 +347,9 @@ def convert_to_facturx(
             )
         
         # Parse and validate metadata
-        try:
-            metadata_dict = json.loads(metadata)
-            invoice_metadata = InvoiceMetadata(**metadata_dict)
-        except json.JSONDecodeError as e:
-            raise HTTPException(
-                status_code=400,
-                detail={"error": "INVALID_JSON", "message": f"Invalid JSON in metadata: {str(e)}"}
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=400,
-                detail={"error": "INVALID_METADATA", "message": f"Invalid metadata structure: {str(e)}"}
-            )
-        
-        # Generate Factur-X PDF
-        try:
-            facturx_pdf = GeneratorService.generate_facturx_pdf(pdf_content, invoice_metadata)
-        except ValueError as e:
-            raise HTTPException(
-                status_code=400,
-                detail={"error": "GENERATION_FAILED", "message": str(e)}
-            )
+        invoice_metadata = _parse_json(InvoiceMetadata, metadata)
         
-        # Return as streaming response
-        return StreamingResponse(
-            BytesIO(facturx_pdf),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=facturx_{invoice_metadata.invoice_number}.pdf"
-            }
-        )
+        return _facturx_pdf_response(pdf_content, invoice_metadata)
         
     except HTTPException:
         metrics.inc("errors_total")
@@ -100,6 +362,7 @@ def convert_to_facturx(
             detail={"error": "INTERNAL_ERROR", "message": "An unexpected error occurred"}
         )
     finally:
+        uploads.close()
         metrics.dec_gauge("active_requests")
         metrics.observe("request_duration_seconds", time.time() - start_time)
 
@@ -118,7 +381,7 @@ def generate_facturx_xml(
     Generate the Factur-X/CII XML content directly from JSON metadata.
     
     This endpoint returns raw XML (Cross Industry Invoice D22B) 
-    without the PDF wrapper.
+    without the PDF wrapper. The XML is streamed while it is generated.
     """
     import time
     from app.metrics import metrics
@@ -128,37 +391,103 @@ def generate_facturx_xml(
     
     try:
         # Parse and validate metadata
-        try:
-            metadata_dict = json.loads(metadata)
-            invoice_metadata = InvoiceMetadata(**metadata_dict)
-        except json.JSONDecodeError as e:
+        invoice_metadata = _parse_json(InvoiceMetadata, metadata)
+        
+        return _xml_response(invoice_metadata)
+        
+    except HTTPException:
+        metrics.inc("errors_total")
+        raise
+    except Exception as e:
+        metrics.inc("errors_total")
+        logger.exception(f"Unexpected error in xml endpoint: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "INTERNAL_ERROR", "message": "An unexpected error occurred"}
+        )
+    finally:
+        metrics.observe("request_duration_seconds", time.time() - start_time)
+
+
+@router.post("/convert/json",
+             response_class=StreamingResponse,
+             responses={
+                 200: {"description": "Factur-X PDF successfully generated"},
+                 400: {"model": ErrorResponse, "description": "Invalid input"},
+                 415: {"model": ErrorResponse, "description": "Body is not application/json"},
+                 500: {"model": ErrorResponse, "description": "Server error"}
+             },
+             openapi_extra=_json_request_body('{"pdf": "<base64 PDF>", "metadata": {<invoice metadata>}}'))
+def convert_json_to_facturx(body: bytes = Depends(_json_body)):
+    """
+    /v1/convert with an application/json body: the PDF (base64) and the metadata.
+    
+    The body is parsed and validated in one pass, without a multipart
+    envelope or a JSON string inside a form field.
+    """
+    import time
+    from app.metrics import metrics
+    start_time = time.time()
+    metrics.inc("requests_total")
+    metrics.inc("requests_convert")
+    metrics.inc_gauge("active_requests")
+    
+    try:
+        request = _parse_json(ConvertRequest, body, "request body")
+        if not request.pdf:
             raise HTTPException(
                 status_code=400,
-                detail={"error": "INVALID_JSON", "message": f"Invalid JSON in metadata: {str(e)}"}
+                detail={"error": "EMPTY_FILE", "message": "PDF file is empty"}
             )
-        except Exception as e:
+        if not request.pdf.startswith(b"%PDF"):
             raise HTTPException(
                 status_code=400,
-                detail={"error": "INVALID_METADATA", "message": f"Invalid metadata structure: {str(e)}"}
+                detail={"error": "INVALID_FILE_TYPE", "message": "Only PDF files are accepted"}
             )
         
-        # Generate XML content
-        try:
-            xml_content = GeneratorService.generate_xml(invoice_metadata)
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail={"error": "GENERATION_FAILED", "message": str(e)}
-            )
+        return _facturx_pdf_response(request.pdf, request.metadata)
         
-        # Return as streaming response
-        return StreamingResponse(
-            BytesIO(xml_content.encode('utf-8')),
-            media_type="application/xml",
-            headers={
-                "Content-Disposition": f"attachment; filename=facturx_{invoice_metadata.invoice_number}.xml"
-            }
+    except HTTPException:
+        metrics.inc("errors_total")
+        raise
+    except Exception as e:
+        metrics.inc("errors_total")
+        logger.exception(f"Unexpected error in convert endpoint: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "INTERNAL_ERROR", "message": "An unexpected error occurred"}
         )
+    finally:
+        metrics.dec_gauge("active_requests")
+        metrics.observe("request_duration_seconds", time.time() - start_time)
+
+
+@router.post("/xml/json",
+             response_class=StreamingResponse,
+             responses={
+                 200: {"description": "Factur-X/CII XML successfully generated"},
+                 400: {"model": ErrorResponse, "description": "Invalid input"},
+                 415: {"model": ErrorResponse, "description": "Body is not application/json"},
+                 500: {"model": ErrorResponse, "description": "Server error"}
+             },
+             openapi_extra=_json_request_body("Invoice metadata, same structure as the /v1/xml metadata field"))
+def generate_facturx_xml_json(body: bytes = Depends(_json_body)):
+    """
+    /v1/xml with the invoice metadata as the application/json body.
+    
+    The metadata is parsed and validated in one pass and the template reads
+    the validated model directly.
+    """
+    import time
+    from app.metrics import metrics
+    start_time = time.time()
+    metrics.inc("requests_total")
+    metrics.inc("requests_xml")
+    
+    try:
+        invoice_metadata = _parse_json(InvoiceMetadata, body)
+        
+        return _xml_response(invoice_metadata)
         
     except HTTPException:
         metrics.inc("errors_total")
@@ -174,6 +503,104 @@ def generate_facturx_xml(
         metrics.observe("request_duration_seconds", time.time() - start_time)
 
 
+_BATCH_OUTPUTS = {"zip": "application/zip", "ndjson": "application/x-ndjson"}
+
+
+def _batch_stream(results, source, output: str):
+    """Response body of /v1/convert/batch: counts items and releases the upload at the end."""
+    from app.metrics import metrics
+    
+    def counted():
+        for result in results:
+            metrics.inc("batch_items")
+            if result.pdf is None:
+                metrics.inc("batch_item_errors")
+            yield result
+    
+    try:
+        yield from (zip_stream if output == "zip" else ndjson_stream)(counted())
+    finally:
+        results.close()  # Stops reading items if the client went away
+        source.close()
+
+
+@router.post("/convert/batch",
+             response_class=StreamingResponse,
+             responses={
+                 200: {"description": "ZIP of Factur-X PDFs (with report.ndjson) or NDJSON status lines, streamed as items finish"},
+                 400: {"model": ErrorResponse, "description": "Invalid input"},
+                 500: {"model": ErrorResponse, "description": "Server error"}
+             })
+def convert_batch(
+    file: UploadFile = File(..., description="ZIP of <name>.pdf + <name>.json pairs, or NDJSON manifest "
+                                              '(one {"id", "pdf" (base64), "metadata"} object per line)'),
+    output: str = Query("zip", description="Response format: zip (PDFs + report.ndjson) or ndjson (per-item status, PDF in base64)")
+):
+    """
+    Convert many invoices in one request.
+    
+    Items are converted in parallel (PDF/A-3 assembly in a process pool,
+    quality gate in the validation pool) with a bounded number in flight,
+    and streamed back as they finish. Each item reports its own errors: a
+    failed invoice does not fail the batch.
+    """
+    from app.metrics import metrics
+    metrics.inc("requests_total")
+    metrics.inc("requests_batch")
+    
+    try:
+        if output not in _BATCH_OUTPUTS:
+            raise HTTPException(
+                status_code=400,
+                detail={"error": "INVALID_OUTPUT", "message": f"output must be one of: {', '.join(_BATCH_OUTPUTS)}"}
+            )
+        
+        # The upload is still read while the response streams
+        source = detached_upload(file)
+        head = source.read(4)
+        source.seek(0)
+        if not head:
+            source.close()
+            raise HTTPException(
+                status_code=400,
+                detail={"error": "EMPTY_FILE", "message": "Batch file is empty"}
+            )
+        if head.startswith(b"PK"):
+            items = iter_zip_items(source)
+            try:
+                # Reads the central directory: a broken archive is a 400, not a truncated stream
+                first = next(items, None)
+            except zipfile.BadZipFile as e:
+                source.close()
+                raise HTTPException(
+                    status_code=400,
+                    detail={"error": "INVALID_ARCHIVE", "message": f"Invalid ZIP archive: {str(e)}"}
+                )
+            items = chain([first], items) if first is not None else iter(())
+        else:
+            items = iter_ndjson_items(source)
+        
+        return StreamingResponse(
+            _batch_stream(BatchService.run(items), source, output),
+            media_type=_BATCH_OUTPUTS[output],
+            headers={"Content-Disposition": f"attachment; filename=facturx_batch.{output}"}
+        )
+        
+    except HTTPException:
+        metrics.inc("errors_total")
+        raise
+    except Exception as e:
+        metrics.inc("errors_total")
+        logger.exception(f"Unexpected error in batch endpoint: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "INTERNAL_ERROR", "message": "An unexpected error occurred"}
+        )
+
+
+_VALIDATE_MODES = ("full", "failfast")
+
+
 @router.post("/validate",
              response_model=ValidationResult,
              responses={
@@ -181,7 +608,10 @@ def generate_facturx_xml(
                  500: {"model": ErrorResponse, "description": "Server error"}
              })
 def validate_facturx(
-    file: UploadFile = File(..., description="Factur-X PDF or XML file to validate")
+    file: UploadFile = File(..., description="Factur-X PDF or XML file to validate"),
+    mode: str = Query("full", description="full: complete report; failfast: stop at the first error (pass/fail)"),
+    max_errors: Optional[int] = Query(None, ge=1, description="Stop at this many errors (1 with mode=failfast)"),
+    br_fr: Optional[bool] = Query(None, description="Also check the French BR-FR rules (default: FX_BR_FR)")
 ):
     """
     Validate a Factur-X PDF or XML file against EN 16931 standards.
@@ -190,48 +620,59 @@ def validate_facturx(
     
     **Pro Edition**: Full compliance report with all errors detailed.
     **Community Edition (Teaser)**: Shows first error + count of hidden errors.
+    
+    With mode=failfast or max_errors, validation stops early: Schematron is
+    skipped when the XSD errors reach the cap, and the rules stop at it. The
+    teaser then counts only the errors found before the cap.
+    
+    br_fr=true adds the French BR-FR rules (2026 e-invoicing mandate) after
+    EN 16931; br_fr=false leaves them out when FX_BR_FR enables them.
     """
     import time
-    import os
     from app.metrics import metrics
-    from app.license import is_licensed
     
     start_time = time.time()
     metrics.inc("requests_total")
     metrics.inc("requests_validate")
     metrics.inc_gauge("active_requests")
+    uploads = ExitStack()
     
     try:
-        # Read file content (Sync read)
-        file_content = file.file.read()
+        # Zero-copy view of the spooled upload (released in finally)
+        file_content = uploads.enter_context(upload_buffer(file))
         if not file_content:
             raise HTTPException(
                 status_code=400,
                 detail={"error": "EMPTY_FILE", "message": "File is empty"}
             )
         
-        # LICENSE CHECK
-        license_key = os.getenv("LICENSE_KEY", "").strip()
-        is_pro = False
+        if mode not in _VALIDATE_MODES:
+            raise HTTPException(
+                status_code=400,
+                detail={"error": "INVALID_MODE", "message": f"mode must be one of: {', '.join(_VALIDATE_MODES)}"}
+            )
+        if mode == "failfast" and max_errors is None:
+            max_errors = 1
         
-        if license_key:
-            try:
-                if is_licensed():
-                    is_pro = True
-                    logger.info("PRO License validated - Full compliance report enabled")
-            except Exception as e:
-                logger.warning(f"License check failed: {e}")
+        is_pro = _is_pro_license()
         
         # ALWAYS run Hybrid Validation (Teaser Mode for Community)
         try:
-            from app.services.hybrid_validation_service import HybridValidationService
-            result = HybridValidationService.validate(file_content, file.filename)
+            from app.services.hybrid_validation_service import BR_FR_ENABLED, HybridValidationService
+            if br_fr is not None and br_fr != BR_FR_ENABLED:
+                # Not the report the result store keeps: never served from it nor stored
+                result = HybridValidationService.validate(file_content, file.filename, max_errors, br_fr=br_fr)
+            elif max_errors is None:
+                result = _stored_results(file_content, file.filename, [KIND_VALIDATE])[KIND_VALIDATE]
+            else:
+                result = _capped_validation(file_content, file.filename, max_errors)
         except ImportError:
             # Fallback to basic validation if hybrid not available
             logger.warning("HybridValidationService not available, falling back to lite")
             is_valid, format_type, flavor, errors = ValidationService.validate_file(
                 file_content,
-                file.filename
+                file.filename,
+                max_errors
             )
             return ValidationResult(
                 valid=is_valid,
@@ -241,85 +682,183 @@ def validate_facturx(
                 validation_mode="lite"
             )
         
-        # Extract all errors from hybrid result
-        all_errors = result.get("errors", [])
-        total_error_count = len(all_errors)
+        return _validation_report(result, is_pro)
         
-        if is_pro:
-            # PRO MODE: Full compliance report
-            error_messages = [e.get("message", str(e)) for e in all_errors]
-            error_rules = [e.get("rule_id") for e in all_errors if e.get("rule_id")]
-            
-            # PRO-TIER METRICS
-            metrics.record_validation(
-                mode="pro",
-                is_valid=result["is_valid"],
-                profile=result.get("profile_detected"),
-                error_rules=error_rules
+    except HTTPException:
+        metrics.inc("errors_total")
+        raise
+    except Exception as e:
+        metrics.inc("errors_total")
+        logger.exception(f"Unexpected error in validate endpoint: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "INTERNAL_ERROR", "message": "An unexpected error occurred"}
+        )
+    finally:
+        uploads.close()
+        metrics.dec_gauge("active_requests")
+        metrics.observe("request_duration_seconds", time.time() - start_time)
+
+
+def _cdar_results(messages: List[bytes], max_errors: Optional[int]) -> List[Dict[str, Any]]:
+    """Validation results of CDAR messages, in order."""
+    from app.metrics import metrics
+    from app.services.hybrid_validation_service import HybridValidationService
+    metrics.inc("cdar_messages", len(messages))
+    return HybridValidationService.validate_cdar(messages, max_errors)
+
+
+def _cdar_archive(source: BinaryIO) -> Tuple[List[str], List[Optional[bytes]]]:
+    """
+    Member names and contents of a ZIP of CDAR messages (None: member over the upload size limit).
+
+    The number of messages and their total declared size are checked before
+    any member is inflated (zipfile never reads past the declared size).
+    """
+    try:
+        archive = zipfile.ZipFile(source)
+        members = sorted(
+            (info for info in archive.infolist()
+             if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+             and info.filename.lower().endswith(".xml")),
+            key=lambda info: info.filename
+        )
+        if len(members) > CDAR_BATCH_MAX_MESSAGES:
+            raise HTTPException(
+                status_code=413,
+                detail={"error": "TOO_MANY_MESSAGES",
+                        "message": f"Archive holds {len(members)} messages. Max is {CDAR_BATCH_MAX_MESSAGES}."}
             )
-            
-            return ValidationResult(
-                valid=result["is_valid"],
-                format=result.get("format_detected"),
-                flavor=result.get("profile_detected"),
-                errors=error_messages,
-                validation_mode="pro"
+        inflated = sum(info.file_size for info in members if info.file_size <= MAX_UPLOAD_SIZE)
+        if inflated > CDAR_BATCH_MAX_INFLATED_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail={"error": "ARCHIVE_TOO_LARGE",
+                        "message": f"Archive inflates to {inflated // (1024 * 1024)}MB. "
+                                   f"Max is {CDAR_BATCH_MAX_INFLATED_MB}MB."}
             )
-        else:
-            # TEASER MODE: Show first error + hidden count
-            if total_error_count == 0:
-                # No errors - valid file
-                metrics.record_validation(
-                    mode="teaser",
-                    is_valid=True,
-                    profile=result.get("profile_detected")
-                )
-                return ValidationResult(
-                    valid=True,
-                    format=result.get("format_detected"),
-                    flavor=result.get("profile_detected"),
-                    errors=[],
-                    validation_mode="teaser"
+        return ([info.filename for info in members],
+                [archive.read(info) if info.file_size <= MAX_UPLOAD_SIZE else None for info in members])
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, RuntimeError, OSError) as e:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "INVALID_ARCHIVE", "message": f"Invalid ZIP archive: {str(e)}"}
+        )
+
+
+@router.post("/cdar/validate",
+             response_model=ValidationResult,
+             responses={
+                 400: {"model": ErrorResponse, "description": "Invalid input"},
+                 500: {"model": ErrorResponse, "description": "Server error"}
+             })
+def validate_cdar(
+    file: UploadFile = File(..., description="CDAR message (CrossDomainAcknowledgementAndResponse XML)"),
+    max_errors: Optional[int] = Query(None, ge=1, description="Stop at this many errors")
+):
+    """
+    Validate a CDAR lifecycle message against the French BR-FR-CDV rules.
+    
+    CDAR messages carry the statuses of the invoices exchanged under the
+    2026 French e-invoicing mandate. The rules run in the validation
+    process pool, precompiled in each worker.
+    
+    **Pro Edition**: Full compliance report with all errors detailed.
+    **Community Edition (Teaser)**: Shows first error + count of hidden errors.
+    """
+    import time
+    from app.metrics import metrics
+    
+    start_time = time.time()
+    metrics.inc("requests_total")
+    metrics.inc("requests_cdar")
+    metrics.inc_gauge("active_requests")
+    uploads = ExitStack()
+    
+    try:
+        file_content = uploads.enter_context(upload_buffer(file))
+        if not file_content:
+            raise HTTPException(
+                status_code=400,
+                detail={"error": "EMPTY_FILE", "message": "File is empty"}
+            )
+        
+        result = _cdar_results([bytes(file_content)], max_errors)[0]
+        return _validation_report(result, _is_pro_license())
+        
+    except HTTPException:
+        metrics.inc("errors_total")
+        raise
+    except Exception as e:
+        metrics.inc("errors_total")
+        logger.exception(f"Unexpected error in CDAR validate endpoint: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "INTERNAL_ERROR", "message": "An unexpected error occurred"}
+        )
+    finally:
+        uploads.close()
+        metrics.dec_gauge("active_requests")
+        metrics.observe("request_duration_seconds", time.time() - start_time)
+
+
+@router.post("/cdar/validate/batch",
+             response_model=CdarBatchResult,
+             responses={
+                 400: {"model": ErrorResponse, "description": "Invalid input"},
+                 500: {"model": ErrorResponse, "description": "Server error"}
+             })
+def validate_cdar_batch(
+    file: UploadFile = File(..., description="ZIP of CDAR messages (*.xml)"),
+    max_errors: Optional[int] = Query(None, ge=1, description="Stop at this many errors per message")
+):
+    """
+    Validate many CDAR lifecycle messages in one request.
+    
+    The messages are validated in chunks across the validation process
+    pool (FX_CDAR_CHUNK per worker task), so the pool round trip is paid
+    once per chunk rather than once per message. Each message gets its
+    own report, in member name order.
+    """
+    import time
+    from app.metrics import metrics
+    
+    start_time = time.time()
+    metrics.inc("requests_total")
+    metrics.inc("requests_cdar")
+    metrics.inc_gauge("active_requests")
+    
+    try:
+        with detached_upload(file) as source:
+            if source.read(2) != b"PK":
+                raise HTTPException(
+                    status_code=400,
+                    detail={"error": "INVALID_ARCHIVE", "message": "Batch file must be a ZIP archive of CDAR messages"}
                 )
+            source.seek(0)
+            names, contents = _cdar_archive(source)
+        
+        messages = [content for content in contents if content]
+        validated = iter(_cdar_results(messages, max_errors))
+        is_pro = _is_pro_license()
+        results = []
+        for name, content in zip(names, contents):
+            if content is None:
+                report = ValidationResult(valid=False, errors=[f"{name} exceeds the upload size limit"])
+            elif not content:
+                report = ValidationResult(valid=False, errors=[f"{name} is empty"])
             else:
-                # Show ONLY first error + teaser message
-                first_error = all_errors[0]
-                hidden_count = total_error_count - 1
-                
-                teaser_errors = [
-                    f"[{first_error.get('rule_id', 'RULE')}] {first_error.get('message', 'Erreur de conformité détectée')}"
-                ]
-                
-                if hidden_count > 0:
-                    teaser_errors.append(
-                        f"⚠️ {hidden_count} autres erreurs de conformité critique détectées. "
-                        f"Activez la version Pro pour le rapport complet et garantir l'acceptation par Chorus Pro/PPF."
-                    )
-                
-                # TEASER CONVERSION METRICS
-                error_rules = [e.get("rule_id") for e in all_errors if e.get("rule_id")]
-                metrics.record_validation(
-                    mode="teaser",
-                    is_valid=False,
-                    profile=result.get("profile_detected"),
-                    error_rules=error_rules,
-                    hidden_count=hidden_count
-                )
-                
-                return ValidationResult(
-                    valid=False,
-                    format=result.get("format_detected"),
-                    flavor=result.get("profile_detected"),
-                    errors=teaser_errors,
-                    validation_mode="teaser"
-                )
+                report = _validation_report(next(validated), is_pro)
+            results.append(CdarBatchItem(id=name, **report.model_dump()))
+        
+        return CdarBatchResult(total=len(results), valid=sum(item.valid for item in results), results=results)
         
     except HTTPException:
         metrics.inc("errors_total")
         raise
     except Exception as e:
         metrics.inc("errors_total")
-        logger.exception(f"Unexpected error in validate endpoint: {e}")
+        logger.exception(f"Unexpected error in CDAR batch endpoint: {e}")
         raise HTTPException(
             status_code=500,
             detail={"error": "INTERNAL_ERROR", "message": "An unexpected error occurred"}
@@ -336,13 +875,14 @@ def validate_facturx(
                  500: {"model": ErrorResponse, "description": "Server error"}
              })
 def extract_facturx(
-    file: UploadFile = File(..., description="Factur-X PDF file to extract data from")
+    file: UploadFile = File(..., description="Factur-X PDF, or bare CII/ZUGFeRD/UBL XML file, to extract data from")
 ):
     """
     Extract Factur-X XML from a PDF and return structured invoice data as JSON.
     
     This endpoint is designed for invoice reception workflows:
     1. Detects if the PDF contains embedded Factur-X/ZUGFeRD XML
+       (bare CII, ZUGFeRD 1.0 or UBL/XRechnung XML is accepted directly)
     2. Extracts and parses the XML
     3. Returns structured invoice data (parties, totals, line items)
     
@@ -357,10 +897,11 @@ def extract_facturx(
     metrics.inc("requests_total")
     metrics.inc("requests_extract")
     metrics.inc_gauge("active_requests")
+    uploads = ExitStack()
     
     try:
-        # Read file content (Sync read)
-        file_content = file.file.read()
+        # Zero-copy view of the spooled upload (released in finally)
+        file_content = uploads.enter_context(upload_buffer(file))
         if not file_content:
             raise HTTPException(
                 status_code=400,
@@ -368,14 +909,7 @@ def extract_facturx(
             )
         
         # Extract invoice data
-        # Extraction: Always use the full ExtractionService (Open Core Policy)
-        # Pro features are now strictly on Validation and Metrics.
-        from app.services.extractor import ExtractionService
-        
-        result = ExtractionService.extract_invoice_data(
-            file_content,
-            file.filename
-        )
+        result = _stored_results(file_content, file.filename, [KIND_EXTRACT])[KIND_EXTRACT]
         
         try:
             return ExtractionResult(**result)
@@ -394,6 +928,148 @@ def extract_facturx(
             detail={"error": "INTERNAL_ERROR", "message": "An unexpected error occurred"}
         )
     finally:
+        uploads.close()
+        metrics.dec_gauge("active_requests")
+        metrics.observe("request_duration_seconds", time.time() - start_time)
+
+
+@router.post("/inspect",
+             response_model=InspectionResult,
+             responses={
+                 400: {"model": ErrorResponse, "description": "Invalid input"},
+                 500: {"model": ErrorResponse, "description": "Server error"}
+             })
+def inspect_facturx(
+    file: UploadFile = File(..., description="Factur-X PDF, or bare CII/ZUGFeRD XML file, to extract and validate")
+):
+    """
+    Extract structured invoice data AND validate the document in one call.
+    
+    Equivalent to /v1/extract followed by /v1/validate on the same file,
+    but the file is uploaded once and its XML extracted and parsed once.
+    Validation runs in the process pool while the JSON mapping runs,
+    so the latency is the longer of the two, not their sum.
+    
+    The validation report follows the same Pro/Teaser rules as /v1/validate.
+    """
+    import time
+    from app.metrics import metrics
+    start_time = time.time()
+    metrics.inc("requests_total")
+    metrics.inc("requests_inspect")
+    metrics.inc_gauge("active_requests")
+    uploads = ExitStack()
+    
+    try:
+        # Zero-copy view of the spooled upload (released in finally)
+        file_content = uploads.enter_context(upload_buffer(file))
+        if not file_content:
+            raise HTTPException(
+                status_code=400,
+                detail={"error": "EMPTY_FILE", "message": "File is empty"}
+            )
+        
+        is_pro = _is_pro_license()
+        
+        results = _stored_results(file_content, file.filename, [KIND_EXTRACT, KIND_VALIDATE])
+        
+        return InspectionResult(
+            extraction=ExtractionResult(**results[KIND_EXTRACT]),
+            validation=_validation_report(results[KIND_VALIDATE], is_pro)
+        )
+        
+    except HTTPException:
+        metrics.inc("errors_total")
+        raise
+    except Exception as e:
+        metrics.inc("errors_total")
+        logger.exception(f"Unexpected error in inspect endpoint: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "INTERNAL_ERROR", "message": "An unexpected error occurred"}
+        )
+    finally:
+        uploads.close()
         metrics.dec_gauge("active_requests")
         metrics.observe("request_duration_seconds", time.time() - start_time)
 
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+_PROBE_KINDS = {
+    "extract": [KIND_EXTRACT],
+    "validate": [KIND_VALIDATE],
+    "inspect": [KIND_EXTRACT, KIND_VALIDATE],
+}
+
+
+@router.get("/probe/{sha256}",
+            responses={
+                200: {"description": "Cached result, same body as the corresponding POST endpoint"},
+                400: {"model": ErrorResponse, "description": "Invalid hash or kind"},
+                404: {"model": ErrorResponse, "description": "Content not seen yet: upload the file"}
+            })
+def probe_result(
+    sha256: str,
+    kind: str = Query("extract", description="Result to return: extract, validate or inspect"),
+    filename: Optional[str] = Query(None, description="Filename reported in the extraction metadata")
+):
+    """
+    Return the result for content the engine has already processed, by SHA-256.
+    
+    Clients hash the file locally and probe first; on 404 they upload it to
+    the matching endpoint (/v1/extract, /v1/validate or /v1/inspect) as usual.
+    Validation follows the same Pro/Teaser rules as /v1/validate.
+    """
+    import time
+    from app.metrics import metrics
+    start_time = time.time()
+    metrics.inc("requests_total")
+    metrics.inc("requests_probe")
+    
+    try:
+        digest = sha256.lower()
+        if not _SHA256_RE.match(digest):
+            raise HTTPException(
+                status_code=400,
+                detail={"error": "INVALID_HASH", "message": "Expected a hex-encoded SHA-256 digest"}
+            )
+        kinds = _PROBE_KINDS.get(kind)
+        if kinds is None:
+            raise HTTPException(
+                status_code=400,
+                detail={"error": "INVALID_KIND", "message": f"kind must be one of: {', '.join(_PROBE_KINDS)}"}
+            )
+        
+        results = {k: result_store.get(k, digest) for k in kinds}
+        if any(result is None for result in results.values()):
+            # Results can still be computed if raw files are kept (FX_RESULT_STORE_FILES_MB)
+            kept_file = result_store.get_file(digest)
+            if kept_file is None:
+                metrics.inc("result_store_misses")
+                raise HTTPException(
+                    status_code=404,
+                    detail={"error": "NOT_FOUND", "message": "Content not seen yet, upload the file"}
+                )
+            results = _stored_results(kept_file, filename or "probe", kinds)
+        else:
+            metrics.inc("result_store_hits", len(kinds))
+            results = _with_filename(results, filename)
+        
+        if kind == "extract":
+            return ExtractionResult(**results[KIND_EXTRACT])
+        report = _validation_report(results[KIND_VALIDATE], _is_pro_license())
+        if kind == "validate":
+            return report
+        return InspectionResult(extraction=ExtractionResult(**results[KIND_EXTRACT]), validation=report)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        metrics.inc("errors_total")
+        logger.exception(f"Unexpected error in probe endpoint: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "INTERNAL_ERROR", "message": "An unexpected error occurred"}
+        )
+    finally:
+        metrics.observe("request_duration_seconds", time.time() - start_time)
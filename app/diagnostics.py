@@ -10,6 +10,7 @@ from fastapi import APIRouter
 from pydantic import BaseModel, Field
 from typing import Dict, List
 
+from app.uploads import MAX_UPLOAD_SIZE_MB
 from app.version import __version__, __git_hash__, __build_date__
 
 router = APIRouter(tags=["diagnostics"])
@@ -107,7 +108,7 @@ async def get_diagnostics():
     runtime_config = RuntimeConfig(
         mode=os.getenv("APP_MODE", "production"),
         workers=int(os.getenv("WORKERS", 1)),
-        max_upload_size_mb=int(os.getenv("MAX_UPLOAD_SIZE_MB", 10))
+        max_upload_size_mb=MAX_UPLOAD_SIZE_MB
     )
     
     # Environment info
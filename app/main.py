@@ -94,35 +94,72 @@ async def startup_event():
         logger.critical(f"CRITICAL STARTUP ERROR: {e}")
         sys.exit(1)
 
+    # Compile the XML templates now rather than on the first /v1/convert
+    from app.services.generator import GeneratorService
+    GeneratorService.warmup()
+
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down API...")
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Dict, Optional
+from app.uploads import BATCH_MAX_UPLOAD_SIZE, MAX_UPLOAD_SIZE, too_large_detail
 
-# SECURITY: DoS Protection via Max Upload Size (20MB)
-class LimitUploadSize(BaseHTTPMiddleware):
-    def __init__(self, app, max_upload_size: int) -> None:
-        super().__init__(app)
-        self.max_upload_size = max_upload_size
+# SECURITY: DoS Protection via Max Upload Size (MAX_UPLOAD_SIZE_MB, default 20MB)
+class LimitUploadSize:
+    """
+    Pure ASGI middleware enforcing the upload size limit.
 
-    async def dispatch(self, request: Request, call_next):
-        if request.method == 'POST':
-            if 'content-length' in request.headers:
-                try:
-                    content_length = int(request.headers['content-length'])
-                    if content_length > self.max_upload_size:
-                        logger.warning(f"Blocked upload exceeding size limit: {content_length} bytes")
-                        return Response("File too large. Max size is 20MB.", status_code=413)
-                except ValueError:
-                    pass # Invalid header, let it proceed or fail later
-        return await call_next(request)
+    Requests announcing a too large Content-Length are rejected before any
+    body is read. Bodies without a usable Content-Length (chunked uploads)
+    are counted as they stream in, and reading stops at the limit.
+    Routes listed in `path_limits` get their own limit (batch uploads).
+    """
+
+    def __init__(self, app: ASGIApp, max_upload_size: int, path_limits: Optional[Dict[str, int]] = None) -> None:
+        self.app = app
+        self.max_upload_size = max_upload_size
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        max_upload_size = self.path_limits.get(scope["path"], self.max_upload_size)
+        headers = dict(scope["headers"])
+        try:
+            content_length = int(headers.get(b"content-length", b""))
+        except ValueError:
+            content_length = None  # Missing or invalid header: count the body instead
+        if content_length is not None and content_length > max_upload_size:
+            logger.warning(f"Blocked upload exceeding size limit: {content_length} bytes")
+            response = JSONResponse({"detail": too_large_detail(max_upload_size // (1024 * 1024))}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_upload_size:
+                    logger.warning(f"Blocked streamed upload exceeding size limit after {received} bytes")
+                    # FastAPI re-raises HTTPExceptions raised while reading the body
+                    raise HTTPException(status_code=413, detail=too_large_detail(max_upload_size // (1024 * 1024)))
+            return message
+
+        await self.app(scope, limited_receive, send)
 
 # Configure Middlewares
 # 1. Size Limit (First line of defense)
-app.add_middleware(LimitUploadSize, max_upload_size=20 * 1024 * 1024) # 20MB
+app.add_middleware(LimitUploadSize, max_upload_size=MAX_UPLOAD_SIZE,
+                   path_limits={"/v1/convert/batch": BATCH_MAX_UPLOAD_SIZE})
 
 # 2. Configure CORS (Secure by Default logic)
 cors_env = os.getenv("CORS_ORIGINS", "*")
@@ -28,6 +28,21 @@ class MetricsCollector:
             "requests_validate": 0,
             "requests_extract": 0,
             "requests_xml": 0,
+            "requests_inspect": 0,
+            "requests_probe": 0,
+            "requests_batch": 0,
+            "batch_items": 0,
+            "batch_item_errors": 0,
+            "requests_cdar": 0,
+            "cdar_messages": 0,
+            "result_store_hits": 0,
+            "result_store_misses": 0,
+            "fragment_cache_hits": 0,
+            "fragment_cache_misses": 0,
+            "xsd_cache_hits": 0,
+            "xsd_cache_misses": 0,
+            "validations_in_thread": 0,
+            "validations_in_process": 0,
             "errors_total": 0,
         }
         self._gauges: Dict[str, float] = {
@@ -36,6 +51,11 @@ class MetricsCollector:
         self._histograms: Dict[str, list] = {
             "request_duration_seconds": [],
         }
+        # Running [sum, count] per label
+        self._labeled_histograms: Dict[str, Dict[str, list]] = {
+            # validation_duration_seconds{profile="minimum|basicwl|basic|en16931|extended"}: worker time
+            "validation_duration_seconds": {},
+        }
         
         # === PRO-TIER BUSINESS METRICS ===
         # Validation outcomes by mode
@@ -86,6 +106,14 @@ class MetricsCollector:
                 if len(self._histograms[histogram]) > 1000:
                     self._histograms[histogram] = self._histograms[histogram][-1000:]
     
+    def observe_labeled(self, histogram: str, label: str, value: float):
+        """Record an observation in a labeled histogram (sum and count per label)."""
+        with self._lock:
+            if histogram in self._labeled_histograms:
+                totals = self._labeled_histograms[histogram].setdefault(label, [0.0, 0])
+                totals[0] += value
+                totals[1] += 1
+    
     # === PRO-TIER METHODS ===
     
     def inc_labeled(self, metric: str, label: str, value: int = 1):
@@ -166,6 +194,17 @@ class MetricsCollector:
                 lines.append("# TYPE facturx_request_duration_seconds_count counter")
                 lines.append(f"facturx_request_duration_seconds_count {len(durations)}")
         
+        # Validation time per detected profile (see FX_PROFILE_RULESETS)
+        with self._lock:
+            for name, labels in self._labeled_histograms.items():
+                if labels:
+                    lines.append("")
+                    lines.append(f"# HELP facturx_{name} Validation time per detected profile")
+                    lines.append(f"# TYPE facturx_{name} summary")
+                    for label, (total, count) in labels.items():
+                        lines.append(f'facturx_{name}_sum{{profile="{label}"}} {total:.4f}')
+                        lines.append(f'facturx_{name}_count{{profile="{label}"}} {count}')
+        
         return "\n".join(lines)
     
     def get_prometheus_format(self) -> str:
@@ -1,6 +1,8 @@
 from pydantic import BaseModel
 from typing import List, Optional, Any, Dict
 
+from app.schemas.validation import ValidationResult
+
 class ErrorDetail(BaseModel):
     code: str
     message: str
@@ -49,3 +51,8 @@ class ExtractionResult(BaseModel):
     xml_extracted: bool
     invoice_json: Optional[InvoiceJson] = None
     errors: List[ErrorDetail] = []
+
+class InspectionResult(BaseModel):
+    """Combined /v1/inspect response: extraction and validation of the same XML."""
+    extraction: ExtractionResult
+    validation: ValidationResult
@@ -2,7 +2,7 @@
 Pydantic models for API request/response validation.
 """
 from typing import Optional, Literal, List, Union
-from pydantic import BaseModel, Field
+from pydantic import Base64Bytes, BaseModel, Field, model_validator
 
 
 class Address(BaseModel):
@@ -124,8 +124,12 @@ class InvoiceMetadata(BaseModel):
     seller: SellerInfo
     buyer: BuyerInfo
     lines: List[LineItem] = Field(default_factory=list, description="Line items")
-    tax_details: List[TaxDetail] = Field(default_factory=list, description="Tax breakdown details")
-    amounts: MonetaryAmounts
+    tax_details: List[TaxDetail] = Field(
+        default_factory=list, description="Tax breakdown details (computed from the lines when empty)"
+    )
+    amounts: Optional[MonetaryAmounts] = Field(
+        None, description="Document totals (computed from the lines when omitted)"
+    )
     currency_code: str = Field(default="EUR", description="ISO 4217 currency code")
     profile: Literal["minimum", "basicwl", "basic", "en16931", "extended"] = Field(
         default="en16931",
@@ -145,14 +149,45 @@ class InvoiceMetadata(BaseModel):
     payment_discount: Optional[PaymentDiscount] = Field(None, description="Payment discount terms")
     payment_means_code: Optional[str] = Field(None, description="Payment means code (e.g. 58=SEPA, 10=Cash)")
 
+    @model_validator(mode="after")
+    def _totals_source(self):
+        # Totals can only be computed from lines or document level allowances/charges
+        if self.amounts is None and not (self.lines or self.allowances or self.charges):
+            raise ValueError("amounts is required when there are no lines, allowances or charges to compute it from")
+        return self
+
+
+class ConvertRequest(BaseModel):
+    """JSON body of /v1/convert/json."""
+    pdf: Base64Bytes = Field(..., description="Original PDF invoice, base64-encoded")
+    metadata: InvoiceMetadata
+
+
+class BatchLine(ConvertRequest):
+    """One line of a /v1/convert/batch NDJSON manifest."""
+    id: Optional[str] = Field(None, description="Client reference, used to name the output PDF (default: line-<n>)")
+
 
 class ValidationResult(BaseModel):
     """Validation result response."""
     valid: bool = Field(..., description="Whether the file is valid")
-    format: Optional[str] = Field(None, description="Detected format (factur-x, zugferd, order-x)")
+    format: Optional[str] = Field(None, description="Detected format (factur-x, zugferd, order-x, cdar)")
     flavor: Optional[str] = Field(None, description="Detected flavor/level")
     errors: list[str] = Field(default_factory=list, description="List of validation errors")
     validation_mode: Optional[str] = Field(None, description="Validation mode: 'hybrid' (Pro) or 'lite' (Community)")
+    truncated: bool = Field(False, description="Validation stopped at max_errors (mode=failfast): more errors may exist")
+
+
+class CdarBatchItem(ValidationResult):
+    """Validation of one message of a /v1/cdar/validate/batch archive."""
+    id: str = Field(..., description="Archive member name")
+
+
+class CdarBatchResult(BaseModel):
+    """Validation report of a batch of CDAR messages."""
+    total: int = Field(..., description="Number of messages")
+    valid: int = Field(..., description="Number of valid messages")
+    results: List[CdarBatchItem] = Field(default_factory=list, description="One report per message, in name order")
 
 
 class ErrorResponse(BaseModel):
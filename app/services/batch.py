@@ -0,0 +1,279 @@
+"""
+Batch Factur-X generation (/v1/convert/batch).
+
+A batch is a ZIP of `<name>.pdf` + `<name>.json` pairs, or an NDJSON manifest
+with one `{"id": ..., "pdf": "<base64>", "metadata": {...}}` object per line.
+
+Items are read from the upload one at a time and at most FX_BATCH_IN_FLIGHT
+of them are being converted at once, so memory does not grow with the batch
+size. Each item goes through the same quality gate as /v1/convert: its XML
+is validated in the validation process pool while the PDF/A-3 is assembled
+in the batch process pool. Results are handed out as items finish, each
+with its own status and errors.
+"""
+import base64
+import json
+import logging
+import os
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import PurePosixPath
+from threading import Lock
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional
+
+from pydantic import ValidationError
+
+from app.schemas.validation import BatchLine, InvoiceMetadata
+from app.services.codelists import CodelistService
+from app.services.generator import GeneratorService
+from app.services.hybrid_validation_service import MAX_TASKS_PER_CHILD
+from app.services.totals import TotalsError, TotalsService
+from app.uploads import MAX_UPLOAD_SIZE
+
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = int(os.getenv("FX_BATCH_WORKERS", "2"))      # PDF assembly processes
+BATCH_IN_FLIGHT = int(os.getenv("FX_BATCH_IN_FLIGHT", "8"))  # Items being converted at once
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = Lock()  # Items start from several threads
+
+# Output entry names are built from client-supplied ids
+_UNSAFE_NAME_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Get or create the PDF assembly process pool."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=BATCH_WORKERS,
+                max_tasks_per_child=MAX_TASKS_PER_CHILD  # Recycle workers to prevent memory leaks
+            )
+            logger.info(f"Initialized batch assembly ProcessPool with {BATCH_WORKERS} workers")
+        return _executor
+
+
+def shutdown_executor():
+    """Cleanup function to shutdown the process pool gracefully."""
+    global _executor
+    if _executor:
+        _executor.shutdown(wait=True)
+        _executor = None
+        logger.info("Batch assembly ProcessPool shutdown complete")
+
+
+class BatchItem:
+    """One invoice of a batch, as read from the upload (nothing is parsed yet)."""
+
+    __slots__ = ("item_id", "pdf", "metadata", "line", "error")
+
+    def __init__(self, item_id: str, pdf: Optional[bytes] = None, metadata: Optional[bytes] = None,
+                 line: Optional[bytes] = None, error: Optional[Dict[str, str]] = None):
+        self.item_id = item_id
+        self.pdf = pdf            # ZIP input: PDF bytes
+        self.metadata = metadata  # ZIP input: metadata JSON
+        self.line = line          # NDJSON input: the whole line (PDF and metadata)
+        self.error = error        # Why the item cannot be converted (unpaired file, too large...)
+
+
+class BatchResult:
+    """Outcome of one item: the Factur-X PDF, or the errors that prevented it."""
+
+    __slots__ = ("item_id", "pdf", "errors")
+
+    def __init__(self, item_id: str, pdf: Optional[bytes] = None, errors: Optional[list] = None):
+        self.item_id = item_id
+        self.pdf = pdf
+        self.errors = errors or []
+
+    @property
+    def filename(self) -> str:
+        return f"{_UNSAFE_NAME_RE.sub('_', self.item_id).strip('._') or 'invoice'}.pdf"
+
+    def status(self, filename: Optional[str] = None) -> Dict[str, Any]:
+        """Per-item report entry (without the PDF)."""
+        if self.pdf is None:
+            return {"id": self.item_id, "status": "error", "errors": self.errors}
+        return {"id": self.item_id, "status": "ok", "file": filename or self.filename}
+
+
+def _error(code: str, message: str) -> Dict[str, str]:
+    return {"error": code, "message": message}
+
+
+def _json_error(e: ValidationError, what: str) -> Dict[str, str]:
+    # Same codes as the single-invoice endpoints
+    json_error = next((error for error in e.errors() if error["type"] == "json_invalid"), None)
+    if json_error is not None:
+        return _error("INVALID_JSON", f"Invalid JSON in {what}: {json_error['msg']}")
+    return _error("INVALID_METADATA", f"Invalid {what} structure: {str(e)}")
+
+
+def iter_zip_items(fileobj: BinaryIO) -> Iterator[BatchItem]:
+    """
+    Items of a ZIP batch, paired by name (`a/b.pdf` + `a/b.json`), in name order.
+
+    Members are only read when their item is reached. Raises
+    zipfile.BadZipFile if the upload is not a ZIP archive.
+    """
+    archive = zipfile.ZipFile(fileobj)
+    members: Dict[str, Dict[str, zipfile.ZipInfo]] = {}
+    for info in archive.infolist():
+        path = PurePosixPath(info.filename)
+        if info.is_dir() or path.parts[0] == "__MACOSX" or path.suffix.lower() not in (".pdf", ".json"):
+            continue
+        members.setdefault(str(path.with_suffix("")), {})[path.suffix.lower()] = info
+
+    for item_id in sorted(members):
+        pair = members[item_id]
+        if ".pdf" not in pair or ".json" not in pair:
+            missing = "PDF" if ".pdf" not in pair else "metadata JSON"
+            yield BatchItem(item_id, error=_error("INCOMPLETE_ITEM", f"No {missing} file for '{item_id}'"))
+            continue
+        oversized = [info.filename for info in pair.values() if info.file_size > MAX_UPLOAD_SIZE]
+        if oversized:
+            yield BatchItem(item_id, error=_error("FILE_TOO_LARGE", f"{oversized[0]} exceeds the upload size limit"))
+            continue
+        try:
+            yield BatchItem(item_id, pdf=archive.read(pair[".pdf"]), metadata=archive.read(pair[".json"]))
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, RuntimeError, OSError) as e:
+            yield BatchItem(item_id, error=_error("INVALID_ARCHIVE", f"Cannot read '{item_id}': {e}"))
+
+
+def iter_ndjson_items(fileobj: BinaryIO) -> Iterator[BatchItem]:
+    """
+    Items of an NDJSON manifest, one per non-empty line (parsed later, in parallel).
+
+    Lines are read at most MAX_UPLOAD_SIZE bytes at a time: a longer line is
+    skipped and reported as FILE_TOO_LARGE, like an oversized ZIP member.
+    """
+    line_number = 0
+    while True:
+        line = fileobj.readline(MAX_UPLOAD_SIZE + 1)
+        if not line:
+            return
+        line_number += 1
+        if len(line) > MAX_UPLOAD_SIZE and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = fileobj.readline(MAX_UPLOAD_SIZE)
+            yield BatchItem(f"line-{line_number}",
+                            error=_error("FILE_TOO_LARGE", f"line {line_number} exceeds the upload size limit"))
+        elif line.strip():
+            yield BatchItem(f"line-{line_number}", line=line)
+
+
+def _convert_item(item: BatchItem) -> BatchResult:
+    if item.error is not None:
+        return BatchResult(item.item_id, errors=[item.error])
+    item_id = item.item_id
+    try:
+        if item.line is not None:
+            request = BatchLine.model_validate_json(item.line)
+            item_id = request.id or item_id
+            pdf_content, metadata = request.pdf, request.metadata
+        else:
+            pdf_content, metadata = item.pdf, InvoiceMetadata.model_validate_json(item.metadata)
+    except ValidationError as e:
+        return BatchResult(item_id, errors=[_json_error(e, "metadata" if item.line is None else "line")])
+
+    if not pdf_content.startswith(b"%PDF"):
+        return BatchResult(item_id, errors=[_error("INVALID_FILE_TYPE", "Only PDF files are accepted")])
+    code_errors = CodelistService.check(metadata)
+    if code_errors:
+        return BatchResult(item_id, errors=[dict(_error("INVALID_CODE", code_errors[0]["message"]),
+                                                 details={"errors": code_errors})])
+    try:
+        metadata = TotalsService.apply(metadata)
+    except TotalsError as e:
+        return BatchResult(item_id, errors=[dict(_error("INCONSISTENT_TOTALS", str(e)), details={"errors": e.errors})])
+    try:
+        return BatchResult(item_id, pdf=GeneratorService.generate_facturx_pdf(pdf_content, metadata, _get_executor()))
+    except ValueError as e:
+        return BatchResult(item_id, errors=[_error("GENERATION_FAILED", str(e))])
+    except Exception as e:
+        logger.exception(f"Unexpected error converting batch item {item_id}: {e}")
+        return BatchResult(item_id, errors=[_error("INTERNAL_ERROR", "An unexpected error occurred")])
+
+
+class BatchService:
+    """Converts batches of invoices with bounded memory."""
+
+    @staticmethod
+    def run(items: Iterable[BatchItem], in_flight: int = BATCH_IN_FLIGHT) -> Iterator[BatchResult]:
+        """
+        Convert the items, `in_flight` at a time, yielding results as they finish.
+
+        The next item is only read from `items` when a slot is free.
+        """
+        with ThreadPoolExecutor(max_workers=in_flight, thread_name_prefix="fx-batch") as pool:
+            pending = set()
+            try:
+                for item in items:
+                    if len(pending) >= in_flight:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                    pending.add(pool.submit(_convert_item, item))
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            finally:
+                # Client gone: drop the items not started yet
+                for future in pending:
+                    future.cancel()
+
+
+class _ChunkSink:
+    """Write-only file object collecting what zipfile writes, drained after each entry."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def zip_stream(results: Iterable[BatchResult]) -> Iterator[bytes]:
+    """
+    ZIP of the generated PDFs, written as results arrive, ending with
+    `report.ndjson` (one status line per item, in completion order).
+    """
+    sink = _ChunkSink()
+    report, used_names = [], {"report.ndjson"}
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for result in results:
+            if result.pdf is None:
+                report.append(json.dumps(result.status()))
+                continue
+            filename, suffix = result.filename, 1
+            while filename in used_names:  # Client-supplied ids may repeat
+                suffix += 1
+                filename = f"{result.filename[:-4]}-{suffix}.pdf"
+            used_names.add(filename)
+            report.append(json.dumps(result.status(filename)))
+            archive.writestr(filename, result.pdf)
+            yield sink.drain()
+        archive.writestr("report.ndjson", "\n".join(report) + "\n" if report else "")
+    yield sink.drain()
+
+
+def ndjson_stream(results: Iterable[BatchResult]) -> Iterator[bytes]:
+    """One status line per item as it finishes, with the PDF inlined as base64."""
+    for result in results:
+        line = result.status()
+        if result.pdf is not None:
+            line["pdf"] = base64.b64encode(result.pdf).decode("ascii")
+        yield (json.dumps(line) + "\n").encode("utf-8")
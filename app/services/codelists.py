@@ -0,0 +1,98 @@
+"""
+Code list pre-validation (EN 16931 BR-CL rules).
+
+Checks the coded fields of an invoice (currency, countries, payment means,
+VAT categories, unit codes) against the frozen tables compiled by
+tools/build_codelists.py, one set lookup per field. An invalid code is
+reported with the rule the Schematron would fail on and the field it comes
+from, before any XML is generated or validated.
+"""
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from app.schemas.validation import InvoiceMetadata
+from app.services.codelist_tables import (
+    COUNTRY_CODES, CURRENCY_CODES, PAYMENT_MEANS_CODES, UNIT_CODES, VAT_CATEGORY_CODES
+)
+
+# Rule id -> (table, what the code list is)
+RULES: Dict[str, Tuple[FrozenSet[str], str]] = {
+    "BR-CL-04": (CURRENCY_CODES, "Invoice currency code must be coded using ISO code list 4217 alpha-3"),
+    "BR-CL-14": (COUNTRY_CODES, "Country codes must be coded using ISO code list 3166-1"),
+    "BR-CL-15": (COUNTRY_CODES, "Country of origin must be coded using ISO code list 3166-1"),
+    "BR-CL-16": (PAYMENT_MEANS_CODES, "Payment means must be coded using UNTDID 4461 code list"),
+    "BR-CL-17": (VAT_CATEGORY_CODES, "Allowance/charge VAT category must be coded using UNCL 5305 code list"),
+    "BR-CL-18": (VAT_CATEGORY_CODES, "VAT category must be coded using UNCL 5305 code list"),
+    "BR-CL-23": (UNIT_CODES, "Unit code must be coded according to UN/ECE Recommendation 20 with Rec 21 extension"),
+}
+
+
+def is_valid_code(rule_id: str, value: str) -> bool:
+    """True if `value` passes the code list of `rule_id` (compared as normalize-space() would)."""
+    return value.strip(" \t\r\n") in RULES[rule_id][0]
+
+
+def _error(rule_id: str, location: str, value: Any) -> Dict[str, str]:
+    return {
+        "rule_id": rule_id,
+        "message": f"[{rule_id}] {RULES[rule_id][1]}: '{value}' is not a valid code",
+        "location": location,
+        "severity": "error",
+        "layer": "codelist",
+    }
+
+
+# (rule id, metadata list, field) checked on every entry of the list
+_LIST_FIELDS = (
+    ("BR-CL-23", "lines", "unit_code"),
+    ("BR-CL-18", "lines", "vat_category"),
+    ("BR-CL-15", "lines", "country_of_origin"),
+    ("BR-CL-18", "tax_details", "category_code"),
+    ("BR-CL-17", "allowances", "vat_category"),
+    ("BR-CL-17", "charges", "vat_category"),
+)
+
+
+def _scalar_codes(metadata: InvoiceMetadata) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """(rule id, field, value) of the single coded fields rendered into the XML."""
+    yield "BR-CL-04", "currency_code", metadata.currency_code
+    for party in ("seller", "buyer", "ship_to"):
+        address = getattr(getattr(metadata, party, None), "address", None)
+        if address is not None:
+            yield "BR-CL-14", f"{party}.address.country_code", address.country_code
+    yield "BR-CL-16", "payment_means_code", metadata.payment_means_code
+
+
+class CodelistService:
+    """Fail-fast code list checks for invoice metadata and extracted invoices."""
+
+    @staticmethod
+    def check(metadata: InvoiceMetadata) -> List[Dict[str, str]]:
+        """Errors (validator format, location = metadata field) for invalid codes."""
+        errors = [
+            _error(rule_id, field, value)
+            for rule_id, field, value in _scalar_codes(metadata)
+            if value is not None and not is_valid_code(rule_id, value)
+        ]
+        for rule_id, name, field in _LIST_FIELDS:
+            table = RULES[rule_id][0]
+            for index, entry in enumerate(getattr(metadata, name) or ()):
+                value = getattr(entry, field)
+                # Exact match first: the usual case needs no normalization
+                if value is not None and value not in table and not is_valid_code(rule_id, value):
+                    errors.append(_error(rule_id, f"{name}[{index}].{field}", value))
+        return errors
+
+    @staticmethod
+    def check_extracted(invoice_json: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Warnings (extraction format) for invalid codes in an extracted invoice."""
+        codes = [("BR-CL-04", "currency", invoice_json.get("currency"))]
+        for party in ("seller", "buyer"):
+            address = (invoice_json.get(party) or {}).get("address") or {}
+            codes.append(("BR-CL-14", f"{party}.address.country", address.get("country")))
+        for index, line in enumerate(invoice_json.get("line_items") or []):
+            codes.append(("BR-CL-23", f"line_items[{index}].unit_code", line.get("unit_code")))
+        return [
+            {"code": "INVALID_CODE", "message": f"{field}: {_error(rule_id, field, value)['message']}"}
+            for rule_id, field, value in codes
+            if value and not is_valid_code(rule_id, value)
+        ]
@@ -1,17 +1,156 @@
 """
 Extraction service for Community Edition (Open Core).
-Parses Factur-X/ZUGFeRD XML and returns FULL invoice data (no obfuscation).
+Parses Factur-X/ZUGFeRD XML (embedded in a PDF or sent bare) and UBL XML,
+and returns FULL invoice data (no obfuscation).
 Pro edition adds advanced validation and compliance features.
 """
 import logging
-from io import BytesIO
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from lxml import etree
-from facturx import get_xml_from_pdf, get_level, get_flavor
 import hashlib
 
+from app.services.codelists import CodelistService
+from app.services.pdf_locator import get_xml_from_pdf_fast
+from app.services.syntax import (
+    SYNTAX_CII, SYNTAX_ZUGFERD_V1, SYNTAX_UBL,
+    detect_syntax, detect_level, looks_like_xml
+)
+
 logger = logging.getLogger(__name__)
 
+# --- Mapping path sets ---
+# Each field maps to an ordered list of candidate XPaths (first match wins).
+# CII (Factur-X / ZUGFeRD 2.x) and ZUGFeRD 1.0 share the same paths: only the
+# namespaces behind the rsm/ram/udt prefixes differ. UBL has its own set.
+_CII_PATHS = {
+    # Use specific paths to avoid matching Profile ID (GuidelineSpecifiedDocumentContextParameter/ID)
+    "invoice_id": [
+        '//rsm:ExchangedDocument/ram:ID',  # Standard CII
+        '//rsm:HeaderExchangedDocument/ram:ID'  # Old ZUGFeRD
+    ],
+    "issue_date": [
+        '//rsm:ExchangedDocument/ram:IssueDateTime/udt:DateTimeString',
+        '//rsm:HeaderExchangedDocument/ram:IssueDateTime/udt:DateTimeString',
+        '//ram:IssueDateTime/udt:DateTimeString'
+    ],
+    "currency": ['//ram:InvoiceCurrencyCode'],
+    "line_items": ['//ram:IncludedSupplyChainTradeLineItem'],
+    "line_name": ['.//ram:SpecifiedTradeProduct/ram:Name'],
+    "line_quantity": ['.//ram:BilledQuantity'],
+    "line_unit_code": ['.//ram:BilledQuantity/@unitCode'],
+    "line_unit_price": [
+        './/ram:SpecifiedLineTradeAgreement/ram:NetPriceProductTradePrice/ram:ChargeAmount',
+        './/ram:NetPriceProductTradePrice/ram:ChargeAmount',
+        './/ram:GrossPriceProductTradePrice/ram:ChargeAmount'
+    ],
+    "line_total": [
+        './/ram:SpecifiedLineTradeSettlement/ram:SpecifiedTradeSettlementLineMonetarySummation/ram:LineTotalAmount',
+        './/ram:SpecifiedTradeSettlementMonetarySummation/ram:LineTotalAmount'
+    ],
+    "line_vat_rate": [
+        './/ram:SpecifiedLineTradeSettlement/ram:ApplicableTradeTax/ram:RateApplicablePercent',
+        './/ram:ApplicableTradeTax/ram:RateApplicablePercent'
+    ],
+    "total_net": [
+        '//ram:ApplicableHeaderTradeSettlement/ram:SpecifiedTradeSettlementHeaderMonetarySummation/ram:TaxBasisTotalAmount',
+        '//ram:SpecifiedTradeSettlementMonetarySummation/ram:TaxBasisTotalAmount',
+        '//ram:SpecifiedTradeSettlementMonetarySummation/ram:LineTotalAmount'
+    ],
+    "total_tax": [
+        '//ram:ApplicableHeaderTradeSettlement/ram:SpecifiedTradeSettlementHeaderMonetarySummation/ram:TaxTotalAmount',
+        '//ram:SpecifiedTradeSettlementMonetarySummation/ram:TaxTotalAmount'
+    ],
+    "total_gross": [
+        '//ram:ApplicableHeaderTradeSettlement/ram:SpecifiedTradeSettlementHeaderMonetarySummation/ram:GrandTotalAmount',
+        '//ram:SpecifiedTradeSettlementMonetarySummation/ram:GrandTotalAmount'
+    ],
+    "total_payable": [
+        '//ram:ApplicableHeaderTradeSettlement/ram:SpecifiedTradeSettlementHeaderMonetarySummation/ram:DuePayableAmount',
+        '//ram:SpecifiedTradeSettlementMonetarySummation/ram:DuePayableAmount'
+    ],
+    "seller_name": ['//ram:SellerTradeParty/ram:Name'],
+    "seller_vat": ['//ram:SellerTradeParty//ram:SpecifiedTaxRegistration/ram:ID'],
+    "seller_address_line": ['//ram:SellerTradeParty/ram:PostalTradeAddress/ram:LineOne'],
+    "seller_city": ['//ram:SellerTradeParty/ram:PostalTradeAddress/ram:CityName'],
+    "seller_postcode": ['//ram:SellerTradeParty/ram:PostalTradeAddress/ram:PostcodeCode'],
+    "seller_country": ['//ram:SellerTradeParty/ram:PostalTradeAddress/ram:CountryID'],
+    "buyer_name": ['//ram:BuyerTradeParty/ram:Name'],
+    "buyer_vat": ['//ram:BuyerTradeParty//ram:SpecifiedTaxRegistration/ram:ID'],
+    "buyer_address_line": ['//ram:BuyerTradeParty/ram:PostalTradeAddress/ram:LineOne'],
+    "buyer_city": ['//ram:BuyerTradeParty/ram:PostalTradeAddress/ram:CityName'],
+    "buyer_postcode": ['//ram:BuyerTradeParty/ram:PostalTradeAddress/ram:PostcodeCode'],
+    "buyer_country": ['//ram:BuyerTradeParty/ram:PostalTradeAddress/ram:CountryID'],
+}
+
+# UBL 2.1 Invoice / CreditNote (EN16931 UBL binding, XRechnung UBL)
+_UBL_PATHS = {
+    "invoice_id": ['/*/cbc:ID'],
+    "issue_date": ['/*/cbc:IssueDate'],
+    "currency": ['/*/cbc:DocumentCurrencyCode'],
+    "line_items": ['/*/cac:InvoiceLine | /*/cac:CreditNoteLine'],
+    "line_name": ['./cac:Item/cbc:Name'],
+    "line_quantity": ['./cbc:InvoicedQuantity', './cbc:CreditedQuantity'],
+    "line_unit_code": ['./cbc:InvoicedQuantity/@unitCode', './cbc:CreditedQuantity/@unitCode'],
+    "line_unit_price": ['./cac:Price/cbc:PriceAmount'],
+    "line_total": ['./cbc:LineExtensionAmount'],
+    "line_vat_rate": ['./cac:Item/cac:ClassifiedTaxCategory/cbc:Percent'],
+    "total_net": [
+        '/*/cac:LegalMonetaryTotal/cbc:TaxExclusiveAmount',
+        '/*/cac:LegalMonetaryTotal/cbc:LineExtensionAmount'
+    ],
+    "total_tax": ['/*/cac:TaxTotal/cbc:TaxAmount'],
+    "total_gross": ['/*/cac:LegalMonetaryTotal/cbc:TaxInclusiveAmount'],
+    "total_payable": ['/*/cac:LegalMonetaryTotal/cbc:PayableAmount'],
+    "seller_name": [
+        '/*/cac:AccountingSupplierParty/cac:Party/cac:PartyLegalEntity/cbc:RegistrationName',
+        '/*/cac:AccountingSupplierParty/cac:Party/cac:PartyName/cbc:Name'
+    ],
+    "seller_vat": [
+        "/*/cac:AccountingSupplierParty/cac:Party/cac:PartyTaxScheme[cac:TaxScheme/cbc:ID='VAT']/cbc:CompanyID",
+        '/*/cac:AccountingSupplierParty/cac:Party/cac:PartyTaxScheme/cbc:CompanyID'
+    ],
+    "seller_address_line": ['/*/cac:AccountingSupplierParty/cac:Party/cac:PostalAddress/cbc:StreetName'],
+    "seller_city": ['/*/cac:AccountingSupplierParty/cac:Party/cac:PostalAddress/cbc:CityName'],
+    "seller_postcode": ['/*/cac:AccountingSupplierParty/cac:Party/cac:PostalAddress/cbc:PostalZone'],
+    "seller_country": ['/*/cac:AccountingSupplierParty/cac:Party/cac:PostalAddress/cac:Country/cbc:IdentificationCode'],
+    "buyer_name": [
+        '/*/cac:AccountingCustomerParty/cac:Party/cac:PartyLegalEntity/cbc:RegistrationName',
+        '/*/cac:AccountingCustomerParty/cac:Party/cac:PartyName/cbc:Name'
+    ],
+    "buyer_vat": ['/*/cac:AccountingCustomerParty/cac:Party/cac:PartyTaxScheme/cbc:CompanyID'],
+    "buyer_address_line": ['/*/cac:AccountingCustomerParty/cac:Party/cac:PostalAddress/cbc:StreetName'],
+    "buyer_city": ['/*/cac:AccountingCustomerParty/cac:Party/cac:PostalAddress/cbc:CityName'],
+    "buyer_postcode": ['/*/cac:AccountingCustomerParty/cac:Party/cac:PostalAddress/cbc:PostalZone'],
+    "buyer_country": ['/*/cac:AccountingCustomerParty/cac:Party/cac:PostalAddress/cac:Country/cbc:IdentificationCode'],
+}
+
+_NAMESPACES = {
+    SYNTAX_CII: {'rsm': 'urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100',
+                 'ram': 'urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100',
+                 'udt': 'urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100'},
+    SYNTAX_ZUGFERD_V1: {'rsm': 'urn:ferd:CrossIndustryDocument:invoice:1p0',
+                        'ram': 'urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:12',
+                        'udt': 'urn:un:unece:uncefact:data:standard:UnqualifiedDataType:15'},
+    SYNTAX_UBL: {'cac': 'urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2',
+                 'cbc': 'urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2'},
+}
+
+
+def _compile_path_set(paths: Dict[str, List[str]], namespaces: Dict[str, str]) -> Dict[str, Tuple[etree.XPath, ...]]:
+    """Pre-compile a mapping path set once (etree.XPath objects are reusable)."""
+    return {
+        field: tuple(etree.XPath(p, namespaces=namespaces) for p in candidates)
+        for field, candidates in paths.items()
+    }
+
+
+# Compiled once at import time, selected per document syntax
+_COMPILED_PATHS = {
+    SYNTAX_CII: _compile_path_set(_CII_PATHS, _NAMESPACES[SYNTAX_CII]),
+    SYNTAX_ZUGFERD_V1: _compile_path_set(_CII_PATHS, _NAMESPACES[SYNTAX_ZUGFERD_V1]),
+    SYNTAX_UBL: _compile_path_set(_UBL_PATHS, _NAMESPACES[SYNTAX_UBL]),
+}
+
 class ExtractionService:
     """
     Community Edition Extractor.
@@ -26,70 +165,103 @@ class ExtractionService:
     )
 
     @staticmethod
-    def extract_invoice_data(file_content: bytes, filename: str) -> Dict[str, Any]:
-        result = {
+    def empty_result() -> Dict[str, Any]:
+        return {
             "format_detected": None,
             "profile_detected": None,
             "xml_extracted": False,
             "invoice_json": None,
             "errors": []
         }
+
+    @staticmethod
+    def extract_invoice_data(file_content: bytes, filename: str) -> Dict[str, Any]:
+        result = ExtractionService.empty_result()
         
         try:
-            # 1. PDF Check
-            if not filename.lower().endswith('.pdf') and not file_content.startswith(b'%PDF'):
-                result["errors"].append({"code": "NOT_A_PDF", "message": "File is not a PDF"})
-                return result
-
-            # 2. Extract XML
-            try:
-                xml_filename, xml_bytes = get_xml_from_pdf(BytesIO(file_content), check_xsd=False)
-                if not xml_bytes:
-                    result["format_detected"] = "not_facturx"
-                    result["errors"].append({"code": "NO_XML", "message": "No Factur-X XML found"})
-                    return result
-                result["xml_extracted"] = True
-            except Exception as e:
-                result["format_detected"] = "not_facturx"
-                result["errors"].append({"code": "EXTRACTION_FAIL", "message": str(e)})
+            xml_bytes = ExtractionService.locate_xml(file_content, filename, result)
+            if xml_bytes is None:
                 return result
 
             # 3. Parse XML
             try:
                 xml_root = etree.fromstring(xml_bytes, parser=ExtractionService._SECURE_PARSER)
-                result["format_detected"] = get_flavor(xml_root)
-                result["profile_detected"] = get_level(xml_root)
-                
-                # 4. Map to Intelligent Demo JSON
-                result["invoice_json"] = ExtractionService._parse_demo_invoice(xml_root, result["format_detected"], filename)
-                
             except Exception as e:
                 result["errors"].append({"code": "PARSE_ERROR", "message": str(e)})
                 logger.exception("Parse error")
-                
-            return result
+                return result
+
+            return ExtractionService.map_xml(xml_root, filename, result)
             
         except Exception as e:
             logger.exception(f"Internal error: {e}")
             result["errors"].append({"code": "INTERNAL_ERROR", "message": str(e)})
             return result
 
+    @staticmethod
+    def locate_xml(file_content: bytes, filename: str, result: Dict[str, Any]) -> Optional[bytes]:
+        """
+        Steps 1-2: return the invoice XML (bare or embedded in the PDF).
+
+        Returns None when there is nothing to parse; the reason is recorded
+        in result["errors"].
+        """
+        # 1. Input type check: PDF (Factur-X/ZUGFeRD) or bare XML (CII/UBL)
+        is_pdf = bytes(file_content[:4]) == b'%PDF'
+        is_xml = not is_pdf and looks_like_xml(file_content)
+        if not is_pdf and not is_xml and not filename.lower().endswith('.pdf'):
+            result["errors"].append({"code": "NOT_A_PDF", "message": "File is neither a PDF nor an XML invoice"})
+            return None
+
+        # 2. Extract XML (bare XML input skips the PDF step entirely)
+        if is_xml:
+            result["xml_extracted"] = True
+            return file_content
+
+        try:
+            xml_filename, xml_bytes = get_xml_from_pdf_fast(file_content)
+            if not xml_bytes:
+                result["format_detected"] = "not_facturx"
+                result["errors"].append({"code": "NO_XML", "message": "No Factur-X XML found"})
+                return None
+            result["xml_extracted"] = True
+            return xml_bytes
+        except Exception as e:
+            result["format_detected"] = "not_facturx"
+            result["errors"].append({"code": "EXTRACTION_FAIL", "message": str(e)})
+            return None
+
+    @staticmethod
+    def map_xml(xml_root: etree._Element, filename: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Steps 3-4: detect syntax/profile and map a parsed document to invoice JSON."""
+        try:
+            result["format_detected"] = detect_syntax(xml_root)
+            result["profile_detected"] = detect_level(xml_root, result["format_detected"])
+            if result["format_detected"] not in _COMPILED_PATHS:
+                # Order-X orders are detected but have no invoice mapping
+                result["errors"].append({
+                    "code": "UNSUPPORTED_FORMAT",
+                    "message": f"Invoice data cannot be extracted from {result['format_detected']} documents"
+                })
+                return result
+            
+            # 4. Map to Intelligent Demo JSON
+            result["invoice_json"] = ExtractionService._parse_demo_invoice(xml_root, result["format_detected"], filename)
+            
+        except Exception as e:
+            result["errors"].append({"code": "PARSE_ERROR", "message": str(e)})
+            logger.exception("Parse error")
+            
+        return result
+
     @staticmethod
     def _parse_demo_invoice(xml_root, flavor, filename):
-        # Namespaces
-        if flavor in ('factur-x', 'facturx'):
-            ns = {'rsm': 'urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100',
-                  'ram': 'urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100',
-                  'udt': 'urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100'}
-        else:
-            ns = {'rsm': 'urn:ferd:CrossIndustryDocument:invoice:1p0',
-                  'ram': 'urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:12',
-                  'udt': 'urn:un:unece:uncefact:data:standard:UnqualifiedDataType:15'}
+        # Compiled path set for this syntax (CII, ZUGFeRD 1.0 or UBL)
+        paths = _COMPILED_PATHS[flavor]
 
-        def xpath_first(el, paths):
-            if isinstance(paths, str): paths = [paths]
-            for p in paths:
-                res = el.xpath(p, namespaces=ns)
+        def xpath_first(el, field):
+            for xpath in paths[field]:
+                res = xpath(el)
                 if res:
                     val = res[0]
                     return val.text if hasattr(val, 'text') else str(val)
@@ -98,23 +270,13 @@ class ExtractionService:
         # --- SMART DEMO MAPPING ---
         
         # 1. Structure (Real)
-        # 1. Structure (Real)
-        # Use specific paths to avoid matching Profile ID (GuidelineSpecifiedDocumentContextParameter/ID)
-        invoice_id = xpath_first(xml_root, [
-            '//rsm:ExchangedDocument/ram:ID', # Standard CII
-            '//rsm:HeaderExchangedDocument/ram:ID' # Old ZUGFeRD
-        ])
-        
-        date_str = xpath_first(xml_root, [
-            '//rsm:ExchangedDocument/ram:IssueDateTime/udt:DateTimeString', 
-            '//rsm:HeaderExchangedDocument/ram:IssueDateTime/udt:DateTimeString', 
-            '//ram:IssueDateTime/udt:DateTimeString'
-        ])
-        currency = xpath_first(xml_root, ['//ram:InvoiceCurrencyCode']) or "EUR"
+        invoice_id = xpath_first(xml_root, "invoice_id")
+        date_str = xpath_first(xml_root, "issue_date")
+        currency = xpath_first(xml_root, "currency") or "EUR"
 
         # 2. Line Items
         line_items = []
-        items = xml_root.xpath('//ram:IncludedSupplyChainTradeLineItem', namespaces=ns)
+        items = paths["line_items"][0](xml_root)
         
         # NOTE: Profile 'minimum' usually has no line items. We do NOT fake them.
         warnings = []
@@ -135,32 +297,25 @@ class ExtractionService:
         
         for item in items[:10]: # Max 10 lines
             # Name: Partial (Identity Protection)
-            raw_name = xpath_first(item, './/ram:SpecifiedTradeProduct/ram:Name') or "Item"
+            raw_name = xpath_first(item, "line_name") or "Item"
             name = (raw_name[:15] + "...") if len(raw_name) > 15 else raw_name
             
             # Qty: Real
-            raw_qty = xpath_first(item, './/ram:BilledQuantity')
+            raw_qty = xpath_first(item, "line_quantity")
             try:
                 qty = float(raw_qty) if raw_qty else 1.0
             except:
                 qty = 1.0
             
             # Unit Price: REAL (Unlocked for Developer Experience)
-            raw_price = xpath_first(item, [
-                './/ram:SpecifiedLineTradeAgreement/ram:NetPriceProductTradePrice/ram:ChargeAmount',
-                './/ram:NetPriceProductTradePrice/ram:ChargeAmount',
-                './/ram:GrossPriceProductTradePrice/ram:ChargeAmount'
-            ])
+            raw_price = xpath_first(item, "line_unit_price")
             try:
                 unit_price = float(raw_price) if raw_price else 0.0
             except:
                 unit_price = 0.0
             
             # Line Total: REAL
-            raw_line_total = xpath_first(item, [
-                './/ram:SpecifiedLineTradeSettlement/ram:SpecifiedTradeSettlementLineMonetarySummation/ram:LineTotalAmount',
-                './/ram:SpecifiedTradeSettlementMonetarySummation/ram:LineTotalAmount'
-            ])
+            raw_line_total = xpath_first(item, "line_total")
             try:
                 line_total = float(raw_line_total) if raw_line_total else (qty * unit_price)
             except:
@@ -168,10 +323,7 @@ class ExtractionService:
             total_net += line_total
             
             # VAT Rate: REAL
-            raw_vat = xpath_first(item, [
-                './/ram:SpecifiedLineTradeSettlement/ram:ApplicableTradeTax/ram:RateApplicablePercent',
-                './/ram:ApplicableTradeTax/ram:RateApplicablePercent'
-            ])
+            raw_vat = xpath_first(item, "line_vat_rate")
             try:
                 vat_rate = float(raw_vat) if raw_vat else 0.0
             except:
@@ -180,7 +332,7 @@ class ExtractionService:
             line_items.append({
                 "description": raw_name,  # Full name (no truncation in Open Core)
                 "quantity": f"{qty}",
-                "unit_code": xpath_first(item, './/ram:BilledQuantity/@unitCode') or "C62",
+                "unit_code": xpath_first(item, "line_unit_code") or "C62",
                 "unit_price": f"{unit_price:.2f}",
                 "vat_rate": f"{vat_rate:.2f}", 
                 "line_total": f"{line_total:.2f}"
@@ -188,23 +340,10 @@ class ExtractionService:
 
         # 3. Totals: REAL (Unlocked for Developer Experience)
         # Extract real totals from XML
-        raw_net = xpath_first(xml_root, [
-            '//ram:ApplicableHeaderTradeSettlement/ram:SpecifiedTradeSettlementHeaderMonetarySummation/ram:TaxBasisTotalAmount',
-            '//ram:SpecifiedTradeSettlementMonetarySummation/ram:TaxBasisTotalAmount',
-            '//ram:SpecifiedTradeSettlementMonetarySummation/ram:LineTotalAmount'
-        ])
-        raw_tax = xpath_first(xml_root, [
-            '//ram:ApplicableHeaderTradeSettlement/ram:SpecifiedTradeSettlementHeaderMonetarySummation/ram:TaxTotalAmount',
-            '//ram:SpecifiedTradeSettlementMonetarySummation/ram:TaxTotalAmount'
-        ])
-        raw_gross = xpath_first(xml_root, [
-            '//ram:ApplicableHeaderTradeSettlement/ram:SpecifiedTradeSettlementHeaderMonetarySummation/ram:GrandTotalAmount',
-            '//ram:SpecifiedTradeSettlementMonetarySummation/ram:GrandTotalAmount'
-        ])
-        raw_payable = xpath_first(xml_root, [
-            '//ram:ApplicableHeaderTradeSettlement/ram:SpecifiedTradeSettlementHeaderMonetarySummation/ram:DuePayableAmount',
-            '//ram:SpecifiedTradeSettlementMonetarySummation/ram:DuePayableAmount'
-        ])
+        raw_net = xpath_first(xml_root, "total_net")
+        raw_tax = xpath_first(xml_root, "total_tax")
+        raw_gross = xpath_first(xml_root, "total_gross")
+        raw_payable = xpath_first(xml_root, "total_payable")
         
         try:
             total_net_real = float(raw_net) if raw_net else total_net
@@ -224,19 +363,19 @@ class ExtractionService:
             payable_amount = gross_total
 
         # 3. Extract REAL seller/buyer (Open Core Reset - no masking in Community)
-        seller_name = xpath_first(xml_root, '//ram:SellerTradeParty/ram:Name') or ""
-        seller_vat = xpath_first(xml_root, '//ram:SellerTradeParty//ram:SpecifiedTaxRegistration/ram:ID') or ""
-        seller_address_line = xpath_first(xml_root, '//ram:SellerTradeParty/ram:PostalTradeAddress/ram:LineOne') or ""
-        seller_city = xpath_first(xml_root, '//ram:SellerTradeParty/ram:PostalTradeAddress/ram:CityName') or ""
-        seller_postcode = xpath_first(xml_root, '//ram:SellerTradeParty/ram:PostalTradeAddress/ram:PostcodeCode') or ""
-        seller_country = xpath_first(xml_root, '//ram:SellerTradeParty/ram:PostalTradeAddress/ram:CountryID') or ""
+        seller_name = xpath_first(xml_root, "seller_name") or ""
+        seller_vat = xpath_first(xml_root, "seller_vat") or ""
+        seller_address_line = xpath_first(xml_root, "seller_address_line") or ""
+        seller_city = xpath_first(xml_root, "seller_city") or ""
+        seller_postcode = xpath_first(xml_root, "seller_postcode") or ""
+        seller_country = xpath_first(xml_root, "seller_country") or ""
         
-        buyer_name = xpath_first(xml_root, '//ram:BuyerTradeParty/ram:Name') or ""
-        buyer_vat = xpath_first(xml_root, '//ram:BuyerTradeParty//ram:SpecifiedTaxRegistration/ram:ID') or ""
-        buyer_address_line = xpath_first(xml_root, '//ram:BuyerTradeParty/ram:PostalTradeAddress/ram:LineOne') or ""
-        buyer_city = xpath_first(xml_root, '//ram:BuyerTradeParty/ram:PostalTradeAddress/ram:CityName') or ""
-        buyer_postcode = xpath_first(xml_root, '//ram:BuyerTradeParty/ram:PostalTradeAddress/ram:PostcodeCode') or ""
-        buyer_country = xpath_first(xml_root, '//ram:BuyerTradeParty/ram:PostalTradeAddress/ram:CountryID') or ""
+        buyer_name = xpath_first(xml_root, "buyer_name") or ""
+        buyer_vat = xpath_first(xml_root, "buyer_vat") or ""
+        buyer_address_line = xpath_first(xml_root, "buyer_address_line") or ""
+        buyer_city = xpath_first(xml_root, "buyer_city") or ""
+        buyer_postcode = xpath_first(xml_root, "buyer_postcode") or ""
+        buyer_country = xpath_first(xml_root, "buyer_country") or ""
 
         data = {
             "invoice_number": invoice_id,
@@ -288,5 +427,8 @@ class ExtractionService:
                 "warnings": warnings if warnings else []
             }
         }
+
+        # 5. Code list checks (currency, countries, unit codes): one lookup per field
+        data["_meta"]["warnings"].extend(CodelistService.check_extracted(data))
         
         return data
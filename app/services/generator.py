@@ -1,26 +1,277 @@
 """
 Factur-X PDF generation service using Jinja2 templating and factur-x library.
 """
+import hashlib
+import json
 import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Executor, ThreadPoolExecutor, wait
 from io import BytesIO
 from pathlib import Path
-from jinja2 import FileSystemLoader, select_autoescape
+from threading import Lock
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from jinja2 import FileSystemLoader, Template, Undefined, meta, nodes, select_autoescape
 from jinja2.sandbox import SandboxedEnvironment # SECURITY: Prevents SSTI/RCE
+from jinja2.visitor import NodeTransformer
+from markupsafe import Markup
+from pydantic import BaseModel
 from facturx import generate_from_binary
+from app.metrics import metrics
 from app.schemas.validation import InvoiceMetadata
+from app.services.hybrid_validation_service import HybridValidationService
+from app.services.pdf_incremental import IncrementalFallback, embed_xml_incremental
 
 logger = logging.getLogger(__name__)
 
+# Template compilation: one specialized variant per profile, compiled once.
+# Auto-reload (template file mtime checks on every request) is for development only.
+TEMPLATE_NAME = "factur-x.xml.j2"
+PROFILES = ("minimum", "basicwl", "basic", "en16931", "extended")
+TEMPLATE_AUTO_RELOAD = os.getenv("FX_TEMPLATE_AUTO_RELOAD", "false").lower() == "true"
+
+# Stable sub-trees (parties, payment means) live in templates/fragments/ and are
+# included by the main template. Once rendered, a fragment is reused for every
+# invoice with the same inputs (e.g. all invoices of a seller).
+FRAGMENT_DIR = "fragments/"
+FRAGMENT_CACHE_SIZE = int(os.getenv("FX_FRAGMENT_CACHE_SIZE", "1024"))  # Max cached fragments (0 disables)
+FRAGMENT_CALL = "_fx_fragment"
+
+
+class _InvoiceSandbox(SandboxedEnvironment):
+    """
+    Sandboxed environment with a fast path for the invoice model.
+
+    The render context is the validated InvoiceMetadata itself: nested
+    models, lists, plain dicts (notes) and scalars. Reading a model field or
+    a dict key needs no attribute check; anything else still goes through
+    the sandbox. Unset (None) model fields are undefined, as they would be
+    in model_dump(exclude_none=True).
+    """
+
+    def getitem(self, obj, argument):
+        if hasattr(type(obj), "__pydantic_fields__"):
+            # A model's __dict__ holds its field values only
+            value = obj.__dict__.get(argument)
+            return self.undefined(obj=obj, name=argument) if value is None else value
+        if type(obj) is dict:
+            try:
+                return obj[argument]
+            except KeyError:
+                return self.undefined(obj=obj, name=argument)
+        return super().getitem(obj, argument)
+
+
 # Load Jinja2 environment (Sandboxed)
 TEMPLATE_DIR = Path(__file__).parent.parent / "templates"
-jinja_env = SandboxedEnvironment(
+jinja_env = _InvoiceSandbox(
     loader=FileSystemLoader(TEMPLATE_DIR),
     autoescape=select_autoescape(['xml']),
     trim_blocks=True,
-    lstrip_blocks=True
+    lstrip_blocks=True,
+    auto_reload=TEMPLATE_AUTO_RELOAD
 )
 
 
+class _ProfileSpecializer(NodeTransformer):
+    """
+    Specialize the template AST for one profile before compilation.
+
+    - `profile == '...'` tests are folded to constants and the dead
+      if/elif/else branches dropped, so no profile check runs per request.
+    - `a.b` lookups become `a['b']`: the context is made of dicts, and
+      Jinja's attribute lookup tries getattr() (and fails) before the key;
+      models are read through the same getitem() fast path.
+    - `{% include 'fragments/...' %}` becomes a call to the fragment cache,
+      passing the variables the fragment reads.
+    """
+
+    def __init__(self, profile: str):
+        self.profile = profile
+        self.dependencies = []  # uptodate checks of the inlined fragments
+
+    def visit_Include(self, node):
+        if not (isinstance(node.template, nodes.Const) and node.template.value.startswith(FRAGMENT_DIR)):
+            return node
+        name = node.template.value
+        source, filename, uptodate = jinja_env.loader.get_source(jinja_env, name)
+        self.dependencies.append(uptodate)
+        variables = sorted(meta.find_undeclared_variables(jinja_env.parse(source, name, filename)))
+        call = nodes.Call(
+            nodes.Name(FRAGMENT_CALL, "load"), [nodes.Const(name), nodes.Const(self.profile)],
+            [nodes.Keyword(variable, nodes.Name(variable, "load")) for variable in variables], None, None,
+            lineno=node.lineno
+        )
+        return nodes.Output([call], lineno=node.lineno)
+
+    def visit_Getattr(self, node):
+        node = self.generic_visit(node)
+        return nodes.Getitem(node.node, nodes.Const(node.attr), node.ctx, lineno=node.lineno)
+
+    def visit_Compare(self, node):
+        node = self.generic_visit(node)
+        if (isinstance(node.expr, nodes.Name) and node.expr.name == "profile" and len(node.ops) == 1
+                and node.ops[0].op in ("eq", "ne") and isinstance(node.ops[0].expr, nodes.Const)):
+            matches = node.ops[0].expr.value == self.profile
+            return nodes.Const(matches if node.ops[0].op == "eq" else not matches, lineno=node.lineno)
+        return node
+
+    def visit_If(self, node):
+        branches = [node] + list(node.elif_)
+        for branch in branches:
+            branch.test = self.visit(branch.test)
+        for branch in branches:
+            if not isinstance(branch.test, nodes.Const):
+                break
+            if branch.test.value:
+                return self._visit_body(branch.body)
+        else:
+            return self._visit_body(node.else_)
+        for branch in branches:
+            branch.body = self._visit_body(branch.body)
+        node.else_ = self._visit_body(node.else_)
+        return node
+
+    def _visit_body(self, body):
+        result = []
+        for child in body:
+            visited = self.visit(child)
+            if isinstance(visited, list):
+                result.extend(visited)
+            elif visited is not None:
+                result.append(visited)
+        return result
+
+
+# profile -> (compiled template, uptodate check from the loader)
+_profile_templates: Dict[str, Tuple[Template, Callable[[], bool]]] = {}
+# (fragment name, profile) -> (compiled template, uptodate check from the loader)
+_fragment_templates: Dict[Tuple[str, str], Tuple[Template, Callable[[], bool]]] = {}
+_profile_templates_lock = Lock()
+
+
+def _compile_profile_template(profile: str, name: str = TEMPLATE_NAME) -> Tuple[Template, Callable[[], bool]]:
+    source, filename, uptodate = jinja_env.loader.get_source(jinja_env, name)
+    specializer = _ProfileSpecializer(profile)
+    ast = specializer.visit(jinja_env.parse(source, name, filename))
+    code = jinja_env.compile(ast, name, filename)
+    template = jinja_env.template_class.from_code(
+        jinja_env, code, jinja_env.make_globals({FRAGMENT_CALL: _render_fragment}), uptodate
+    )
+    if specializer.dependencies:
+        # Fragments are inlined as calls: recompile when one of them changes too
+        checks = [uptodate] + specializer.dependencies
+        uptodate = lambda: all(check() for check in checks)
+    return template, uptodate
+
+
+def _cached_template(cache: dict, key, profile: str, name: str) -> Template:
+    entry = cache.get(key)
+    if entry is None or (TEMPLATE_AUTO_RELOAD and not entry[1]()):
+        with _profile_templates_lock:
+            entry = cache.get(key)
+            if entry is None or (TEMPLATE_AUTO_RELOAD and not entry[1]()):
+                if entry is not None and cache is _fragment_templates:
+                    fragment_cache.clear()
+                entry = _compile_profile_template(profile, name)
+                cache[key] = entry
+    return entry[0]
+
+
+def _profile_template(profile: str) -> Template:
+    return _cached_template(_profile_templates, profile, profile, TEMPLATE_NAME)
+
+
+def _fragment_template(name: str, profile: str) -> Template:
+    return _cached_template(_fragment_templates, (name, profile), profile, name)
+
+
+class FragmentCache:
+    """Thread-safe bounded LRU of rendered XML fragments, keyed by a digest of their inputs."""
+
+    def __init__(self, max_entries: int = FRAGMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._fragments: "OrderedDict[Tuple[str, str, bytes], Markup]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Tuple[str, str, bytes]) -> Optional[Markup]:
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+            return fragment
+
+    def put(self, key: Tuple[str, str, bytes], fragment: Markup):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._fragments[key] = fragment
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+
+# Singleton instance
+fragment_cache = FragmentCache()
+
+
+def _fragment_input(value):
+    # Models are keyed on their field values (json.dumps calls this for nested models too)
+    return value.__dict__ if isinstance(value, BaseModel) else str(value)
+
+
+def _render_fragment(name: str, profile: str, /, **variables) -> Markup:
+    """
+    Rendered (and escaped) fragment for these inputs, from the cache when
+    the same party / payment block was already rendered.
+    """
+    variables = {key: value for key, value in variables.items() if not isinstance(value, Undefined)}
+    if fragment_cache.max_entries <= 0:
+        return Markup(_fragment_template(name, profile).render(**variables))
+    inputs = json.dumps(variables, sort_keys=True, separators=(",", ":"), default=_fragment_input)
+    key = (name, profile, hashlib.blake2b(inputs.encode("utf-8"), digest_size=16).digest())
+    fragment = fragment_cache.get(key)
+    if fragment is not None:
+        metrics.inc("fragment_cache_hits")
+        return fragment
+    metrics.inc("fragment_cache_misses")
+    fragment = Markup(_fragment_template(name, profile).render(**variables))
+    fragment_cache.put(key, fragment)
+    return fragment
+
+
+def _template_context(metadata: InvoiceMetadata) -> Dict[str, object]:
+    """
+    Render context read straight from the validated model (no model_dump()
+    copy of the lines). None fields are left out, so Jinja2 'default'
+    filters and 'is defined' tests work for missing optional fields.
+    """
+    return {name: value for name, value in metadata.__dict__.items() if value is not None}
+
+
+# XML is rendered incrementally and handed out in chunks of about this size
+XML_CHUNK_SIZE = 64 * 1024
+
+# How the XML is attached to the PDF:
+# "rewrite" (factur-x library, the whole PDF is re-serialized) or
+# "incremental" (an update section is appended to the untouched original)
+EMBED_MODE = os.getenv("FX_EMBED_MODE", "rewrite").lower()
+
+# Document properties shared by every generated PDF (the title is per invoice)
+PDF_METADATA = {
+    'author': 'Factur-X API',
+    'keywords': 'Factur-X, ZUGFeRD, e-invoice',
+    'subject': 'Factur-X Invoice',
+}
+
+# PDF/A-3 assembly runs here while the quality gate validates the XML in the process pool
+_assembly_executor = ThreadPoolExecutor(thread_name_prefix="fx-pdf-assembly")
+
+
 class GeneratorService:
     """Service for generating Factur-X PDFs."""
 
@@ -36,15 +287,9 @@ class GeneratorService:
             XML string.
         """
         try:
-            template = jinja_env.get_template("factur-x.xml.j2")
-            
-            # Prepare context for template
-            # Prepare context for template
-            # Use model_dump to automatically include all new fields (IBAN, ShipTo, etc.)
-            # exclude_none=True ensures Jinja2 'default' filters work correctly for missing optional fields
-            context = metadata.model_dump(exclude_none=True)
+            template = _profile_template(metadata.profile)
             
-            xml_content = template.render(**context)
+            xml_content = template.render(_template_context(metadata))
             logger.info(f"Generated XML for invoice {metadata.invoice_number}")
             return xml_content
             
@@ -53,55 +298,131 @@ class GeneratorService:
             raise ValueError(f"XML generation failed: {str(e)}")
 
     @staticmethod
-    def generate_facturx_pdf(pdf_content: bytes, metadata: InvoiceMetadata) -> bytes:
+    def iter_xml(metadata: InvoiceMetadata) -> Iterator[bytes]:
+        """
+        Render the Factur-X XML incrementally, as UTF-8 chunks of about XML_CHUNK_SIZE.
+        
+        Same output as generate_xml(), without holding the whole document
+        (and its encoded copy) in memory: chunks can be streamed to the
+        client as line items are rendered.
+        """
+        template = _profile_template(metadata.profile)
+        pending, pending_size = [], 0
+        for piece in template.generate(_template_context(metadata)):
+            pending.append(piece)
+            pending_size += len(piece)
+            if pending_size >= XML_CHUNK_SIZE:
+                yield "".join(pending).encode("utf-8")
+                pending, pending_size = [], 0
+        if pending:
+            yield "".join(pending).encode("utf-8")
+
+    @staticmethod
+    def generate_xml_bytes(metadata: InvoiceMetadata) -> bytes:
+        """generate_xml() as UTF-8 bytes, built from the streamed chunks (no str copy)."""
+        try:
+            xml_bytes = b"".join(GeneratorService.iter_xml(metadata))
+            logger.info(f"Generated XML for invoice {metadata.invoice_number}")
+            return xml_bytes
+        except Exception as e:
+            logger.error(f"Failed to generate XML: {e}")
+            raise ValueError(f"XML generation failed: {str(e)}")
+
+    @staticmethod
+    def warmup():
+        """Compile the XML template variants of every profile (called at startup)."""
+        fragments = jinja_env.list_templates(filter_func=lambda name: name.startswith(FRAGMENT_DIR))
+        for profile in PROFILES:
+            _profile_template(profile)
+            for name in fragments:
+                _fragment_template(name, profile)
+        logger.info(f"Compiled XML templates for profiles: {', '.join(PROFILES)}")
+
+    @staticmethod
+    def generate_facturx_pdf(pdf_content: bytes, metadata: InvoiceMetadata,
+                             assembly_executor: Optional[Executor] = None) -> bytes:
         """
         Generate Factur-X PDF by embedding XML into a regular PDF.
         
+        The generated XML goes through the quality gate (hybrid validation)
+        while the PDF/A-3 is assembled: an invalid document is rejected as
+        soon as its validation report is available.
+        
         Args:
-            pdf_content: Original PDF bytes.
+            pdf_content: Original PDF (bytes, memoryview or mmap).
             metadata: Invoice metadata.
+            assembly_executor: Where the PDF is assembled (default: a thread
+                pool of this process; batches use a process pool).
             
         Returns:
             Factur-X PDF bytes.
         """
         try:
             # Generate XML from metadata
-            xml_content = GeneratorService.generate_xml(metadata)
+            xml_bytes = GeneratorService.generate_xml_bytes(metadata)
             
-            # Convert to bytes
-            xml_bytes = xml_content.encode('utf-8')
+            # AUTOMATIC VALIDATION (Quality Gate)
+            # Ensure we never deliver a broken or non-compliant file.
+            # The XML is validated as-is: no need to extract it back from the PDF,
+            # and only until its first error: the gate is pass/fail.
+            pending = HybridValidationService.submit_xml(xml_bytes, max_errors=1)
+            validation_future = pending.future
+            if validation_future is None:
+                # Already decided (parse error, lite mode): skip the PDF work if invalid
+                GeneratorService._check_compliance(pending.result())
+                if assembly_executor is not None:
+                    return assembly_executor.submit(
+                        GeneratorService._assemble_pdf, bytes(pdf_content), xml_bytes, metadata
+                    ).result()
+                return GeneratorService._assemble_pdf(pdf_content, xml_bytes, metadata)
             
-            # Use factur-x library to generate Factur-X PDF
-            logger.info("Generating Factur-X PDF...")
-            result_bytes = generate_from_binary(
-                pdf_content,  # First positional arg: input PDF bytes
-                xml_bytes,    # Second positional arg: XML bytes
-                flavor='factur-x',
-                level=metadata.profile,
-                pdf_metadata={
-                    'author': 'Factur-X API',
-                    'keywords': 'Factur-X, ZUGFeRD, e-invoice',
-                    'title': f'Invoice {metadata.invoice_number}',
-                    'subject': 'Factur-X Invoice',
-                }
+            if not isinstance(pdf_content, bytes):
+                pdf_content = bytes(pdf_content)  # The upload buffer is released when the request ends
+            assembly = (assembly_executor or _assembly_executor).submit(
+                GeneratorService._assemble_pdf, pdf_content, xml_bytes, metadata
             )
+            done, _ = wait([validation_future, assembly], return_when=FIRST_COMPLETED)
+            if assembly in done and assembly.exception() is not None:
+                validation_future.cancel()
+                raise assembly.exception()
             
-            logger.info(f"Successfully generated Factur-X PDF for invoice {metadata.invoice_number}")
-            
-            # AUTOMATIC VALIDATION (Quality Gate)
-            # Ensure we never deliver a broken or non-compliant file
-            from app.services.hybrid_validation_service import HybridValidationService
-            validation_res = HybridValidationService.validate(result_bytes, "generated_check.pdf")
-            
-            if not validation_res["is_valid"]:
-                errors = validation_res.get("errors", [])
-                error_msg = errors[0].get("message") if errors else "Unknown validation error"
-                logger.error(f"Generated PDF failed compliance check: {errors}")
-                # We fail strict. A generated invoice MUST be valid.
-                raise ValueError(f"Generated Factur-X PDF failed compliance check: {error_msg}")
-                
-            return result_bytes
+            # Invalid document: fail now, the PDF (if still being assembled) is discarded
+            GeneratorService._check_compliance(pending.result())
+            return assembly.result()
             
         except Exception as e:
             logger.error(f"Failed to generate Factur-X PDF: {e}")
             raise ValueError(f"Factur-X PDF generation failed: {str(e)}")
+
+    @staticmethod
+    def _assemble_pdf(pdf_content: bytes, xml_bytes: bytes, metadata: InvoiceMetadata) -> bytes:
+        """Embed the XML into the PDF and convert it to PDF/A-3 (factur-x library)."""
+        logger.info("Generating Factur-X PDF...")
+        pdf_metadata = dict(PDF_METADATA, title=f'Invoice {metadata.invoice_number}')
+        if EMBED_MODE == "incremental":
+            try:
+                result_bytes = embed_xml_incremental(pdf_content, xml_bytes, metadata.profile, pdf_metadata)
+                logger.info(f"Successfully generated Factur-X PDF (incremental update) for invoice {metadata.invoice_number}")
+                return result_bytes
+            except IncrementalFallback as e:
+                logger.warning(f"Incremental embedding not possible ({e}), rewriting the PDF")
+        if not isinstance(pdf_content, bytes):
+            pdf_content = bytes(pdf_content)  # factur-x requires bytes
+        result_bytes = generate_from_binary(
+            pdf_content,  # First positional arg: input PDF bytes
+            xml_bytes,    # Second positional arg: XML bytes
+            flavor='factur-x',
+            level=metadata.profile,
+            pdf_metadata=pdf_metadata
+        )
+        logger.info(f"Successfully generated Factur-X PDF for invoice {metadata.invoice_number}")
+        return result_bytes
+
+    @staticmethod
+    def _check_compliance(validation_res: dict):
+        """Raise ValueError unless the quality gate passed. A generated invoice MUST be valid."""
+        if not validation_res["is_valid"]:
+            errors = validation_res.get("errors", [])
+            error_msg = errors[0].get("message") if errors else "Unknown validation error"
+            logger.error(f"Generated XML failed compliance check: {errors}")
+            raise ValueError(f"Generated Factur-X PDF failed compliance check: {error_msg}")
@@ -3,22 +3,50 @@ HybridValidationService: Production-grade EN 16931 validation using the Hybrid A
 
 Uses:
 - lxml for XSD structure validation (fast, secure)
-- SaxonC-HE for Schematron business rules (XSLT 3.0 compliant)
+- SaxonC-HE for Schematron business rules (XSLT 3.0 compliant), except the
+  XPath 1.0 asserts, evaluated natively on the lxml tree (FX_SCHEMATRON_ENGINE)
+
+Large invoices (FX_SCHEMATRON_SHARD_MB) are validated by several workers at
+once, each running a group of the Schematron patterns (FX_SCHEMATRON_SHARDS).
+
+Each document is validated against the ruleset of its syntax and Factur-X
+profile (select_ruleset, FX_PROFILE_RULESETS): UBL Invoice/CreditNote documents
+get the EN 16931 UBL Schematron, BASIC WL and EXTENDED CII documents the
+Factur-X 1.08 XSD and Schematron of their profile, the others the EN 16931 ones.
+
+The French BR-FR rules (2026 e-invoicing mandate) run as a third layer when
+enabled (FX_BR_FR, or br_fr per call), in the worker's SaxonC session.
+CDAR lifecycle messages are validated against the BR-FR-CDV rules alone
+(validate_cdar), many messages per worker task.
+
+Callers that only need pass/fail (the /v1/convert quality gate, mode=failfast
+on /v1/validate) pass max_errors: validation stops at that many errors and the
+result is flagged "truncated".
 
 This service is designed for use with ProcessPoolExecutor in production
-to isolate SaxonC-HE and prevent memory issues.
+to isolate SaxonC-HE and prevent memory issues. Small documents, whose
+validation costs little more than the pool round trip and the ruleset
+recompilation of recycled workers, can opt in to a single long-lived SaxonC
+thread of the main process instead (FX_VALIDATION_ENGINE, FX_THREAD_ENGINE_MAX_KB),
+at the cost of that isolation.
 """
 import logging
 import os
-from io import BytesIO
+import time
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Tuple, List, Optional, Dict, Any
-from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 import asyncio
+import threading
 
-from facturx import get_xml_from_pdf, get_level, get_flavor
 from lxml import etree
 
+from app.metrics import metrics
+from app.services.pdf_locator import get_xml_from_pdf_fast
+from app.services.schematron import plan_shards
+from app.services.syntax import NS_CDAR, SYNTAX_CII, SYNTAX_UBL, detect_level, detect_syntax
+
 logger = logging.getLogger(__name__)
 
 # Path configuration
@@ -28,6 +56,37 @@ DOCS_ROOT = PROJECT_ROOT / "docs" / "2025_12_04_FNFE_SCHEMATRONS_FR_CTC_V1.2.0"
 # Validation artifacts (relative to project)
 XSD_PATH = DOCS_ROOT / "_CII_D22B_XSD" / "CrossIndustryInvoice_100pD22B.xsd"
 XSLT_PATH = DOCS_ROOT / "_EN16931_Schematrons_V1.3.15_CII_ET_UBL" / "_XSLT" / "EN16931-CII-validation.xslt"
+SCH_PATH = DOCS_ROOT / "_EN16931_Schematrons_V1.3.15_CII_ET_UBL" / "EN16931-CII-validation-preprocessed.sch"
+
+# UBL 2.1 Invoice / CreditNote (no UBL XSD is shipped: Schematron only)
+UBL_XSLT_PATH = DOCS_ROOT / "_EN16931_Schematrons_V1.3.15_CII_ET_UBL" / "_XSLT" / "EN16931-UBL-validation.xslt"
+UBL_SCH_PATH = DOCS_ROOT / "_EN16931_Schematrons_V1.3.15_CII_ET_UBL" / "EN16931-UBL-validation-preprocessed.sch"
+
+# French BR-FR rules (Flux 2): compiled XSLT reporting through xsl:message, roles in the Schematron
+BR_FR_XSLT_PATH = DOCS_ROOT / "_XSLT_BR_FR_Flux2" / "20251114_BR-FR-Flux2-Schematron-CII_V1.2.0-compiled.xsl"
+BR_FR_SCH_PATH = DOCS_ROOT / "20251114_BR-FR-Flux2-Schematron-CII_V1.2.0.sch"
+BR_FR_UBL_XSLT_PATH = DOCS_ROOT / "_XSLT_BR_FR_Flux2" / "20251114_BR-FR-Flux2-Schematron-UBL_V1.2.0-compiled.xsl"
+BR_FR_UBL_SCH_PATH = DOCS_ROOT / "20251114_BR-FR-Flux2-Schematron-UBL_V1.2.0.sch"
+
+# French CDAR lifecycle messages (statuses of the invoices): BR-FR-CDV rules, reporting through xsl:message
+CDAR_XSLT_PATH = DOCS_ROOT / "_XSLT_BR_FR_Flux2" / "20251114_BR-FR-CDV-Schematron-CDAR_V1.2.0-compiled.xsl"
+CDAR_SCH_PATH = DOCS_ROOT / "20251114_BR-FR-CDV-Schematron-CDAR_V1.2.0.sch"
+CDAR_ROOT = f"{{{NS_CDAR}}}CrossDomainAcknowledgementAndResponse"
+FORMAT_CDAR = "cdar"
+
+# Run the BR-FR rules unless the request says otherwise
+BR_FR_ENABLED = os.getenv("FX_BR_FR", "false").lower() == "true"
+
+# Factur-X 1.08 per-profile artifacts (each XSLT reads the code lists of its *_codedb.xml, next to it)
+FACTURX_ROOT = DOCS_ROOT / "_Factur-X_XSD_et_Schematrons_V1.08"
+BASICWL_ROOT = FACTURX_ROOT / "1. Factur-X_1.08_BASICWL"
+EXTENDED_ROOT = FACTURX_ROOT / "4. Factur-X_1.08_EXTENDED"
+
+# Validate BASIC WL / EXTENDED documents against their own Factur-X ruleset rather than EN 16931
+PROFILE_RULESETS_ENABLED = os.getenv("FX_PROFILE_RULESETS", "true").lower() == "true"
+
+# "native": XPath 1.0 asserts evaluated with lxml, SaxonC only for XPath 2.0 ones; "saxon": the whole XSLT in SaxonC
+SCHEMATRON_ENGINE = os.getenv("FX_SCHEMATRON_ENGINE", "native").lower()
 
 # ProcessPool configuration
 _executor: Optional[ProcessPoolExecutor] = None
@@ -35,6 +94,69 @@ MAX_WORKERS = int(os.getenv("FX_VALIDATION_WORKERS", "2"))
 VALIDATION_TIMEOUT = int(os.getenv("FX_VALIDATION_TIMEOUT", "30"))
 MAX_TASKS_PER_CHILD = int(os.getenv("FX_MAX_TASKS_PER_CHILD", "100"))
 
+# Invoices from this size on have their Schematron patterns split across this many workers
+SCHEMATRON_SHARDS = int(os.getenv("FX_SCHEMATRON_SHARDS", str(min(MAX_WORKERS, os.cpu_count() or 1))))
+SHARD_THRESHOLD = int(float(os.getenv("FX_SCHEMATRON_SHARD_MB", "2")) * 1024 * 1024)
+
+# CDAR messages validated per worker task (the pool round trip costs more than one message)
+CDAR_CHUNK = int(os.getenv("FX_CDAR_CHUNK", "256"))
+
+# "process" (default): every validation in the process pool; opt-in "thread": in the SaxonC thread
+# of the main process; opt-in "auto": documents up to FX_THREAD_ENGINE_MAX_KB in the thread, the
+# others in the pool. The thread gives up process isolation: a SaxonC crash or runaway memory takes
+# the API process down, and a validation past its timeout keeps the only SaxonC thread busy.
+VALIDATION_ENGINE = os.getenv("FX_VALIDATION_ENGINE", "process").lower()
+THREAD_ENGINE_MAX_SIZE = int(float(os.getenv("FX_THREAD_ENGINE_MAX_KB", "64")) * 1024)
+
+# SaxonC-HE (saxonche 12) crashes when two threads of a process run it at once: one thread only
+_saxon_thread: Optional[ThreadPoolExecutor] = None
+_saxon_thread_lock = threading.Lock()
+_saxon_thread_backlog = 0  # Validations submitted to the thread and not finished
+
+
+@dataclass(frozen=True)
+class Ruleset:
+    """The XSD and Schematron XSLT a document is validated against."""
+    name: str
+    xsd_path: Optional[Path]
+    xslt_path: Path
+    sch_path: Optional[Path] = None  # Preprocessed Schematron of the XSLT, for the native engine
+    br_fr_xslt_path: Path = BR_FR_XSLT_PATH  # French rules of the same syntax
+    br_fr_sch_path: Path = BR_FR_SCH_PATH
+
+    def available(self) -> bool:
+        return (self.xsd_path is None or self.xsd_path.exists()) and self.xslt_path.exists()
+
+
+EN16931_RULESET = Ruleset("en16931", XSD_PATH, XSLT_PATH, SCH_PATH)
+UBL_RULESET = Ruleset("ubl", None, UBL_XSLT_PATH, UBL_SCH_PATH, BR_FR_UBL_XSLT_PATH, BR_FR_UBL_SCH_PATH)
+
+PROFILE_RULESETS: Dict[str, Ruleset] = {
+    "basicwl": Ruleset("basicwl", BASICWL_ROOT / "Factur-X_1.08_BASICWL.xsd",
+                       BASICWL_ROOT / "_XSLT_BASICWL" / "FACTUR-X_BASIC-WL.xslt"),
+    "extended": Ruleset("extended", EXTENDED_ROOT / "Factur-X_1.08_EXTENDED.xsd",
+                        EXTENDED_ROOT / "_XSLT_EXTENDED" / "FACTUR-X_EXTENDED.xslt"),
+}
+
+
+def select_ruleset(profile: Optional[str], syntax: str = SYNTAX_CII) -> Ruleset:
+    """
+    The ruleset of a document, from its syntax and detected Factur-X profile.
+
+    UBL documents (EN 16931 or XRechnung) get the EN 16931 UBL ruleset.
+    BASIC WL documents have no lines and EXTENDED ones go beyond EN 16931: the
+    EN 16931 ruleset reports errors on valid ones, their Factur-X ruleset does not.
+    MINIMUM, BASIC and EN16931 stay on EN 16931: Factur-X 1.08 has no MINIMUM
+    or BASIC ruleset, and its EN16931 Schematron leaves out most of the CEN
+    rules (the code lists among them).
+    """
+    if syntax == SYNTAX_UBL:
+        return UBL_RULESET
+    ruleset = PROFILE_RULESETS.get(profile) if PROFILE_RULESETS_ENABLED else None
+    if ruleset is None or not ruleset.available():
+        return EN16931_RULESET
+    return ruleset
+
 
 def _get_executor() -> ProcessPoolExecutor:
     """Get or create the validation process pool."""
@@ -48,7 +170,57 @@ def _get_executor() -> ProcessPoolExecutor:
     return _executor
 
 
-def _run_hybrid_validation(xml_content: bytes, xsd_path: str, xslt_path: str) -> Dict[str, Any]:
+def _get_saxon_thread() -> ThreadPoolExecutor:
+    """Get or create the SaxonC thread of the main process."""
+    global _saxon_thread
+    with _saxon_thread_lock:
+        if _saxon_thread is None:
+            _saxon_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="saxon")
+            logger.info("Initialized HybridValidator SaxonC thread")
+        return _saxon_thread
+
+
+def _thread_task_done(future: Future):
+    global _saxon_thread_backlog
+    with _saxon_thread_lock:
+        _saxon_thread_backlog -= 1
+
+
+def _submit(size: int, fn, *args) -> Future:
+    """
+    Run a worker function on the engine for a document of `size` bytes (FX_VALIDATION_ENGINE).
+
+    In auto mode, small documents go to the SaxonC thread unless it already has
+    as many validations waiting as the pool has workers: the pool then takes
+    them, so a burst of small documents still uses every core.
+    """
+    global _saxon_thread_backlog
+    if VALIDATION_ENGINE == "thread" or (VALIDATION_ENGINE == "auto" and size <= THREAD_ENGINE_MAX_SIZE):
+        saxon_thread = _get_saxon_thread()
+        with _saxon_thread_lock:
+            use_thread = VALIDATION_ENGINE == "thread" or _saxon_thread_backlog < MAX_WORKERS
+            if use_thread:
+                _saxon_thread_backlog += 1
+        if use_thread:
+            metrics.inc("validations_in_thread")
+            try:
+                future = saxon_thread.submit(fn, *args)
+            except BaseException:
+                with _saxon_thread_lock:
+                    _saxon_thread_backlog -= 1
+                raise
+            future.add_done_callback(_thread_task_done)
+            return future
+    metrics.inc("validations_in_process")
+    return _get_executor().submit(fn, *args)
+
+
+def _run_hybrid_validation(xml_content: bytes, xsd_path: Optional[str], xslt_path: Optional[str],
+                           sch_path: Optional[str] = None,
+                           modes: Optional[Tuple[str, ...]] = None,
+                           max_errors: Optional[int] = None,
+                           br_fr_xslt_path: Optional[str] = None,
+                           br_fr_sch_path: Optional[str] = None) -> Dict[str, Any]:
     """
     Worker function to run hybrid validation in an isolated process.
     
@@ -56,19 +228,34 @@ def _run_hybrid_validation(xml_content: bytes, xsd_path: str, xslt_path: str) ->
     1. Isolate SaxonC-HE memory from main process
     2. Prevent GIL contention
     3. Allow process recycling on memory issues
+    
+    Small documents may run it on the SaxonC thread of the main process
+    instead (see _submit).
+
+    A shard of a sharded validation only runs the patterns of `modes`
+    (the first shard also runs the XSD validation and the BR-FR rules, the
+    others get neither xsd_path nor br_fr_xslt_path).
+
+    The compiled XSD and XSLT stay cached in the worker for the next documents
+    of the same ruleset; "duration" is the time spent validating.
     """
     import sys
     import os
     
     from app.services.hybrid_validator import HybridValidator, ValidationResult
     
+    start = time.perf_counter()
     try:
         validator = HybridValidator(
-            xsd_path=xsd_path if os.path.exists(xsd_path) else None,
-            xslt_path=xslt_path if os.path.exists(xslt_path) else None
+            xsd_path=xsd_path if xsd_path and os.path.exists(xsd_path) else None,
+            xslt_path=xslt_path if xslt_path and os.path.exists(xslt_path) else None,
+            sch_path=sch_path if sch_path and os.path.exists(sch_path) else None,
+            modes=modes,
+            br_fr_xslt_path=br_fr_xslt_path if br_fr_xslt_path and os.path.exists(br_fr_xslt_path) else None,
+            br_fr_sch_path=br_fr_sch_path if br_fr_sch_path and os.path.exists(br_fr_sch_path) else None
         )
         
-        result = validator.validate(xml_content)
+        result = validator.validate(xml_content, max_errors)
         
         return {
             "is_valid": result.is_valid,
@@ -76,6 +263,8 @@ def _run_hybrid_validation(xml_content: bytes, xsd_path: str, xslt_path: str) ->
             "schematron_valid": result.schematron_valid,
             "error_count": result.error_count,
             "warning_count": result.warning_count,
+            "truncated": result.truncated,
+            "duration": time.perf_counter() - start,
             "errors": [
                 {
                     "rule_id": e.rule_id,
@@ -97,6 +286,34 @@ def _run_hybrid_validation(xml_content: bytes, xsd_path: str, xslt_path: str) ->
         }
 
 
+def _run_cdar_validation(messages: List[bytes], xslt_path: str, sch_path: Optional[str] = None,
+                         max_errors: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Worker function validating CDAR messages against the BR-FR-CDV rules, one result each.
+
+    A chunk of messages is one task: the rules compiled in the worker serve all of them.
+    """
+    return [_run_hybrid_validation(xml_content, None, None, max_errors=max_errors,
+                                   br_fr_xslt_path=xslt_path, br_fr_sch_path=sch_path)
+            for xml_content in messages]
+
+
+def _chunk_item(chunk: Future, index: int) -> Future:
+    """A future for the index-th result of a chunk of validations."""
+    item: Future = Future()
+
+    def chunk_done(future: Future):
+        if not item.set_running_or_notify_cancel():
+            return
+        try:
+            item.set_result(future.result()[index])
+        except BaseException as e:
+            item.set_exception(e)
+
+    chunk.add_done_callback(chunk_done)
+    return item
+
+
 class HybridValidationService:
     """
     Production-grade validation service using the Hybrid Architecture.
@@ -123,38 +340,44 @@ class HybridValidationService:
         recover=False
     )
     
+    @staticmethod
+    def empty_result() -> Dict[str, Any]:
+        return {
+            "is_valid": False,
+            "format_detected": None,
+            "profile_detected": None,
+            "ruleset": None,  # Ruleset the document was validated against (see select_ruleset)
+            "xsd_valid": None,
+            "schematron_valid": None,
+            "errors": [],
+            "truncated": False,  # Stopped at max_errors: more errors may exist
+            "validation_mode": "hybrid"  # vs "lite" for Community fallback
+        }
+
     @classmethod
-    def validate(cls, file_content: bytes, filename: str) -> Dict[str, Any]:
+    def validate(cls, file_content: bytes, filename: str, max_errors: Optional[int] = None,
+                 br_fr: Optional[bool] = None) -> Dict[str, Any]:
         """
-        Validate a Factur-X PDF or XML file synchronously.
+        Validate a Factur-X PDF or a CII/UBL XML file synchronously.
         
         Args:
-            file_content: Raw file bytes
+            file_content: Raw file content (bytes, memoryview or mmap)
             filename: Original filename for type detection
+            max_errors: Stop at this many errors (None: full report)
+            br_fr: Also run the French BR-FR rules (None: FX_BR_FR)
             
         Returns:
             Dict with validation results
         """
-        result = {
-            "is_valid": False,
-            "format_detected": None,
-            "profile_detected": None,
-            "xsd_valid": None,
-            "schematron_valid": None,
-            "errors": [],
-            "validation_mode": "hybrid"  # vs "lite" for Community fallback
-        }
+        result = cls.empty_result()
         
         try:
             # 1. Extract XML if PDF
-            is_pdf = filename.lower().endswith('.pdf') or file_content.startswith(b'%PDF')
+            is_pdf = filename.lower().endswith('.pdf') or bytes(file_content[:4]) == b'%PDF'
             
             if is_pdf:
                 try:
-                    xml_filename, xml_content = get_xml_from_pdf(
-                        BytesIO(file_content),
-                        check_xsd=False
-                    )
+                    xml_filename, xml_content = get_xml_from_pdf_fast(file_content)
                     if not xml_content:
                         result["errors"].append({
                             "rule_id": "FX-NO-XML",
@@ -172,13 +395,120 @@ class HybridValidationService:
                     })
                     return result
             else:
-                xml_content = file_content
+                xml_content = bytes(file_content)
             
-            # 2. Detect format/profile
-            try:
+            return cls.submit_xml(xml_content, max_errors=max_errors, br_fr=br_fr).result()
+            
+        except Exception as e:
+            logger.exception(f"Unexpected validation error: {e}")
+            result["errors"].append({
+                "rule_id": "FX-INTERNAL",
+                "message": f"Internal error: {e}",
+                "severity": "error",
+                "layer": "system"
+            })
+            return result
+
+    @classmethod
+    def submit_xml(cls, xml_content: bytes, xml_etree: Optional[etree._Element] = None,
+                   max_errors: Optional[int] = None, br_fr: Optional[bool] = None) -> "PendingValidation":
+        """
+        Detect format/profile and submit the XML to the process pool without waiting.
+        
+        Callers can do other work (JSON mapping, PDF assembly) while the
+        worker validates, then call .result() on the returned handle.
+        
+        Args:
+            xml_content: Factur-X/CII XML bytes
+            xml_etree: Already parsed root element, to avoid parsing twice
+            max_errors: Stop at this many errors (None: full report)
+            br_fr: Also run the French BR-FR rules (None: FX_BR_FR)
+        """
+        result = cls.empty_result()
+        if br_fr is None:
+            br_fr = BR_FR_ENABLED
+        
+        # 2. Detect syntax (root element) and profile
+        try:
+            if xml_etree is None:
                 xml_etree = etree.fromstring(xml_content, parser=cls._SECURE_PARSER)
-                result["format_detected"] = get_flavor(xml_etree)
-                result["profile_detected"] = get_level(xml_etree)
+            result["format_detected"] = detect_syntax(xml_etree)
+            result["profile_detected"] = detect_level(xml_etree, result["format_detected"])
+        except Exception as e:
+            result["errors"].append({
+                "rule_id": "FX-PARSE-ERROR",
+                "message": f"Invalid XML: {e}",
+                "severity": "error",
+                "layer": "xsd"
+            })
+            return PendingValidation(result)
+        
+        # 3. Check if hybrid validation is available
+        ruleset = select_ruleset(result["profile_detected"], result["format_detected"])
+        xsd_available = ruleset.xsd_path is not None and ruleset.xsd_path.exists()
+        xslt_available = ruleset.xslt_path.exists()
+        
+        if not xsd_available and not xslt_available:
+            logger.warning("No validation schemas found - falling back to basic validation")
+            result["validation_mode"] = "lite"
+            result["is_valid"] = True  # Basic parse succeeded
+            return PendingValidation(result)
+        
+        # 4. Run hybrid validation in process pool, sharded by Schematron pattern for large invoices
+        result["ruleset"] = ruleset.name
+        try:
+            shards = [None]
+            if (SCHEMATRON_SHARDS > 1 and len(xml_content) >= SHARD_THRESHOLD and xslt_available
+                    and VALIDATION_ENGINE != "thread"):
+                shards = plan_shards(str(ruleset.xslt_path), SCHEMATRON_SHARDS)
+            futures = [
+                _submit(
+                    len(xml_content),
+                    _run_hybrid_validation,
+                    xml_content,
+                    str(ruleset.xsd_path) if index == 0 and xsd_available else None,
+                    str(ruleset.xslt_path),
+                    str(ruleset.sch_path) if ruleset.sch_path and SCHEMATRON_ENGINE == "native" else None,
+                    modes,
+                    max_errors,
+                    str(ruleset.br_fr_xslt_path) if br_fr and index == 0 else None,
+                    str(ruleset.br_fr_sch_path) if br_fr and index == 0 else None
+                )
+                for index, modes in enumerate(shards)
+            ]
+            future = futures[0] if len(futures) == 1 else _gather_shards(futures, max_errors)
+        except Exception as e:
+            result["errors"].append({
+                "rule_id": "FX-POOL-ERROR",
+                "message": f"Process pool error: {e}",
+                "severity": "error",
+                "layer": "system"
+            })
+            return PendingValidation(result)
+        return PendingValidation(result, future)
+    
+    @classmethod
+    def validate_cdar(cls, messages: List[bytes], max_errors: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Validate CDAR lifecycle messages (CrossDomainAcknowledgementAndResponse) against the
+        French BR-FR-CDV rules.
+
+        The messages are spread over the pool workers, CDAR_CHUNK per task.
+
+        Args:
+            messages: Raw XML of each message
+            max_errors: Stop at this many errors per message (None: full report)
+
+        Returns:
+            One validation result dict per message, in input order
+        """
+        results, pending, unchecked = [], [], 0
+        has_rules = CDAR_XSLT_PATH.exists()
+        for xml_content in messages:
+            result = cls.empty_result()
+            results.append(result)
+            try:
+                root = etree.fromstring(xml_content, parser=cls._SECURE_PARSER)
             except Exception as e:
                 result["errors"].append({
                     "rule_id": "FX-PARSE-ERROR",
@@ -186,71 +516,54 @@ class HybridValidationService:
                     "severity": "error",
                     "layer": "xsd"
                 })
-                return result
-            
-            # 3. Check if hybrid validation is available
-            xsd_available = XSD_PATH.exists()
-            xslt_available = XSLT_PATH.exists()
-            
-            if not xsd_available and not xslt_available:
-                logger.warning("No validation schemas found - falling back to basic validation")
+                continue
+            if root.tag != CDAR_ROOT:
+                result["errors"].append({
+                    "rule_id": "FX-NOT-CDAR",
+                    "message": f"Not a CDAR message: root element {root.tag!r}, "
+                               f"expected CrossDomainAcknowledgementAndResponse",
+                    "severity": "error",
+                    "layer": "system"
+                })
+                continue
+            result["format_detected"] = FORMAT_CDAR
+            if not has_rules:
                 result["validation_mode"] = "lite"
                 result["is_valid"] = True  # Basic parse succeeded
-                return result
-            
-            # 4. Run hybrid validation in process pool
-            executor = _get_executor()
-            
+                unchecked += 1
+                continue
+            result["ruleset"] = FORMAT_CDAR
+            pending.append((result, xml_content))
+
+        if unchecked:
+            logger.warning(f"No CDAR rules found - falling back to basic validation for {unchecked} message(s)")
+        chunk_size = max(1, min(CDAR_CHUNK, -(-len(pending) // MAX_WORKERS)))
+        handles = []
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
             try:
-                future = executor.submit(
-                    _run_hybrid_validation,
-                    xml_content,
-                    str(XSD_PATH),
-                    str(XSLT_PATH)
+                future = _submit(
+                    max(len(xml_content) for _, xml_content in chunk),
+                    _run_cdar_validation,
+                    [xml_content for _, xml_content in chunk],
+                    str(CDAR_XSLT_PATH),
+                    str(CDAR_SCH_PATH) if CDAR_SCH_PATH.exists() else None,
+                    max_errors
                 )
-                validation_result = future.result(timeout=VALIDATION_TIMEOUT)
-                
-                if "error" in validation_result:
+            except Exception as e:
+                for result, _ in chunk:
                     result["errors"].append({
-                        "rule_id": "FX-HYBRID-ERROR",
-                        "message": validation_result["error"],
+                        "rule_id": "FX-POOL-ERROR",
+                        "message": f"Process pool error: {e}",
                         "severity": "error",
                         "layer": "system"
                     })
-                    return result
-                
-                result["is_valid"] = validation_result["is_valid"]
-                result["xsd_valid"] = validation_result["xsd_valid"]
-                result["schematron_valid"] = validation_result["schematron_valid"]
-                result["errors"] = validation_result["errors"]
-                
-            except FuturesTimeoutError:
-                result["errors"].append({
-                    "rule_id": "FX-TIMEOUT",
-                    "message": f"Validation timed out after {VALIDATION_TIMEOUT}s",
-                    "severity": "error",
-                    "layer": "system"
-                })
-            except Exception as e:
-                result["errors"].append({
-                    "rule_id": "FX-POOL-ERROR",
-                    "message": f"Process pool error: {e}",
-                    "severity": "error",
-                    "layer": "system"
-                })
-            
-            return result
-            
-        except Exception as e:
-            logger.exception(f"Unexpected validation error: {e}")
-            result["errors"].append({
-                "rule_id": "FX-INTERNAL",
-                "message": f"Internal error: {e}",
-                "severity": "error",
-                "layer": "system"
-            })
-            return result
-    
+                continue
+            handles += [PendingValidation(result, _chunk_item(future, index)) for index, (result, _) in enumerate(chunk)]
+        for handle in handles:
+            handle.result()
+        return results
+
     @classmethod
     async def validate_async(cls, file_content: bytes, filename: str) -> Dict[str, Any]:
         """
@@ -269,10 +582,146 @@ class HybridValidationService:
         )
 
 
+def _is_error(error: Dict[str, Any]) -> bool:
+    return error["severity"].lower() in ("error", "fatal")
+
+
+def truncate_report(result: Dict[str, Any], max_errors: Optional[int]) -> Dict[str, Any]:
+    """A validation result cut after its max_errors-th error, flagged "truncated" (a copy if cut)."""
+    if max_errors is None:
+        return result
+    blocking = [index for index, e in enumerate(result["errors"]) if _is_error(e)]
+    if len(blocking) < max_errors:
+        return result
+    return dict(result, errors=result["errors"][:blocking[max_errors - 1] + 1], truncated=True)
+
+
+def _merge_shards(results: List[Dict[str, Any]], max_errors: Optional[int] = None) -> Dict[str, Any]:
+    """
+    The worker result of a whole validation from the results of its shards, in shard order.
+
+    The shards hold consecutive patterns: their failures, concatenated, are in SVRL order.
+    A dynamic error stops the whole Schematron, as it would have in one transform.
+    With max_errors, a failed XSD (first shard) stands for the whole result, and the
+    failures stop at the max_errors-th error.
+    """
+    for result in results:
+        if "error" in result:
+            return result
+    if results[0]["truncated"] and not results[0]["xsd_valid"]:
+        return results[0]
+    br_fr = [e for e in results[0]["errors"] if e["layer"] == "br-fr" or e["rule_id"] == "SYS-BR-FR"]
+    errors = [e for e in results[0]["errors"]
+              if e["layer"] not in ("schematron", "br-fr") and e["rule_id"] not in ("SYS-SAXON", "SYS-BR-FR")]
+    stopped = [e for result in results for e in result["errors"] if e["rule_id"] == "SYS-SAXON"]
+    errors += stopped[:1] or [e for result in results for e in result["errors"] if e["layer"] == "schematron"]
+    errors += br_fr  # Run by the first shard, reported after EN 16931 as in one validation
+    schematron_valid = all(result["schematron_valid"] for result in results)
+    merged = truncate_report({
+        "is_valid": results[0]["xsd_valid"] and schematron_valid,
+        "xsd_valid": results[0]["xsd_valid"],
+        "schematron_valid": schematron_valid,
+        "truncated": False,
+        "duration": max(result["duration"] for result in results),  # The shards run side by side
+        "errors": errors,
+    }, max_errors)
+    merged["error_count"] = len([e for e in merged["errors"] if _is_error(e)])
+    merged["warning_count"] = len([e for e in merged["errors"] if e["severity"].lower() == "warning"])
+    return merged
+
+
+def _gather_shards(futures: List[Future], max_errors: Optional[int] = None) -> Future:
+    """One future for the shards of a validation, resolved with their merged result."""
+    gathered: Future = Future()
+    pending = set(futures)
+    lock = threading.Lock()
+
+    def shard_done(future: Future):
+        with lock:
+            pending.discard(future)
+            if pending:
+                return
+        if not gathered.set_running_or_notify_cancel():
+            return
+        try:
+            gathered.set_result(_merge_shards([f.result() for f in futures], max_errors))
+        except BaseException as e:
+            gathered.set_exception(e)
+
+    def cancel_shards(future: Future):
+        if future.cancelled():
+            for shard in futures:
+                shard.cancel()
+
+    gathered.add_done_callback(cancel_shards)
+    for future in futures:
+        future.add_done_callback(shard_done)
+    return gathered
+
+
+class PendingValidation:
+    """Handle on a validation submitted with HybridValidationService.submit_xml()."""
+
+    def __init__(self, result: Dict[str, Any], future: Optional[Future] = None):
+        self._result = result
+        self.future = future
+
+    def result(self, timeout: Optional[float] = VALIDATION_TIMEOUT) -> Dict[str, Any]:
+        """Wait for the worker (if any) and return the validation result dict."""
+        result = self._result
+        if self.future is None:
+            return result
+        
+        try:
+            validation_result = self.future.result(timeout=timeout)
+            
+            if "error" in validation_result:
+                result["errors"].append({
+                    "rule_id": "FX-HYBRID-ERROR",
+                    "message": validation_result["error"],
+                    "severity": "error",
+                    "layer": "system"
+                })
+                return result
+            
+            result["is_valid"] = validation_result["is_valid"]
+            result["xsd_valid"] = validation_result["xsd_valid"]
+            result["schematron_valid"] = validation_result["schematron_valid"]
+            result["errors"] = validation_result["errors"]
+            result["truncated"] = validation_result["truncated"]
+            metrics.observe_labeled("validation_duration_seconds",
+                                    result["profile_detected"] or result["format_detected"] or "unknown",
+                                    validation_result["duration"])
+            
+        except FuturesTimeoutError:
+            result["errors"].append({
+                "rule_id": "FX-TIMEOUT",
+                "message": f"Validation timed out after {timeout}s",
+                "severity": "error",
+                "layer": "system"
+            })
+        except Exception as e:
+            result["errors"].append({
+                "rule_id": "FX-POOL-ERROR",
+                "message": f"Process pool error: {e}",
+                "severity": "error",
+                "layer": "system"
+            })
+        finally:
+            # Never merge twice
+            self.future = None
+        
+        return result
+
+
 def shutdown_executor():
-    """Cleanup function to shutdown the process pool gracefully."""
-    global _executor
+    """Cleanup function to shutdown the process pool and the SaxonC thread gracefully."""
+    global _executor, _saxon_thread
     if _executor:
         _executor.shutdown(wait=True)
         _executor = None
         logger.info("HybridValidator ProcessPool shutdown complete")
+    if _saxon_thread:
+        _saxon_thread.shutdown(wait=True)
+        _saxon_thread = None
+        logger.info("HybridValidator SaxonC thread shutdown complete")
@@ -1,16 +1,21 @@
 import os
 import logging
 from enum import Enum
-from typing import List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from lxml import etree
 from saxonche import PySaxonProcessor
 
+from app.services.schematron import (BLOCKING_ROLES, Failure, assert_roles, error_count, load_schematron,
+                                     parse_messages, parse_svrl, split_stylesheet, targeted_stylesheet, truncate)
+
 logger = logging.getLogger(__name__)
 
 class ValidationLayer(Enum):
     XSD = "xsd"
     SCHEMATRON = "schematron"
+    BR_FR = "br-fr"
     SYSTEM = "system"
 
 @dataclass
@@ -27,6 +32,7 @@ class ValidationResult:
     xsd_valid: bool
     schematron_valid: bool
     errors: List[ValidationError]
+    truncated: bool = False  # max_errors reached: more errors may exist
     
     @property
     def error_count(self) -> int:
@@ -41,30 +47,62 @@ class HybridValidator:
     Hybrid Validation Engine:
     - XSD: lxml (fast, standard)
     - Schematron: SaxonC-HE (official EU rules, XSLT 3.0)
+
+    With sch_path (the preprocessed Schematron the XSLT was compiled from),
+    the XPath 1.0 asserts run natively on the lxml tree (app/services/schematron.py)
+    and SaxonC-HE only runs the asserts that need XPath 2.0.
+
+    With modes (see schematron.plan_shards), only the Schematron patterns of
+    those XSLT modes run: one shard of a sharded validation.
+
+    validate(max_errors=N) stops at N errors, for callers that only need to
+    know whether the document is valid (N=1) or want a bounded report:
+    Schematron is skipped when the XSD errors already reach N, and otherwise
+    stops once the XSD errors and failed asserts add up to N.
+
+    With br_fr_xslt_path, the French BR-FR rules (reported through xsl:message,
+    their roles read from br_fr_sch_path) run after EN 16931, on the document
+    SaxonC already parsed. Their failures are in the BR_FR layer.
+
+    The XSD and the stylesheets are compiled on first use and kept for the
+    life of the process (load_xsd, saxon_executable).
     """
-    def __init__(self, xsd_path: Optional[str] = None, xslt_path: Optional[str] = None):
+    def __init__(self, xsd_path: Optional[str] = None, xslt_path: Optional[str] = None,
+                 sch_path: Optional[str] = None, modes: Optional[Tuple[str, ...]] = None,
+                 br_fr_xslt_path: Optional[str] = None, br_fr_sch_path: Optional[str] = None):
         self.xsd_path = xsd_path
         self.xslt_path = xslt_path
+        self.sch_path = sch_path
+        self.modes = tuple(modes) if modes is not None else None
+        self.br_fr_xslt_path = br_fr_xslt_path
+        self.br_fr_sch_path = br_fr_sch_path
 
-    def validate(self, xml_content: bytes) -> ValidationResult:
+    def validate(self, xml_content: bytes, max_errors: Optional[int] = None) -> ValidationResult:
         errors = []
         xsd_valid = True
         schematron_valid = True
+        truncated = False
+        doc = None
+        input_node = None
+
+        def parsed_input():
+            """The document parsed for SaxonC, once for all the stylesheets."""
+            nonlocal input_node
+            if input_node is None:
+                input_node = saxon_processor().parse_xml(xml_text=xml_content.decode('utf-8-sig'))
+            return input_node
         
         # 1. XSD Validation via lxml
         if self.xsd_path and os.path.exists(self.xsd_path):
             try:
-                # Security: Load XSD with strict parser
-                schema_doc = etree.parse(self.xsd_path)
-                schema = etree.XMLSchema(schema_doc)
+                schema = load_xsd(self.xsd_path)
                 
                 # Parse XML to validate
-                parser = etree.XMLParser(resolve_entities=False, no_network=True)
-                doc = etree.fromstring(xml_content, parser=parser)
+                doc = etree.fromstring(xml_content, parser=self._parser())
                 
                 if not schema.validate(doc):
                     xsd_valid = False
-                    for err in schema.error_log:
+                    for err in list(schema.error_log)[:max_errors]:
                         errors.append(ValidationError(
                             rule_id="XSD-INVALID",
                             message=err.message,
@@ -76,56 +114,139 @@ class HybridValidator:
                 logger.error(f"XSD Engine Error: {e}")
                 errors.append(ValidationError("SYS-XSD", str(e), "", "error", ValidationLayer.SYSTEM))
                 xsd_valid = False
+        truncated = max_errors is not None and len(errors) >= max_errors
+        # Errors left to the Schematron once the XSD ones are counted
+        cap = max_errors - len(errors) if max_errors is not None else None
 
-        # 2. Schematron Validation via SaxonC-HE
-        if self.xslt_path and os.path.exists(self.xslt_path):
+        # 2. Schematron Validation: native XPath 1.0 asserts + SaxonC-HE (not worth it once the XSD reached the cap)
+        if self.xslt_path and os.path.exists(self.xslt_path) and not truncated:
             try:
-                # We use a context manager to ensure Saxon resources are released
-                # Note: ProcessPool isolation handles memory management at a higher level
-                with PySaxonProcessor(license=False) as proc:
-                    # Security: Hardening against external entities
-                    proc.set_configuration_property("http://saxon.sf.net/feature/parserFeature?uri=http://xml.org/sax/features/external-general-entities", "false")
-                    proc.set_configuration_property("http://saxon.sf.net/feature/parserFeature?uri=http://xml.org/sax/features/external-parameter-entities", "false")
-                    
-                    xsltproc = proc.new_xslt30_processor()
-                    executable = xsltproc.compile_stylesheet(stylesheet_file=self.xslt_path)
-                    
-                    # Run transformation
-                    input_node = proc.parse_xml(xml_text=xml_content.decode('utf-8'))
-                    svrl_result = executable.transform_to_string(xdm_node=input_node)
-                    
-                    # Parse SVRL (Schematron Validation Report Language)
-                    svrl_doc = etree.fromstring(svrl_result.encode('utf-8'))
-                    ns = {"svrl": "http://purl.oclc.org/dsdl/svrl"}
-                    
-                    failed_asserts = svrl_doc.xpath("//svrl:failed-assert", namespaces=ns)
-                    for fa in failed_asserts:
-                        role = (fa.get("role") or "error").lower()
-                        # Blocking errors: error, fatal, or undefined
-                        is_error = role in ("error", "fatal")
-                        
-                        if is_error:
-                            schematron_valid = False
-                        
-                        text_nodes = fa.xpath("svrl:text", namespaces=ns)
-                        msg = text_nodes[0].text if text_nodes else "Rule violation"
-                        
-                        errors.append(ValidationError(
-                            rule_id=fa.get("id", "RULE-FAIL"),
-                            message=msg.strip(),
-                            location=fa.get("location", ""),
-                            severity=role,
-                            layer=ValidationLayer.SCHEMATRON
-                        ))
+                if self.sch_path and os.path.exists(self.sch_path):
+                    rules = load_schematron(self.sch_path, self.xslt_path)
+                    if doc is None:
+                        doc = etree.fromstring(xml_content, parser=self._parser())
+                    failures = rules.evaluate(doc, self.modes, cap)
+                    stylesheet = rules.stylesheet(self.modes)
+                    remaining = cap - error_count(failures) if cap is not None else None
+                    if stylesheet is not None and (remaining is None or remaining > 0):
+                        failures += self._run_saxon(parsed_input(), stylesheet_text=stylesheet, max_errors=remaining,
+                                                    base_dir=os.path.dirname(self.xslt_path))
+                    failures = rules.sort(doc, failures)
+                elif self.modes is not None:
+                    failures = self._run_saxon(parsed_input(), stylesheet_text=split_stylesheet(self.xslt_path, self.modes),
+                                               max_errors=cap, base_dir=os.path.dirname(self.xslt_path))
+                else:
+                    failures = self._run_saxon(parsed_input(), stylesheet_file=self.xslt_path, max_errors=cap)
+                failures = truncate(failures, cap)
+                truncated = cap is not None and error_count(failures) >= cap
+
+                for failure in failures:
+                    # Blocking errors: error, fatal, or undefined
+                    if failure.role in BLOCKING_ROLES:
+                        schematron_valid = False
+                    errors.append(ValidationError(
+                        rule_id=failure.rule_id,
+                        message=failure.message,
+                        location=failure.location,
+                        severity=failure.role,
+                        layer=ValidationLayer.SCHEMATRON
+                    ))
                         
             except Exception as e:
                 logger.error(f"Saxon Execution Error: {e}")
                 errors.append(ValidationError("SYS-SAXON", str(e), "", "error", ValidationLayer.SYSTEM))
                 schematron_valid = False
+
+        # 3. French BR-FR rules, in the same SaxonC session
+        if self.br_fr_xslt_path and os.path.exists(self.br_fr_xslt_path) and not truncated:
+            try:
+                remaining = max_errors - len([e for e in errors if e.severity in BLOCKING_ROLES]) \
+                    if max_errors is not None else None
+                roles = assert_roles(self.br_fr_sch_path) if self.br_fr_sch_path else {}
+                failures = self._run_saxon_messages(parsed_input(), self.br_fr_xslt_path, roles, remaining)
+                truncated = max_errors is not None and error_count(failures) >= remaining
+                for failure in failures:
+                    if failure.role in BLOCKING_ROLES:
+                        schematron_valid = False
+                    errors.append(ValidationError(failure.rule_id, failure.message, failure.location, failure.role,
+                                                  ValidationLayer.BR_FR))
+            except Exception as e:
+                logger.error(f"BR-FR Execution Error: {e}")
+                errors.append(ValidationError("SYS-BR-FR", str(e), "", "error", ValidationLayer.SYSTEM))
+                schematron_valid = False
                 
         return ValidationResult(
             is_valid=xsd_valid and schematron_valid,
             xsd_valid=xsd_valid,
             schematron_valid=schematron_valid,
-            errors=errors
+            errors=errors,
+            truncated=truncated
         )
+
+    @staticmethod
+    def _parser() -> etree.XMLParser:
+        return etree.XMLParser(resolve_entities=False, no_network=True)
+
+    @staticmethod
+    def _run_saxon(input_node, stylesheet_file: Optional[str] = None,
+                   stylesheet_text: Optional[str] = None, max_errors: Optional[int] = None,
+                   base_dir: Optional[str] = None) -> List[Failure]:
+        """
+        Failed asserts of the SVRL produced by a Schematron XSLT (up to max_errors errors).
+
+        base_dir resolves the relative document() calls of a stylesheet given as text
+        (the Factur-X code lists next to their XSLT).
+        """
+        executable = saxon_executable(stylesheet_file, stylesheet_text, base_dir)
+
+        # Run transformation
+        svrl_result = executable.transform_to_string(xdm_node=input_node)
+
+        # Parse SVRL (Schematron Validation Report Language)
+        return parse_svrl(svrl_result.encode('utf-8'), max_errors)
+
+    @staticmethod
+    def _run_saxon_messages(input_node, stylesheet_file: str, roles: Dict[str, str],
+                            max_errors: Optional[int] = None) -> List[Failure]:
+        """
+        Failed asserts of a Schematron XSLT reporting through xsl:message (up to max_errors errors).
+
+        The patterns are only applied to the nodes their rules may match (targeted_stylesheet).
+        """
+        executable = saxon_executable(stylesheet_text=targeted_stylesheet(stylesheet_file),
+                                      base_dir=os.path.dirname(stylesheet_file))
+        # Collected instead of written to stderr (the executable is shared by the documents of the worker)
+        executable.set_save_xsl_message(True, os.devnull)
+        executable.clear_xsl_messages()
+        executable.transform_to_string(xdm_node=input_node)
+        messages = executable.get_xsl_messages()
+        texts = [messages.item_at(index).string_value for index in range(messages.size)] if messages else []
+        return parse_messages(texts, roles, max_errors)
+
+
+@lru_cache(maxsize=None)
+def load_xsd(xsd_path: str) -> etree.XMLSchema:
+    """Compiled XSD, once per process."""
+    return etree.XMLSchema(etree.parse(xsd_path))
+
+
+@lru_cache(maxsize=None)
+def saxon_processor() -> PySaxonProcessor:
+    """The SaxonC-HE processor of the process (ProcessPool isolation bounds its memory)."""
+    proc = PySaxonProcessor(license=False)
+    # Security: Hardening against external entities
+    proc.set_configuration_property("http://saxon.sf.net/feature/parserFeature?uri=http://xml.org/sax/features/external-general-entities", "false")
+    proc.set_configuration_property("http://saxon.sf.net/feature/parserFeature?uri=http://xml.org/sax/features/external-parameter-entities", "false")
+    return proc
+
+
+@lru_cache(maxsize=None)
+def saxon_executable(stylesheet_file: Optional[str] = None, stylesheet_text: Optional[str] = None,
+                     base_dir: Optional[str] = None):
+    """Compiled Schematron XSLT (from a file, or as text resolving relative URIs in base_dir), once per process."""
+    xsltproc = saxon_processor().new_xslt30_processor()
+    if stylesheet_text is not None:
+        if base_dir is not None:
+            xsltproc.set_cwd(base_dir)
+        return xsltproc.compile_stylesheet(stylesheet_text=stylesheet_text)
+    return xsltproc.compile_stylesheet(stylesheet_file=stylesheet_file)
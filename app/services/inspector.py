@@ -0,0 +1,83 @@
+"""
+Inspection service: extraction + validation of one document in a single pass.
+
+The XML is located and parsed once. Validation is submitted to the hybrid
+process pool first, then the JSON mapping runs in the calling thread, so the
+latency is max(validation, mapping) instead of their sum.
+"""
+import logging
+from typing import Any, Dict
+
+from lxml import etree
+
+from app.services.extractor import ExtractionService
+from app.services.hybrid_validation_service import HybridValidationService
+
+logger = logging.getLogger(__name__)
+
+# Extraction error code -> (validation rule_id, message prefix) when no XML could be read
+_LOCATE_ERRORS = {
+    "NO_XML": ("FX-NO-XML", "No Factur-X/ZUGFeRD XML found in PDF"),
+    "EXTRACTION_FAIL": ("FX-EXTRACT-FAIL", "Failed to extract XML"),
+    "NOT_A_PDF": ("FX-PARSE-ERROR", "Invalid XML"),
+}
+
+
+class InspectionService:
+    """Runs ExtractionService and HybridValidationService on a single extraction."""
+
+    @staticmethod
+    def inspect(file_content: bytes, filename: str) -> Dict[str, Any]:
+        """
+        Extract and validate a Factur-X PDF or bare XML file.
+
+        Args:
+            file_content: Raw file content (bytes, memoryview or mmap).
+            filename: Original filename.
+
+        Returns:
+            {"extraction": <ExtractionService result>, "validation": <HybridValidationService result>}
+        """
+        extraction = ExtractionService.empty_result()
+
+        xml_content = ExtractionService.locate_xml(file_content, filename, extraction)
+        if xml_content is None:
+            return {"extraction": extraction, "validation": InspectionService._locate_failure(extraction)}
+        xml_content = bytes(xml_content)  # Sent to the worker process
+
+        try:
+            xml_root = etree.fromstring(xml_content, parser=ExtractionService._SECURE_PARSER)
+        except Exception as e:
+            extraction["errors"].append({"code": "PARSE_ERROR", "message": str(e)})
+            validation = HybridValidationService.empty_result()
+            validation["errors"].append({
+                "rule_id": "FX-PARSE-ERROR",
+                "message": f"Invalid XML: {e}",
+                "severity": "error",
+                "layer": "xsd"
+            })
+            return {"extraction": extraction, "validation": validation}
+
+        # Validation runs in the pool while the mapping runs here
+        pending = HybridValidationService.submit_xml(xml_content, xml_root)
+        try:
+            ExtractionService.map_xml(xml_root, filename, extraction)
+        finally:
+            validation = pending.result()
+
+        return {"extraction": extraction, "validation": validation}
+
+    @staticmethod
+    def _locate_failure(extraction: Dict[str, Any]) -> Dict[str, Any]:
+        """Validation report mirroring HybridValidationService.validate() when no XML is available."""
+        validation = HybridValidationService.empty_result()
+        for error in extraction["errors"]:
+            rule_id, prefix = _LOCATE_ERRORS.get(error["code"], ("FX-INTERNAL", "Internal error"))
+            message = prefix if error["code"] == "NO_XML" else f"{prefix}: {error['message']}"
+            validation["errors"].append({
+                "rule_id": rule_id,
+                "message": message,
+                "severity": "error",
+                "layer": "xsd" if rule_id == "FX-PARSE-ERROR" else "system"
+            })
+        return validation
@@ -0,0 +1,305 @@
+"""
+Incremental-update embedding of the Factur-X XML (FX_EMBED_MODE=incremental).
+
+facturx.generate_from_binary() loads the whole PDF with pypdf and serializes
+every object again, so its cost grows with the PDF (scanned pages, images).
+This module leaves the original bytes untouched and appends one incremental
+update section (ISO 32000-1, 7.5.6) holding only:
+
+1. the embedded XML stream, its Filespec and the /AF array,
+2. the XMP metadata stream (same content as the factur-x library writes),
+3. an sRGB /OutputIntents entry, unless the document already has one,
+   (2 and 3 are prebuilt once per process, see pdfa_assets)
+4. new versions of the Catalog and the Info dictionary,
+5. an xref section of the same kind as the original (table or stream),
+   chained to it with /Prev.
+
+The work is proportional to the XML size. Anything unusual (encryption,
+broken xref, unexpected catalog...) raises IncrementalFallback and callers
+use generate_from_binary().
+"""
+import hashlib
+import logging
+import mmap
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from facturx.facturx import FACTURX_FILENAME, _get_pdf_timestamp
+
+from app.services.pdf_locator import LocatorFallback, _Name, _PdfIndex, _Ref
+from app.services.pdfa_assets import SRGB_IDENTIFIER, info_entries, srgb_icc_profile, xmp_metadata
+
+logger = logging.getLogger(__name__)
+
+MIN_PDF_VERSION = (1, 6)  # Same header version as the factur-x library output
+
+_NAME_DELIMITERS = b"()<>[]{}/%#"
+
+
+class IncrementalFallback(Exception):
+    """Raised when a PDF cannot be updated incrementally; use generate_from_binary()."""
+
+
+# --- Serialization ---
+
+def _name(value: str) -> bytes:
+    out = bytearray(b"/")
+    for byte in value.encode("latin-1"):
+        if 0x21 <= byte <= 0x7E and byte not in _NAME_DELIMITERS:
+            out.append(byte)
+        else:
+            out += b"#%02X" % byte
+    return bytes(out)
+
+
+def _literal(value: bytes) -> bytes:
+    return b"(" + value.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").replace(b"\r", b"\\r") + b")"
+
+
+def _text(value: str) -> bytes:
+    """PDF text string: ASCII as-is, anything else as UTF-16BE with BOM."""
+    try:
+        return value.encode("ascii")
+    except UnicodeEncodeError:
+        return b"\xfe\xff" + value.encode("utf-16-be")
+
+
+def _real(value: float) -> bytes:
+    return (b"%.6f" % value).rstrip(b"0").rstrip(b".") or b"0"
+
+
+def _serialize(value: Any) -> bytes:
+    """Serialize a value read by pdf_locator._Lexer (or built here) back to PDF syntax."""
+    if isinstance(value, _Name):
+        return _name(value)
+    if value is True:
+        return b"true"
+    if value is False:
+        return b"false"
+    if value is None:
+        return b"null"
+    if isinstance(value, _Ref):
+        return b"%d %d R" % (value.num, value.gen)
+    if isinstance(value, int):
+        return b"%d" % value
+    if isinstance(value, float):
+        return _real(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return _literal(bytes(value))
+    if isinstance(value, str):
+        return _literal(_text(value))
+    if isinstance(value, list):
+        return b"[" + b" ".join(_serialize(item) for item in value) + b"]"
+    if isinstance(value, dict):
+        return b"<<" + b"".join(_name(key) + b" " + _serialize(item) for key, item in value.items()) + b">>"
+    raise IncrementalFallback(f"Cannot serialize {type(value).__name__}")
+
+
+def _stream(stream_dict: Dict[str, Any], data: bytes) -> bytes:
+    stream_dict = dict(stream_dict, Length=len(data))
+    return _serialize(stream_dict) + b"\nstream\n" + data + b"\nendstream"
+
+
+class _UpdateSection:
+    """Objects appended after the original bytes, with their offsets."""
+
+    def __init__(self, start_offset: int, next_num: int):
+        self.chunks: List[bytes] = []
+        self.offset = start_offset
+        self.next_num = next_num
+        self.entries: Dict[int, Tuple[int, int]] = {}  # objnum -> (offset, gen)
+
+    def new_ref(self) -> _Ref:
+        ref = _Ref(self.next_num, 0)
+        self.next_num += 1
+        return ref
+
+    def add(self, ref: _Ref, body: bytes):
+        self.entries[ref.num] = (self.offset, ref.gen)
+        self.append(b"%d %d obj\n" % (ref.num, ref.gen) + body + b"\nendobj\n")
+
+    def append(self, data: bytes):
+        self.chunks.append(data)
+        self.offset += len(data)
+
+    def subsections(self) -> List[Tuple[int, List[int]]]:
+        """Contiguous runs of object numbers: [(first, [nums...]), ...]."""
+        runs: List[Tuple[int, List[int]]] = []
+        for num in sorted(self.entries):
+            if runs and runs[-1][1][-1] == num - 1:
+                runs[-1][1].append(num)
+            else:
+                runs.append((num, [num]))
+        return runs
+
+
+def _version(raw: str) -> Optional[Tuple[int, ...]]:
+    try:
+        return tuple(int(part) for part in raw.split("."))
+    except ValueError:
+        return None
+
+
+def _needs_version_bump(buf, catalog: Dict[str, Any]) -> bool:
+    header = bytes(buf[:16]).split(b"\n")[0].split(b"\r")[0]
+    versions = [_version(header[5:].decode("latin-1").strip())]
+    if isinstance(catalog.get("Version"), _Name):
+        versions.append(_version(catalog["Version"]))
+    return max((v for v in versions if v), default=(1, 0)) < MIN_PDF_VERSION
+
+
+def embed_xml_incremental(
+    pdf_content,
+    xml_bytes: bytes,
+    level: str,
+    pdf_metadata: Dict[str, str],
+    afrelationship: str = "data",
+) -> bytes:
+    """
+    Attach a Factur-X XML to a PDF through an incremental update.
+
+    Produces the same document structure as
+    facturx.generate_from_binary(pdf, xml, flavor='factur-x', level=level,
+    pdf_metadata=pdf_metadata): /AF, /Names /EmbeddedFiles, XMP metadata,
+    Info dictionary, plus an sRGB output intent.
+
+    Args:
+        pdf_content: Original PDF (bytes, memoryview or mmap), kept byte-for-byte.
+        xml_bytes: Factur-X XML.
+        level: Factur-X profile (minimum, basicwl, basic, en16931, extended).
+        pdf_metadata: author/keywords/title/subject, as for generate_from_binary.
+        afrelationship: AFRelationship of the XML (data, source, alternative).
+
+    Returns:
+        The original PDF followed by the update section.
+
+    Raises:
+        IncrementalFallback: the PDF cannot be updated incrementally.
+    """
+    buf = pdf_content if isinstance(pdf_content, mmap.mmap) else memoryview(pdf_content)
+    try:
+        index = _PdfIndex(buf)
+        trailer = index.trailer
+        if "Encrypt" in trailer:
+            raise IncrementalFallback("Encrypted PDF")
+        root_ref = trailer.get("Root")
+        catalog = index.resolve(root_ref)
+        if not isinstance(root_ref, _Ref) or not isinstance(catalog, dict):
+            raise IncrementalFallback("No catalog")
+        size = trailer.get("Size")
+        if not isinstance(size, int) or size <= 0:
+            raise IncrementalFallback("Invalid trailer /Size")
+        names = index.resolve(catalog.get("Names"))
+        info = index.resolve(trailer.get("Info"))
+    except LocatorFallback as e:
+        raise IncrementalFallback(str(e)) from e
+
+    separator = b"" if bytes(buf[-1:]) in (b"\n", b"\r") else b"\n"
+    update = _UpdateSection(len(buf) + len(separator), size)
+
+    # 1. Embedded file, Filespec, /AF (same entries as the factur-x library)
+    file_ref, filespec_ref, af_ref = update.new_ref(), update.new_ref(), update.new_ref()
+    update.add(file_ref, _stream({
+        "Type": _Name("EmbeddedFile"),
+        "Subtype": _Name("text/xml"),
+        "Params": {
+            "CheckSum": hashlib.md5(xml_bytes).hexdigest(),
+            "ModDate": _get_pdf_timestamp(),
+            "Size": len(xml_bytes),
+        },
+        "Filter": _Name("FlateDecode"),
+    }, zlib.compress(xml_bytes)))
+    update.add(filespec_ref, _serialize({
+        "Type": _Name("Filespec"),
+        "AFRelationship": _Name(afrelationship.capitalize()),
+        "Desc": "Factur-X XML file",
+        "F": FACTURX_FILENAME,
+        "UF": FACTURX_FILENAME,
+        "EF": {"F": file_ref, "UF": file_ref},
+    }))
+    update.add(af_ref, _serialize([filespec_ref]))
+
+    # 2. XMP metadata (an existing /Metadata object is replaced in place)
+    metadata_ref = catalog.get("Metadata")
+    if not isinstance(metadata_ref, _Ref):
+        metadata_ref = update.new_ref()
+    update.add(metadata_ref, _stream({"Type": _Name("Metadata"), "Subtype": _Name("XML")}, xmp_metadata(level, pdf_metadata)))
+
+    # 3. Catalog: other /Names entries (Dests, JavaScript...) are kept
+    new_catalog = dict(catalog)
+    new_names = dict(names) if isinstance(names, dict) else {}
+    new_names["EmbeddedFiles"] = {"Names": [FACTURX_FILENAME, filespec_ref]}
+    new_catalog.update({
+        "AF": af_ref,
+        "Names": new_names,
+        "PageMode": _Name("UseAttachments"),
+        "Metadata": metadata_ref,
+    })
+    if catalog.get("OutputIntents") is None:
+        icc_ref = update.new_ref()
+        update.add(icc_ref, _stream({"N": 3, "Filter": _Name("FlateDecode")}, srgb_icc_profile()))
+        new_catalog["OutputIntents"] = [{
+            "Type": _Name("OutputIntent"),
+            "S": _Name("GTS_PDFA1"),
+            "OutputConditionIdentifier": SRGB_IDENTIFIER,
+            "Info": SRGB_IDENTIFIER,
+            "RegistryName": "http://www.color.org",
+            "DestOutputProfile": icc_ref,
+        }]
+    if _needs_version_bump(buf, catalog):
+        new_catalog["Version"] = _Name("%d.%d" % MIN_PDF_VERSION)
+    update.add(root_ref, _serialize(new_catalog))
+
+    # 4. Info dictionary (existing entries are kept, like pypdf add_metadata)
+    info_ref = trailer.get("Info")
+    if not isinstance(info_ref, _Ref):
+        info_ref = update.new_ref()
+    new_info = dict(info) if isinstance(info, dict) else {}
+    new_info.update(info_entries(pdf_metadata))
+    update.add(info_ref, _serialize(new_info))
+
+    # 5. Cross-reference section and trailer
+    new_id = hashlib.md5(b"%d" % index.startxref + hashlib.md5(xml_bytes).digest()).digest()
+    file_id = trailer.get("ID")
+    first_id = file_id[0] if isinstance(file_id, list) and file_id and isinstance(file_id[0], bytes) else new_id
+    new_trailer = {
+        "Root": root_ref,
+        "Info": info_ref,
+        "ID": [first_id, new_id],
+        "Prev": index.startxref,
+    }
+    if trailer.get("Type") == "XRef":
+        _write_xref_stream(update, new_trailer)
+    else:
+        _write_xref_table(update, new_trailer)
+
+    return b"".join([buf, separator, *update.chunks])
+
+
+def _write_xref_table(update: _UpdateSection, trailer: Dict[str, Any]):
+    xref_offset = update.offset
+    # Starts with the free head of the list (object 0), as readers expect
+    rows = [b"xref\n0 1\n0000000000 65535 f\r\n"]
+    for first, nums in update.subsections():
+        rows.append(b"%d %d\n" % (first, len(nums)))
+        rows.extend(b"%010d %05d n\r\n" % update.entries[num] for num in nums)
+    trailer = dict(trailer, Size=update.next_num)
+    rows.append(b"trailer\n" + _serialize(trailer) + b"\nstartxref\n%d\n%%%%EOF\n" % xref_offset)
+    update.append(b"".join(rows))
+
+
+def _write_xref_stream(update: _UpdateSection, trailer: Dict[str, Any]):
+    # The xref stream is an object itself and lists its own offset
+    xref_ref = update.new_ref()
+    xref_offset = update.offset
+    update.entries[xref_ref.num] = (xref_offset, 0)
+    offset_width = max(4, (xref_offset.bit_length() + 7) // 8)
+    index, data = [], bytearray()
+    for first, nums in update.subsections():
+        index += [first, len(nums)]
+        for num in nums:
+            offset, gen = update.entries[num]
+            data += b"\x01" + offset.to_bytes(offset_width, "big") + gen.to_bytes(2, "big")
+    stream_dict = dict(trailer, Type=_Name("XRef"), Size=update.next_num, W=[1, offset_width, 2], Index=index)
+    body = _stream(stream_dict, bytes(data))
+    update.append(b"%d 0 obj\n" % xref_ref.num + body + b"\nendobj\nstartxref\n%d\n%%%%EOF\n" % xref_offset)
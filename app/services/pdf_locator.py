@@ -0,0 +1,547 @@
+"""
+Fast embedded-file locator for Factur-X / ZUGFeRD PDFs.
+
+facturx.get_xml_from_pdf() builds a full pypdf object graph just to reach one
+/EmbeddedFiles entry. This module reads only what is needed:
+
+1. the trailer and cross-reference data (classic tables, xref streams,
+   hybrid files and incremental updates via /Prev),
+2. the Catalog -> /Names -> /EmbeddedFiles name tree (or the /AF array),
+3. the single attachment stream, which is inflated on its own.
+
+The payload is never copied: it is accessed through a memoryview (or an mmap
+when a file path is given). Anything unusual (encryption, unknown filters,
+broken offsets...) raises LocatorFallback and callers use the pypdf path.
+Streams are inflated up to pypdf's own output limit: a decompression bomb
+falls back to pypdf, which refuses it.
+"""
+import logging
+import mmap
+import os
+import re
+import zlib
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from facturx import get_xml_from_pdf
+from facturx.facturx import ALL_FILENAMES
+from pypdf.filters import ZLIB_MAX_OUTPUT_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# Feature flag: the fast path can be disabled without a redeploy
+FAST_LOCATOR_ENABLED = os.getenv("FX_FAST_PDF_LOCATOR", "true").lower() == "true"
+
+_MAX_PREV_CHAIN = 64        # xref sections followed through /Prev
+_MAX_NAME_TREE_DEPTH = 8    # /Kids levels in the EmbeddedFiles name tree
+_STARTXREF_WINDOW = 2048    # bytes scanned at the end of the file
+MAX_INFLATED_SIZE = ZLIB_MAX_OUTPUT_LENGTH  # bytes a FlateDecode stream may inflate to (as in pypdf)
+
+_WS_RE = re.compile(rb"(?:[\x00\t\n\x0c\r ]+|%[^\r\n]*)*")
+_TOKEN_RE = re.compile(rb"[^\x00\t\n\x0c\r ()<>\[\]{}/%]*")
+_SIMPLE_STRING_RE = re.compile(rb"\(([^()\\]*)\)")
+_HEX_STRING_RE = re.compile(rb"<([0-9A-Fa-f\s]*)>")
+_STRING_SPECIAL_RE = re.compile(rb"[()\\]")
+_ESCAPE_RE = re.compile(rb"\\([0-7]{1,3}|\r\n|.)", re.S)
+_STRING_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+_NUMBER_RE = re.compile(rb"[+-]?(?:\d+\.?\d*|\.\d+)")
+_XREF_ROW_RE = re.compile(rb"(\d{10}) (\d{5}) ([nf])")
+_OBJ_HEADER_RE = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+
+
+class LocatorFallback(Exception):
+    """Raised when the fast path cannot handle a PDF; use pypdf instead."""
+
+
+class _Ref:
+    __slots__ = ("num", "gen")
+
+    def __init__(self, num: int, gen: int):
+        self.num = num
+        self.gen = gen
+
+
+class _Name(str):
+    """PDF name object (kept distinct from strings)."""
+
+
+class _Stream:
+    __slots__ = ("dict", "start", "length")
+
+    def __init__(self, stream_dict: Dict[str, Any], start: int, length: Any):
+        self.dict = stream_dict
+        self.start = start
+        self.length = length
+
+
+class _Lexer:
+    """Minimal PDF object parser over a buffer (no copies of stream data)."""
+
+    def __init__(self, buf, pos: int = 0):
+        self.buf = buf
+        self.pos = pos
+
+    def _skip_ws(self):
+        self.pos = _WS_RE.match(self.buf, self.pos).end()
+
+    def _token(self) -> bytes:
+        self._skip_ws()
+        match = _TOKEN_RE.match(self.buf, self.pos)
+        self.pos = match.end()
+        return match.group(0)
+
+    def parse(self) -> Any:
+        self._skip_ws()
+        if self.pos >= len(self.buf):
+            raise LocatorFallback("Unexpected end of data")
+        c = self.buf[self.pos]
+        if c == 0x2F:  # '/'
+            self.pos += 1
+            return _Name(self._decode_name(self._token()))
+        if c == 0x3C:  # '<'
+            if self.buf[self.pos + 1] == 0x3C:
+                return self._parse_dict()
+            return self._parse_hex_string()
+        if c == 0x5B:  # '['
+            self.pos += 1
+            items = []
+            while True:
+                self._skip_ws()
+                if self.buf[self.pos] == 0x5D:  # ']'
+                    self.pos += 1
+                    return items
+                items.append(self.parse())
+        if c == 0x28:  # '('
+            return self._parse_literal_string()
+        token = self._token()
+        if token == b"true":
+            return True
+        if token == b"false":
+            return False
+        if token == b"null":
+            return None
+        if _NUMBER_RE.fullmatch(token):
+            if b"." in token:
+                return float(token)
+            value = int(token)
+            # Lookahead for an indirect reference: "num gen R"
+            save = self.pos
+            gen = self._token()
+            if gen.isdigit():
+                if self._token() == b"R":
+                    return _Ref(value, int(gen))
+            self.pos = save
+            return value
+        raise LocatorFallback(f"Unexpected token {token[:20]!r}")
+
+    @staticmethod
+    def _decode_name(raw: bytes) -> str:
+        if b"#" in raw:
+            raw = re.sub(rb"#([0-9A-Fa-f]{2})", lambda m: bytes([int(m.group(1), 16)]), raw)
+        return raw.decode("latin-1")
+
+    def _parse_dict(self) -> Dict[str, Any]:
+        self.pos += 2
+        result = {}
+        while True:
+            self._skip_ws()
+            if self.buf[self.pos] == 0x3E and self.buf[self.pos + 1] == 0x3E:  # '>>'
+                self.pos += 2
+                return result
+            key = self.parse()
+            if not isinstance(key, _Name):
+                raise LocatorFallback("Dictionary key is not a name")
+            result[key] = self.parse()
+
+    def _parse_hex_string(self) -> bytes:
+        match = _HEX_STRING_RE.match(self.buf, self.pos)
+        if match is None:
+            raise LocatorFallback("Invalid hex string")
+        self.pos = match.end()
+        digits = re.sub(rb"\s", b"", match.group(1))
+        if len(digits) % 2:
+            digits += b"0"
+        return bytes.fromhex(digits.decode("ascii"))
+
+    def _parse_literal_string(self) -> bytes:
+        simple = _SIMPLE_STRING_RE.match(self.buf, self.pos)
+        if simple:
+            self.pos = simple.end()
+            return simple.group(1)
+        # Find the closing parenthesis (balanced, escapes skipped), then unescape
+        pos = self.pos + 1
+        depth = 1
+        while depth:
+            special = _STRING_SPECIAL_RE.search(self.buf, pos)
+            if special is None:
+                raise LocatorFallback("Unterminated string")
+            pos = special.end()
+            if special.group(0) == b"\\":
+                pos += 1
+            else:
+                depth += 1 if special.group(0) == b"(" else -1
+        raw = bytes(self.buf[self.pos + 1:pos - 1])
+        self.pos = pos
+        return _ESCAPE_RE.sub(_unescape, raw)
+
+
+def _unescape(match) -> bytes:
+    value = match.group(1)
+    if value[0] in b"01234567":
+        return bytes([int(value, 8) & 0xFF])
+    if value in (b"\r\n", b"\r", b"\n"):  # line continuation
+        return b""
+    return _STRING_ESCAPES.get(value, value)
+
+
+class _PdfIndex:
+    """Cross-reference index of a PDF, merged over all incremental updates."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        # Xref sections, newest first. Each is either a classic table
+        # subsection (first objnum, count, offset of first row) or the decoded
+        # entries of an xref stream {objnum: ("o", offset) | ("c", objstm, index)}.
+        self.sections: List[Any] = []
+        self.trailer: Dict[str, Any] = {}
+        self.startxref = 0  # Offset of the newest xref section
+        self._objstm_cache: Dict[int, Dict[int, Any]] = {}
+        self._load()
+
+    # --- Cross-reference loading ---
+
+    def _load(self):
+        buf = self.buf
+        tail_start = max(0, len(buf) - _STARTXREF_WINDOW)
+        tail = bytes(buf[tail_start:])
+        idx = tail.rfind(b"startxref")
+        if idx < 0:
+            raise LocatorFallback("No startxref")
+        lexer = _Lexer(tail, idx + len(b"startxref"))
+        offset = lexer.parse()
+        if not isinstance(offset, int):
+            raise LocatorFallback("Invalid startxref")
+        self.startxref = offset
+
+        seen = set()
+        newest = True
+        while offset is not None:
+            if offset in seen or len(seen) >= _MAX_PREV_CHAIN or offset >= len(buf):
+                raise LocatorFallback("Invalid /Prev chain")
+            seen.add(offset)
+            trailer = self._load_section(offset)
+            if newest:
+                self.trailer = trailer
+                newest = False
+            # Hybrid-reference files: the xref stream complements the table
+            xref_stm = trailer.get("XRefStm")
+            if isinstance(xref_stm, int) and xref_stm not in seen:
+                seen.add(xref_stm)
+                self._load_section(xref_stm)
+            prev = trailer.get("Prev")
+            offset = prev if isinstance(prev, int) else None
+
+    def _load_section(self, offset: int) -> Dict[str, Any]:
+        probe = _Lexer(self.buf, offset)
+        probe._skip_ws()
+        if bytes(self.buf[probe.pos:probe.pos + 4]) == b"xref":
+            return self._load_table(probe.pos + 4)
+        return self._load_xref_stream(offset)
+
+    def _load_table(self, pos: int) -> Dict[str, Any]:
+        # Entries are fixed 20-byte rows, so subsections are only indexed
+        # here and individual rows are decoded on lookup (see _lookup).
+        buf = self.buf
+        lexer = _Lexer(buf, pos)
+        while True:
+            token = lexer._token()
+            if token == b"trailer":
+                trailer = lexer.parse()
+                if not isinstance(trailer, dict):
+                    raise LocatorFallback("Invalid trailer")
+                return trailer
+            count = lexer._token()
+            if not token.isdigit() or not count.isdigit():
+                raise LocatorFallback("Invalid xref table")
+            start, count = int(token), int(count)
+            lexer._skip_ws()
+            if count:
+                last = lexer.pos + 20 * (count - 1)
+                if not _XREF_ROW_RE.match(buf, last):
+                    raise LocatorFallback("Xref rows are not 20 bytes long")
+                self.sections.append((start, count, lexer.pos))
+            lexer.pos += 20 * count
+
+    def _load_xref_stream(self, offset: int) -> Dict[str, Any]:
+        obj = self._parse_object_at(offset)
+        if not isinstance(obj, _Stream) or obj.dict.get("Type") != "XRef":
+            raise LocatorFallback("startxref does not point to an xref section")
+        data = self._stream_data(obj)
+        widths = obj.dict.get("W")
+        if not isinstance(widths, list) or len(widths) != 3:
+            raise LocatorFallback("Invalid /W in xref stream")
+        size = obj.dict.get("Size", 0)
+        index = obj.dict.get("Index", [0, size])
+        row = sum(widths)
+        pos = 0
+        entries = {}
+
+        def field(width, default):
+            nonlocal pos
+            if width == 0:
+                return default
+            value = int.from_bytes(data[pos:pos + width], "big")
+            pos += width
+            return value
+
+        for start, count in zip(index[::2], index[1::2]):
+            for i in range(count):
+                if pos + row > len(data):
+                    raise LocatorFallback("Truncated xref stream")
+                kind = field(widths[0], 1)
+                f2 = field(widths[1], 0)
+                f3 = field(widths[2], 0)
+                num = start + i
+                if kind == 1:
+                    entries[num] = ("o", f2)
+                elif kind == 2:
+                    entries[num] = ("c", f2, f3)
+        self.sections.append(entries)
+        return obj.dict
+
+    # --- Object access ---
+
+    def _parse_object_at(self, offset: int) -> Any:
+        header = _OBJ_HEADER_RE.match(bytes(self.buf[offset:offset + 32]))
+        if not header:
+            raise LocatorFallback(f"No object at offset {offset}")
+        lexer = _Lexer(self.buf, offset + header.end())
+        value = lexer.parse()
+        if isinstance(value, dict):
+            save = lexer.pos
+            if lexer._token() == b"stream":
+                pos = lexer.pos
+                if self.buf[pos] == 0x0D:
+                    pos += 1
+                if self.buf[pos] == 0x0A:
+                    pos += 1
+                return _Stream(value, pos, value.get("Length"))
+            lexer.pos = save
+        return value
+
+    def resolve(self, value: Any) -> Any:
+        depth = 0
+        while isinstance(value, _Ref):
+            depth += 1
+            if depth > 32:
+                raise LocatorFallback("Reference loop")
+            entry = self._lookup(value.num)
+            if entry is None:
+                return None
+            if entry[0] == "o":
+                value = self._parse_object_at(entry[1])
+            else:
+                value = self._object_from_objstm(entry[1], entry[2], value.num)
+        return value
+
+    def _lookup(self, num: int) -> Optional[Tuple]:
+        # The first in-use definition wins. Free entries never shadow older
+        # ones: hybrid files mark compressed objects as free in the table and
+        # define them in the /XRefStm stream that follows it.
+        for section in self.sections:
+            if isinstance(section, dict):
+                if num in section:
+                    return section[num]
+                continue
+            start, count, pos = section
+            if start <= num < start + count:
+                row = _XREF_ROW_RE.match(self.buf, pos + 20 * (num - start))
+                if not row:
+                    raise LocatorFallback("Invalid xref row")
+                if row.group(3) == b"n":
+                    return ("o", int(row.group(1)))
+        return None
+
+    def _object_from_objstm(self, stm_num: int, index: int, num: int) -> Any:
+        objects = self._objstm_cache.get(stm_num)
+        if objects is None:
+            stream = self.resolve(_Ref(stm_num, 0))
+            if not isinstance(stream, _Stream) or stream.dict.get("Type") != "ObjStm":
+                raise LocatorFallback("Invalid object stream")
+            data = self._stream_data(stream)
+            first = stream.dict.get("First")
+            count = stream.dict.get("N")
+            header = _Lexer(data, 0)
+            pairs = [(header.parse(), header.parse()) for _ in range(count)]
+            objects = {}
+            for obj_num, obj_offset in pairs:
+                objects[obj_num] = _Lexer(data, first + obj_offset).parse()
+            self._objstm_cache[stm_num] = objects
+        if num not in objects:
+            raise LocatorFallback("Object missing from object stream")
+        return objects[num]
+
+    def _stream_data(self, stream: _Stream) -> bytes:
+        length = self.resolve(stream.length)
+        if not isinstance(length, int) or stream.start + length > len(self.buf):
+            raise LocatorFallback("Invalid stream /Length")
+        raw = self.buf[stream.start:stream.start + length]
+        filters = stream.dict.get("Filter")
+        params = stream.dict.get("DecodeParms")
+        if filters is None:
+            return bytes(raw)
+        if not isinstance(filters, list):
+            filters, params = [filters], [params]
+        elif not isinstance(params, list):
+            params = [params] * len(filters)
+        data = raw
+        for name, param in zip(filters, params):
+            if name != "FlateDecode":
+                raise LocatorFallback(f"Unsupported filter {name}")
+            data = _inflate(data)
+            param = self.resolve(param)
+            if isinstance(param, dict) and param.get("Predictor", 1) > 1:
+                data = _undo_png_predictor(data, param)
+        return bytes(data)
+
+
+def _inflate(data) -> bytes:
+    """FlateDecode, refusing streams that inflate beyond MAX_INFLATED_SIZE."""
+    inflater = zlib.decompressobj()
+    try:
+        out = inflater.decompress(data, MAX_INFLATED_SIZE)
+    except zlib.error as e:
+        raise LocatorFallback(f"Invalid FlateDecode stream: {e}")
+    if inflater.unconsumed_tail:
+        raise LocatorFallback(f"Stream inflates beyond {MAX_INFLATED_SIZE} bytes")
+    return out
+
+
+def _undo_png_predictor(data: bytes, params: Dict[str, Any]) -> bytes:
+    predictor = params.get("Predictor", 1)
+    if predictor < 10:
+        raise LocatorFallback("TIFF predictor not supported")
+    columns = params.get("Columns", 1) * params.get("Colors", 1) * params.get("BitsPerComponent", 8) // 8
+    row_len = columns + 1
+    out = bytearray()
+    prev = bytearray(columns)
+    for i in range(0, len(data), row_len):
+        filter_type = data[i]
+        row = bytearray(data[i + 1:i + row_len])
+        if filter_type == 2:  # Up
+            for j in range(len(row)):
+                row[j] = (row[j] + prev[j]) & 0xFF
+        elif filter_type != 0:
+            raise LocatorFallback(f"PNG filter {filter_type} not supported")
+        out += row
+        prev = row
+    return bytes(out)
+
+
+def _decode_text(value: Any) -> Optional[str]:
+    """Decode a PDF text string (PDFDocEncoding or UTF-16BE with BOM)."""
+    if not isinstance(value, bytes):
+        return None
+    if value.startswith(b"\xfe\xff"):
+        return value[2:].decode("utf-16-be", errors="replace")
+    return value.decode("latin-1")
+
+
+def _collect_name_tree(index: _PdfIndex, node: Any, out: List, depth: int = 0):
+    node = index.resolve(node)
+    if not isinstance(node, dict):
+        raise LocatorFallback("Invalid name tree node")
+    if depth > _MAX_NAME_TREE_DEPTH:
+        raise LocatorFallback("Name tree too deep")
+    names = index.resolve(node.get("Names"))
+    if isinstance(names, list):
+        out.extend(zip(names[::2], names[1::2]))
+    kids = index.resolve(node.get("Kids"))
+    if isinstance(kids, list):
+        for kid in kids:
+            _collect_name_tree(index, kid, out, depth + 1)
+
+
+def _filespec_name(index: _PdfIndex, filespec: Dict[str, Any]) -> Optional[str]:
+    for key in ("UF", "F"):
+        name = _decode_text(index.resolve(filespec.get(key)))
+        if name:
+            return name
+    return None
+
+
+def locate_embedded_xml(buf, filenames: Optional[List[str]] = None) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    Locate and inflate the Factur-X/ZUGFeRD/Order-X XML attachment.
+
+    Args:
+        buf: PDF content as bytes, memoryview or mmap.
+        filenames: Accepted attachment names (defaults to all Factur-X names).
+
+    Returns:
+        (xml_filename, xml_bytes), or (None, None) if the PDF has no such attachment.
+
+    Raises:
+        LocatorFallback: the PDF uses a construct the fast path does not handle.
+    """
+    filenames = filenames or ALL_FILENAMES
+    index = _PdfIndex(memoryview(buf) if not isinstance(buf, mmap.mmap) else buf)
+    if "Encrypt" in index.trailer:
+        raise LocatorFallback("Encrypted PDF")
+
+    catalog = index.resolve(index.trailer.get("Root"))
+    if not isinstance(catalog, dict):
+        raise LocatorFallback("No catalog")
+
+    # 1. /Names -> /EmbeddedFiles name tree (same lookup order as facturx)
+    candidates = []
+    names = index.resolve(catalog.get("Names"))
+    if isinstance(names, dict) and names.get("EmbeddedFiles") is not None:
+        pairs = []
+        _collect_name_tree(index, names["EmbeddedFiles"], pairs)
+        candidates = [(_decode_text(index.resolve(key)), spec) for key, spec in pairs]
+    # 2. /AF array (PDF/A-3 associated files) when there is no name tree
+    if not candidates:
+        af = index.resolve(catalog.get("AF"))
+        if isinstance(af, list):
+            for spec in af:
+                spec_dict = index.resolve(spec)
+                if isinstance(spec_dict, dict):
+                    candidates.append((_filespec_name(index, spec_dict), spec_dict))
+
+    for name, spec in candidates:
+        if name not in filenames:
+            continue
+        filespec = index.resolve(spec)
+        if not isinstance(filespec, dict):
+            raise LocatorFallback("Invalid filespec")
+        ef = index.resolve(filespec.get("EF"))
+        if not isinstance(ef, dict):
+            raise LocatorFallback("Filespec without /EF")
+        stream = index.resolve(ef.get("F") if ef.get("F") is not None else ef.get("UF"))
+        if not isinstance(stream, _Stream):
+            raise LocatorFallback("Embedded file is not a stream")
+        return name, index._stream_data(stream)
+    return None, None
+
+
+def get_xml_from_pdf_fast(file_content) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    Drop-in replacement for facturx.get_xml_from_pdf(..., check_xsd=False).
+
+    Tries the fast locator first and falls back to the pypdf-based
+    implementation on anything the locator does not handle.
+    """
+    if FAST_LOCATOR_ENABLED:
+        try:
+            return locate_embedded_xml(file_content)
+        except Exception as e:
+            logger.debug(f"Fast PDF locator fallback: {e}")
+    content = file_content if isinstance(file_content, bytes) else bytes(file_content)
+    return get_xml_from_pdf(BytesIO(content), check_xsd=False)
+
+
+def map_file(path: Union[str, os.PathLike]) -> mmap.mmap:
+    """Memory-map a PDF file read-only (for large files on disk)."""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
@@ -0,0 +1,79 @@
+"""
+Prebuilt PDF/A-3 scaffolding for Factur-X embedding.
+
+The sRGB output intent profile, the XMP packet (with the Factur-X extension
+schema) and the Info dictionary are the same for every invoice of a given
+profile, apart from a few values. They are built once per process (the XMP
+skeleton once per profile level) and each request only injects the
+invoice-specific values and timestamps.
+"""
+import functools
+import re
+import zlib
+from pathlib import Path
+from typing import Dict, Tuple
+from xml.sax.saxutils import escape
+
+from facturx.facturx import (
+    _get_metadata_timestamp, _get_pdf_timestamp, _prepare_pdf_metadata_txt, _prepare_pdf_metadata_xml
+)
+
+# Compact sRGB v4 profile (CC0, see LICENSE_ICC)
+ICC_PROFILE_PATH = Path(__file__).parent.parent / "assets" / "icc" / "sRGB.icc"
+SRGB_IDENTIFIER = "sRGB IEC61966-2.1"
+
+# Values injected per request into the XMP skeleton
+_XMP_FIELDS = ("title", "author", "subject")
+_XMP_DATES_RE = re.compile(rb"(<xmp:(?:CreateDate|ModifyDate)>)[^<]*(</xmp:)")
+_MARK = "\x00"
+
+
+@functools.lru_cache(maxsize=None)
+def srgb_icc_profile() -> bytes:
+    """Flate-compressed sRGB ICC profile (data of the /DestOutputProfile stream)."""
+    return zlib.compress(ICC_PROFILE_PATH.read_bytes(), 9)
+
+
+@functools.lru_cache(maxsize=None)
+def _xmp_skeleton(level: str) -> Tuple[bytes, ...]:
+    """
+    XMP packet of the factur-x library for a profile level, split around the
+    per-invoice values: (literal, field, literal, field, ..., literal).
+    """
+    placeholders = {field: f"{_MARK}{field}{_MARK}" for field in _XMP_FIELDS}
+    packet = _prepare_pdf_metadata_xml("factur-x", level, None, placeholders)
+    packet = _XMP_DATES_RE.sub(lambda m: m.group(1) + b"\x00timestamp\x00" + m.group(2), packet)
+    return tuple(packet.split(_MARK.encode()))
+
+
+def xmp_metadata(level: str, pdf_metadata: Dict[str, str]) -> bytes:
+    """
+    XMP packet for one invoice (same content as the factur-x library, with
+    the values XML-escaped).
+    """
+    parts = list(_xmp_skeleton(level))
+    values = {field: escape(pdf_metadata.get(field, "")).encode("utf-8") for field in _XMP_FIELDS}
+    values["timestamp"] = _get_metadata_timestamp().encode("ascii")
+    parts[1::2] = [values[field.decode("ascii")] for field in parts[1::2]]
+    return b"".join(parts)
+
+
+@functools.lru_cache(maxsize=None)
+def _info_constants() -> Dict[str, str]:
+    # Creator string and key names, taken from the factur-x library once
+    return {key.lstrip("/"): value for key, value in _prepare_pdf_metadata_txt({}).items()}
+
+
+def info_entries(pdf_metadata: Dict[str, str]) -> Dict[str, str]:
+    """Info dictionary entries (without leading slashes) for one invoice."""
+    pdf_date = _get_pdf_timestamp()
+    entries = dict(_info_constants())
+    entries.update({
+        "Author": pdf_metadata.get("author", ""),
+        "Keywords": pdf_metadata.get("keywords", ""),
+        "Subject": pdf_metadata.get("subject", ""),
+        "Title": pdf_metadata.get("title", ""),
+        "CreationDate": pdf_date,
+        "ModDate": pdf_date,
+    })
+    return entries
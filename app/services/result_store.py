@@ -0,0 +1,119 @@
+"""
+Content-addressed result store.
+
+Extraction and validation results are cached by the SHA-256 of the uploaded
+file, so clients can probe for a result (GET /v1/probe/{sha256}) instead of
+re-uploading content the engine has already processed.
+
+Bounded LRU in process memory. Raw files are NOT kept unless
+FX_RESULT_STORE_FILES_MB is set; when they are, a probe for a result kind that
+was never computed can still be answered from the kept file.
+"""
+import copy
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.syntax import looks_like_xml
+
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_SIZE = int(os.getenv("FX_RESULT_STORE_SIZE", "1024"))       # Max cached results (0 disables)
+RESULT_STORE_FILES_MB = int(os.getenv("FX_RESULT_STORE_FILES_MB", "0"))  # Raw file budget (0 = never keep files)
+
+# Result kinds, named after the endpoints that produce them
+KIND_EXTRACT = "extract"
+KIND_VALIDATE = "validate"
+
+# Infrastructure failures say nothing about the document: never cache them
+_TRANSIENT_CODES = frozenset({
+    "INTERNAL_ERROR",
+    "FX-TIMEOUT", "FX-POOL-ERROR", "FX-HYBRID-ERROR", "FX-INTERNAL",
+})
+
+
+def content_digest(file_content) -> str:
+    """SHA-256 hex digest of bytes, memoryview or mmap content."""
+    return hashlib.sha256(file_content).hexdigest()
+
+
+def is_content_addressable(file_content, filename: str) -> bool:
+    """
+    True if the result depends on the content only.
+
+    Services also look at the filename when the content is ambiguous (e.g. an
+    XML upload named '.pdf' goes through PDF extraction): such uploads are not
+    cached, so a digest always maps to one result.
+    """
+    if bytes(file_content[:4]) == b'%PDF':
+        return True
+    return looks_like_xml(file_content) and not filename.lower().endswith('.pdf')
+
+
+class ResultStore:
+    """Thread-safe bounded LRU of results keyed by (kind, sha256)."""
+
+    def __init__(self, max_entries: int = RESULT_STORE_SIZE, max_file_bytes: int = RESULT_STORE_FILES_MB * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_file_bytes = max_file_bytes
+        self._results: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._files: "OrderedDict[str, bytes]" = OrderedDict()
+        self._file_bytes = 0
+        self._lock = Lock()
+
+    def get(self, kind: str, digest: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached result, or None."""
+        with self._lock:
+            result = self._results.get((kind, digest))
+            if result is None:
+                return None
+            self._results.move_to_end((kind, digest))
+        return copy.deepcopy(result)
+
+    def put(self, kind: str, digest: str, result: Dict[str, Any]):
+        """Cache a result unless it only reflects an infrastructure failure."""
+        if self.max_entries <= 0:
+            return
+        if any(e.get("code", e.get("rule_id")) in _TRANSIENT_CODES for e in result.get("errors", [])):
+            return
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._results[(kind, digest)] = result
+            self._results.move_to_end((kind, digest))
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def get_file(self, digest: str) -> Optional[bytes]:
+        with self._lock:
+            content = self._files.get(digest)
+            if content is not None:
+                self._files.move_to_end(digest)
+            return content
+
+    def put_file(self, digest: str, file_content):
+        """Keep the raw file (only when FX_RESULT_STORE_FILES_MB is configured)."""
+        size = len(file_content)
+        if size > self.max_file_bytes:
+            return
+        with self._lock:
+            if digest in self._files:
+                self._files.move_to_end(digest)
+                return
+            self._files[digest] = bytes(file_content)
+            self._file_bytes += size
+            while self._file_bytes > self.max_file_bytes:
+                _, evicted = self._files.popitem(last=False)
+                self._file_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._files.clear()
+            self._file_bytes = 0
+
+
+# Singleton instance
+result_store = ResultStore()
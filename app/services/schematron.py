@@ -0,0 +1,532 @@
+"""
+Native EN 16931 Schematron evaluation (lxml, XPath 1.0).
+
+Compiles the rules of the preprocessed Schematron into etree.XPath objects,
+grouped by rule context, and evaluates them in-process on the already parsed
+invoice. Each assert is one call over all the elements its rule fires on,
+and the absolute paths it reads are evaluated once per document. Asserts
+that need XPath 2.0 (xs:decimal arithmetic, regular expressions, quantified
+expressions, ...) are left to SaxonC, which runs a reduced copy of the
+compiled XSLT holding only those asserts, applied to the elements they may
+fire on instead of the whole tree.
+
+Failures are reported as the SVRL of the full XSLT would report them: same
+rule ids, messages and locations, in the same order. tools/schematron_parity.py
+checks this on the test corpus.
+
+Schematrons compiled to report through xsl:message rather than SVRL (the
+French BR-FR rules) are read with parse_messages(), their roles taken from
+the Schematron source (assert_roles()). Their SaxonC run applies each
+pattern to the nodes its rules may match (targeted_stylesheet()) rather than
+walking the whole tree once per pattern.
+
+Both engines can also run a subset of the patterns (the XSLT modes), so that
+the patterns of a huge invoice are validated in parallel: plan_shards() groups
+consecutive patterns, and the failures of the groups, in group order, are the
+failures of the whole Schematron.
+"""
+import copy
+import re
+from io import BytesIO
+from functools import lru_cache
+from itertools import chain, combinations
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from lxml import etree
+
+from app.services.xpath_translator import EXTENSIONS, FX_NS, Unsupported, XPathDynamicError, translate, translate_pattern
+
+SCH_NS = {"sch": "http://purl.oclc.org/dsdl/schematron"}
+SVRL_NS = {"svrl": "http://purl.oclc.org/dsdl/svrl"}
+XSL_NS = {"xsl": "http://www.w3.org/1999/XSL/Transform", **SVRL_NS}
+
+
+# Roles of the failed asserts that make a document invalid (the others are warnings)
+BLOCKING_ROLES = ("error", "fatal")
+
+# The Factur-X Schematrons have no roles: their only warning says so at the end of its message (PEPPOL-EN16931-R008)
+_WARNING_MESSAGE_SUFFIX = "(still status warning)"
+
+# lxml copies a node-set passed as a variable with a duplicate check per node: larger ones are split up
+_NODE_SET_LIMIT = 256
+
+
+class SchematronError(ValueError):
+    """An assert stopped with a dynamic error, as it would have in SaxonC."""
+
+
+class Failure(NamedTuple):
+    """A failed assert, as reported in SVRL."""
+    rule_id: str
+    role: str
+    message: str
+    location: str
+    element: Optional[etree._Element] = None
+
+
+class Assert(NamedTuple):
+    id: str
+    role: str
+    message: str
+    test: str
+    xpath: Optional[etree.XPath]  # $context[not(test)], the failing elements; None: evaluated by SaxonC
+    reason: Optional[str]  # why the assert needs SaxonC
+    variables: Tuple[str, ...] = ()  # absolute paths it uses, evaluated once per document
+    inline: Optional[etree.XPath] = None  # same as xpath, without the variables
+
+
+class Rule(NamedTuple):
+    context: str
+    xpath: Optional[etree.XPath]  # None: the rule (and the rest of its pattern) runs in SaxonC
+    asserts: List[Assert]
+
+
+class Pattern(NamedTuple):
+    id: str
+    mode: str
+    rules: List[Rule]
+
+
+def element_location(element: etree._Element) -> str:
+    """Location of an element as the skeleton's schematron-get-full-path mode writes it."""
+    steps = []
+    for node in chain((element,), element.iterancestors()):
+        qname = etree.QName(node)
+        position = 1 + sum(1 for _ in node.itersiblings(node.tag, preceding=True))
+        name = f"*:{qname.localname}[namespace-uri()='{qname.namespace}']" if qname.namespace else qname.localname
+        steps.append(f"/{name}[{position}]")
+    return "".join(reversed(steps))
+
+
+class _Locations(dict):
+    """element_location() of many elements, counting the siblings of each parent once."""
+
+    def __init__(self):
+        super().__init__()
+        self._positions: Dict[Tuple[Any, str], int] = {}
+
+    def __missing__(self, element: etree._Element) -> str:
+        parent = element.getparent()
+        if parent is None:
+            location = element_location(element)
+        else:
+            if (element, element.tag) not in self._positions:
+                counts: Dict[str, int] = {}
+                for child in parent.iterchildren(etree.Element):
+                    counts[child.tag] = counts.get(child.tag, 0) + 1
+                    self._positions[child, child.tag] = counts[child.tag]
+            qname = etree.QName(element)
+            name = f"*:{qname.localname}[namespace-uri()='{qname.namespace}']" if qname.namespace else qname.localname
+            location = f"{self[parent]}/{name}[{self._positions[element, element.tag]}]"
+        self[element] = location
+        return location
+
+
+_LOCATION_STEP_RE = re.compile(r"\*:([\w.-]+)\[namespace-uri\(\)='([^']*)'\]")
+
+
+def resolve_location(root: etree._Element, location: str) -> Optional[etree._Element]:
+    """Element at an SVRL location (None if it does not resolve to an element)."""
+    path = _LOCATION_STEP_RE.sub(r"*[local-name()='\1' and namespace-uri()='\2']", location)
+    try:
+        nodes = root.xpath(path)
+    except etree.XPathError:
+        return None
+    return nodes[0] if nodes and isinstance(nodes[0], etree._Element) else None
+
+
+def parse_svrl(svrl: bytes, max_errors: Optional[int] = None) -> List[Failure]:
+    """Failed asserts of an SVRL report, in report order (the rest of the report is not read past max_errors errors)."""
+    failures = []
+    errors = 0
+    for _, fa in etree.iterparse(BytesIO(svrl), tag=f"{{{SVRL_NS['svrl']}}}failed-assert"):
+        text = fa.find("svrl:text", SVRL_NS)
+        message = text.text.strip() if text is not None and text.text else "Rule violation"
+        default_role = "warning" if message.endswith(_WARNING_MESSAGE_SUFFIX) else "error"
+        failures.append(Failure(
+            rule_id=fa.get("id", "RULE-FAIL"),
+            role=(fa.get("role") or default_role).lower(),
+            message=message,
+            location=fa.get("location", ""),
+        ))
+        errors += failures[-1].role in BLOCKING_ROLES
+        if max_errors is not None and errors >= max_errors:
+            break
+    return failures
+
+
+def parse_messages(messages: List[str], roles: Dict[str, str], max_errors: Optional[int] = None) -> List[Failure]:
+    """
+    Failed asserts of a Schematron XSLT reporting through xsl:message, one "<text>\\nID:<assert id>"
+    message each, in report order (up to max_errors errors). The messages carry no location.
+    """
+    failures = []
+    errors = 0
+    for text in messages:
+        message, _, rule_id = text.rpartition("\nID:")
+        rule_id = rule_id.strip() if message else "RULE-FAIL"
+        failures.append(Failure(
+            rule_id=rule_id,
+            role=roles.get(rule_id, "error"),
+            message=" ".join((message or text).split()) or "Rule violation",
+            location="",
+        ))
+        errors += failures[-1].role in BLOCKING_ROLES
+        if max_errors is not None and errors >= max_errors:
+            break
+    return failures
+
+
+@lru_cache(maxsize=None)
+def assert_roles(sch_path: str) -> Dict[str, str]:
+    """The role (or flag) of each assert of a Schematron, by assert id."""
+    roles = {}
+    for node in etree.parse(sch_path).iterfind(".//sch:assert", SCH_NS):
+        role = node.get("role") or node.get("flag")
+        if node.get("id") and role:
+            roles[node.get("id")] = role.lower()
+    return roles
+
+
+def error_count(failures: List[Failure]) -> int:
+    """Number of failures that make the document invalid."""
+    return sum(1 for failure in failures if failure.role in BLOCKING_ROLES)
+
+
+def truncate(failures: List[Failure], max_errors: Optional[int]) -> List[Failure]:
+    """The failures up to the max_errors-th error (all of them if max_errors is None)."""
+    if max_errors is None:
+        return failures
+    errors = 0
+    for index, failure in enumerate(failures):
+        errors += failure.role in BLOCKING_ROLES
+        if errors >= max_errors:
+            return failures[:index + 1]
+    return failures
+
+
+def _compile(expression: str, namespaces: Dict[str, str]) -> etree.XPath:
+    """etree.XPath registering only the prefixes and guard functions it uses (each one costs on every call)."""
+    used = {prefix: uri for prefix, uri in namespaces.items() if f"{prefix}:" in expression}
+    if "fx:" not in expression:
+        return etree.XPath(expression, namespaces=used)
+    return etree.XPath(expression, namespaces={**used, "fx": FX_NS}, extensions=EXTENSIONS)
+
+
+def _candidate_path(context: str) -> Optional[List[str]]:
+    """The paths of a rule context without predicates: a superset of the nodes it matches (None if unsure)."""
+    branches, text, depth, quote = [], "", 0, None
+    for char in context:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "'\"":
+            quote = char
+        elif char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+        elif depth == 0 and char == "|":
+            branches.append(text.strip())
+            text = ""
+        elif depth == 0:
+            if char == "(":
+                return None
+            text += char
+    branches.append(text.strip())
+    paths = [branch if branch.startswith("/") else "//" + branch for branch in branches]
+    try:
+        for path in paths:
+            etree.XPath(path, namespaces={"fx": FX_NS})  # prefixes are checked at evaluation, not compilation
+    except etree.XPathSyntaxError:
+        return None
+    return paths
+
+
+class CompiledSchematron:
+    """The Schematron rules split between native XPath 1.0 evaluation and a reduced SaxonC stylesheet."""
+
+    def __init__(self, sch_path: str, xslt_path: str):
+        sch = etree.parse(sch_path)
+        namespaces = {ns.get("prefix"): ns.get("uri") for ns in sch.iterfind("sch:ns", SCH_NS)}
+        xslt = etree.parse(xslt_path)
+        modes = pattern_modes(xslt)
+        sch_patterns = sch.findall("sch:pattern", SCH_NS)
+        if len(modes) != len(sch_patterns):
+            raise ValueError(f"{xslt_path} does not match {sch_path}: {len(modes)} modes, {len(sch_patterns)} patterns")
+
+        self.patterns: List[Pattern] = []
+        # Absolute path -> variable name, for all the asserts
+        variables: Dict[str, str] = {}
+        # Assert id -> (pattern index, index in its rule): the SVRL order of failures on one element
+        self._order: Dict[str, Tuple[int, int]] = {}
+        for pattern_index, (pattern, mode) in enumerate(zip(sch_patterns, modes)):
+            rules, native_contexts = [], True
+            for rule in pattern.iterfind("sch:rule", SCH_NS):
+                context = self._compile_context(rule.get("context"), namespaces) if native_contexts else None
+                native_contexts = context is not None
+                asserts = []
+                for index, node in enumerate(rule.iterfind("sch:assert", SCH_NS)):
+                    asserts.append(self._compile_assert(node, namespaces, variables, native=native_contexts))
+                    self._order[node.get("id")] = (pattern_index, index)
+                rules.append(Rule(rule.get("context"), context, asserts))
+            self.patterns.append(Pattern(pattern.get("id"), mode, rules))
+
+        used = {name for a in self.asserts for name in a.variables}
+        self._paths = {name: _compile(path, namespaces) for path, name in variables.items() if name in used}
+        self._xslt = xslt
+        self._stylesheets: Dict[Optional[Tuple[str, ...]], Optional[str]] = {}
+        self.saxon_stylesheet = self.stylesheet()
+
+    @staticmethod
+    def _compile_context(context: str, namespaces: Dict[str, str]) -> Optional[etree.XPath]:
+        """XPath selecting the nodes the rule context matches (None if it needs XPath 2.0)."""
+        try:
+            return _compile(translate_pattern(context), namespaces)
+        except (Unsupported, etree.XPathSyntaxError):
+            return None
+
+    @staticmethod
+    def _compile_assert(node: etree._Element, namespaces: Dict[str, str], variables: Dict[str, str],
+                        native: bool) -> Assert:
+        xpath, reason, used, inline = None, None, (), None
+        if not native:
+            reason = "rule context needs XPath 2.0"
+        else:
+            try:
+                # Only registered once it compiles: a path of an assert left to SaxonC is never evaluated
+                candidate = dict(variables)
+                translation = translate(node.get("test"), candidate)
+                xpath = _compile(f"$context[not({translation.xpath})]", namespaces)
+                variables.update(candidate)
+                used = translation.variables
+                if used:
+                    inline = _compile(f"$context[not({translate(node.get('test')).xpath})]", namespaces)
+            except Unsupported as e:
+                reason = str(e)
+            except etree.XPathSyntaxError as e:
+                reason = f"not XPath 1.0: {e}"
+        return Assert(
+            id=node.get("id"),
+            role=(node.get("role") or "error").lower(),
+            message=(node.text or "").strip(),
+            test=node.get("test"),
+            xpath=xpath,
+            reason=reason,
+            variables=used,
+            inline=inline,
+        )
+
+    def stylesheet(self, modes: Optional[Tuple[str, ...]] = None) -> Optional[str]:
+        """
+        The reduced stylesheet SaxonC runs for the given pattern modes (None: all the patterns),
+        None if all their asserts are native.
+        """
+        if modes not in self._stylesheets:
+            self._stylesheets[modes] = self._reduce_stylesheet(copy.deepcopy(self._xslt), modes)
+        return self._stylesheets[modes]
+
+    def _reduce_stylesheet(self, xslt: etree._ElementTree, modes: Optional[Tuple[str, ...]]) -> Optional[str]:
+        """The compiled XSLT without the natively evaluated asserts (None if nothing is left for SaxonC)."""
+        native = {a.id for pattern in self.patterns for rule in pattern.rules for a in rule.asserts if a.xpath}
+        found = set()
+        for assert_id in xslt.xpath("//svrl:failed-assert/xsl:attribute[@name='id']", namespaces=XSL_NS):
+            found.add(assert_id.text.strip())
+            if assert_id.text.strip() in native:
+                choose = assert_id.xpath("ancestor::xsl:choose[1]", namespaces=XSL_NS)[0]
+                choose.getparent().remove(choose)
+        missing = set(self._order) - found
+        if missing:
+            raise ValueError(f"Asserts missing from the compiled XSLT: {', '.join(sorted(missing))}")
+
+        # Rule templates stay, even when all their asserts are native: they decide which rule fires on a node
+        idle = [p.mode for p in self.patterns
+                if all(a.xpath for rule in p.rules for a in rule.asserts) or (modes is not None and p.mode not in modes)]
+        if len(idle) == len(self.patterns):
+            return None
+        _remove_modes(xslt, idle)
+        for pattern in self.patterns:
+            if pattern.mode not in idle:
+                self._prune_traversal(xslt, pattern)
+        return etree.tostring(xslt, encoding="unicode")
+
+    @staticmethod
+    def _prune_traversal(xslt: etree._ElementTree, pattern: Pattern):
+        """
+        Apply the templates of a pattern to the nodes its SaxonC rules may match, instead of every node.
+
+        The candidates are the rule contexts without their predicates: the rule templates still decide
+        which rule fires on each of them (the first matching one), and the rules after the last one with
+        SaxonC asserts can no longer fire on a candidate first, so they are dropped.
+        """
+        templates = sorted(
+            xslt.xpath("/xsl:stylesheet/xsl:template[@mode=$mode][number(@priority) >= 0]",
+                       namespaces=XSL_NS, mode=pattern.mode),
+            key=lambda template: -int(template.get("priority")))
+        saxon = [index for index, rule in enumerate(pattern.rules) if any(a.xpath is None for a in rule.asserts)]
+        candidates = [_candidate_path(pattern.rules[index].context) for index in saxon]
+        if len(templates) != len(pattern.rules) or None in candidates:
+            return
+        for template in templates[saxon[-1] + 1:]:
+            template.getparent().remove(template)
+        for node in xslt.xpath("//xsl:apply-templates[@mode=$mode][@select='@*|*']", namespaces=XSL_NS,
+                               mode=pattern.mode):
+            node.getparent().remove(node)
+        for node in xslt.xpath("/xsl:stylesheet/xsl:template[@match='/']//xsl:apply-templates[@mode=$mode]",
+                               namespaces=XSL_NS, mode=pattern.mode):
+            node.set("select", " | ".join(dict.fromkeys(path for paths in candidates for path in paths)))
+
+    @property
+    def asserts(self) -> List[Assert]:
+        return [a for pattern in self.patterns for rule in pattern.rules for a in rule.asserts]
+
+    def evaluate(self, root: etree._Element, modes: Optional[Tuple[str, ...]] = None,
+                 max_errors: Optional[int] = None) -> List[Failure]:
+        """
+        Failures of the native asserts of the given pattern modes (None: all the patterns),
+        by pattern and assert (sort() restores the SVRL order).
+
+        With max_errors, evaluation stops at the assert that brings the errors to max_errors:
+        these are the first errors found, not necessarily the first ones in SVRL order.
+        """
+        failures = []
+        errors = 0
+        values: Dict[str, Any] = {}
+        locations = _Locations()
+        for pattern in self.patterns:
+            if modes is not None and pattern.mode not in modes:
+                continue
+            # An element fires the first rule of the pattern whose context it matches
+            claimed: Set[etree._Element] = set()
+            for rule in pattern.rules:
+                if rule.xpath is None:
+                    break
+                elements = [element for element in rule.xpath(root) if element not in claimed]
+                if not elements:
+                    continue
+                claimed.update(elements)
+                for a in rule.asserts:
+                    if a.xpath is None:
+                        continue
+                    for name in a.variables:
+                        if name not in values:
+                            values[name] = self._paths[name](root)
+                    xpath, variables = a.xpath, {name: values[name] for name in a.variables}
+                    if any(isinstance(value, list) and len(value) > _NODE_SET_LIMIT for value in variables.values()):
+                        xpath, variables = a.inline, {}
+                    for start in range(0, len(elements), _NODE_SET_LIMIT):
+                        chunk = elements[start:start + _NODE_SET_LIMIT]
+                        try:
+                            failed = xpath(root, context=chunk, **variables)
+                        except XPathDynamicError as e:
+                            location = self._locate_error(xpath, chunk, variables)
+                            raise SchematronError(f"{a.id} at {location}: {e}") from None
+                        failures.extend(Failure(a.id, a.role, a.message, locations[element], element)
+                                        for element in failed)
+                        if failed and a.role in BLOCKING_ROLES:
+                            errors += len(failed)
+                            if max_errors is not None and errors >= max_errors:
+                                return failures
+        return failures
+
+    @staticmethod
+    def _locate_error(xpath: etree.XPath, elements: List[etree._Element], variables: Dict[str, Any]) -> str:
+        for element in elements:
+            try:
+                xpath(element, context=[element], **variables)
+            except XPathDynamicError:
+                return element_location(element)
+        return ""
+
+    def sort(self, root: etree._Element, failures: List[Failure]) -> List[Failure]:
+        """Failures in SVRL order: pattern, then document order, then assert order in the rule."""
+        if len(failures) < 2:
+            return failures
+        document_order = {element: index for index, element in enumerate(root.iter())}
+        unresolved = len(document_order)
+
+        def key(failure: Failure) -> Tuple[int, int, int]:
+            pattern_index, assert_index = self._order.get(failure.rule_id, (len(self.patterns), 0))
+            element = failure.element if failure.element is not None else resolve_location(root, failure.location)
+            return pattern_index, document_order.get(element, unresolved), assert_index
+
+        return sorted(failures, key=key)
+
+
+def pattern_modes(xslt: etree._ElementTree) -> List[str]:
+    """The modes of the compiled Schematron XSLT, one per pattern, in pattern order."""
+    return xslt.xpath("/xsl:stylesheet/xsl:template[@match='/']//xsl:apply-templates/@mode", namespaces=XSL_NS)
+
+
+def _remove_modes(xslt: etree._ElementTree, modes: List[str]):
+    """Remove the patterns of the given modes from a compiled Schematron XSLT."""
+    for mode in modes:
+        for node in xslt.xpath("//xsl:apply-templates[@mode=$mode] | /xsl:stylesheet/xsl:template[@mode=$mode]",
+                               namespaces=XSL_NS, mode=mode):
+            node.getparent().remove(node)
+
+
+@lru_cache(maxsize=None)
+def plan_shards(xslt_path: str, count: int) -> List[Tuple[str, ...]]:
+    """
+    The pattern modes of a compiled Schematron XSLT in at most `count` groups of consecutive patterns.
+
+    The groups balance the number of rules and asserts, which is what a pattern costs on a large
+    invoice; keeping them consecutive lets the failures be merged by concatenation.
+    """
+    xslt = etree.parse(xslt_path)
+    modes = pattern_modes(xslt)
+    weights = [len(xslt.xpath("/xsl:stylesheet/xsl:template[@mode=$mode][number(@priority) >= 0]"
+                              " | /xsl:stylesheet/xsl:template[@mode=$mode]//svrl:failed-assert",
+                              namespaces=XSL_NS, mode=mode))
+               for mode in modes]
+    count = max(1, min(count, len(modes)))
+    best = None
+    for cuts in combinations(range(1, len(modes)), count - 1):
+        bounds = list(zip((0,) + cuts, cuts + (len(modes),)))
+        heaviest = max(sum(weights[start:end]) for start, end in bounds)
+        if best is None or heaviest < best[0]:
+            best = heaviest, bounds
+    return [tuple(modes[start:end]) for start, end in best[1]]
+
+
+@lru_cache(maxsize=None)
+def split_stylesheet(xslt_path: str, modes: Tuple[str, ...]) -> str:
+    """The compiled Schematron XSLT reduced to the patterns of the given modes."""
+    xslt = etree.parse(xslt_path)
+    _remove_modes(xslt, [mode for mode in pattern_modes(xslt) if mode not in modes])
+    return etree.tostring(xslt, encoding="unicode")
+
+
+@lru_cache(maxsize=None)
+def load_schematron(sch_path: str, xslt_path: str) -> CompiledSchematron:
+    """Compiled rules, once per process."""
+    return CompiledSchematron(sch_path, xslt_path)
+
+
+@lru_cache(maxsize=None)
+def targeted_stylesheet(xslt_path: str) -> str:
+    """
+    The compiled Schematron XSLT applying each pattern to the nodes its rules may match,
+    instead of walking the whole tree once per pattern.
+
+    The candidates are the rule contexts without their predicates, in document order:
+    the rule templates still decide which rule fires on each of them, so the failures
+    and their order do not change. Patterns with a context that cannot be bounded this
+    way keep their walk. Small documents (CDAR messages) spend most of a full transform
+    walking the tree, once per pattern.
+    """
+    xslt = etree.parse(xslt_path)
+    for mode in pattern_modes(xslt):
+        templates = xslt.xpath("/xsl:stylesheet/xsl:template[@mode=$mode][number(@priority) >= 0]",
+                               namespaces=XSL_NS, mode=mode)
+        candidates = [_candidate_path(template.get("match")) for template in templates]
+        if not templates or None in candidates or any("@" in path.rsplit("/", 1)[-1]
+                                                       for paths in candidates for path in paths):
+            continue
+        for node in xslt.xpath("/xsl:stylesheet/xsl:template[@mode=$mode]//xsl:apply-templates[@mode=$mode]",
+                               namespaces=XSL_NS, mode=mode):
+            node.getparent().remove(node)
+        for node in xslt.xpath("/xsl:stylesheet/xsl:template[@match='/']//xsl:apply-templates[@mode=$mode]",
+                               namespaces=XSL_NS, mode=mode):
+            node.set("select", " | ".join(dict.fromkeys(path for paths in candidates for path in paths)))
+    return etree.tostring(xslt, encoding="unicode")
@@ -0,0 +1,98 @@
+"""
+Syntax detection for bare e-invoice XML documents.
+
+Identifies the invoice syntax (Factur-X/ZUGFeRD 2.x CII, ZUGFeRD 1.0, UBL)
+from the root element alone, so callers can route a document without
+wrapping it in a PDF first.
+"""
+import logging
+from typing import Optional
+from lxml import etree
+from facturx import get_level
+
+logger = logging.getLogger(__name__)
+
+# Syntax identifiers (values match facturx.get_flavor() where they overlap)
+SYNTAX_CII = "factur-x"
+SYNTAX_ZUGFERD_V1 = "zugferd"
+SYNTAX_UBL = "ubl"
+SYNTAX_ORDER_X = "order-x"
+
+# Root element namespaces
+NS_CII = "urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100"
+NS_ZUGFERD_V1 = "urn:ferd:CrossIndustryDocument:invoice:1p0"
+NS_UBL_INVOICE = "urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+NS_UBL_CREDIT_NOTE = "urn:oasis:names:specification:ubl:schema:xsd:CreditNote-2"
+NS_ORDER_X = "urn:un:unece:uncefact:data:standard:SCRDMCCBDACIOMessageStructure:100"
+NS_CDAR = "urn:un:unece:uncefact:data:standard:CrossDomainAcknowledgementAndResponse:100"  # Lifecycle messages
+
+_ROOT_SYNTAX = {
+    f"{{{NS_CII}}}CrossIndustryInvoice": SYNTAX_CII,
+    f"{{{NS_ZUGFERD_V1}}}CrossIndustryDocument": SYNTAX_ZUGFERD_V1,
+    f"{{{NS_UBL_INVOICE}}}Invoice": SYNTAX_UBL,
+    f"{{{NS_UBL_CREDIT_NOTE}}}CreditNote": SYNTAX_UBL,
+    f"{{{NS_ORDER_X}}}SCRDMCCBDACIOMessageStructure": SYNTAX_ORDER_X,
+}
+
+_UBL_CUSTOMIZATION_ID = etree.XPath(
+    "/*/cbc:CustomizationID/text()",
+    namespaces={"cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2"}
+)
+_CII_GUIDELINE_ID = etree.XPath(
+    "//*[local-name()='GuidelineSpecifiedDocumentContextParameter']/*[local-name()='ID']/text()"
+)
+
+
+def looks_like_xml(file_content: bytes) -> bool:
+    """Cheap sniff: True if the payload starts with '<' (after BOM/whitespace)."""
+    head = bytes(file_content[:64])
+    if head.startswith(b'\xef\xbb\xbf'):
+        head = head[3:]
+    return head.lstrip().startswith(b'<')
+
+
+def detect_syntax(xml_root: etree._Element) -> str:
+    """
+    Detect the invoice syntax from the root element.
+
+    Returns:
+        One of SYNTAX_CII, SYNTAX_ZUGFERD_V1, SYNTAX_UBL, SYNTAX_ORDER_X.
+
+    Raises:
+        ValueError: if the root element is not a supported invoice document.
+    """
+    syntax = _ROOT_SYNTAX.get(xml_root.tag)
+    if syntax is None:
+        raise ValueError(
+            f"Unsupported XML root element {xml_root.tag!r}: expected a CII, "
+            f"ZUGFeRD 1.0 or UBL Invoice/CreditNote document"
+        )
+    return syntax
+
+
+def detect_level(xml_root: etree._Element, syntax: str) -> Optional[str]:
+    """
+    Detect the profile/level of a document of the given syntax.
+
+    CII/ZUGFeRD use facturx.get_level(), with a fallback to 'en16931' for
+    newer EN16931-based URNs (e.g. XRechnung 3.0) the library does not know.
+    UBL documents report 'xrechnung' or 'en16931' from their CustomizationID.
+    """
+    if syntax == SYNTAX_UBL:
+        customization = _UBL_CUSTOMIZATION_ID(xml_root)
+        urn = customization[0].lower() if customization else ""
+        if "xrechnung" in urn:
+            return "xrechnung"
+        if "en16931" in urn:
+            return "en16931"
+        return None
+
+    try:
+        return get_level(xml_root)
+    except Exception:
+        guideline = _CII_GUIDELINE_ID(xml_root)
+        urn = guideline[0].lower() if guideline else ""
+        if "en16931" in urn or "xrechnung" in urn:
+            logger.info(f"Using fallback level detection for URN: {urn}")
+            return "en16931"
+        raise
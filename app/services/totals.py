@@ -0,0 +1,223 @@
+"""
+Invoice totals and VAT breakdown calculation (EN 16931 BR-CO / BR-x-08 arithmetic).
+
+Computes the document totals (BG-22) and the VAT breakdown (BG-23) from the
+lines and the document level allowances and charges. The template renders
+each line net amount, allowance/charge amount and rate with "%.2f", so they
+are summed exactly as rendered: rounded to cents the same way first.
+
+Amount columns are converted once to integer cents and summed in bulk;
+only the per-category results go through Decimal. This keeps a 20k-line invoice
+in the millisecond range and a usual one in microseconds, so requests can
+be completed or rejected before any XML, PDF or Schematron work.
+
+FX_TOTALS_MODE:
+- "fill" (default): omitted `amounts` / `tax_details` are computed.
+- "strict": same, and provided totals that do not match the lines are
+  rejected with the EN 16931 rule they would fail.
+"""
+import logging
+import os
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, List, Optional, Tuple
+
+from app.schemas.validation import InvoiceMetadata, MonetaryAmounts, TaxDetail
+
+logger = logging.getLogger(__name__)
+
+TOTALS_MODE = os.getenv("FX_TOTALS_MODE", "fill").lower()
+
+_CENT = Decimal("0.01")
+_ZERO = Decimal(0)
+# VAT category code -> rule prefix of its BR-x-08 breakdown rule
+_CATEGORY_RULES = {"S": "S", "Z": "Z", "E": "E", "AE": "AE", "K": "IC", "G": "G", "O": "O", "L": "AF", "M": "AG"}
+
+CategoryKey = Tuple[str, Decimal]  # (VAT category code, rate)
+
+
+class TotalsError(ValueError):
+    """Provided totals are inconsistent with the lines (strict mode)."""
+
+    def __init__(self, errors: List[Dict[str, str]]):
+        self.errors = errors
+        super().__init__(errors[0]["message"])
+
+
+def _round(value: Decimal) -> Decimal:
+    return value.quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+def _decimal(value) -> Decimal:
+    # Provided totals and tax details are strings, rendered as given
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def _cents(values: List[float]) -> List[int]:
+    """Integer cents of a column of amounts, rounded as the template renders them ("%.2f")."""
+    return [int(("%.2f" % value).replace(".", "")) for value in values]
+
+
+def _grouped_sum(keys: List[Tuple[str, float]], values: List[float]) -> Dict[CategoryKey, Decimal]:
+    """Exact sum of the rendered `values` per (category, rate) key."""
+    if not values:
+        return {}
+    cents = _cents(values)
+    distinct = set(keys)
+    if len(distinct) == 1:  # Usual case: a single VAT rate
+        sums = {distinct.pop(): sum(cents)}
+    else:
+        sums = dict.fromkeys(distinct, 0)
+        for key, n in zip(keys, cents):
+            sums[key] += n
+    # Rates as rendered ("%.2f"), e.g. 5.5 and 5.50 are the same category
+    return {(category, Decimal("%.2f" % rate).normalize()): Decimal(n).scaleb(-2)
+            for (category, rate), n in sums.items()}
+
+
+class InvoiceTotals:
+    """Totals computed from the lines, allowances and charges (unrounded sums kept exact)."""
+
+    __slots__ = ("line_total", "allowance_total", "charge_total", "tax_basis_total",
+                 "breakdown", "tax_total", "grand_total")
+
+    def __init__(self, line_total: Decimal, allowance_total: Decimal, charge_total: Decimal,
+                 breakdown: Dict[CategoryKey, Tuple[Decimal, Decimal]]):
+        self.line_total = line_total
+        self.allowance_total = allowance_total
+        self.charge_total = charge_total
+        self.tax_basis_total = line_total - allowance_total + charge_total
+        self.breakdown = breakdown  # (category, rate) -> (taxable amount, tax amount)
+        self.tax_total = sum((tax for _, tax in breakdown.values()), _ZERO)
+        self.grand_total = self.tax_basis_total + self.tax_total
+
+
+class TotalsService:
+    """Calculation engine for the monetary totals and the VAT breakdown."""
+
+    @staticmethod
+    def compute(metadata: InvoiceMetadata) -> InvoiceTotals:
+        """Document totals and VAT breakdown from the lines, allowances and charges."""
+        lines = metadata.lines
+        allowances = metadata.allowances or []
+        charges = metadata.charges or []
+
+        line_sums = _grouped_sum([(line.vat_category, line.vat_rate) for line in lines],
+                                 [line.net_total for line in lines])
+        allowance_sums = _grouped_sum([(a.vat_category, a.vat_rate) for a in allowances],
+                                      [a.amount for a in allowances])
+        charge_sums = _grouped_sum([(c.vat_category, c.vat_rate) for c in charges],
+                                   [c.amount for c in charges])
+
+        # BR-x-08: taxable amount per category and rate, each sum rounded as in the Schematron
+        breakdown = {}
+        for key in sorted(set(line_sums) | set(allowance_sums) | set(charge_sums)):
+            basis = (_round(line_sums.get(key, _ZERO)) + _round(charge_sums.get(key, _ZERO))
+                     - _round(allowance_sums.get(key, _ZERO)))
+            breakdown[key] = (basis, _round(basis * key[1] / 100))
+        return InvoiceTotals(
+            line_total=_round(sum(line_sums.values(), _ZERO)),
+            allowance_total=_round(sum(allowance_sums.values(), _ZERO)),
+            charge_total=_round(sum(charge_sums.values(), _ZERO)),
+            breakdown=breakdown,
+        )
+
+    @staticmethod
+    def check(metadata: InvoiceMetadata, totals: Optional[InvoiceTotals] = None) -> List[Dict[str, str]]:
+        """
+        Errors (validator format) for provided totals that the EN 16931
+        Schematron would reject, checked against the computed ones.
+        """
+        totals = totals or TotalsService.compute(metadata)
+        amounts = metadata.amounts
+        errors = []
+
+        def fail(rule_id: str, message: str):
+            errors.append({"rule_id": rule_id, "message": f"[{rule_id}] {message}", "severity": "error", "layer": "totals"})
+
+        def given(value: Optional[str]) -> Decimal:
+            return _decimal(value) if value is not None else _ZERO
+
+        if amounts is not None:
+            # Rendered values (LineTotalAmount falls back to the tax basis total in the template)
+            line_total = given(amounts.line_total if amounts.line_total is not None else amounts.tax_basis_total)
+            allowance_total, charge_total = given(amounts.allowance_total), given(amounts.charge_total)
+            tax_basis_total, tax_total = given(amounts.tax_basis_total), given(amounts.tax_total)
+            grand_total, prepaid = given(amounts.grand_total), given(amounts.prepaid)
+
+            if line_total != totals.line_total:
+                fail("BR-CO-10", f"Sum of invoice line net amounts is {totals.line_total}, not {line_total}")
+            if metadata.allowances and allowance_total != totals.allowance_total:
+                fail("BR-CO-11", f"Sum of allowances on document level is {totals.allowance_total}, not {allowance_total}")
+            if metadata.charges and charge_total != totals.charge_total:
+                fail("BR-CO-12", f"Sum of charges on document level is {totals.charge_total}, not {charge_total}")
+            expected = _round(line_total - allowance_total + charge_total)
+            if tax_basis_total != expected:
+                fail("BR-CO-13", f"Invoice total amount without VAT should be {expected}, not {tax_basis_total}")
+            if metadata.tax_details:
+                expected = _round(sum((given(tax.calculated_amount) for tax in metadata.tax_details), _ZERO))
+                if tax_total != expected:
+                    fail("BR-CO-14", f"Invoice total VAT amount should be {expected} (sum of the VAT breakdown), not {tax_total}")
+            expected = _round(tax_basis_total + tax_total)
+            if grand_total != expected:
+                fail("BR-CO-15", f"Invoice total amount with VAT should be {expected}, not {grand_total}")
+            expected = grand_total - prepaid
+            if given(amounts.due_payable) != expected:
+                fail("BR-CO-16", f"Amount due for payment should be {expected}, not {amounts.due_payable}")
+
+        for tax in metadata.tax_details:
+            basis, rate, calculated = given(tax.basis_amount), given(tax.rate), given(tax.calculated_amount)
+            expected_tax = _round(abs(basis) * rate / 100)
+            if (rate == 0 and calculated.to_integral_value(ROUND_HALF_UP) != 0) or (
+                    rate != 0 and abs(abs(calculated) - expected_tax) > 1):
+                fail("BR-CO-17", f"VAT amount of category {tax.category_code} {tax.rate}% should be {expected_tax}, not {calculated}")
+            computed = totals.breakdown.get((tax.category_code, rate.normalize()))
+            expected_basis = computed[0] if computed else _ZERO
+            if tax.category_code in _CATEGORY_RULES and basis != expected_basis:
+                rule_id = f"BR-{_CATEGORY_RULES[tax.category_code]}-08"
+                fail(rule_id, f"Taxable amount of category {tax.category_code} {tax.rate}% should be {expected_basis}, not {basis}")
+        return errors
+
+    @staticmethod
+    def apply(metadata: InvoiceMetadata, mode: Optional[str] = None) -> InvoiceMetadata:
+        """
+        Metadata ready for generation: omitted `amounts` / `tax_details`
+        computed from the lines; in strict mode, TotalsError if the provided
+        totals are inconsistent.
+        """
+        mode = mode or TOTALS_MODE
+        fill_amounts = metadata.amounts is None
+        fill_taxes = not metadata.tax_details and bool(metadata.lines)
+        if not (fill_amounts or fill_taxes or mode == "strict"):
+            return metadata
+
+        totals = TotalsService.compute(metadata)
+        update = {}
+        if fill_taxes:
+            update["tax_details"] = [
+                TaxDetail(calculated_amount=str(tax), basis_amount=str(_round(basis)),
+                          rate=str(_round(rate)), category_code=category)
+                for (category, rate), (basis, tax) in totals.breakdown.items()
+            ]
+        if fill_amounts:
+            tax_total = totals.tax_total
+            if not fill_taxes and metadata.tax_details:
+                tax_total = _round(sum((_decimal(tax.calculated_amount) for tax in metadata.tax_details), _ZERO))
+            grand_total = _round(totals.tax_basis_total + tax_total)
+            update["amounts"] = MonetaryAmounts(
+                line_total=str(totals.line_total),
+                allowance_total=str(totals.allowance_total) if metadata.allowances else None,
+                charge_total=str(totals.charge_total) if metadata.charges else None,
+                tax_basis_total=str(totals.tax_basis_total),
+                tax_total=str(tax_total),
+                grand_total=str(grand_total),
+                due_payable=str(grand_total),
+            )
+        if update:
+            metadata = metadata.model_copy(update=update)
+            logger.info(f"Computed {', '.join(update)} for invoice {metadata.invoice_number}")
+
+        if mode == "strict":
+            errors = TotalsService.check(metadata, totals)
+            if errors:
+                raise TotalsError(errors)
+        return metadata
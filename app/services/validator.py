@@ -1,10 +1,15 @@
+import importlib.resources
 import logging
-from io import BytesIO
 from pathlib import Path
-from typing import Tuple, Optional, List
-from facturx import get_xml_from_pdf, xml_check_xsd, get_level, get_flavor
+from threading import Lock, local
+from typing import Dict, Tuple, Optional, List
+from facturx import get_level, get_flavor
+from facturx.facturx import FACTURX_LEVEL2xsd, ORDERX_LEVEL2xsd
 from lxml import etree
 
+from app.metrics import metrics
+from app.services.pdf_locator import get_xml_from_pdf_fast
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,8 +27,17 @@ class ValidationService:
     # Assets Path
     _SCHEMATRON_DIR = Path(__file__).parent.parent / "assets" / "schematron"
     
-    # Pre-compiled XSLT validator (Singleton)
-    _CORE_VALIDATOR: Optional[etree.XSLT] = None
+    # Business rules XSLT: read once, compiled once per thread (an lxml XSLT object
+    # must not run in several threads at once)
+    _CORE_SOURCE: Optional[bytes] = None
+    _CORE_LOADED = False
+    _CORE_LOCK = Lock()
+    _CORE_LOCAL = local()
+
+    # Compiled XSDs of the factur-x library, per (flavor, level), each with its lock:
+    # an XMLSchema keeps the error log of its last validation on the object
+    _SCHEMAS: Dict[Tuple[str, Optional[str]], Tuple[etree.XMLSchema, Lock]] = {}
+    _SCHEMAS_LOCK = Lock()
 
     # Dictionary mapping technical XSD substrings to user-friendly messages
     _ERROR_MAP = {
@@ -43,17 +57,88 @@ class ValidationService:
 
     @classmethod
     def _initialize_schematrons(cls):
-        """Initializes XSLT validators if not already loaded."""
-        if cls._CORE_VALIDATOR is None:
+        """Loads the XSLT business rules once (concurrent first requests wait for it)."""
+        if cls._CORE_LOADED:
+            return
+        with cls._CORE_LOCK:
+            if cls._CORE_LOADED:
+                return
             # We use a combined file for core EN16931 + FR business rules 
             # optimized for Python (XPath 1.0)
             core_path = cls._SCHEMATRON_DIR / "facturx_py_rules.xsl"
             if core_path.exists():
                 try:
-                    cls._CORE_VALIDATOR = etree.XSLT(etree.parse(str(core_path)))
+                    source = core_path.read_bytes()
+                    etree.XSLT(etree.fromstring(source))  # A broken stylesheet fails here, once
+                    cls._CORE_SOURCE = source
                     logger.info("Loaded Factur-X Python-Compatible Business Rules (XSLT)")
                 except Exception as e:
                     logger.error(f"Failed to load Core Rules: {e}")
+            cls._CORE_LOADED = True
+
+    @classmethod
+    def _core_validator(cls) -> Optional[etree.XSLT]:
+        """The business rules compiled for the calling thread (None when they could not be loaded)."""
+        if cls._CORE_SOURCE is None:
+            return None
+        validator = getattr(cls._CORE_LOCAL, "validator", None)
+        if validator is None:
+            validator = cls._CORE_LOCAL.validator = etree.XSLT(etree.fromstring(cls._CORE_SOURCE))
+        return validator
+
+    @staticmethod
+    def _xsd_file(flavor: str, level: Optional[str]) -> str:
+        """XSD of the factur-x library for this flavor and level (as xml_check_xsd picks it)."""
+        if flavor in ('factur-x', 'facturx'):
+            if level not in FACTURX_LEVEL2xsd:
+                raise ValueError(f"Wrong level '{level}' for Factur-X invoice.")
+            return f"xsd/{FACTURX_LEVEL2xsd[level]}"
+        if flavor == 'zugferd':
+            return "xsd/zugferd/ZUGFeRD1p0.xsd"
+        if flavor in ('order-x', 'orderx'):
+            if level not in ORDERX_LEVEL2xsd:
+                raise ValueError(f"Wrong level '{level}' for Order-X document.")
+            return f"xsd/{ORDERX_LEVEL2xsd[level]}"
+        raise ValueError(f"Unsupported flavor '{flavor}'")
+
+    @classmethod
+    def _schema(cls, flavor: str, level: Optional[str]) -> Tuple[etree.XMLSchema, Lock]:
+        """Compiled XSD for this flavor and level, once per process."""
+        key = (flavor, level)
+        entry = cls._SCHEMAS.get(key)
+        if entry is not None:
+            metrics.inc("xsd_cache_hits")
+            return entry
+        with cls._SCHEMAS_LOCK:
+            entry = cls._SCHEMAS.get(key)
+            if entry is None:
+                metrics.inc("xsd_cache_misses")
+                xsd_file = importlib.resources.files("facturx").joinpath(cls._xsd_file(flavor, level))
+                with xsd_file.open("rb") as xsd:
+                    entry = (etree.XMLSchema(etree.parse(xsd)), Lock())
+                cls._SCHEMAS[key] = entry
+                logger.info(f"Compiled {flavor} {level} XSD")
+            else:
+                metrics.inc("xsd_cache_hits")
+        return entry
+
+    @classmethod
+    def _check_xsd(cls, xml_etree: etree._Element, flavor: str, level: Optional[str]):
+        """
+        Validate the parsed document against the official XSD (cached xml_check_xsd).
+
+        Raises an exception with the message of facturx.xml_check_xsd when it is invalid.
+        """
+        schema, lock = cls._schema(flavor, level)
+        with lock:
+            try:
+                schema.assertValid(xml_etree)
+            except etree.DocumentInvalid as e:
+                raise Exception(
+                    f"The {flavor.capitalize()} XML file is not valid against the official "
+                    f"XML Schema Definition. Here is the error, which may give you an idea on the "
+                    f"cause of the problem: {e}."
+                )
 
     @staticmethod
     def _humanize_errors(technical_errors: List[str]) -> List[str]:
@@ -78,8 +163,9 @@ class ValidationService:
         return list(dict.fromkeys(human_errors)) # Remove duplicates
 
     @staticmethod
-    def _check_schematron(xml_etree: etree._Element, validator: etree.XSLT) -> List[str]:
-        """Runs Schematron validation and extracts failed assertions."""
+    def _check_schematron(xml_etree: etree._Element, validator: etree.XSLT,
+                          max_errors: Optional[int] = None) -> List[str]:
+        """Runs Schematron validation and extracts failed assertions (up to max_errors)."""
         errors = []
         try:
             # SVRL (Schematron Validation Report Language) output
@@ -89,9 +175,11 @@ class ValidationService:
 
             # Find all failed assertions in the SVRL report
             ns = {"svrl": "http://purl.oclc.org/dsdl/svrl"}
-            failed_asserts = result_tree.xpath("//svrl:failed-assert", namespaces=ns)
+            failed_asserts = result_tree.iterfind(".//svrl:failed-assert", namespaces=ns)
             
             for assertion in failed_asserts:
+                if max_errors is not None and len(errors) >= max_errors:
+                    break
                 # Check severity
                 severity = assertion.get("severity", "fatal").lower()
                 is_blocking = severity not in ["warning", "info"]
@@ -118,13 +206,15 @@ class ValidationService:
         return errors
 
     @staticmethod
-    def validate_file(file_content: bytes, filename: str) -> Tuple[bool, Optional[str], Optional[str], List[str]]:
+    def validate_file(file_content: bytes, filename: str,
+                      max_errors: Optional[int] = None) -> Tuple[bool, Optional[str], Optional[str], List[str]]:
         """
         Validate a Factur-X PDF or XML file.
         
         Args:
-            file_content: Raw file bytes.
+            file_content: Raw file content (bytes, memoryview or mmap).
             filename: Original filename (used for type detection).
+            max_errors: Stop collecting business rule errors at this many (None: all).
             
         Returns:
             Tuple of (is_valid, format, flavor, errors_list).
@@ -138,22 +228,19 @@ class ValidationService:
         
         try:
             # Detect file type
-            is_pdf = filename.lower().endswith('.pdf') or file_content.startswith(b'%PDF')
+            is_pdf = filename.lower().endswith('.pdf') or bytes(file_content[:4]) == b'%PDF'
             
             if is_pdf:
                 # Extract XML from PDF
                 logger.debug(f"Validating PDF file: {filename}")
                 try:
-                    xml_filename, xml_content = get_xml_from_pdf(
-                        BytesIO(file_content),
-                        check_xsd=False
-                    )
+                    xml_filename, xml_content = get_xml_from_pdf_fast(file_content)
                     if not xml_content:
                         return False, None, None, ["No Factur-X/ZUGFeRD XML found in PDF"]
                 except Exception as e:
                     return False, None, None, [f"Failed to extract XML from PDF: {str(e)}"]
             else:
-                xml_content = file_content
+                xml_content = bytes(file_content)
 
             # 1. Parse XML and technical validation (XSD)
             try:
@@ -176,16 +263,18 @@ class ValidationService:
             except Exception as e:
                 return False, None, None, [f"Invalid XML syntax: {str(e)}"]
             
-            # XSD Check
+            # XSD Check (compiled once, on the tree parsed above)
             try:
-                xml_check_xsd(xml_content, flavor=detected_format, level=detected_flavor)
+                ValidationService._check_xsd(xml_etree, detected_format, detected_flavor)
             except Exception as e:
                 return False, detected_format, detected_flavor, ValidationService._humanize_errors([str(e)])
 
             # 2. Business Rules Validation (Schematron Lite)
             if detected_flavor in ["en16931", "extended"]:
-                if ValidationService._CORE_VALIDATOR:
-                    schematron_errors = ValidationService._check_schematron(xml_etree, ValidationService._CORE_VALIDATOR)
+                core_validator = ValidationService._core_validator()
+                if core_validator:
+                    schematron_errors = ValidationService._check_schematron(
+                        xml_etree, core_validator, max_errors)
                     if schematron_errors:
                         logger.warning(f"Business rule validation failed: {schematron_errors}")
                         return False, detected_format, detected_flavor, schematron_errors
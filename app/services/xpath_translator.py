@@ -0,0 +1,452 @@
+"""
+XPath 2.0 -> XPath 1.0 translation for Schematron rules (see app/services/schematron.py).
+
+Translates the subset of XPath 2.0 the EN 16931 rules are written in to
+XPath 1.0 expressions lxml can compile, with the same results. Where the
+two languages differ, the translation either rewrites the construct
+(exists(), ends-with(), upper-case() against a literal, comparisons with a
+sequence or a boolean) or calls a guard function that stops evaluation on
+the dynamic errors XPath 2.0 raises (more than one item for a single-item
+argument, an untyped value that is not a number in arithmetic). Anything
+else (xs:decimal arithmetic, regular expressions, variables, quantified
+expressions, ...) raises Unsupported.
+"""
+import operator
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from lxml import etree
+
+FX_NS = "urn:facturx-engine:xpath2"
+
+# Static kinds of translated expressions
+NODES, ITEM, STRING, NUMBER, BOOLEAN, SEQUENCE, UPPER = (
+    "nodes", "item", "string", "number", "boolean", "sequence", "upper-case"
+)
+_NODE_KINDS = (NODES, ITEM)
+
+_TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<literal>'[^']*'|"[^"]*")
+  | (?P<number>\d+(?:\.\d*)?|\.\d+)
+  | (?P<name>(?:\*|[A-Za-z_][\w.-]*)(?::(?:\*|[A-Za-z_][\w.-]*))?)
+  | (?P<op>//|::|\.\.|!=|<=|>=|<<|>>|[/.=<>()\[\],@|+*$-])
+)""", re.X)
+
+_COMPARISONS = ("=", "!=", "<", "<=", ">", ">=")
+_CONVERSE = {"=": "=", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+_KIND_TESTS = ("node", "text", "comment", "processing-instruction")
+_STRING_FUNCTIONS = ("string", "concat", "substring", "substring-before", "substring-after",
+                     "normalize-space", "translate")
+_LOWER, _UPPER = "abcdefghijklmnopqrstuvwxyz", "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+# Non-ASCII characters upper-case into I, S and F (dotless i, long s, sharp s, ligatures)
+_UPPER_SAFE_RE = re.compile(r"'[A-EG-HJ-RT-Z0-9 _.-]*'")
+_DOUBLE_RE = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?|-?INF|NaN")
+# A step selecting elements only (no attributes or text nodes, no variables): see _Translator.absolute_path()
+_ELEMENT_STEP_RE = re.compile(r"""(?:
+    \.\.?
+  | (?:(?:child|descendant|descendant-or-self|self|parent|ancestor|ancestor-or-self|following-sibling|preceding-sibling)::)?
+    (?:\*|[A-Za-z_][\w.-]*)(?::(?:\*|[A-Za-z_][\w.-]*))?
+)(?:\[[^$]*\])?""", re.X)
+_BOOLEANS = {"true": True, "1": True, "false": False, "0": False}
+
+
+class Unsupported(ValueError):
+    """The expression needs XPath 2.0."""
+
+
+class XPathDynamicError(ValueError):
+    """An error XPath 2.0 would raise while evaluating the expression."""
+
+
+def _string_value(item) -> str:
+    return "".join(item.itertext()) if isinstance(item, etree._Element) else str(item)
+
+
+def _one(context, value):
+    if isinstance(value, list) and len(value) > 1:
+        raise XPathDynamicError("XPTY0004: a sequence of more than one item is not allowed here")
+    return value
+
+
+def _number(context, value):
+    for item in value if isinstance(value, list) else ():
+        if not _DOUBLE_RE.fullmatch(_string_value(item).strip()):
+            raise XPathDynamicError(f"FORG0001: cannot convert {_string_value(item)!r} to double")
+    return value
+
+
+_RELATIONS = {"=": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt,
+              ">=": operator.ge}
+
+
+def _number_compare(context, value, op, number):
+    # General comparison: untyped values are cast to double one by one, in order, until one compares true
+    for item in value:
+        text = _string_value(item).strip()
+        if not _DOUBLE_RE.fullmatch(text):
+            raise XPathDynamicError(f"FORG0001: cannot convert {text!r} to double")
+        if _RELATIONS[op](float(text.replace("INF", "inf")), number):
+            return True
+    return False
+
+
+def _boolean_equals(context, value, expected):
+    # Untyped values are cast to xs:boolean one by one, in order, until one is equal
+    for item in value:
+        cast = _BOOLEANS.get(" ".join(_string_value(item).split()))
+        if cast is None:
+            raise XPathDynamicError(f"FORG0001: {_string_value(item)!r} cannot be cast to a boolean")
+        if cast == expected:
+            return True
+    return False
+
+
+EXTENSIONS = {(FX_NS, "one"): _one, (FX_NS, "number"): _number, (FX_NS, "number-compare"): _number_compare,
+              (FX_NS, "boolean-equals"): _boolean_equals}
+
+
+class _Translator:
+    """Recursive descent over the expression, emitting XPath 1.0 as it goes: each rule returns (text, kind)."""
+
+    def __init__(self, expression: str, guards: bool, variables: Optional[Dict[str, str]] = None):
+        self.tokens: List[Tuple[str, str]] = []
+        position, expression = 0, expression.rstrip()
+        while position < len(expression):
+            match = _TOKEN_RE.match(expression, position)
+            if match is None or match.end() == position:
+                raise Unsupported(f"unexpected {expression[position:position + 10]!r}")
+            self.tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            position = match.end()
+        self.position = 0
+        # Guards raise XPath 2.0 dynamic errors; in match patterns an error only means "no match"
+        self.guards = guards
+        # Absolute path -> variable name, shared by the expressions of a rule set (None: no hoisting)
+        self.variables = variables
+        self.hoisted: List[str] = []
+        self.depth = 0  # Predicate nesting
+        # Translated absolute path -> (its XPath 1.0 without variables, the variable hoisted from it)
+        self.absolute: Dict[str, Tuple[str, Optional[str]]] = {}
+
+    def peek(self, offset: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def accept(self, value: str, kind: str = "op") -> bool:
+        if self.peek() == (kind, value):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, value: str):
+        if not self.accept(value):
+            raise Unsupported(f"expected {value!r}, found {self.peek()[1]!r}")
+
+    def finish(self):
+        if self.position < len(self.tokens):
+            raise Unsupported(f"unexpected {self.peek()[1]!r}")
+
+    # --- Guards ---
+
+    def single(self, operand: Tuple[str, str]) -> str:
+        text, kind = operand
+        if kind in (SEQUENCE, UPPER):
+            raise Unsupported(f"{kind} argument")
+        return f"fx:one({text})" if kind == NODES and self.guards else text
+
+    def numeric(self, operand: Tuple[str, str]) -> str:
+        text, kind = operand
+        if kind in _NODE_KINDS and self.guards:
+            return f"fx:number({self.single(operand)})"
+        if kind not in (NUMBER, *_NODE_KINDS):
+            raise Unsupported(f"arithmetic on a {kind} value")
+        return text
+
+    def truth(self, operand: Tuple[str, str]) -> str:
+        """An operand used for its effective boolean value: a whole absolute path is evaluated once."""
+        text = operand[0]
+        inner = text[1:-1] if text.startswith("(") and text.endswith(")") else text
+        if self.variables is None or inner not in self.absolute:
+            return text
+        path, hoisted = self.absolute[inner]
+        if hoisted is not None:
+            self.hoisted.remove(hoisted)
+        name = self.variables.setdefault(f"boolean({path})", f"p{len(self.variables) + 1}")
+        self.hoisted.append(name)
+        return f"${name}"
+
+    # --- Grammar ---
+
+    def expression(self) -> Tuple[str, str]:
+        left = self.and_expression()
+        while self.accept("or", "name"):
+            left = f"{self.truth(left)} or {self.truth(self.and_expression())}", BOOLEAN
+        return left
+
+    def and_expression(self) -> Tuple[str, str]:
+        left = self.comparison()
+        while self.accept("and", "name"):
+            left = f"{self.truth(left)} and {self.truth(self.comparison())}", BOOLEAN
+        return left
+
+    def comparison(self) -> Tuple[str, str]:
+        left = self.additive()
+        kind, op = self.peek()
+        if kind != "op" or op not in _COMPARISONS:
+            return left
+        self.position += 1
+        return self.compare(left, op, self.additive()), BOOLEAN
+
+    def compare(self, left: Tuple[str, str], op: str, right: Tuple[str, str]) -> str:
+        (left_text, left_kind), (right_text, right_kind) = left, right
+        if SEQUENCE in (left_kind, right_kind):
+            if op not in ("=", "!=") or left_kind == right_kind:
+                raise Unsupported("comparison with a sequence")
+            # General comparisons are existential: a = (x, y) is a = x or a = y
+            other, items = (left, right_text) if right_kind == SEQUENCE else (right, left_text)
+            return "(" + " or ".join(self.compare(other, op, (item, STRING)) for item in items) + ")"
+        if UPPER in (left_kind, right_kind):
+            upper, literal = (left_text, right_text) if left_kind == UPPER else (right_text, left_text)
+            if op not in ("=", "!=") or not _UPPER_SAFE_RE.fullmatch(literal):
+                raise Unsupported("upper-case() comparison")
+            return f"{upper} {op} {literal}"
+        if BOOLEAN in (left_kind, right_kind) and left_kind != right_kind:
+            nodes, value = (left, right_text) if right_kind == BOOLEAN else (right, left_text)
+            if op != "=" or nodes[1] not in _NODE_KINDS or value not in ("true()", "false()"):
+                raise Unsupported("comparison with a boolean")
+            if self.guards:
+                return f"fx:boolean-equals({nodes[0]}, {value})"
+            return f"{nodes[0]}[normalize-space(.)='{value[:-2]}' or normalize-space(.)='{int(value == 'true()')}']"
+        if left_kind in _NODE_KINDS and right_kind in _NODE_KINDS or left_kind == right_kind:
+            if op not in ("=", "!=") and left_kind != NUMBER:
+                # Untyped and string operands compare as strings in XPath 2.0, as numbers in XPath 1.0
+                raise Unsupported("relational comparison of untyped values")
+            return f"{left_text} {op} {right_text}"
+        if NUMBER in (left_kind, right_kind) and {left_kind, right_kind} - {NUMBER} <= set(_NODE_KINDS):
+            # Untyped values are cast to double
+            if NODES in (left_kind, right_kind) and self.guards:
+                if left_kind == NODES:
+                    return f"fx:number-compare({left_text}, '{op}', {right_text})"
+                return f"fx:number-compare({right_text}, '{_CONVERSE[op]}', {left_text})"
+            return f"{self.numeric(left)} {op} {self.numeric(right)}"
+        if STRING in (left_kind, right_kind) and {left_kind, right_kind} - {STRING} <= set(_NODE_KINDS):
+            if op not in ("=", "!="):
+                raise Unsupported("relational comparison of strings")
+            return f"{left_text} {op} {right_text}"
+        raise Unsupported(f"comparison of {left_kind} with {right_kind}")
+
+    def additive(self) -> Tuple[str, str]:
+        left = self.multiplicative()
+        while self.peek() in (("op", "+"), ("op", "-")):
+            op = self.tokens[self.position][1]
+            self.position += 1
+            left = f"{self.numeric(left)} {op} {self.numeric(self.multiplicative())}", NUMBER
+        return left
+
+    def multiplicative(self) -> Tuple[str, str]:
+        left = self.unary()
+        while self.peek() in (("op", "*"), ("name", "*"), ("name", "div"), ("name", "mod")):
+            op = self.tokens[self.position][1]
+            self.position += 1
+            left = f"{self.numeric(left)} {op} {self.numeric(self.unary())}", NUMBER
+        return left
+
+    def unary(self) -> Tuple[str, str]:
+        if self.accept("-"):
+            return f"-{self.numeric(self.unary())}", NUMBER
+        return self.union()
+
+    def union(self) -> Tuple[str, str]:
+        left = self.path()
+        while self.accept("|"):
+            right = self.path()
+            if left[1] not in _NODE_KINDS or right[1] not in _NODE_KINDS:
+                raise Unsupported("union of atomic values")
+            left = f"{left[0]} | {right[0]}", NODES
+        return left
+
+    def path(self) -> Tuple[str, str]:
+        if self.accept("/"):
+            kind, value = self.peek()
+            if kind == "name" or value in ("@", ".", ".."):
+                return self.absolute_path("/"), NODES
+            return "/", ITEM
+        if self.accept("//"):
+            return self.absolute_path("//"), NODES
+        return self.relative_path()
+
+    def absolute_path(self, separator: str) -> str:
+        steps = [(separator, *self.step())]
+        steps += self.steps(steps[0][2])
+        path = "".join(separator + text for separator, text, _ in steps)
+        if self.variables is None:
+            return path
+        # The element steps select the same nodes for every context node: evaluated once per document
+        count = 0
+        while count < len(steps) and _ELEMENT_STEP_RE.fullmatch(steps[count][1]):
+            count += 1
+        if count == 0:
+            self.absolute[path] = path, None
+            return path
+        hoisted = "".join(separator + text for separator, text, _ in steps[:count])
+        name = self.variables.setdefault(hoisted, f"p{len(self.variables) + 1}")
+        self.hoisted.append(name)
+        text = f"${name}" + "".join(separator + text for separator, text, _ in steps[count:])
+        self.absolute[text] = path, name
+        return text
+
+    def relative_path(self) -> Tuple[str, str]:
+        text, kind = self.step()
+        for separator, step, _ in self.steps(kind):
+            text, kind = text + separator + step, NODES
+        return text, kind
+
+    def steps(self, kind: str) -> List[Tuple[str, str, str]]:
+        """The (separator, step, kind) following a first step of the given kind."""
+        steps = []
+        while self.peek() in (("op", "/"), ("op", "//")):
+            separator = self.tokens[self.position][1]
+            self.position += 1
+            step, step_kind = self.step()
+            if kind not in _NODE_KINDS or step_kind not in _NODE_KINDS:
+                raise Unsupported("path step on an atomic value")
+            steps.append((separator, step, step_kind))
+            kind = NODES
+        return steps
+
+    def step(self) -> Tuple[str, str]:
+        kind, value = self.peek()
+        if kind == "literal":
+            self.position += 1
+            return value, STRING
+        if kind == "number":
+            self.position += 1
+            return value, NUMBER
+        if kind == "op" and value == "(":
+            self.position += 1
+            return self.predicates(*self.parenthesized())
+        if kind == "op" and value in (".", ".."):
+            self.position += 1
+            return self.predicates(value, ITEM)
+        if kind == "op" and value == "@":
+            self.position += 1
+            return self.predicates("@" + self.node_test(), NODES)
+        if kind == "name" and self.peek(1) == ("op", "::"):
+            self.position += 2
+            return self.predicates(f"{value}::{self.node_test()}", NODES)
+        if kind == "name" and self.peek(1) == ("op", "(") and value not in _KIND_TESTS:
+            self.position += 2
+            return self.predicates(*self.function(value))
+        return self.predicates(self.node_test(), NODES)
+
+    def node_test(self) -> str:
+        kind, value = self.peek()
+        if kind != "name" or value.startswith("*:"):
+            raise Unsupported(f"unexpected {value!r}")
+        self.position += 1
+        if value in _KIND_TESTS and self.accept("("):
+            self.expect(")")
+            return f"{value}()"
+        return value
+
+    def parenthesized(self) -> Tuple[str, str]:
+        if self.accept(")"):
+            raise Unsupported("empty sequence")
+        first = self.expression()
+        if not self.accept(","):
+            self.expect(")")
+            return f"({first[0]})", first[1]
+        items = [first]
+        while True:
+            items.append(self.expression())
+            if not self.accept(","):
+                break
+        self.expect(")")
+        if any(kind != STRING for _, kind in items):
+            raise Unsupported("sequence of non-literals")
+        return [text for text, _ in items], SEQUENCE
+
+    def predicates(self, text, kind: str) -> Tuple[str, str]:
+        while self.accept("["):
+            if kind not in _NODE_KINDS:
+                raise Unsupported(f"predicate on a {kind} value")
+            self.depth += 1
+            predicate = self.expression()[0]
+            self.depth -= 1
+            self.expect("]")
+            if self.guards and "fx:" in predicate:
+                # Where XPath 2.0 only needs the first match, later nodes (and their errors) are never evaluated
+                raise Unsupported("dynamic error check in a predicate")
+            # XPath 1.0 has no predicates on "." (the context item)
+            text = f"self::node()[{predicate}]" if text == "." else f"{text}[{predicate}]"
+        return text, kind
+
+    def arguments(self) -> List[Tuple[str, str]]:
+        if self.accept(")"):
+            return []
+        arguments = [self.expression()]
+        while self.accept(","):
+            arguments.append(self.expression())
+        self.expect(")")
+        return arguments
+
+    def function(self, name: str) -> Tuple[str, str]:
+        arguments = self.arguments()
+        if name in _STRING_FUNCTIONS or name in ("contains", "starts-with", "string-length", "number"):
+            text = f"{name}({', '.join(self.single(argument) for argument in arguments)})"
+            if name in ("contains", "starts-with"):
+                return text, BOOLEAN
+            return text, NUMBER if name in ("string-length", "number") else STRING
+        if name in ("round", "floor", "ceiling") and len(arguments) == 1:
+            return f"{name}({self.numeric(arguments[0])})", NUMBER
+        if name in ("count", "sum") and len(arguments) == 1 and arguments[0][1] in _NODE_KINDS:
+            argument = arguments[0][0]
+            if name == "sum" and self.guards:
+                argument = f"fx:number({argument})"
+            return f"{name}({argument})", NUMBER
+        if name in ("not", "boolean", "exists") and len(arguments) == 1:
+            if arguments[0][1] in (SEQUENCE, UPPER):
+                raise Unsupported(f"{name}() of a {arguments[0][1]} value")
+            return f"{'not' if name == 'not' else 'boolean'}({self.truth(arguments[0])})", BOOLEAN
+        if name in ("position", "last") and self.guards and not self.depth:
+            # The position of the context node among the nodes of its rule: not kept by the translation
+            raise Unsupported(f"{name}() of the rule context")
+        if name in ("true", "false", "position", "last", "name", "local-name", "namespace-uri") and not arguments:
+            return f"{name}()", BOOLEAN if name in ("true", "false") else NUMBER if name in ("position", "last") else STRING
+        if name == "ends-with" and len(arguments) == 2:
+            string, suffix = (self.single(argument) for argument in arguments)
+            return f"(substring({string}, string-length({string}) - string-length({suffix}) + 1) = {suffix})", BOOLEAN
+        if name == "upper-case" and len(arguments) == 1:
+            return f"translate({self.single(arguments[0])}, '{_LOWER}', '{_UPPER}')", UPPER
+        raise Unsupported(f"{name}()")
+
+
+class Translation(NamedTuple):
+    xpath: str
+    variables: Tuple[str, ...]  # Hoisted absolute paths the expression uses
+
+
+def translate(expression: str, variables: Optional[Dict[str, str]] = None) -> Translation:
+    """
+    XPath 1.0 (with fx: guard functions) for the effective boolean value of an XPath 2.0 expression.
+
+    With `variables`, absolute paths are replaced by variables ($p1, ...), registered there (path -> name),
+    for the caller to evaluate once per document instead of once per context node.
+    """
+    translator = _Translator(expression, guards=True, variables=variables)
+    text, kind = translator.expression()
+    translator.finish()
+    if kind in (SEQUENCE, UPPER):
+        raise Unsupported(f"{kind} value")
+    return Translation(f"boolean({translator.truth((text, kind))})", tuple(dict.fromkeys(translator.hoisted)))
+
+
+def translate_pattern(pattern: str) -> str:
+    """XPath 1.0 selecting every node an XSLT match pattern matches."""
+    translator = _Translator(pattern, guards=False)
+    branches = [translator.path()]
+    while translator.accept("|"):
+        branches.append(translator.path())
+    translator.finish()
+    if any(kind not in _NODE_KINDS for _, kind in branches):
+        raise Unsupported("pattern matching atomic values")
+    return " | ".join(text if text.startswith("/") else "//" + text for text, _ in branches)
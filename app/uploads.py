@@ -0,0 +1,93 @@
+"""
+Upload size limits and zero-copy access to uploaded files.
+
+Multipart parts are spooled by Starlette (SpooledTemporaryFile, in memory up
+to 1 MB, then on disk). Routes use upload_buffer() to hand services a
+read-only mmap of the spooled file instead of a fresh bytes copy, and
+detached_upload() when the upload is still read while the response streams.
+"""
+import logging
+import mmap
+import os
+from contextlib import contextmanager
+from io import BytesIO
+from typing import BinaryIO, Iterator, Union
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "20"))
+MAX_UPLOAD_SIZE = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+
+# /v1/convert/batch carries many invoices in one upload
+BATCH_MAX_UPLOAD_SIZE_MB = int(os.getenv("FX_BATCH_MAX_UPLOAD_MB", "500"))
+BATCH_MAX_UPLOAD_SIZE = BATCH_MAX_UPLOAD_SIZE_MB * 1024 * 1024
+
+# /v1/cdar/validate/batch: messages of an archive, and their total inflated size (read before validation)
+CDAR_BATCH_MAX_MESSAGES = int(os.getenv("FX_CDAR_BATCH_MAX_MESSAGES", "10000"))
+CDAR_BATCH_MAX_INFLATED_MB = int(os.getenv("FX_CDAR_BATCH_MAX_INFLATED_MB", "100"))
+CDAR_BATCH_MAX_INFLATED_SIZE = CDAR_BATCH_MAX_INFLATED_MB * 1024 * 1024
+
+UploadBuffer = Union[bytes, mmap.mmap]
+
+
+def too_large_detail(max_size_mb: int = MAX_UPLOAD_SIZE_MB) -> dict:
+    return {"error": "FILE_TOO_LARGE", "message": f"File too large. Max size is {max_size_mb}MB."}
+
+
+@contextmanager
+def upload_buffer(upload: UploadFile) -> Iterator[UploadBuffer]:
+    """
+    Yield the content of an uploaded file without copying large payloads.
+
+    Small uploads (still in memory) are returned as bytes. Uploads spooled to
+    disk are memory-mapped read-only; the mapping is closed on exit.
+    """
+    spool = upload.file
+    spool.seek(0)
+    rolled_to_disk = getattr(spool, "_rolled", True)
+    if not rolled_to_disk:
+        yield spool.read()
+        return
+
+    try:
+        size = os.fstat(spool.fileno()).st_size
+    except (AttributeError, OSError):
+        size = None
+    if not size:
+        # Not backed by a real file (or empty): plain read
+        yield spool.read()
+        return
+
+    mapped = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mapped
+    finally:
+        try:
+            mapped.close()
+        except BufferError:
+            # A slice of the mapping is still referenced: the GC unmaps it
+            logger.debug("Upload mapping still exported, deferring close")
+
+
+def detached_upload(upload: UploadFile) -> BinaryIO:
+    """
+    Open a file object on the upload that outlives the request form.
+
+    FastAPI closes uploaded files once the route returns, before a streamed
+    response is sent. Uploads spooled to disk are reopened through a
+    duplicated descriptor (no copy); small in-memory uploads are copied.
+    The caller closes the returned file.
+    """
+    spool = upload.file
+    spool.seek(0)
+    if getattr(spool, "_rolled", True):
+        try:
+            detached = os.fdopen(os.dup(spool.fileno()), "rb")
+        except (AttributeError, OSError):
+            pass
+        else:
+            detached.seek(0)
+            return detached
+    return BytesIO(spool.read())
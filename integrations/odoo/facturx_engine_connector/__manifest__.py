@@ -1,6 +1,6 @@
 {
     'name': 'Factur-X Engine Connector',
-    'version': '1.0.0',
+    'version': '1.1.0',
     'category': 'Accounting/Accounting',
     'summary': 'Import Factur-X/ZUGFeRD invoices using Local Engine',
     'description': """
@@ -1,5 +1,6 @@
 import requests
 import base64
+import hashlib
 import logging
 from odoo import models, fields, _, api
 from odoo.exceptions import UserError
@@ -41,8 +42,18 @@ class AccountMove(models.Model):
             if license_key:
                 headers['X-LICENSE-KEY'] = license_key
             
-            # Use 'extract' endpoint
-            response = requests.post(f"{config_url}/v1/extract", files=files, headers=headers, timeout=10)
+            # Probe by content hash first: re-imports of a known PDF skip the upload
+            digest = hashlib.sha256(pdf_content).hexdigest()
+            response = requests.get(
+                f"{config_url}/v1/probe/{digest}",
+                params={'kind': 'extract', 'filename': 'invoice.pdf'},
+                headers=headers,
+                timeout=10
+            )
+            
+            if response.status_code != 200:
+                # Not seen yet (or engine without /v1/probe): use 'extract' endpoint
+                response = requests.post(f"{config_url}/v1/extract", files=files, headers=headers, timeout=10)
             
             if response.status_code != 200:
                 error_msg = response.text
@@ -0,0 +1,133 @@
+"""
+Tests for batch generation (/v1/convert/batch, app/services/batch.py).
+"""
+import base64
+import copy
+import json
+import threading
+import zipfile
+from io import BytesIO
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import batch
+from app.services.batch import BatchItem, BatchResult, BatchService
+from app.services.pdf_locator import locate_embedded_xml
+from tests.test_convert import METADATA, invalid_metadata
+from tests.test_extract import create_dummy_pdf
+
+client = TestClient(app)
+
+
+def invoice(number: str) -> dict:
+    return dict(copy.deepcopy(METADATA), invoice_number=number)
+
+
+def make_zip(files: dict) -> bytes:
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def post_batch(content: bytes, filename: str, output: str = "zip"):
+    return client.post("/v1/convert/batch", params={"output": output}, files={"file": (filename, content)})
+
+
+def test_zip_batch():
+    pdf = create_dummy_pdf()
+    upload = make_zip({
+        "march/A-1.pdf": pdf, "march/A-1.json": json.dumps(invoice("A-1")),
+        "march/A-2.pdf": pdf, "march/A-2.json": json.dumps(invoice("A-2")),
+        "march/bad.pdf": pdf, "march/bad.json": json.dumps(invalid_metadata()),
+        "march/orphan.pdf": pdf,
+    })
+
+    response = post_batch(upload, "batch.zip")
+
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(BytesIO(response.content))
+    report = {line["id"]: line for line in map(json.loads, archive.read("report.ndjson").splitlines())}
+    assert set(report) == {"march/A-1", "march/A-2", "march/bad", "march/orphan"}
+    assert report["march/bad"]["errors"][0]["error"] == "GENERATION_FAILED"
+    assert report["march/orphan"]["errors"][0]["error"] == "INCOMPLETE_ITEM"
+    for item_id in ("march/A-1", "march/A-2"):
+        assert report[item_id]["status"] == "ok"
+        xml = locate_embedded_xml(archive.read(report[item_id]["file"]))[1]
+        assert item_id.split("/")[1].encode() in xml
+    assert sorted(archive.namelist()) == ["march_A-1.pdf", "march_A-2.pdf", "report.ndjson"]
+
+
+def test_ndjson_batch():
+    pdf = base64.b64encode(create_dummy_pdf()).decode("ascii")
+    lines = [
+        json.dumps({"id": "N-1", "pdf": pdf, "metadata": invoice("N-1")}),
+        "",
+        "{not json",
+        json.dumps({"pdf": pdf, "metadata": {"invoice_number": "N-3"}}),
+        json.dumps({"id": "N-1", "pdf": pdf, "metadata": invoice("N-1")}),
+    ]
+
+    response = post_batch("\n".join(lines).encode(), "batch.ndjson", output="ndjson")
+
+    assert response.status_code == 200, response.text
+    results = [json.loads(line) for line in response.content.splitlines()]
+    errors = {line["id"]: line["errors"][0]["error"] for line in results if line["status"] == "error"}
+    assert errors == {"line-3": "INVALID_JSON", "line-4": "INVALID_METADATA"}
+    generated = [line for line in results if line["status"] == "ok"]
+    assert [line["id"] for line in generated] == ["N-1", "N-1"]
+    assert b"N-1" in locate_embedded_xml(base64.b64decode(generated[0]["pdf"]))[1]
+
+
+def test_ndjson_lines_over_the_size_limit(monkeypatch):
+    monkeypatch.setattr(batch, "MAX_UPLOAD_SIZE", 8)
+    manifest = BytesIO(b"{123456}\n" + b"x" * 30 + b"\n\n{}\n" + b"y" * 9)
+
+    items = list(batch.iter_ndjson_items(manifest))
+
+    assert [(item.item_id, item.line, item.error and item.error["error"]) for item in items] == [
+        ("line-1", b"{123456}\n", None), ("line-2", None, "FILE_TOO_LARGE"), ("line-4", b"{}\n", None),
+        ("line-5", None, "FILE_TOO_LARGE")]
+
+
+def test_zip_output_names_are_unique():
+    results = [BatchResult("N-1", pdf=b"%PDF-1"), BatchResult("N-1", pdf=b"%PDF-2"), BatchResult("../x", pdf=b"%PDF-3")]
+
+    archive = zipfile.ZipFile(BytesIO(b"".join(batch.zip_stream(results))))
+
+    assert archive.namelist() == ["N-1.pdf", "N-1-2.pdf", "x.pdf", "report.ndjson"]
+    assert archive.read("N-1-2.pdf") == b"%PDF-2"
+
+
+def test_batch_in_flight_is_bounded(monkeypatch):
+    """Items are only read from the upload when a slot is free."""
+    release = threading.Semaphore(0)
+    pulled = []
+
+    def slow_convert(item):
+        release.acquire()
+        return BatchResult(item.item_id, errors=[{"error": "TEST", "message": ""}])
+
+    def items():
+        for i in range(10):
+            pulled.append(i)
+            yield BatchItem(str(i))
+
+    monkeypatch.setattr(batch, "_convert_item", slow_convert)
+    results = BatchService.run(items(), in_flight=3)
+    for finished in range(10):
+        release.release()
+        next(results)
+        assert len(pulled) <= finished + 1 + 3
+    assert next(results, None) is None
+
+
+def test_batch_rejects_invalid_input():
+    broken_zip = make_zip({"a.pdf": b"%PDF"})[:-10]
+
+    assert post_batch(broken_zip, "batch.zip").json()["detail"]["error"] == "INVALID_ARCHIVE"
+    assert post_batch(b"", "batch.zip").json()["detail"]["error"] == "EMPTY_FILE"
+    assert post_batch(b"{}", "batch.ndjson", output="tar").json()["detail"]["error"] == "INVALID_OUTPUT"
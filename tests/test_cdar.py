@@ -0,0 +1,106 @@
+"""
+Tests for CDAR lifecycle message validation (/v1/cdar/validate, BR-FR-CDV rules).
+"""
+import zipfile
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import api
+from app.main import app
+from app.services import hybrid_validation_service
+from app.services.hybrid_validation_service import CDAR_SCH_PATH, HybridValidationService
+from app.services.schematron import assert_roles
+from tests.test_batch import make_zip
+
+client = TestClient(app)
+
+STATUS_200 = (Path(__file__).parent.parent / "examples" / "cdar_status_200.xml").read_bytes()
+# Unknown acknowledgement type code (MDT-77)
+BAD_TYPE = STATUS_200.replace(b"<ram:TypeCode>305</ram:TypeCode>", b"<ram:TypeCode>999</ram:TypeCode>")
+
+
+def test_valid_message():
+    result, = HybridValidationService.validate_cdar([STATUS_200])
+
+    assert result["is_valid"] and result["errors"] == []
+    assert (result["format_detected"], result["ruleset"]) == ("cdar", "cdar")
+
+
+def test_rules_report_with_their_role():
+    result, = HybridValidationService.validate_cdar([BAD_TYPE])
+
+    assert [e["rule_id"] for e in result["errors"]] == ["BR-FR-CDV-09_MDT-77"]
+    assert all(e["layer"] == "br-fr" and e["severity"] == assert_roles(str(CDAR_SCH_PATH))[e["rule_id"]]
+               for e in result["errors"])
+
+
+def test_results_keep_the_message_order():
+    messages = [STATUS_200, BAD_TYPE, b"<Invoice/>", b"<not xml"] * 3
+
+    results = HybridValidationService.validate_cdar(messages)
+
+    assert [[e["rule_id"] for e in result["errors"]] for result in results] == [
+        [], ["BR-FR-CDV-09_MDT-77"], ["FX-NOT-CDAR"], ["FX-PARSE-ERROR"]] * 3
+
+
+def test_validate_endpoint():
+    response = client.post("/v1/cdar/validate", files={"file": ("status.xml", BAD_TYPE)})
+
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert report["format"] == "cdar"
+    assert report["errors"][0].startswith("[BR-FR-CDV-09_MDT-77]")
+
+
+def test_batch_endpoint():
+    upload = make_zip({
+        "b/bad.xml": BAD_TYPE, "a/ok.xml": STATUS_200, "a/empty.xml": b"", "readme.txt": b"not a message",
+        "__MACOSX/a/._ok.xml": b"\x00",
+    })
+
+    response = client.post("/v1/cdar/validate/batch", files={"file": ("statuses.zip", upload)})
+
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["total"], report["valid"]) == (3, 1)
+    assert [(item["id"], item["valid"]) for item in report["results"]] == [
+        ("a/empty.xml", False), ("a/ok.xml", True), ("b/bad.xml", False)]
+
+
+def test_batch_endpoint_rejects_non_zip():
+    response = client.post("/v1/cdar/validate/batch", files={"file": ("status.xml", STATUS_200)})
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["error"] == "INVALID_ARCHIVE"
+
+
+def test_batch_endpoint_rejects_too_many_messages(monkeypatch):
+    monkeypatch.setattr(api, "CDAR_BATCH_MAX_MESSAGES", 2)
+    upload = make_zip({f"{i}.xml": STATUS_200 for i in range(3)})
+
+    response = client.post("/v1/cdar/validate/batch", files={"file": ("statuses.zip", upload)})
+
+    assert response.status_code == 413
+    assert response.json()["detail"]["error"] == "TOO_MANY_MESSAGES"
+
+
+def test_batch_endpoint_bounds_the_inflated_size(monkeypatch):
+    monkeypatch.setattr(api, "CDAR_BATCH_MAX_INFLATED_SIZE", 2 * len(STATUS_200))
+    monkeypatch.setattr(zipfile.ZipFile, "read", lambda *args: pytest.fail("member read before the size check"))
+    upload = make_zip({f"{i}.xml": STATUS_200 for i in range(3)})
+
+    response = client.post("/v1/cdar/validate/batch", files={"file": ("statuses.zip", upload)})
+
+    assert response.status_code == 413
+    assert response.json()["detail"]["error"] == "ARCHIVE_TOO_LARGE"
+
+
+def test_missing_rules_are_logged(monkeypatch, caplog):
+    monkeypatch.setattr(hybrid_validation_service, "CDAR_XSLT_PATH", Path("/nonexistent/cdar.xslt"))
+
+    results = HybridValidationService.validate_cdar([STATUS_200, BAD_TYPE])
+
+    assert [(result["is_valid"], result["validation_mode"]) for result in results] == [(True, "lite")] * 2
+    assert "No CDAR rules found" in caplog.text
@@ -0,0 +1,81 @@
+"""
+Tests for the code list pre-validation (app/services/codelists.py) and the
+tables compiled by tools/build_codelists.py: the pre-check must flag exactly
+what the EN 16931 Schematron flags, before any generation work.
+"""
+import copy
+
+from app.schemas.validation import InvoiceMetadata
+from app.services.codelists import CodelistService
+from app.services.extractor import ExtractionService
+from app.services.generator import GeneratorService
+from app.services.hybrid_validation_service import HybridValidationService
+from tests.test_convert import METADATA, convert
+from tools.build_codelists import OUTPUT_PATH, build_tables, render_module
+
+
+def bad_codes() -> dict:
+    data = copy.deepcopy(METADATA)
+    data["currency_code"] = "EURO"
+    data["buyer"]["address"]["country_code"] = "XX"
+    data["payment_means_code"] = "99"
+    data["lines"][0]["unit_code"] = "PIECE"
+    return data
+
+
+def test_tables_are_up_to_date():
+    tables, _ = build_tables()
+
+    assert OUTPUT_PATH.read_text(encoding="utf-8") == render_module(tables)
+
+
+def test_valid_metadata_has_no_errors():
+    assert CodelistService.check(InvoiceMetadata(**METADATA)) == []
+
+
+def test_invalid_codes_are_located():
+    errors = CodelistService.check(InvoiceMetadata(**bad_codes()))
+
+    assert [(error["rule_id"], error["location"]) for error in errors] == [
+        ("BR-CL-04", "currency_code"),
+        ("BR-CL-14", "buyer.address.country_code"),
+        ("BR-CL-16", "payment_means_code"),
+        ("BR-CL-23", "lines[0].unit_code"),
+    ]
+    assert "'PIECE'" in errors[-1]["message"]
+
+
+def test_precheck_matches_schematron():
+    metadata = InvoiceMetadata(**bad_codes())
+
+    result = HybridValidationService.submit_xml(GeneratorService.generate_xml_bytes(metadata)).result()
+
+    schematron_rules = {error["rule_id"] for error in result["errors"] if error["rule_id"].startswith("BR-CL-")}
+    assert {error["rule_id"] for error in CodelistService.check(metadata)} == schematron_rules - {"BR-CL-03"}
+
+
+def test_convert_rejects_invalid_code_before_generation(monkeypatch):
+    def no_generation(*args, **kwargs):
+        raise AssertionError("generation must not start")
+
+    monkeypatch.setattr(GeneratorService, "generate_facturx_pdf", no_generation)
+    data = copy.deepcopy(METADATA)
+    data["lines"][0]["vat_category"] = "X"
+
+    response = convert(data)
+
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert detail["error"] == "INVALID_CODE"
+    assert [error["location"] for error in detail["details"]["errors"]] == ["lines[0].vat_category"]
+
+
+def test_extraction_flags_invalid_codes():
+    xml = GeneratorService.generate_xml_bytes(InvoiceMetadata(**bad_codes()))
+
+    result = ExtractionService.extract_invoice_data(xml, "invoice.xml")
+
+    warnings = [w["message"] for w in result["invoice_json"]["_meta"]["warnings"] if w["code"] == "INVALID_CODE"]
+    assert [message.split(":")[0] for message in warnings] == [
+        "currency", "buyer.address.country", "line_items[0].unit_code"
+    ]
@@ -0,0 +1,102 @@
+"""
+Tests for the /v1/convert quality gate (XML validated while the PDF is assembled).
+"""
+import copy
+import json
+import threading
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import generator
+from tests.test_extract import create_dummy_pdf
+
+client = TestClient(app)
+
+METADATA = {
+    "invoice_number": "CONVERT-GATE-001",
+    "issue_date": "20260126",
+    "seller": {
+        "name": "Gate Seller",
+        "address": {"line1": "Rue de la Loi", "postcode": "75000", "city": "Paris", "country_code": "FR"},
+        "siret": "12345678900010",
+        "vat_number": "FR12345678901"
+    },
+    "buyer": {
+        "name": "Gate Buyer",
+        "address": {"line1": "1 Place Bellecour", "postcode": "69002", "city": "Lyon", "country_code": "FR"}
+    },
+    "lines": [
+        {"name": "Item 1", "quantity": 1.0, "net_price": 100.0, "net_total": 100.0, "vat_rate": 20.0, "vat_category": "S"}
+    ],
+    "tax_details": [
+        {"calculated_amount": "20.00", "basis_amount": "100.00", "rate": "20.00", "category_code": "S"}
+    ],
+    "amounts": {"tax_basis_total": "100.00", "tax_total": "20.00", "grand_total": "120.00", "due_payable": "120.00"},
+    "payment_terms": "Paiement à 30 jours",
+    "currency_code": "EUR",
+    "profile": "en16931"
+}
+
+
+def invalid_metadata():
+    metadata = copy.deepcopy(METADATA)
+    metadata["amounts"]["grand_total"] = "120.05"  # BR-CO-15: 100.00 + 20.00 != 120.05
+    metadata["amounts"]["due_payable"] = "120.05"
+    return metadata
+
+
+def convert(metadata, pdf_content=None):
+    return client.post(
+        "/v1/convert",
+        files={"pdf": ("invoice.pdf", pdf_content or create_dummy_pdf(), "application/pdf")},
+        data={"metadata": json.dumps(metadata)}
+    )
+
+
+def test_convert_valid_invoice():
+    response = convert(METADATA)
+
+    assert response.status_code == 200, response.text
+    assert response.content.startswith(b"%PDF")
+    validation = client.post("/v1/validate", files={"file": ("out.pdf", response.content, "application/pdf")}).json()
+    assert validation["valid"] is True
+
+
+def test_convert_rejects_invalid_invoice():
+    response = convert(invalid_metadata())
+
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert detail["error"] == "GENERATION_FAILED"
+    assert "failed compliance check" in detail["message"]
+
+
+def test_convert_invalid_invoice_does_not_wait_for_pdf(monkeypatch):
+    """The quality gate answers without waiting for the PDF/A-3 assembly."""
+    release = threading.Event()
+    assembly = {"started": False, "finished": False}
+
+    def slow_generate_from_binary(*args, **kwargs):
+        assembly["started"] = True
+        release.wait(timeout=30)
+        assembly["finished"] = True
+        return b"%PDF-1.7"
+
+    monkeypatch.setattr(generator, "generate_from_binary", slow_generate_from_binary)
+    try:
+        response = convert(invalid_metadata())
+    finally:
+        release.set()
+
+    assert response.status_code == 400
+    assert "failed compliance check" in response.json()["detail"]["message"]
+    assert assembly["started"] is True
+    assert assembly["finished"] is False
+
+
+def test_convert_assembly_error():
+    response = convert(METADATA, pdf_content=b"not really a pdf")
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["error"] == "GENERATION_FAILED"
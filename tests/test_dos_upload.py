@@ -38,3 +38,57 @@ def test_normal_upload_passes_middleware():
     # 200 means it somehow passed validation (unlikely but middleware logic is sound)
     assert response.status_code in [200, 400]
     assert response.status_code != 413
+
+
+def test_dos_protection_streamed_body():
+    """
+    Chunked uploads carry no Content-Length: the body is counted as it streams in.
+    """
+    from app.uploads import MAX_UPLOAD_SIZE
+
+    chunk = b"A" * (1024 * 1024)
+
+    def body():
+        for _ in range(MAX_UPLOAD_SIZE // len(chunk) + 2):
+            yield chunk
+
+    response = client.post(
+        "/v1/extract",
+        headers={"Content-Type": "multipart/form-data; boundary=xyz"},
+        content=body()
+    )
+
+    assert response.status_code == 413
+    assert "File too large" in response.text
+
+
+def test_large_upload_spooled_to_disk():
+    """
+    Uploads above the in-memory spool size (1MB) are memory-mapped, not copied.
+    """
+    import os
+    from facturx import generate_from_binary
+    from PIL import Image
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+    from tests.test_pdf_locator import CII_XML
+
+    # Scanned-like page: incompressible noise keeps the PDF above 1MB
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    noise = Image.frombytes("RGB", (512, 512), os.urandom(512 * 512 * 3))
+    pdf.drawImage(ImageReader(noise), 0, 0, width=595, height=842)
+    pdf.showPage()
+    pdf.save()
+    facturx_pdf = generate_from_binary(buffer.getvalue(), CII_XML, check_xsd=False)
+    assert len(facturx_pdf) > 1024 * 1024
+
+    response = client.post(
+        "/v1/extract",
+        files={"file": ("scan.pdf", facturx_pdf, "application/pdf")}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["xml_extracted"] is True
+    assert data["invoice_json"]["invoice_number"] == "471102"
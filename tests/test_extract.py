@@ -5,6 +5,7 @@ import pytest
 from fastapi.testclient import TestClient
 import json
 from io import BytesIO
+from pathlib import Path
 from reportlab.pdfgen import canvas
 
 from app.main import app
@@ -167,6 +168,139 @@ def test_end_to_end_convert_validate_extract():
     print("  - Full product workflow validated!")
 
 
+CORPUS_DIR = Path(__file__).parent / "corpus" / "corpus-master" / "XML-Rechnung"
+
+
+def test_extract_bare_cii_xml():
+    """Bare CII XML is extracted directly, without a PDF wrapper."""
+    xml_content = (CORPUS_DIR / "CII" / "EN16931_Einfach.cii.xml").read_bytes()
+
+    response = client.post(
+        "/v1/extract",
+        files={"file": ("invoice.xml", xml_content, "application/xml")}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["format_detected"] == "factur-x"
+    assert data["profile_detected"] == "en16931"
+    assert data["xml_extracted"] is True
+    assert data["errors"] == []
+    assert data["invoice_json"]["invoice_number"] == "471102"
+    assert data["invoice_json"]["totals"]["gross_amount"] == "529.87"
+
+
+def test_extract_bare_ubl_xml():
+    """UBL invoices are mapped through the UBL path set."""
+    xml_content = (CORPUS_DIR / "UBL" / "EN16931_Einfach.ubl.xml").read_bytes()
+
+    response = client.post(
+        "/v1/extract",
+        files={"file": ("invoice.xml", xml_content, "application/xml")}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["format_detected"] == "ubl"
+    assert data["profile_detected"] == "en16931"
+    assert data["errors"] == []
+
+    invoice_json = data["invoice_json"]
+    assert invoice_json["invoice_number"] == "471102"
+    assert invoice_json["invoice_date"] == "2018-03-05"
+    assert invoice_json["seller"]["name"] == "Lieferant GmbH"
+    assert invoice_json["seller"]["vat_number"] == "DE123456789"
+    assert invoice_json["totals"]["net_amount"] == "473.00"
+    assert invoice_json["totals"]["payable_amount"] == "529.87"
+    assert invoice_json["line_items"][0]["line_total"] == "198.00"
+
+
+def test_extract_bare_ubl_credit_note():
+    xml_content = (CORPUS_DIR / "UBL" / "ubl-tc434-creditnote1.xml").read_bytes()
+
+    response = client.post(
+        "/v1/extract",
+        files={"file": ("credit_note.xml", xml_content, "application/xml")}
+    )
+
+    data = response.json()
+    assert data["format_detected"] == "ubl"
+    assert data["invoice_json"]["line_items"]
+    assert data["invoice_json"]["totals"]["payable_amount"] == "100.11"
+
+
+def test_extract_bare_zugferd_v1_xml():
+    """ZUGFeRD 1.0 (CrossIndustryDocument) uses the CII paths with the 1.0 namespaces."""
+    xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rsm:CrossIndustryDocument xmlns:rsm="urn:ferd:CrossIndustryDocument:invoice:1p0"
+    xmlns:ram="urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:12"
+    xmlns:udt="urn:un:unece:uncefact:data:standard:UnqualifiedDataType:15">
+  <rsm:SpecifiedExchangedDocumentContext>
+    <ram:GuidelineSpecifiedDocumentContextParameter>
+      <ram:ID>urn:ferd:CrossIndustryDocument:invoice:1p0:basic</ram:ID>
+    </ram:GuidelineSpecifiedDocumentContextParameter>
+  </rsm:SpecifiedExchangedDocumentContext>
+  <rsm:HeaderExchangedDocument>
+    <ram:ID>ZF1-0001</ram:ID>
+    <ram:IssueDateTime><udt:DateTimeString format="102">20140301</udt:DateTimeString></ram:IssueDateTime>
+  </rsm:HeaderExchangedDocument>
+  <rsm:SpecifiedSupplyChainTradeTransaction>
+    <ram:ApplicableSupplyChainTradeAgreement>
+      <ram:SellerTradeParty><ram:Name>Alt Seller</ram:Name></ram:SellerTradeParty>
+    </ram:ApplicableSupplyChainTradeAgreement>
+  </rsm:SpecifiedSupplyChainTradeTransaction>
+</rsm:CrossIndustryDocument>"""
+
+    response = client.post(
+        "/v1/extract",
+        files={"file": ("zugferd.xml", xml_content, "application/xml")}
+    )
+
+    data = response.json()
+    assert data["format_detected"] == "zugferd"
+    assert data["profile_detected"] == "basic"
+    assert data["invoice_json"]["invoice_number"] == "ZF1-0001"
+    assert data["invoice_json"]["seller"]["name"] == "Alt Seller"
+
+
+def test_extract_order_x_is_unsupported():
+    """Order-X orders are detected but not mapped with the invoice paths."""
+    xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rsm:SCRDMCCBDACIOMessageStructure xmlns:rsm="urn:un:unece:uncefact:data:standard:SCRDMCCBDACIOMessageStructure:100"
+    xmlns:ram="urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:128">
+  <rsm:ExchangedDocumentContext>
+    <ram:GuidelineSpecifiedDocumentContextParameter>
+      <ram:ID>urn:order-x.eu:1p0:basic</ram:ID>
+    </ram:GuidelineSpecifiedDocumentContextParameter>
+  </rsm:ExchangedDocumentContext>
+  <rsm:ExchangedDocument>
+    <ram:ID>PO-0001</ram:ID>
+    <ram:TypeCode>220</ram:TypeCode>
+  </rsm:ExchangedDocument>
+</rsm:SCRDMCCBDACIOMessageStructure>"""
+
+    response = client.post(
+        "/v1/extract",
+        files={"file": ("order-x.xml", xml_content, "application/xml")}
+    )
+
+    data = response.json()
+    assert data["format_detected"] == "order-x"
+    assert data["invoice_json"] is None
+    assert [error["code"] for error in data["errors"]] == ["UNSUPPORTED_FORMAT"]
+
+
+def test_extract_rejects_unknown_xml_root():
+    response = client.post(
+        "/v1/extract",
+        files={"file": ("other.xml", b"<root>Not an invoice</root>", "application/xml")}
+    )
+
+    data = response.json()
+    assert data["invoice_json"] is None
+    assert any(error["code"] == "PARSE_ERROR" for error in data["errors"])
+
+
 def test_diagnostics_endpoint():
     """Test the /diagnostics endpoint."""
     response = client.get("/diagnostics")
@@ -0,0 +1,55 @@
+"""
+Tests for the /v1/inspect endpoint (extract + validate in one pass).
+"""
+from facturx import generate_from_binary
+from fastapi.testclient import TestClient
+
+from app.main import app
+from tests.test_extract import CORPUS_DIR, create_dummy_pdf
+
+client = TestClient(app)
+
+
+def post(endpoint: str, filename: str, content: bytes, content_type: str = "application/pdf"):
+    return client.post(endpoint, files={"file": (filename, content, content_type)})
+
+
+def test_inspect_matches_extract_and_validate():
+    """One /v1/inspect call returns exactly what /v1/extract + /v1/validate return."""
+    xml_content = (CORPUS_DIR / "CII" / "EN16931_Einfach.cii.xml").read_bytes()
+    facturx_pdf = generate_from_binary(create_dummy_pdf(), xml_content, check_xsd=False)
+
+    response = post("/v1/inspect", "invoice.pdf", facturx_pdf)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["extraction"] == post("/v1/extract", "invoice.pdf", facturx_pdf).json()
+    assert data["validation"] == post("/v1/validate", "invoice.pdf", facturx_pdf).json()
+    assert data["extraction"]["invoice_json"]["invoice_number"] == "471102"
+    assert data["validation"]["format"] == "factur-x"
+
+
+def test_inspect_bare_xml():
+    xml_content = (CORPUS_DIR / "CII" / "EN16931_Rabatte.cii.xml").read_bytes()
+
+    data = post("/v1/inspect", "invoice.xml", xml_content, "application/xml").json()
+
+    assert data["extraction"]["xml_extracted"] is True
+    assert data["validation"] == post("/v1/validate", "invoice.xml", xml_content, "application/xml").json()
+
+
+def test_inspect_pdf_without_xml():
+    pdf_content = create_dummy_pdf()
+
+    data = post("/v1/inspect", "plain.pdf", pdf_content).json()
+
+    assert data["extraction"]["format_detected"] == "not_facturx"
+    assert data["validation"]["valid"] is False
+    assert data["validation"] == post("/v1/validate", "plain.pdf", pdf_content).json()
+
+
+def test_inspect_empty_file():
+    response = post("/v1/inspect", "empty.pdf", b"")
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["error"] == "EMPTY_FILE"
@@ -1,4 +1,6 @@
 
+import re
+
 import pytest
 from app.services.validator import ValidationService
 from app.services.generator import GeneratorService
@@ -46,3 +48,51 @@ def test_validator_sensitivity_nuclear():
     print(f"Errors found: {errors}")
     assert is_valid is False
     assert len(errors) > 0
+
+def test_xsd_errors_match_xml_check_xsd():
+    from concurrent.futures import ThreadPoolExecutor
+    from facturx import xml_check_xsd
+    from lxml import etree
+    from app.metrics import metrics
+
+    def library_error(xml):
+        try:
+            xml_check_xsd(xml, flavor="factur-x", level="minimum")
+        except Exception as e:
+            return str(e)
+
+    documents = [get_valid_xml_base(), re.sub(rb'<ram:TypeCode>.*?</ram:TypeCode>', b'', get_valid_xml_base())]
+    expected = [library_error(xml) for xml in documents]
+    assert expected[0] != expected[1]
+    trees = [etree.fromstring(xml) for xml in documents]
+    ValidationService._schema("factur-x", "minimum")
+    hits = metrics._counters["xsd_cache_hits"]
+
+    def check(index):
+        try:
+            ValidationService._check_xsd(trees[index % 2], "factur-x", "minimum")
+        except Exception as e:
+            return str(e)
+
+    # The error log of the shared schema is not mixed up between threads
+    with ThreadPoolExecutor(8) as pool:
+        assert list(pool.map(check, range(2000))) == expected * 1000
+    assert metrics._counters["xsd_cache_hits"] == hits + 2000
+
+
+def test_business_rules_are_compiled_per_thread():
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    ValidationService._initialize_schematrons()
+    barrier = threading.Barrier(4)
+
+    def validators(_):
+        barrier.wait()  # One task per thread
+        return threading.get_ident(), ValidationService._core_validator(), ValidationService._core_validator()
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(validators, range(4)))
+
+    assert all(first is second for _, first, second in results)
+    assert len({id(first) for _, first, _ in results}) == len({ident for ident, _, _ in results}) == 4
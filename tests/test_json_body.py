@@ -0,0 +1,78 @@
+"""
+Tests for the application/json variants of /v1/convert and /v1/xml
+(metadata parsed and validated in one pass by pydantic-core).
+"""
+import base64
+import copy
+import json
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.schemas.validation import InvoiceMetadata
+from app.services.pdf_locator import locate_embedded_xml
+from tests.test_convert import METADATA, invalid_metadata
+from tests.test_extract import create_dummy_pdf
+from tests.test_xml_templates import RICH_METADATA, reference_render
+
+client = TestClient(app)
+
+
+def convert_json(metadata, pdf_content=None):
+    body = {"pdf": base64.b64encode(pdf_content or create_dummy_pdf()).decode("ascii"), "metadata": metadata}
+    return client.post("/v1/convert/json", json=body)
+
+
+def test_xml_json_matches_form_endpoint():
+    data = copy.deepcopy(RICH_METADATA)
+    data["lines"] = [dict(data["lines"][0], line_id=str(i)) for i in range(500)]
+
+    response = client.post("/v1/xml/json", json=data)
+
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/xml"
+    assert response.content == client.post("/v1/xml", data={"metadata": json.dumps(data)}).content
+    assert response.content == reference_render(InvoiceMetadata(**data)).encode("utf-8")
+
+
+def test_convert_json_valid_invoice():
+    response = convert_json(METADATA)
+
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/pdf"
+    assert locate_embedded_xml(response.content)[0] == "factur-x.xml"
+
+
+def test_convert_json_rejects_invalid_invoice():
+    response = convert_json(invalid_metadata())
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["error"] == "GENERATION_FAILED"
+
+
+def test_convert_json_rejects_non_pdf():
+    response = convert_json(METADATA, b"GIF89a not a pdf")
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["error"] == "INVALID_FILE_TYPE"
+
+
+def test_json_body_errors():
+    invalid = client.post("/v1/xml/json", content=b'{"invoice_number": ', headers={"content-type": "application/json"})
+    missing = client.post("/v1/xml/json", json={"invoice_number": "X"})
+    bad_pdf = client.post("/v1/convert/json", json={"pdf": "JVBERi0", "metadata": METADATA})
+    form = client.post("/v1/xml/json", data={"metadata": json.dumps(METADATA)})
+
+    assert invalid.status_code == 400 and invalid.json()["detail"]["error"] == "INVALID_JSON"
+    assert missing.status_code == 400 and missing.json()["detail"]["error"] == "INVALID_METADATA"
+    assert bad_pdf.status_code == 400 and bad_pdf.json()["detail"]["error"] == "INVALID_METADATA"
+    assert form.status_code == 415
+
+
+def test_form_endpoint_parse_errors():
+    """The multipart endpoints use the same one-pass parsing and error codes."""
+    invalid = client.post("/v1/xml", data={"metadata": "{not json"})
+    not_an_object = client.post("/v1/xml", data={"metadata": "[1, 2]"})
+
+    assert invalid.status_code == 400 and invalid.json()["detail"]["error"] == "INVALID_JSON"
+    assert not_an_object.status_code == 400 and not_an_object.json()["detail"]["error"] == "INVALID_METADATA"
@@ -0,0 +1,133 @@
+"""
+Tests for incremental-update embedding (app/services/pdf_incremental.py)
+and the prebuilt PDF/A assets it uses (app/services/pdfa_assets.py).
+The output is compared with facturx.generate_from_binary(), the rewrite path.
+"""
+import re
+from io import BytesIO
+
+import pytest
+from facturx import generate_from_binary, get_xml_from_pdf
+from facturx.facturx import _prepare_pdf_metadata_xml
+from lxml import etree
+from pypdf import PdfReader, PdfWriter
+
+from app.services import generator
+from app.services.pdf_incremental import IncrementalFallback, embed_xml_incremental
+from app.services.pdf_locator import locate_embedded_xml
+from app.services.pdfa_assets import xmp_metadata
+from tests.test_convert import METADATA, convert
+from tests.test_pdf_locator import CII_XML, build_xref_stream_pdf, create_dummy_pdf
+
+PDF_METADATA = {
+    "author": "Factur-X API",
+    "keywords": "Factur-X, ZUGFeRD, e-invoice",
+    "title": "Invoice Übersicht 471102",
+    "subject": "Factur-X Invoice",
+}
+_TIMESTAMPS = re.compile(rb"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\+00:00")
+
+
+def describe(pdf_bytes: bytes) -> dict:
+    """Factur-X relevant structure of a PDF, as read by pypdf."""
+    reader = PdfReader(BytesIO(pdf_bytes), strict=True)
+    catalog = reader.trailer["/Root"]
+    names = catalog["/Names"]["/EmbeddedFiles"]["/Names"]
+    filespec = names[1].get_object()
+    embedded = filespec["/EF"]["/F"].get_object()
+    params = embedded["/Params"]
+    info = reader.metadata
+    return {
+        "xml": get_xml_from_pdf(BytesIO(pdf_bytes), check_xsd=False),
+        "embedded_names": [str(name) for name in names[::2]],
+        "af": [spec.get_object()["/F"] for spec in catalog["/AF"]],
+        "page_mode": catalog["/PageMode"],
+        "filespec": {key: filespec[key] for key in ("/Type", "/AFRelationship", "/Desc", "/F", "/UF")},
+        "subtype": embedded["/Subtype"],
+        "params": (params["/CheckSum"], params["/Size"]),
+        "xmp": _TIMESTAMPS.sub(b"", catalog["/Metadata"].get_object().get_data()),
+        "info": {key: info[key] for key in ("/Author", "/Keywords", "/Title", "/Subject", "/Creator")},
+        "pages": len(reader.pages),
+    }
+
+
+def test_incremental_matches_rewrite():
+    """Same Factur-X structure as generate_from_binary; original bytes kept as-is."""
+    base_pdf = create_dummy_pdf()
+
+    incremental = embed_xml_incremental(base_pdf, CII_XML, "en16931", PDF_METADATA)
+    rewritten = generate_from_binary(base_pdf, CII_XML, flavor="factur-x", level="en16931",
+                                     check_xsd=False, pdf_metadata=dict(PDF_METADATA))
+
+    assert incremental.startswith(base_pdf)
+    assert describe(incremental) == describe(rewritten)
+    assert locate_embedded_xml(incremental) == ("factur-x.xml", CII_XML)
+
+
+def test_incremental_adds_srgb_output_intent():
+    catalog = PdfReader(BytesIO(embed_xml_incremental(create_dummy_pdf(), CII_XML, "en16931", PDF_METADATA))).trailer["/Root"]
+
+    intent = catalog["/OutputIntents"][0].get_object()
+    assert intent["/S"] == "/GTS_PDFA1"
+    assert intent["/DestOutputProfile"].get_object()["/N"] == 3
+    assert catalog["/Version"] == "/1.6"
+
+
+def test_incremental_replaces_existing_facturx():
+    """Re-embedding into a Factur-X PDF replaces the XML and reuses the /Metadata object."""
+    facturx_pdf = generate_from_binary(create_dummy_pdf(), CII_XML, check_xsd=False)
+    new_xml = CII_XML.replace(b"471102", b"471103")
+    metadata_ref = PdfReader(BytesIO(facturx_pdf)).trailer["/Root"].raw_get("/Metadata")
+
+    output = embed_xml_incremental(facturx_pdf, new_xml, "en16931", PDF_METADATA)
+
+    reader = PdfReader(BytesIO(output), strict=True)
+    assert reader.trailer["/Root"].raw_get("/Metadata").idnum == metadata_ref.idnum
+    assert describe(output)["xml"] == ("factur-x.xml", new_xml)
+    assert locate_embedded_xml(output) == ("factur-x.xml", new_xml)
+
+
+def test_incremental_on_xref_stream_pdf():
+    """Files using xref streams get an xref stream update section."""
+    base_pdf = build_xref_stream_pdf(b"<old/>", filename="other.xml")
+
+    output = embed_xml_incremental(base_pdf, CII_XML, "en16931", PDF_METADATA)
+
+    assert b"/Type /XRef" in output[len(base_pdf):]
+    assert get_xml_from_pdf(BytesIO(output), check_xsd=False) == ("factur-x.xml", CII_XML)
+    assert locate_embedded_xml(output) == ("factur-x.xml", CII_XML)
+
+
+def test_incremental_rejects_encrypted_pdf():
+    writer = PdfWriter(clone_from=PdfReader(BytesIO(create_dummy_pdf())))
+    writer.encrypt("secret")
+    buffer = BytesIO()
+    writer.write(buffer)
+
+    with pytest.raises(IncrementalFallback):
+        embed_xml_incremental(buffer.getvalue(), CII_XML, "en16931", PDF_METADATA)
+
+
+def test_convert_incremental_mode(monkeypatch):
+    monkeypatch.setattr(generator, "EMBED_MODE", "incremental")
+    pdf_content = create_dummy_pdf()
+
+    response = convert(METADATA, pdf_content)
+
+    assert response.status_code == 200, response.text
+    assert response.content.startswith(pdf_content)
+    assert locate_embedded_xml(response.content)[0] == "factur-x.xml"
+
+
+def test_xmp_skeleton_matches_facturx():
+    """The cached XMP skeleton renders the factur-x library packet (timestamps aside)."""
+    for level in ("minimum", "basicwl", "basic", "en16931", "extended"):
+        expected = _prepare_pdf_metadata_xml("factur-x", level, None, PDF_METADATA)
+        assert _TIMESTAMPS.sub(b"", xmp_metadata(level, PDF_METADATA)) == _TIMESTAMPS.sub(b"", expected)
+
+
+def test_xmp_values_are_escaped():
+    packet = xmp_metadata("en16931", dict(PDF_METADATA, title="Invoice <A&B>"))
+
+    title = etree.fromstring(packet.strip()).find(".//{http://purl.org/dc/elements/1.1/}title")
+    assert "".join(title.itertext()).strip() == "Invoice <A&B>"
@@ -0,0 +1,191 @@
+"""
+Tests for the fast embedded-file locator (app/services/pdf_locator.py).
+Every case is checked against facturx.get_xml_from_pdf(), the reference path.
+"""
+import zlib
+from io import BytesIO
+from pathlib import Path
+from typing import Optional
+
+import pytest
+from facturx import generate_from_binary, get_xml_from_pdf
+from pypdf import PdfReader
+from reportlab.pdfgen import canvas
+
+from app.services import pdf_locator
+from app.services.pdf_locator import (
+    LocatorFallback, get_xml_from_pdf_fast, locate_embedded_xml, map_file
+)
+
+ROOT_DIR = Path(__file__).parent.parent
+CII_XML = (ROOT_DIR / "tests" / "corpus" / "corpus-master" / "XML-Rechnung" / "CII" / "EN16931_Einfach.cii.xml").read_bytes()
+
+
+def create_dummy_pdf() -> bytes:
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    pdf.drawString(100, 750, "Locator Test")
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def reference(pdf_bytes: bytes):
+    return get_xml_from_pdf(BytesIO(pdf_bytes), check_xsd=False)
+
+
+def append_incremental_update(pdf_bytes: bytes, new_xml: bytes) -> bytes:
+    """Replace the embedded XML stream through an incremental update (new xref + /Prev)."""
+    reader = PdfReader(BytesIO(pdf_bytes))
+    names = reader.trailer["/Root"]["/Names"]["/EmbeddedFiles"]["/Names"]
+    stream_ref = names[1].get_object()["/EF"].raw_get("/F")
+    prev = int(pdf_bytes[pdf_bytes.rindex(b"startxref") + 9:].split()[0])
+
+    body = zlib.compress(new_xml)
+    offset = len(pdf_bytes) + 1
+    update = b"\n" + (
+        f"{stream_ref.idnum} 0 obj\n<< /Type /EmbeddedFile /Filter /FlateDecode /Length {len(body)} >>\nstream\n"
+    ).encode() + body + b"\nendstream\nendobj\n"
+    xref_offset = len(pdf_bytes) + len(update)
+    update += (
+        f"xref\n0 1\n0000000000 65535 f \n{stream_ref.idnum} 1\n{offset:010d} 00000 n \n"
+        f"trailer\n<< /Size {reader.trailer['/Size']} /Root {reader.trailer.raw_get('/Root').idnum} 0 R /Prev {prev} >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode()
+    return pdf_bytes + update
+
+
+def build_xref_stream_pdf(xml_bytes: bytes, filename: str = "factur-x.xml", embedded: Optional[bytes] = None) -> bytes:
+    """PDF 1.5 file with an xref stream (PNG Up predictor) and an object stream (embedded: deflated XML as is)."""
+    out = bytearray(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+
+    def add(num: int, body: bytes):
+        offsets[num] = len(out)
+        out.extend(f"{num} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    add(1, b"<< /Type /Catalog /Pages 5 0 R /Names 2 0 R >>")
+    embedded = embedded if embedded is not None else zlib.compress(xml_bytes)
+    add(6, f"<< /Type /EmbeddedFile /Filter /FlateDecode /Length {len(embedded)} >>\nstream\n".encode()
+        + embedded + b"\nendstream")
+
+    # Objects 2-5 live in object stream 7
+    compressed = [
+        (2, b"<< /EmbeddedFiles 3 0 R >>"),
+        (3, b"<< /Names [ <FEFF" + filename.encode("utf-16-be").hex().upper().encode() + b"> 4 0 R ] >>"),
+        (4, b"<< /Type /Filespec /F (" + filename.encode() + b") /EF << /F 6 0 R >> >>"),
+        (5, b"<< /Type /Pages /Kids [] /Count 0 >>"),
+    ]
+    header, data = [], b""
+    for num, body in compressed:
+        header.append(f"{num} {len(data)}".encode())
+        data += body + b" "
+    header = b" ".join(header) + b"\n"
+    objstm = zlib.compress(header + data)
+    add(7, f"<< /Type /ObjStm /N {len(compressed)} /First {len(header)} /Filter /FlateDecode /Length {len(objstm)} >>\nstream\n".encode()
+        + objstm + b"\nendstream")
+
+    xref_offset = len(out)
+    rows = [(0, 0, 0)]
+    rows += [(1, offsets[1], 0)]
+    rows += [(2, 7, i) for i in range(4)]
+    rows += [(1, offsets[6], 0), (1, offsets[7], 0), (1, xref_offset, 0)]
+    raw, prev = b"", bytes(7)
+    for kind, f2, f3 in rows:
+        row = bytes([kind]) + f2.to_bytes(4, "big") + f3.to_bytes(2, "big")
+        raw += b"\x02" + bytes((a - b) & 0xFF for a, b in zip(row, prev))
+        prev = row
+    xref = zlib.compress(raw)
+    add(8, f"<< /Type /XRef /Size 9 /W [1 4 2] /Root 1 0 R /Filter /FlateDecode "
+           f"/DecodeParms << /Predictor 12 /Columns 7 >> /Length {len(xref)} >>\nstream\n".encode()
+        + xref + b"\nendstream")
+    out.extend(f"startxref\n{xref_offset}\n%%EOF\n".encode())
+    return bytes(out)
+
+
+def test_locator_matches_facturx_on_generated_pdf():
+    facturx_pdf = generate_from_binary(create_dummy_pdf(), CII_XML, check_xsd=False)
+
+    assert locate_embedded_xml(facturx_pdf) == reference(facturx_pdf)
+
+
+def test_locator_on_shipped_example():
+    example = (ROOT_DIR / "examples" / "invoice_raw.pdf").read_bytes()
+
+    filename, xml = locate_embedded_xml(example)
+    assert filename == "factur-x.xml"
+    assert xml == reference(example)[1]
+
+
+def test_locator_follows_incremental_updates():
+    facturx_pdf = generate_from_binary(create_dummy_pdf(), CII_XML, check_xsd=False)
+    updated_xml = CII_XML.replace(b"471102", b"471102-UPDATED")
+    updated_pdf = append_incremental_update(facturx_pdf, updated_xml)
+
+    filename, xml = locate_embedded_xml(updated_pdf)
+    assert filename == "factur-x.xml"
+    assert xml == updated_xml
+    assert xml == reference(updated_pdf)[1]
+
+
+def test_locator_reads_xref_and_object_streams():
+    pdf_bytes = build_xref_stream_pdf(CII_XML)
+
+    assert locate_embedded_xml(pdf_bytes) == ("factur-x.xml", CII_XML)
+    assert locate_embedded_xml(pdf_bytes) == reference(pdf_bytes)
+
+
+def test_locator_ignores_unrelated_attachments():
+    pdf_bytes = build_xref_stream_pdf(CII_XML, filename="notes.xml")
+
+    assert locate_embedded_xml(pdf_bytes) == (None, None)
+
+
+def test_locator_pdf_without_attachment():
+    assert locate_embedded_xml(create_dummy_pdf()) == (None, None)
+
+
+def test_locator_mmap(tmp_path):
+    facturx_pdf = generate_from_binary(create_dummy_pdf(), CII_XML, check_xsd=False)
+    path = tmp_path / "invoice.pdf"
+    path.write_bytes(facturx_pdf)
+
+    mapped = map_file(path)
+    try:
+        assert locate_embedded_xml(mapped) == reference(facturx_pdf)
+    finally:
+        mapped.close()
+
+
+def test_fast_wrapper_falls_back_on_broken_xref():
+    facturx_pdf = generate_from_binary(create_dummy_pdf(), CII_XML, check_xsd=False)
+    # Point startxref into the middle of nowhere: pypdf rebuilds the xref, we do not
+    head, _, _ = facturx_pdf.rpartition(b"startxref")
+    broken = head + b"startxref\n12\n%%EOF\n"
+
+    with pytest.raises(LocatorFallback):
+        locate_embedded_xml(broken)
+    assert get_xml_from_pdf_fast(broken) == reference(broken)
+
+
+def test_decompression_bomb_is_refused():
+    # ~80 KB of deflate inflating to 80 MB, over pypdf's ZLIB_MAX_OUTPUT_LENGTH
+    deflate = zlib.compressobj(9)
+    padding = b" " * (1 << 20)
+    body = deflate.compress(b"<?xml version='1.0'?><a>") + b"".join(deflate.compress(padding) for _ in range(80))
+    bomb = build_xref_stream_pdf(b"", embedded=body + deflate.compress(b"</a>") + deflate.flush())
+
+    with pytest.raises(LocatorFallback, match="inflates beyond"):
+        locate_embedded_xml(bomb)
+    # The pypdf path refuses it too ("Limit reached while decompressing")
+    assert get_xml_from_pdf_fast(bomb) == reference(bomb) == (None, None)
+
+
+def test_inflate_limit(monkeypatch):
+    pdf = build_xref_stream_pdf(CII_XML)
+    monkeypatch.setattr(pdf_locator, "MAX_INFLATED_SIZE", len(CII_XML))
+    assert locate_embedded_xml(pdf) == ("factur-x.xml", CII_XML)
+
+    monkeypatch.setattr(pdf_locator, "MAX_INFLATED_SIZE", len(CII_XML) - 1)
+    with pytest.raises(LocatorFallback):
+        locate_embedded_xml(pdf)
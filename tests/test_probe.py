@@ -0,0 +1,126 @@
+"""
+Tests for the content-addressed result store and the /v1/probe endpoint.
+"""
+import hashlib
+
+from facturx import generate_from_binary
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.result_store import KIND_EXTRACT, KIND_VALIDATE, ResultStore, result_store
+from tests.test_extract import CORPUS_DIR, create_dummy_pdf
+
+client = TestClient(app)
+
+
+def make_facturx_pdf(invoice_number: str) -> bytes:
+    xml_content = (CORPUS_DIR / "CII" / "EN16931_Einfach.cii.xml").read_bytes()
+    return generate_from_binary(create_dummy_pdf(), xml_content.replace(b"471102", invoice_number.encode()), check_xsd=False)
+
+
+def test_probe_miss_then_hit_after_extract():
+    pdf_content = make_facturx_pdf("PROBE-001")
+    digest = hashlib.sha256(pdf_content).hexdigest()
+
+    miss = client.get(f"/v1/probe/{digest}")
+    assert miss.status_code == 404
+    assert miss.json()["detail"]["error"] == "NOT_FOUND"
+
+    extracted = client.post("/v1/extract", files={"file": ("invoice.pdf", pdf_content, "application/pdf")})
+    hit = client.get(f"/v1/probe/{digest}", params={"kind": "extract", "filename": "invoice.pdf"})
+
+    assert hit.status_code == 200
+    assert hit.json() == extracted.json()
+    assert hit.json()["invoice_json"]["invoice_number"] == "PROBE-001"
+
+
+def test_probe_validate_applies_report_formatting():
+    pdf_content = make_facturx_pdf("PROBE-002")
+    digest = hashlib.sha256(pdf_content).hexdigest()
+
+    validated = client.post("/v1/validate", files={"file": ("invoice.pdf", pdf_content, "application/pdf")})
+    hit = client.get(f"/v1/probe/{digest}", params={"kind": "validate"})
+
+    assert hit.status_code == 200
+    assert hit.json() == validated.json()
+    # The raw hybrid result is cached, not the formatted report
+    assert "validation_mode" in result_store.get(KIND_VALIDATE, digest)
+
+
+def test_probe_inspect_needs_both_results():
+    pdf_content = make_facturx_pdf("PROBE-003")
+    digest = hashlib.sha256(pdf_content).hexdigest()
+
+    client.post("/v1/extract", files={"file": ("invoice.pdf", pdf_content, "application/pdf")})
+    assert client.get(f"/v1/probe/{digest}", params={"kind": "inspect"}).status_code == 404
+
+    inspected = client.post("/v1/inspect", files={"file": ("invoice.pdf", pdf_content, "application/pdf")})
+    hit = client.get(f"/v1/probe/{digest}", params={"kind": "inspect", "filename": "invoice.pdf"})
+    assert hit.status_code == 200
+    assert hit.json() == inspected.json()
+
+
+def test_probe_rejects_bad_input():
+    assert client.get("/v1/probe/not-a-hash").status_code == 400
+    assert client.get(f"/v1/probe/{'0' * 64}", params={"kind": "convert"}).status_code == 400
+
+
+def test_result_store_is_bounded_lru():
+    store = ResultStore(max_entries=2, max_file_bytes=0)
+    store.put(KIND_EXTRACT, "a", {"errors": []})
+    store.put(KIND_EXTRACT, "b", {"errors": []})
+    store.get(KIND_EXTRACT, "a")
+    store.put(KIND_EXTRACT, "c", {"errors": []})
+
+    assert store.get(KIND_EXTRACT, "b") is None
+    assert store.get(KIND_EXTRACT, "a") is not None
+    assert store.get(KIND_EXTRACT, "c") is not None
+
+    # Raw files are not kept unless a budget is configured
+    store.put_file("a", b"%PDF-1.4")
+    assert store.get_file("a") is None
+
+
+def test_result_store_skips_transient_failures():
+    store = ResultStore(max_entries=10, max_file_bytes=0)
+    store.put(KIND_VALIDATE, "a", {"errors": [{"rule_id": "FX-TIMEOUT", "message": "timed out"}]})
+
+    assert store.get(KIND_VALIDATE, "a") is None
+
+
+def test_result_store_keeps_files_within_budget():
+    store = ResultStore(max_entries=10, max_file_bytes=10)
+    store.put_file("a", b"123456")
+    store.put_file("b", b"7890")
+    store.put_file("c", b"xy")
+
+    assert store.get_file("a") is None
+    assert store.get_file("b") == b"7890"
+    assert store.get_file("c") == b"xy"
+
+
+def test_failfast_validation_is_not_stored():
+    xml_content = (CORPUS_DIR / "CII" / "EN16931_Einfach.cii.xml").read_bytes()
+    xml_content = xml_content.replace(b"471102", b"PROBE-004").replace(b">EUR<", b">EURO<")  # BR-CO-15, BR-CL-04
+    pdf_content = generate_from_binary(create_dummy_pdf(), xml_content, check_xsd=False)
+    digest = hashlib.sha256(pdf_content).hexdigest()
+
+    failfast = client.post("/v1/validate", params={"mode": "failfast"},
+                           files={"file": ("invoice.pdf", pdf_content, "application/pdf")}).json()
+
+    assert failfast["valid"] is False and failfast["truncated"] is True
+    assert result_store.get(KIND_VALIDATE, digest) is None
+
+
+def test_br_fr_validation_is_not_stored():
+    pdf_content = make_facturx_pdf("PROBE-005")
+    digest = hashlib.sha256(pdf_content).hexdigest()
+
+    br_fr = client.post("/v1/validate", params={"br_fr": "true"},
+                        files={"file": ("invoice.pdf", pdf_content, "application/pdf")}).json()
+    assert result_store.get(KIND_VALIDATE, digest) is None
+    default = client.post("/v1/validate", files={"file": ("invoice.pdf", pdf_content, "application/pdf")}).json()
+
+    assert default["valid"] is True and default["errors"] == []
+    assert "BR-FR-05/BT-22" in br_fr["errors"][0]  # Mandatory notes (PMT, PMD, AAB) of French invoices
+    assert result_store.get(KIND_VALIDATE, digest) is not None
@@ -0,0 +1,392 @@
+"""
+Tests for the native Schematron evaluation (app/services/schematron.py and
+app/services/xpath_translator.py): the failed asserts must be the ones the
+full EN 16931 XSLT reports in SaxonC, in the same order, down to the dynamic
+errors that stop it.
+"""
+import os
+
+import pytest
+from lxml import etree
+from saxonche import PySaxonApiError
+
+from app.metrics import metrics
+from app.schemas.validation import InvoiceMetadata
+from app.services.generator import GeneratorService
+from app.services import hybrid_validation_service
+from app.services.hybrid_validation_service import (BR_FR_SCH_PATH, BR_FR_UBL_SCH_PATH, BR_FR_UBL_XSLT_PATH,
+                                                    BR_FR_XSLT_PATH, PROFILE_RULESETS, SCH_PATH, XSD_PATH, XSLT_PATH,
+                                                    HybridValidationService, _merge_shards, _run_hybrid_validation,
+                                                    select_ruleset)
+from app.services.hybrid_validator import HybridValidator, ValidationLayer, saxon_executable, saxon_processor
+from app.services.schematron import (SchematronError, assert_roles, element_location, load_schematron,
+                                     parse_messages, parse_svrl, pattern_modes, plan_shards, resolve_location,
+                                     targeted_stylesheet)
+from app.services.syntax import SYNTAX_CII, SYNTAX_UBL
+from app.services.xpath_translator import EXTENSIONS, FX_NS, Unsupported, XPathDynamicError, translate
+from tests.test_codelists import bad_codes
+from tests.test_totals import MIXED_LINES
+from tools.schematron_parity import CORPUS_DIR, ENGINE_ERROR, Parity, corpus_files, mutations
+
+ZUGFERD_EXAMPLES = CORPUS_DIR / "ZUGFeRD-2.4-examples" / "_ZUGFeRD 2.4 examples"
+XRECHNUNG_STANDARD = CORPUS_DIR / "xrechnung-3.0.2-testsuite-2025-07-10" / "instances" / "standard"
+
+
+@pytest.fixture(scope="module")
+def parity():
+    return Parity()
+
+
+@pytest.fixture(scope="module")
+def ubl_parity():
+    return Parity(SYNTAX_UBL)
+
+
+def worker_report(result: dict) -> dict:
+    """A worker result without its timing."""
+    return {key: value for key, value in result.items() if key != "duration"}
+
+
+def evaluate(test: str, xml: str) -> bool:
+    """A translated assert on the root element of `xml`."""
+    return etree.XPath(translate(test).xpath, namespaces={"fx": FX_NS}, extensions=EXTENSIONS)(etree.fromstring(xml))
+
+
+def test_translation_keeps_xpath2_results():
+    assert evaluate("exists(a) and ends-with(a, 'ID')", "<r><a>VATID</a></r>")
+    assert evaluate("a = ('x', 'y')", "<r><a>y</a></r>")
+    assert not evaluate("a = ('x', 'y')", "<r><a>z</a></r>")
+    assert evaluate("a = false()", "<r><a> 0 </a></r>")
+    assert evaluate("upper-case(a) = 'VAT'", "<r><a>vat</a></r>")
+    assert evaluate("a >= 0", "<r><a>-1</a><a>2</a></r>")  # General comparisons are existential
+
+
+@pytest.mark.parametrize("test, xml", [
+    ("a + 1 = 2", "<r><a>1</a><a>1</a></r>"),  # XPTY0004: more than one item for an operand
+    ("a = 1", "<r><a>one</a></r>"),  # FORG0001: not a number
+    ("a = true()", "<r><a>yes</a></r>"),  # FORG0001: not a boolean
+])
+def test_translation_raises_xpath2_errors(test, xml):
+    with pytest.raises(XPathDynamicError):
+        evaluate(test, xml)
+
+
+@pytest.mark.parametrize("test", [
+    "xs:decimal(a) = 1",
+    "matches(a, '^[0-9]+$')",
+    "every $x in a satisfies $x = 1",
+    "a > b",  # String comparison in XPath 2.0
+    "b[a = 1]",  # Evaluated lazily in XPath 2.0: a later b cannot raise
+])
+def test_xpath2_only_expressions_are_left_to_saxon(test):
+    with pytest.raises(Unsupported):
+        translate(test)
+
+
+def test_absolute_paths_are_hoisted():
+    variables = {}
+
+    first = translate("not(@unitCode) or (/rsm:A/ram:B/@unitCode)", variables)
+    second = translate("count(/rsm:A/ram:B) = 1", variables)
+
+    assert first.xpath == "boolean(not(@unitCode) or $p2)"
+    assert second.xpath == "boolean(count($p1) = 1)"
+    assert variables == {"/rsm:A/ram:B": "p1", "boolean(/rsm:A/ram:B/@unitCode)": "p2"}
+
+
+def test_locations_round_trip():
+    root = etree.fromstring(GeneratorService.generate_xml_bytes(InvoiceMetadata(**MIXED_LINES)))
+    element = root.findall(".//{*}IncludedSupplyChainTradeLineItem")[2]
+
+    assert resolve_location(root, element_location(element)) is element
+
+
+def test_corpus_parity(parity):
+    for path in corpus_files():
+        expected, actual = parity.compare(path.read_bytes())
+        assert actual == expected, path.name
+
+
+def test_mutation_parity(parity):
+    outcomes = [parity.compare(xml) for _, xml in mutations(corpus_files(), 60)]
+
+    assert [actual for _, actual in outcomes] == [expected for expected, _ in outcomes]
+    assert any(expected and expected != ENGINE_ERROR for expected, _ in outcomes)
+
+
+def test_ubl_parity(ubl_parity):
+    files = corpus_files(SYNTAX_UBL)
+    for path in files:
+        expected, actual = ubl_parity.compare(path.read_bytes())
+        assert actual == expected, path.name
+
+    outcomes = [ubl_parity.compare(xml) for _, xml in mutations(files, 40)]
+    assert [actual for _, actual in outcomes] == [expected for expected, _ in outcomes]
+
+
+def test_dynamic_error_stops_validation():
+    rules = load_schematron(str(SCH_PATH), str(XSLT_PATH))
+    root = etree.fromstring(GeneratorService.generate_xml_bytes(InvoiceMetadata(**MIXED_LINES)))
+    total = root.find(".//{*}GrandTotalAmount")
+    total.addnext(etree.fromstring(etree.tostring(total)))  # BR-DEC-14: string-length(substring-after(., '.'))
+
+    with pytest.raises(SchematronError, match="BR-DEC-14 at .*SpecifiedTradeSettlementHeaderMonetarySummation.*XPTY0004"):
+        rules.evaluate(root)
+
+
+@pytest.mark.parametrize("data", [MIXED_LINES, bad_codes()], ids=["valid", "bad-codes"])
+def test_validator_matches_saxon_engine(data):
+    xml = GeneratorService.generate_xml_bytes(InvoiceMetadata(**data))
+
+    saxon = HybridValidator(str(XSD_PATH), str(XSLT_PATH)).validate(xml)
+    native = HybridValidator(str(XSD_PATH), str(XSLT_PATH), sch_path=str(SCH_PATH)).validate(xml)
+
+    assert native == saxon
+
+
+def test_shards_are_consecutive_patterns():
+    modes = pattern_modes(etree.parse(str(XSLT_PATH)))
+
+    for count in (1, 2, 3, 8):
+        shards = plan_shards(str(XSLT_PATH), count)
+        assert len(shards) == min(count, len(modes))
+        assert [mode for shard in shards for mode in shard] == modes
+
+
+@pytest.mark.parametrize("sch_path", [str(SCH_PATH), None], ids=["native", "saxon"])
+@pytest.mark.parametrize("data", [MIXED_LINES, bad_codes()], ids=["valid", "bad-codes"])
+def test_sharded_validation_matches_whole(sch_path, data):
+    xml = GeneratorService.generate_xml_bytes(InvoiceMetadata(**data))
+
+    whole = _run_hybrid_validation(xml, str(XSD_PATH), str(XSLT_PATH), sch_path)
+    shards = [_run_hybrid_validation(xml, str(XSD_PATH) if index == 0 else None, str(XSLT_PATH), sch_path, modes)
+              for index, modes in enumerate(plan_shards(str(XSLT_PATH), 2))]
+
+    assert worker_report(_merge_shards(shards)) == worker_report(whole)
+
+
+def test_large_invoices_are_sharded(monkeypatch):
+    xml = GeneratorService.generate_xml_bytes(InvoiceMetadata(**bad_codes()))
+    whole = HybridValidationService.submit_xml(xml).result()
+    monkeypatch.setattr(hybrid_validation_service, "SCHEMATRON_SHARDS", 2)
+    monkeypatch.setattr(hybrid_validation_service, "SHARD_THRESHOLD", len(xml))
+    plans = []
+    monkeypatch.setattr(hybrid_validation_service, "plan_shards", lambda *args: plans.append(args) or plan_shards(*args))
+
+    sharded = HybridValidationService.submit_xml(xml).result()
+
+    assert plans == [(str(XSLT_PATH), 2)]
+    assert sharded == whole
+    assert any(e["layer"] == "schematron" for e in sharded["errors"])
+
+
+def test_engines_report_the_same(monkeypatch):
+    xml = GeneratorService.generate_xml_bytes(InvoiceMetadata(**bad_codes()))
+    reports = {}
+    for engine in ("process", "thread"):
+        monkeypatch.setattr(hybrid_validation_service, "VALIDATION_ENGINE", engine)
+        counter = f"validations_in_{engine}"
+        before = metrics._counters[counter]
+        reports[engine] = HybridValidationService.submit_xml(xml, br_fr=True).result()
+        assert metrics._counters[counter] == before + 1
+
+    assert reports["thread"] == reports["process"]
+    assert any(e["layer"] == "br-fr" for e in reports["thread"]["errors"])
+
+
+def test_auto_engine_routes_by_size(monkeypatch):
+    xml = GeneratorService.generate_xml_bytes(InvoiceMetadata(**bad_codes()))
+    monkeypatch.setattr(hybrid_validation_service, "VALIDATION_ENGINE", "auto")
+
+    def engines(max_size: int, backlog: int = 0) -> tuple:
+        monkeypatch.setattr(hybrid_validation_service, "THREAD_ENGINE_MAX_SIZE", max_size)
+        monkeypatch.setattr(hybrid_validation_service, "_saxon_thread_backlog", backlog)
+        before = metrics._counters["validations_in_thread"], metrics._counters["validations_in_process"]
+        HybridValidationService.submit_xml(xml).result()
+        return (metrics._counters["validations_in_thread"] - before[0],
+                metrics._counters["validations_in_process"] - before[1])
+
+    assert engines(len(xml)) == (1, 0)
+    assert engines(len(xml) - 1) == (0, 1)
+    # A busy SaxonC thread leaves small documents to the pool
+    assert engines(len(xml), backlog=hybrid_validation_service.MAX_WORKERS) == (0, 1)
+
+
+@pytest.mark.parametrize("sch_path", [str(SCH_PATH), None], ids=["native", "saxon"])
+def test_max_errors_stops_at_the_cap(sch_path):
+    xml = GeneratorService.generate_xml_bytes(InvoiceMetadata(**bad_codes()))
+    validator = HybridValidator(str(XSD_PATH), str(XSLT_PATH), sch_path=sch_path)
+
+    full = validator.validate(xml)
+    capped = validator.validate(xml, max_errors=2)
+
+    assert full.error_count > 2 and not full.truncated
+    assert capped.error_count == 2 and capped.truncated and not capped.is_valid
+    assert all(error in full.errors for error in capped.errors)
+
+
+def test_max_errors_skips_schematron_after_xsd_errors():
+    root = etree.fromstring(GeneratorService.generate_xml_bytes(InvoiceMetadata(**bad_codes())))
+    root.append(etree.Element(root[0].tag))
+    root.append(etree.Element(root[0].tag))
+
+    result = HybridValidator(str(XSD_PATH), str(XSLT_PATH), sch_path=str(SCH_PATH)).validate(
+        etree.tostring(root), max_errors=1)
+
+    assert [e.layer for e in result.errors] == [ValidationLayer.XSD]
+    assert result.truncated and result.schematron_valid
+
+
+def test_max_errors_above_the_xsd_errors_runs_schematron():
+    """mode=full&max_errors=N on an XSD-invalid document: the XSD errors leave room for the Schematron."""
+    root = etree.fromstring(GeneratorService.generate_xml_bytes(InvoiceMetadata(**bad_codes())))
+    root.append(etree.Element(root[0].tag))
+    xml = etree.tostring(root)
+    validator = HybridValidator(str(XSD_PATH), str(XSLT_PATH), sch_path=str(SCH_PATH))
+
+    full = validator.validate(xml)
+    capped = validator.validate(xml, max_errors=50)
+
+    assert {e.layer for e in capped.errors} == {ValidationLayer.XSD, ValidationLayer.SCHEMATRON}
+    assert capped.errors == full.errors and not capped.truncated
+    assert not capped.xsd_valid and not capped.schematron_valid
+
+
+def test_svrl_is_read_up_to_max_errors():
+    svrl = b"""<svrl:schematron-output xmlns:svrl="http://purl.oclc.org/dsdl/svrl">
+        <svrl:failed-assert id="W" role="warning"><svrl:text>w</svrl:text></svrl:failed-assert>
+        <svrl:failed-assert id="E1"><svrl:text>e</svrl:text></svrl:failed-assert>
+        <svrl:failed-assert id="E2" role="fatal"><svrl:text>e</svrl:text></svrl:failed-assert>
+    </svrl:schematron-output>"""
+
+    assert [f.rule_id for f in parse_svrl(svrl)] == ["W", "E1", "E2"]
+    assert [f.rule_id for f in parse_svrl(svrl, max_errors=1)] == ["W", "E1"]
+
+
+@pytest.mark.parametrize("profile, ruleset", [
+    ("minimum", "en16931"), ("basicwl", "basicwl"), ("basic", "en16931"), ("en16931", "en16931"),
+    ("extended", "extended"), (None, "en16931"),
+])
+def test_profiles_select_their_ruleset(profile, ruleset):
+    assert select_ruleset(profile).name == ruleset
+    assert select_ruleset(profile, SYNTAX_UBL).name == "ubl"
+
+
+@pytest.mark.parametrize("example", ["01.01a-INVOICE", "02.01a-INVOICE", "03.01a-INVOICE"])
+def test_ubl_invoice_gets_the_verdict_of_its_cii_twin(example):
+    ubl = HybridValidationService.submit_xml((XRECHNUNG_STANDARD / f"{example}_ubl.xml").read_bytes()).result()
+    cii = HybridValidationService.submit_xml((XRECHNUNG_STANDARD / f"{example}_uncefact.xml").read_bytes()).result()
+
+    assert (ubl["format_detected"], ubl["profile_detected"], ubl["ruleset"]) == ("ubl", "xrechnung", "ubl")
+    assert cii["ruleset"] == "en16931"
+    assert ubl["is_valid"] and cii["is_valid"]
+
+
+def test_ubl_credit_note_is_validated():
+    path = CORPUS_DIR / "corpus-master" / "XML-Rechnung" / "UBL" / "ubl-tc434-creditnote1.xml"  # Starts with a BOM
+    result = HybridValidationService.submit_xml(path.read_bytes()).result()
+    assert result["ruleset"] == "ubl" and result["is_valid"]
+
+    broken = HybridValidationService.submit_xml(path.read_bytes().replace(b"<cbc:DocumentCurrencyCode>EUR",
+                                                                          b"<cbc:DocumentCurrencyCode>EURO")).result()
+    assert "BR-CL-04" in [e["rule_id"] for e in broken["errors"]]
+
+
+def test_ubl_br_fr_rules():
+    xml = (XRECHNUNG_STANDARD / "01.01a-INVOICE_ubl.xml").read_bytes()
+    result = HybridValidationService.submit_xml(xml, br_fr=True).result()
+
+    br_fr = [e for e in result["errors"] if e["layer"] == "br-fr"]
+    assert br_fr and all(e["severity"] == assert_roles(str(BR_FR_UBL_SCH_PATH))[e["rule_id"]] for e in br_fr)
+
+
+@pytest.mark.parametrize("example", ["1. BASIC WL/BASIC-WL_Einfach", "4. EXTENDED/EXTENDED_Warenrechnung"])
+def test_profile_ruleset_accepts_what_en16931_rejects(monkeypatch, example):
+    xml = (ZUGFERD_EXAMPLES / example / f"{example.split('/')[1]}.xml").read_bytes()
+    result = HybridValidationService.submit_xml(xml).result()
+    assert result["is_valid"] and result["ruleset"] == result["profile_detected"]
+    assert all(e["severity"] == "warning" for e in result["errors"])  # PEPPOL-EN16931-R008 ("still status warning")
+
+    durations = metrics._labeled_histograms["validation_duration_seconds"]
+    observed = durations[result["profile_detected"]][1]
+    monkeypatch.setattr(hybrid_validation_service, "PROFILE_RULESETS_ENABLED", False)
+    en16931 = HybridValidationService.submit_xml(xml).result()
+    assert en16931["ruleset"] == "en16931" and not en16931["is_valid"]
+    assert durations[result["profile_detected"]][1] == observed + 1
+
+
+def test_sharded_profile_ruleset_matches_whole():
+    """The shards of a Factur-X XSLT still find the code lists next to it."""
+    ruleset = PROFILE_RULESETS["extended"]
+    xml = (ZUGFERD_EXAMPLES / "4. EXTENDED" / "EXTENDED_Kostenrechnung" / "EXTENDED_Kostenrechnung.xml").read_bytes()
+    xml = xml.replace(b"<ram:InvoiceCurrencyCode>EUR", b"<ram:InvoiceCurrencyCode>EURO")
+
+    whole = _run_hybrid_validation(xml, str(ruleset.xsd_path), str(ruleset.xslt_path))
+    shards = [_run_hybrid_validation(xml, str(ruleset.xsd_path) if index == 0 else None, str(ruleset.xslt_path),
+                                     modes=modes)
+              for index, modes in enumerate(plan_shards(str(ruleset.xslt_path), 2))]
+
+    assert not whole["is_valid"]
+    assert worker_report(_merge_shards(shards)) == worker_report(whole)
+
+
+def test_br_fr_layer_runs_after_en16931():
+    xml = GeneratorService.generate_xml_bytes(InvoiceMetadata(**bad_codes()))
+    en16931 = HybridValidator(str(XSD_PATH), str(XSLT_PATH), sch_path=str(SCH_PATH)).validate(xml)
+
+    result = HybridValidator(str(XSD_PATH), str(XSLT_PATH), sch_path=str(SCH_PATH), br_fr_xslt_path=str(BR_FR_XSLT_PATH),
+                             br_fr_sch_path=str(BR_FR_SCH_PATH)).validate(xml)
+
+    br_fr = result.errors[len(en16931.errors):]
+    assert result.errors[:len(en16931.errors)] == en16931.errors
+    assert br_fr and all(e.layer == ValidationLayer.BR_FR and e.rule_id.startswith("BR-FR-") for e in br_fr)
+    assert all(e.severity == assert_roles(str(BR_FR_SCH_PATH))[e.rule_id] for e in br_fr)
+
+
+def test_br_fr_runs_with_the_first_shard():
+    xml = GeneratorService.generate_xml_bytes(InvoiceMetadata(**bad_codes()))
+
+    br_fr = (str(BR_FR_XSLT_PATH), str(BR_FR_SCH_PATH))
+
+    whole = _run_hybrid_validation(xml, str(XSD_PATH), str(XSLT_PATH), str(SCH_PATH), None, None, *br_fr)
+    shards = [_run_hybrid_validation(xml, str(XSD_PATH) if index == 0 else None, str(XSLT_PATH), str(SCH_PATH), modes,
+                                     None, *(br_fr if index == 0 else (None, None)))
+              for index, modes in enumerate(plan_shards(str(XSLT_PATH), 2))]
+
+    assert any(e["layer"] == "br-fr" for e in whole["errors"])
+    assert worker_report(_merge_shards(shards)) == worker_report(whole)
+
+
+@pytest.mark.parametrize("syntax, xslt_path", [(SYNTAX_CII, BR_FR_XSLT_PATH), (SYNTAX_UBL, BR_FR_UBL_XSLT_PATH)])
+def test_targeted_stylesheet_reports_the_same_messages(syntax, xslt_path):
+    def messages(executable, xml: bytes) -> list:
+        executable.set_save_xsl_message(True, os.devnull)
+        executable.clear_xsl_messages()
+        try:
+            executable.transform_to_string(xdm_node=saxon_processor().parse_xml(xml_text=xml.decode("utf-8-sig")))
+        except PySaxonApiError as e:
+            return [ENGINE_ERROR, str(e)]
+        found = executable.get_xsl_messages()
+        return [found.item_at(index).string_value for index in range(found.size)] if found else []
+
+    full = saxon_executable(stylesheet_file=str(xslt_path))
+    targeted = saxon_executable(stylesheet_text=targeted_stylesheet(str(xslt_path)),
+                                base_dir=os.path.dirname(xslt_path))
+    files = corpus_files(syntax)
+    documents = [path.read_bytes() for path in files[::4]] + [xml for _, xml in mutations(files, 20)]
+
+    assert all(messages(targeted, xml) == messages(full, xml) for xml in documents)
+
+
+def test_xsl_messages_are_read_as_failures():
+    messages = [" BR-FR-01/BT-1 : trop long.\nID:BR-FR-01_BT-1", "BR-X : bloquant\nID:BR-X", "sans identifiant"]
+
+    failures = parse_messages(messages, {"BR-FR-01_BT-1": "warning"})
+
+    assert [(f.rule_id, f.role, f.message) for f in failures] == [
+        ("BR-FR-01_BT-1", "warning", "BR-FR-01/BT-1 : trop long."),
+        ("BR-X", "error", "BR-X : bloquant"),
+        ("RULE-FAIL", "error", "sans identifiant"),
+    ]
+    assert [f.rule_id for f in parse_messages(messages, {"BR-FR-01_BT-1": "warning"}, max_errors=1)] == [
+        "BR-FR-01_BT-1", "BR-X"]
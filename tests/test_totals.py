@@ -0,0 +1,143 @@
+"""
+Tests for the totals calculation engine (app/services/totals.py):
+computed totals must pass the EN 16931 Schematron, and strict mode must
+reject inconsistent totals before any generation work.
+"""
+import copy
+from decimal import Decimal
+
+from app.schemas.validation import InvoiceMetadata
+from app.services import totals
+from app.services.generator import GeneratorService
+from app.services.hybrid_validation_service import HybridValidationService
+from app.services.totals import TotalsService, _cents
+from tests.test_convert import METADATA, convert, invalid_metadata
+
+# Two rates, document level allowance and charge, amounts that do not add up in binary floating point
+MIXED_LINES = {
+    **copy.deepcopy(METADATA),
+    "lines": [
+        {"line_id": str(i), "name": f"Item {i}", "quantity": 1.0, "net_price": price, "net_total": price,
+         "vat_rate": rate, "vat_category": "S"}
+        for i, (price, rate) in enumerate([(0.1, 20.0), (0.2, 20.0), (10.05, 5.5), (33.33, 20.0), (19.99, 5.5)], start=1)
+    ],
+    "allowances": [{"amount": 1.15, "reason": "Loyalty", "vat_category": "S", "vat_rate": 20.0}],
+    "charges": [{"amount": 4.99, "reason": "Shipping", "vat_category": "S", "vat_rate": 5.5}],
+}
+
+
+def without_totals(data: dict) -> dict:
+    data = copy.deepcopy(data)
+    del data["amounts"]
+    data["tax_details"] = []
+    return data
+
+
+def test_compute_is_exact():
+    metadata = InvoiceMetadata(**MIXED_LINES)
+
+    result = TotalsService.compute(metadata)
+
+    assert result.line_total == Decimal("63.67")
+    assert result.breakdown == {
+        ("S", Decimal("5.5")): (Decimal("35.03"), Decimal("1.93")),
+        ("S", Decimal("20")): (Decimal("32.48"), Decimal("6.50")),
+    }
+    assert (result.tax_basis_total, result.tax_total, result.grand_total) == (
+        Decimal("67.51"), Decimal("8.43"), Decimal("75.94"))
+
+
+def test_cents_are_rounded_as_rendered():
+    # "%.2f" as in the template: 0.125 is an exact binary tie, 33.335 is just above 33.335
+    assert _cents([0.1, 0.25, -1.5]) == [10, 25, -150]
+    assert _cents([0.125, 33.335, 1.23456789, -0.004]) == [12, 3334, 123, 0]
+
+
+def test_large_invoice_sums_exactly():
+    data = copy.deepcopy(METADATA)
+    data["lines"] = [dict(data["lines"][0], line_id=str(i), net_price=0.01, net_total=0.01) for i in range(20000)]
+
+    result = TotalsService.compute(InvoiceMetadata(**data))
+
+    assert result.line_total == Decimal("200.00")
+    assert result.tax_total == Decimal("40.00")
+
+
+def test_computed_totals_pass_compliance_check():
+    response = convert(without_totals(MIXED_LINES))
+
+    assert response.status_code == 200, response.text
+
+
+def test_totals_sum_the_rendered_amounts():
+    """Amounts with more than 2 decimals are summed as written in the XML ("%.2f")."""
+    data = copy.deepcopy(METADATA)
+    data["lines"] = [dict(data["lines"][0], line_id=str(i), net_price=33.335, net_total=33.335) for i in range(3)]
+    data["allowances"] = [{"amount": 1.115, "reason": "Loyalty", "vat_category": "S", "vat_rate": 20.0}]
+    data["charges"] = [{"amount": 2.005, "reason": "Shipping", "vat_category": "S", "vat_rate": 20.0}]
+
+    metadata = TotalsService.apply(InvoiceMetadata(**without_totals(data)))
+    result = HybridValidationService.validate(GeneratorService.generate_xml_bytes(metadata), "invoice.xml")
+
+    assert (metadata.amounts.line_total, metadata.tax_details[0].basis_amount) == ("100.02", "100.91")
+    assert not {"BR-CO-10", "BR-S-08"} & {error["rule_id"] for error in result["errors"]}
+    assert result["is_valid"], result["errors"]
+
+
+def test_omitted_totals_are_filled():
+    metadata = TotalsService.apply(InvoiceMetadata(**without_totals(METADATA)))
+
+    assert metadata.amounts.model_dump(exclude_none=True) == {
+        "line_total": "100.00", "tax_basis_total": "100.00", "tax_total": "20.00",
+        "grand_total": "120.00", "due_payable": "120.00",
+    }
+    assert [tax.model_dump() for tax in metadata.tax_details] == METADATA["tax_details"]
+
+
+def test_provided_totals_are_kept():
+    metadata = InvoiceMetadata(**invalid_metadata())
+
+    assert TotalsService.apply(metadata, mode="fill") is metadata
+
+
+def test_check_reports_schematron_rules():
+    data = copy.deepcopy(MIXED_LINES)
+    data["amounts"] = {"line_total": "63.67", "allowance_total": "1.15", "charge_total": "4.99",
+                       "tax_basis_total": "67.51", "tax_total": "8.43", "grand_total": "75.94", "due_payable": "75.94"}
+    data["tax_details"] = [
+        {"calculated_amount": "1.93", "basis_amount": "35.03", "rate": "5.50", "category_code": "S"},
+        {"calculated_amount": "6.50", "basis_amount": "32.48", "rate": "20.00", "category_code": "S"},
+    ]
+    assert TotalsService.check(InvoiceMetadata(**data)) == []
+
+    data["amounts"]["line_total"] = "63.68"
+    data["tax_details"][1]["basis_amount"] = "32.50"
+    rules = [error["rule_id"] for error in TotalsService.check(InvoiceMetadata(**data))]
+
+    assert rules == ["BR-CO-10", "BR-CO-13", "BR-S-08"]
+
+
+def test_strict_mode_rejects_before_generation(monkeypatch):
+    monkeypatch.setattr(totals, "TOTALS_MODE", "strict")
+
+    def no_generation(*args, **kwargs):
+        raise AssertionError("generation must not start")
+
+    monkeypatch.setattr(GeneratorService, "generate_facturx_pdf", no_generation)
+
+    response = convert(invalid_metadata())
+
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert detail["error"] == "INCONSISTENT_TOTALS"
+    assert [error["rule_id"] for error in detail["details"]["errors"]] == ["BR-CO-15"]
+
+
+def test_amounts_required_without_lines():
+    data = without_totals(METADATA)
+    data["lines"] = []
+
+    response = convert(data)
+
+    assert response.status_code == 400
+    assert "amounts is required" in response.text
@@ -0,0 +1,184 @@
+"""
+Tests for the precompiled, profile-specialized XML templates (GeneratorService.generate_xml),
+the streamed rendering (GeneratorService.iter_xml, /v1/xml) and the fragment cache.
+Every variant must render exactly what the original template renders.
+"""
+import copy
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from jinja2 import FileSystemLoader, select_autoescape
+from jinja2.sandbox import SandboxedEnvironment
+
+from app.main import app
+from app.metrics import metrics
+from app.schemas.validation import InvoiceMetadata
+from app.services import generator
+from app.services.generator import PROFILES, TEMPLATE_DIR, TEMPLATE_NAME, FragmentCache, GeneratorService
+from tests.test_convert import METADATA
+
+client = TestClient(app)
+
+# Every optional block of the template is switched on
+RICH_METADATA = {
+    **METADATA,
+    "invoice_number": "RICH-<&>-001",
+    "notes": ["Plain note", {"subject_code": "AAI", "content": "Coded note"}, {"content": "No subject"}],
+    "seller": {
+        **METADATA["seller"],
+        "id": "SELLER-1", "global_id": "3012345000005", "tax_number": "FC-42",
+        "contact_name": "Jane Doe", "phone": "+33 1 23 45 67 89", "email": "billing@seller.example",
+        "iban": "FR7612345678901234567890123", "bic": "AGRIFRPP", "bank_name": "Bank & Co",
+        "address": {**METADATA["seller"]["address"], "line2": "Bâtiment B"},
+    },
+    "buyer": {
+        **METADATA["buyer"],
+        "id": "CUST-9", "global_id": "4012345000009", "global_id_scheme": "0060",
+        "email": "ap@buyer.example", "vat_number": "FR98765432109",
+    },
+    "lines": [
+        {
+            "line_id": "1", "name": "Widget \"Pro\"", "quantity": 3.0, "net_price": 10.0, "net_total": 30.0,
+            "vat_rate": 20.0, "note": "Line note", "global_id": "03012345678906", "seller_assigned_id": "W-1",
+            "buyer_assigned_id": "B-1", "description": "A widget", "country_of_origin": "DE",
+            "gross_price": 12.0, "price_discount": 2.0, "billing_period": {"start": "20260101", "end": "20260131"},
+        },
+        {"line_id": "2", "name": "Service", "quantity": 1.5, "unit_code": "HUR", "net_price": 46.6667,
+         "net_total": 70.0, "vat_rate": 20.0},
+    ],
+    "amounts": {**METADATA["amounts"], "line_total": "100.00", "charge_total": "0.00",
+                "allowance_total": "0.00", "prepaid": "10.00"},
+    "due_date": "20260225",
+    "buyer_reference": "PO-123",
+    "contract_reference": "CT-7",
+    "delivery_date": "20260120",
+    "ship_to": {"id": "LOC-1", "global_id": "5012345000001", "name": "Warehouse",
+                "address": {"line1": "1 Dock St", "postcode": "13001", "city": "Marseille", "country_code": "FR"}},
+    "creditor_reference": "FR12ZZZ123456",
+    "allowances": [{"amount": 5.0, "reason": "Loyalty", "reason_code": "95", "vat_category": "S", "vat_rate": 20.0}],
+    "charges": [{"amount": 5.0, "reason": "Shipping", "vat_category": "S", "vat_rate": 20.0}],
+    "payment_discount": {"days": 10, "percent": 2.0},
+    "payment_means_code": "30",
+    "billing_period": {"start": "20260101", "end": "20260131"},
+}
+
+
+def reference_render(metadata: InvoiceMetadata) -> str:
+    """The original rendering path: generic template, sandbox, no specialization."""
+    env = SandboxedEnvironment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(['xml']),
+        trim_blocks=True,
+        lstrip_blocks=True
+    )
+    return env.get_template(TEMPLATE_NAME).render(**metadata.model_dump(exclude_none=True))
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+@pytest.mark.parametrize("data", [METADATA, RICH_METADATA], ids=["minimal", "rich"])
+def test_specialized_template_parity(profile, data):
+    metadata = InvoiceMetadata(**dict(copy.deepcopy(data), profile=profile))
+
+    assert GeneratorService.generate_xml(metadata) == reference_render(metadata)
+
+
+def test_specialized_template_has_no_profile_branch():
+    """The profile test is resolved at compile time."""
+    source, filename, _ = generator.jinja_env.loader.get_source(generator.jinja_env, TEMPLATE_NAME)
+    code = generator.jinja_env.compile(
+        generator._ProfileSpecializer("basic").visit(generator.jinja_env.parse(source, TEMPLATE_NAME, filename)),
+        TEMPLATE_NAME, filename, raw=True
+    )
+
+    assert "'profile'" not in code
+    assert "urn:cen.eu:en16931:2017#compliant#urn:factur-x.eu:1p0:basic" in code
+    assert "urn:factur-x.eu:1p0:minimum" not in code
+
+
+def test_warmup_compiles_every_profile():
+    GeneratorService.warmup()
+
+    assert set(generator._profile_templates) == set(PROFILES)
+    assert {name for name, _ in generator._fragment_templates} == {
+        "fragments/seller_party.xml.j2", "fragments/buyer_party.xml.j2", "fragments/payment_means.xml.j2"
+    }
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_streamed_xml_parity(profile):
+    metadata = InvoiceMetadata(**dict(copy.deepcopy(RICH_METADATA), profile=profile))
+
+    assert b"".join(GeneratorService.iter_xml(metadata)) == GeneratorService.generate_xml(metadata).encode("utf-8")
+    assert GeneratorService.generate_xml_bytes(metadata) == reference_render(metadata).encode("utf-8")
+
+
+def test_streamed_xml_is_chunked():
+    data = copy.deepcopy(RICH_METADATA)
+    data["lines"] = [dict(data["lines"][0], line_id=str(i)) for i in range(2000)]
+    metadata = InvoiceMetadata(**data)
+
+    chunks = list(GeneratorService.iter_xml(metadata))
+
+    assert len(chunks) > 1
+    assert all(len(chunk) < 2 * generator.XML_CHUNK_SIZE for chunk in chunks)
+    assert b"".join(chunks) == reference_render(metadata).encode("utf-8")
+
+
+def test_xml_endpoint_streams_generated_xml():
+    data = copy.deepcopy(RICH_METADATA)
+    data["lines"] = [dict(data["lines"][0], line_id=str(i)) for i in range(2000)]
+
+    response = client.post("/v1/xml", data={"metadata": json.dumps(data)})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/xml"
+    assert response.content == reference_render(InvoiceMetadata(**data)).encode("utf-8")
+
+
+def test_fragments_are_rendered_once_per_party(monkeypatch):
+    monkeypatch.setattr(generator, "fragment_cache", FragmentCache())
+    hits, misses = metrics._counters["fragment_cache_hits"], metrics._counters["fragment_cache_misses"]
+    invoices = []
+    for i in range(4):
+        data = copy.deepcopy(RICH_METADATA)
+        data["invoice_number"] = f"RUN-{i}"
+        data["buyer"]["name"] = f"Buyer {i % 2}"
+        invoices.append(InvoiceMetadata(**data))
+
+    for metadata in invoices:
+        assert GeneratorService.generate_xml(metadata) == reference_render(metadata)
+
+    # Seller + payment means once, two distinct buyers
+    assert metrics._counters["fragment_cache_misses"] - misses == 4
+    assert metrics._counters["fragment_cache_hits"] - hits == 8
+
+
+def test_fragment_cache_keys_on_content(monkeypatch):
+    """A changed party detail is never served from the cache, whatever the profile."""
+    monkeypatch.setattr(generator, "fragment_cache", FragmentCache())
+    for profile in PROFILES:
+        for bank_name in ("Bank & Co", "Other Bank"):
+            data = copy.deepcopy(RICH_METADATA)
+            data["seller"]["bank_name"] = bank_name
+            metadata = InvoiceMetadata(**dict(data, profile=profile))
+            assert GeneratorService.generate_xml(metadata) == reference_render(metadata)
+
+
+def test_fragment_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(generator, "fragment_cache", FragmentCache(max_entries=2))
+    for i in range(5):
+        data = copy.deepcopy(METADATA)
+        data["buyer"]["name"] = f"Buyer {i}"
+        metadata = InvoiceMetadata(**data)
+        assert GeneratorService.generate_xml(metadata) == reference_render(metadata)
+
+    assert len(generator.fragment_cache._fragments) == 2
+
+
+def test_fragment_cache_disabled(monkeypatch):
+    monkeypatch.setattr(generator, "fragment_cache", FragmentCache(max_entries=0))
+    metadata = InvoiceMetadata(**RICH_METADATA)
+
+    assert GeneratorService.generate_xml(metadata) == reference_render(metadata)
+    assert not generator.fragment_cache._fragments
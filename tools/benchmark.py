@@ -0,0 +1,867 @@
+"""
+Performance benchmarks for the engine's hot paths.
+
+Usage:
+    python -m tools.benchmark [SCENARIO ...] [--repeat N]
+
+Scenarios:
+    locator   Fast PDF attachment locator vs facturx.get_xml_from_pdf (pypdf)
+    inspect   /v1/inspect single pass vs /v1/extract + /v1/validate services
+    convert   /v1/convert quality gate p50/p99: PDF round-trip vs XML validated during assembly
+    embed     XML embedding cost vs PDF size: generate_from_binary rewrite vs incremental update
+    assets    PDF/A scaffolding per request (XMP, Info, ICC): built from scratch vs prebuilt
+    xml       XML generation at 10 / 1,000 / 10,000 lines: generic sandboxed template vs precompiled variant
+    stream    Peak memory of XML generation for large invoices: render() + encode vs streamed chunks
+    fragments Billing run of one seller: XML generation without vs with the party/payment fragment cache
+    batch     48 invoices: one /v1/convert call each vs a single /v1/convert/batch (ZIP in, ZIP out)
+    json      5,000-line invoice: json.loads + InvoiceMetadata(**) + model_dump vs model_validate_json, and /v1/xml vs /v1/xml/json
+    codes     Invalid code (BR-CL) in a 1,000-line invoice: rejected by the quality gate vs the code list pre-check
+    totals    Totals engine at 10 / 1,000 / 20,000 lines: Decimal per value vs integer columns; rejecting bad totals: quality gate vs strict pre-check
+    schematron EN 16931 Schematron per invoice: full XSLT in SaxonC vs native XPath 1.0 asserts + reduced XSLT
+    failfast  Rejecting invalid invoices (corpus, 1,000 lines): full report vs max_errors=1, both Schematron engines
+    shards    Validation latency of 1,000 / 4,000 / 10,000-line invoices vs the number of Schematron pattern shards
+    profiles  BASIC WL / EXTENDED examples: EN 16931 ruleset vs the Factur-X ruleset of their profile (errors, median ms)
+    ubl       XRechnung testsuite: throughput of the UBL documents vs their CII twins (UBL and CII rulesets)
+    cdar      CDAR status messages/s: full vs targeted BR-FR-CDV stylesheet in a worker, and through the pool (one task per message vs chunks)
+    xsd       Lite validation XSD check of the corpus: facturx.xml_check_xsd per call vs the compiled XSD cache
+    lite      Lite validation business rules at 1 / 8 / 32 threads: one shared lxml XSLT vs one per thread (docs/s, wrong reports)
+    engines   Sustained validation of 1 to 1,000-line invoices: SaxonC thread vs process pool (worker recycling included), crossover size
+
+The XML corpus (tests/corpus) has no PDFs, so the locator scenario wraps the
+corpus CII invoices into Factur-X PDFs, and adds scanned-image PDFs of
+increasing size to show how both paths scale.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+CORPUS_CII_DIR = PROJECT_ROOT / "tests" / "corpus" / "corpus-master" / "XML-Rechnung" / "CII"
+EXAMPLE_PDF = PROJECT_ROOT / "examples" / "invoice_raw.pdf"
+
+
+def sample(func: Callable[[], object], repeat: int) -> List[float]:
+    """Run func `repeat` times; return the durations in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def timeit(func: Callable[[], object], repeat: int) -> Tuple[float, float]:
+    """Run func `repeat` times; return (median, max) in milliseconds."""
+    samples = sample(func, repeat)
+    return statistics.median(samples), max(samples)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0-100)."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def print_row(label: str, *columns: str):
+    print(f"  {label:<38}" + "".join(f"{c:>16}" for c in columns))
+
+
+# --- Test data ---
+
+def make_text_pdf() -> bytes:
+    from reportlab.pdfgen import canvas
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    pdf.drawString(100, 750, "Benchmark Invoice")
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def make_scanned_pdf(pages: int) -> bytes:
+    """Pages of incompressible noise images, like a scanned paper invoice (~2 MB/page)."""
+    from PIL import Image
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    side = 512
+    for _ in range(pages):
+        image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+        pdf.drawImage(ImageReader(image), 0, 0, width=595, height=842)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def corpus_facturx_pdfs() -> List[Tuple[str, bytes]]:
+    from facturx import generate_from_binary
+    base_pdf = make_text_pdf()
+    pdfs = []
+    for xml_path in sorted(CORPUS_CII_DIR.glob("*.xml")):
+        try:
+            pdfs.append((xml_path.name, generate_from_binary(base_pdf, xml_path.read_bytes(), check_xsd=False)))
+        except Exception as e:
+            print(f"  skipped {xml_path.name}: {e}")
+    return pdfs
+
+
+# --- Scenarios ---
+
+def bench_locator(repeat: int):
+    from facturx import generate_from_binary, get_xml_from_pdf
+    from app.services.pdf_locator import locate_embedded_xml
+
+    def pypdf_path(pdf_bytes):
+        return get_xml_from_pdf(BytesIO(pdf_bytes), check_xsd=False)
+
+    print("\n[locator] median ms (pypdf -> fast), results checked for equality")
+    print_row("document", "size", "pypdf", "fast", "speedup")
+
+    cases = corpus_facturx_pdfs()
+    if EXAMPLE_PDF.exists():
+        cases.append((EXAMPLE_PDF.name, EXAMPLE_PDF.read_bytes()))
+    xml = (CORPUS_CII_DIR / "EN16931_Einfach.cii.xml").read_bytes()
+    for pages in (1, 15, 100):
+        cases.append((f"scanned-{pages}p", generate_from_binary(make_scanned_pdf(pages), xml, check_xsd=False)))
+
+    corpus_total = {"pypdf": 0.0, "fast": 0.0}
+    for name, pdf_bytes in cases:
+        if locate_embedded_xml(pdf_bytes) != pypdf_path(pdf_bytes):
+            print_row(name, "MISMATCH")
+            continue
+        slow, _ = timeit(lambda: pypdf_path(pdf_bytes), repeat)
+        fast, _ = timeit(lambda: locate_embedded_xml(pdf_bytes), repeat)
+        if not name.startswith("scanned-"):
+            corpus_total["pypdf"] += slow
+            corpus_total["fast"] += fast
+        print_row(name[:38], f"{len(pdf_bytes) / 1024:.0f} KB", f"{slow:.2f}", f"{fast:.2f}", f"x{slow / fast:.1f}")
+    print_row("corpus total", "", f"{corpus_total['pypdf']:.1f}", f"{corpus_total['fast']:.1f}",
+              f"x{corpus_total['pypdf'] / corpus_total['fast']:.1f}")
+
+
+def bench_inspect(repeat: int):
+    from app.services.extractor import ExtractionService
+    from app.services.hybrid_validation_service import HybridValidationService
+    from app.services.inspector import InspectionService
+
+    def sequential(pdf_bytes):
+        ExtractionService.extract_invoice_data(pdf_bytes, "invoice.pdf")
+        HybridValidationService.validate(pdf_bytes, "invoice.pdf")
+
+    print("\n[inspect] median ms (extract + validate -> inspect), saved = upload/extract/parse + overlapped mapping")
+    print_row("document", "sequential", "inspect", "saved")
+    cases = corpus_facturx_pdfs()
+    # Warm up the validation pool (worker start-up and XSLT compilation)
+    HybridValidationService.validate(cases[0][1], "invoice.pdf")
+    totals = [0.0, 0.0]
+    for name, pdf_bytes in cases:
+        before, _ = timeit(lambda: sequential(pdf_bytes), repeat)
+        after, _ = timeit(lambda: InspectionService.inspect(pdf_bytes, "invoice.pdf"), repeat)
+        totals[0] += before
+        totals[1] += after
+        print_row(name[:38], f"{before:.1f}", f"{after:.1f}", f"{before - after:.1f}")
+    print_row("corpus total", f"{totals[0]:.1f}", f"{totals[1]:.1f}", f"{totals[0] - totals[1]:.1f}")
+
+
+def bench_convert(repeat: int):
+    import logging
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services import generator
+    from app.services.hybrid_validation_service import HybridValidationService
+    from tests.test_convert import METADATA, invalid_metadata
+
+    def pdf_roundtrip_gate(pdf_content, metadata):
+        """Previous flow: assemble the PDF, then extract the XML back from it and validate."""
+        xml_bytes = generator.GeneratorService.generate_xml(metadata).encode("utf-8")
+        result_bytes = generator.GeneratorService._assemble_pdf(pdf_content, xml_bytes, metadata)
+        generator.GeneratorService._check_compliance(HybridValidationService.validate(result_bytes, "generated_check.pdf"))
+        return result_bytes
+
+    logging.disable(logging.ERROR)  # Every rejected invoice is logged at ERROR
+    client = TestClient(app)
+    samples = max(repeat, 20)
+    print(f"\n[convert] /v1/convert latency ms over {samples} requests (PDF round-trip gate -> concurrent XML gate)")
+    print_row("document", "p50 before", "p50 after", "p99 before", "p99 after")
+    pdfs = [("text page", make_text_pdf()), ("scanned 15 pages", make_scanned_pdf(15))]
+    documents = [("valid", METADATA), ("invalid totals", invalid_metadata())]
+    current_gate = generator.GeneratorService.generate_facturx_pdf
+
+    for pdf_name, pdf_content in pdfs:
+        for doc_name, metadata in documents:
+            def request():
+                client.post("/v1/convert", files={"pdf": ("invoice.pdf", pdf_content, "application/pdf")},
+                            data={"metadata": json.dumps(metadata)})
+            request()  # Warm up (worker start-up, XSLT compilation)
+            generator.GeneratorService.generate_facturx_pdf = staticmethod(pdf_roundtrip_gate)
+            try:
+                before = sample(request, samples)
+            finally:
+                generator.GeneratorService.generate_facturx_pdf = current_gate
+            after = sample(request, samples)
+            print_row(f"{pdf_name}, {doc_name}", f"{percentile(before, 50):.1f}", f"{percentile(after, 50):.1f}",
+                      f"{percentile(before, 99):.1f}", f"{percentile(after, 99):.1f}")
+
+
+def bench_embed(repeat: int):
+    from facturx import generate_from_binary
+    from app.services.pdf_incremental import embed_xml_incremental
+    from app.services.pdf_locator import locate_embedded_xml
+
+    pdf_metadata = {"author": "Factur-X API", "keywords": "Factur-X", "title": "Invoice", "subject": "Factur-X Invoice"}
+    xml = (CORPUS_CII_DIR / "EN16931_Einfach.cii.xml").read_bytes()
+
+    print("\n[embed] median ms (rewrite -> incremental), output sizes in KB")
+    print_row("input PDF", "size", "rewrite", "incremental", "speedup", "size delta")
+    cases = [("text page", make_text_pdf())] + [(f"scanned {pages}p", make_scanned_pdf(pages)) for pages in (1, 15, 100)]
+    for name, pdf_bytes in cases:
+        rewritten = generate_from_binary(pdf_bytes, xml, flavor="factur-x", level="en16931", check_xsd=False,
+                                         pdf_metadata=dict(pdf_metadata))
+        incremental = embed_xml_incremental(pdf_bytes, xml, "en16931", pdf_metadata)
+        if locate_embedded_xml(incremental) != locate_embedded_xml(rewritten):
+            print_row(name, "MISMATCH")
+            continue
+        slow, _ = timeit(lambda: generate_from_binary(pdf_bytes, xml, flavor="factur-x", level="en16931",
+                                                      check_xsd=False, pdf_metadata=dict(pdf_metadata)), repeat)
+        fast, _ = timeit(lambda: embed_xml_incremental(pdf_bytes, xml, "en16931", pdf_metadata), repeat)
+        print_row(name, f"{len(pdf_bytes) / 1024:.0f} KB", f"{slow:.2f}", f"{fast:.2f}", f"x{slow / fast:.1f}",
+                  f"+{(len(incremental) - len(pdf_bytes)) / 1024:.1f} KB")
+
+
+def bench_assets(repeat: int):
+    import tracemalloc
+    import zlib
+    from facturx.facturx import _prepare_pdf_metadata_txt, _prepare_pdf_metadata_xml
+    from app.services.generator import PDF_METADATA
+    from app.services.pdfa_assets import ICC_PROFILE_PATH, info_entries, srgb_icc_profile, xmp_metadata
+
+    def from_scratch(level):
+        pdf_metadata = {"author": "Factur-X API", "keywords": "Factur-X, ZUGFeRD, e-invoice",
+                        "title": "Invoice 471102", "subject": "Factur-X Invoice"}
+        _prepare_pdf_metadata_xml("factur-x", level, None, pdf_metadata)
+        _prepare_pdf_metadata_txt(pdf_metadata)
+        zlib.compress(ICC_PROFILE_PATH.read_bytes(), 9)
+
+    def prebuilt(level):
+        pdf_metadata = dict(PDF_METADATA, title="Invoice 471102")
+        xmp_metadata(level, pdf_metadata)
+        info_entries(pdf_metadata)
+        srgb_icc_profile()
+
+    def allocations(func) -> float:
+        """KB allocated by one call, including memory freed before it returns."""
+        func()  # Fill caches first
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+
+    calls = 1000
+    print(f"\n[assets] PDF/A scaffolding per request, us per call over {calls} calls (scratch -> prebuilt)")
+    print_row("profile", "scratch us", "prebuilt us", "scratch KB", "prebuilt KB")
+    for level in ("minimum", "basicwl", "basic", "en16931", "extended"):
+        before, _ = timeit(lambda: [from_scratch(level) for _ in range(calls)], repeat)
+        after, _ = timeit(lambda: [prebuilt(level) for _ in range(calls)], repeat)
+        print_row(level, f"{before:.1f}", f"{after:.1f}",
+                  f"{allocations(lambda: from_scratch(level)):.1f}", f"{allocations(lambda: prebuilt(level)):.1f}")
+
+
+def invoice_metadata(line_count: int, profile: str = "en16931"):
+    """InvoiceMetadata with `line_count` copies of the test invoice line."""
+    import copy
+    from app.schemas.validation import InvoiceMetadata
+    from tests.test_convert import METADATA
+
+    data = copy.deepcopy(METADATA)
+    data["lines"] = [dict(data["lines"][0], line_id=str(i + 1)) for i in range(line_count)]
+    data["profile"] = profile
+    return InvoiceMetadata(**data)
+
+
+def bench_xml(repeat: int):
+    from jinja2 import FileSystemLoader, select_autoescape
+    from jinja2.sandbox import SandboxedEnvironment
+    from app.services.generator import TEMPLATE_DIR, TEMPLATE_NAME, GeneratorService
+
+    # Previous setup: generic template, auto-reload on, plain sandbox
+    generic_env = SandboxedEnvironment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(['xml']),
+                                       trim_blocks=True, lstrip_blocks=True)
+
+    def generic(metadata):
+        return generic_env.get_template(TEMPLATE_NAME).render(**metadata.model_dump(exclude_none=True))
+
+    GeneratorService.warmup()
+    print("\n[xml] generate_xml median ms (generic template -> precompiled profile variant)")
+    print_row("lines", "generic", "precompiled", "speedup")
+    for line_count in (10, 1000, 10000):
+        metadata = invoice_metadata(line_count)
+        if generic(metadata) != GeneratorService.generate_xml(metadata):
+            print_row(str(line_count), "MISMATCH")
+            continue
+        before, _ = timeit(lambda: generic(metadata), repeat)
+        after, _ = timeit(lambda: GeneratorService.generate_xml(metadata), repeat)
+        print_row(f"{line_count:,}", f"{before:.2f}", f"{after:.2f}", f"x{before / after:.1f}")
+
+
+def bench_stream(repeat: int):
+    import tracemalloc
+    from app.services.generator import GeneratorService
+
+    def peak_mb(func) -> float:
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+
+    def render_and_encode(metadata):
+        return GeneratorService.generate_xml(metadata).encode("utf-8")
+
+    def stream(metadata):
+        for _ in GeneratorService.iter_xml(metadata):
+            pass  # Chunks are written to the socket and dropped
+
+    GeneratorService.warmup()
+    print("\n[stream] XML generation: peak traced MB (excl. metadata) and median ms")
+    print_row("lines", "XML MB", "str+encode MB", "bytes MB", "streamed MB", "str+encode ms", "streamed ms")
+    for line_count in (1000, 20000):
+        metadata = invoice_metadata(line_count)
+        size_mb = len(render_and_encode(metadata)) / (1024 * 1024)
+        before, _ = timeit(lambda: render_and_encode(metadata), repeat)
+        after, _ = timeit(lambda: stream(metadata), repeat)
+        print_row(f"{line_count:,}", f"{size_mb:.1f}", f"{peak_mb(lambda: render_and_encode(metadata)):.1f}",
+                  f"{peak_mb(lambda: GeneratorService.generate_xml_bytes(metadata)):.1f}",
+                  f"{peak_mb(lambda: stream(metadata)):.1f}", f"{before:.1f}", f"{after:.1f}")
+
+
+def bench_fragments(repeat: int):
+    import copy
+    from app.metrics import metrics
+    from app.schemas.validation import InvoiceMetadata
+    from app.services.generator import GeneratorService, fragment_cache
+    from tests.test_xml_templates import RICH_METADATA
+
+    # One seller (full party and bank details), a few recurring buyers, short invoices
+    invoices = []
+    for i in range(200):
+        data = copy.deepcopy(RICH_METADATA)
+        data["invoice_number"] = f"RUN-{i:05d}"
+        data["buyer"]["id"] = f"CUST-{i % 5}"
+        invoices.append(InvoiceMetadata(**data))
+
+    def billing_run():
+        for metadata in invoices:
+            GeneratorService.generate_xml(metadata)
+
+    GeneratorService.warmup()
+    max_entries = fragment_cache.max_entries
+    fragment_cache.max_entries = 0
+    uncached = [GeneratorService.generate_xml(metadata) for metadata in invoices]
+    before, _ = timeit(billing_run, repeat)
+    fragment_cache.max_entries = max_entries
+    fragment_cache.clear()
+    hits, misses = metrics._counters["fragment_cache_hits"], metrics._counters["fragment_cache_misses"]
+    same = [GeneratorService.generate_xml(metadata) for metadata in invoices] == uncached
+    after, _ = timeit(billing_run, repeat)
+    hits = metrics._counters["fragment_cache_hits"] - hits
+    misses = metrics._counters["fragment_cache_misses"] - misses
+
+    print(f"\n[fragments] {len(invoices)} invoices, 1 seller, 5 buyers: run median ms")
+    print_row("output", "no cache", "cache", "speedup", "hit rate")
+    print_row("same" if same else "MISMATCH", f"{before:.1f}", f"{after:.1f}", f"x{before / after:.1f}",
+              f"{100 * hits / (hits + misses):.1f}%")
+
+
+def bench_json(repeat: int):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.schemas.validation import InvoiceMetadata
+    from app.services.generator import GeneratorService, _profile_template
+
+    raw = invoice_metadata(5000).model_dump_json(exclude_none=True)
+    client = TestClient(app)
+
+    def previous(raw):
+        # Form route before: three passes over the invoice before rendering
+        metadata = InvoiceMetadata(**json.loads(raw))
+        return _profile_template(metadata.profile).render(**metadata.model_dump(exclude_none=True))
+
+    def current(raw):
+        return GeneratorService.generate_xml(InvoiceMetadata.model_validate_json(raw))
+
+    GeneratorService.warmup()
+    print(f"\n[json] 5,000 lines ({len(raw) / (1024 * 1024):.1f} MB of JSON): median ms")
+    print_row("step", "before", "after", "speedup")
+    parse_before, _ = timeit(lambda: InvoiceMetadata(**json.loads(raw)), repeat)
+    parse_after, _ = timeit(lambda: InvoiceMetadata.model_validate_json(raw), repeat)
+    print_row("parse + validate", f"{parse_before:.1f}", f"{parse_after:.1f}", f"x{parse_before / parse_after:.1f}")
+    if previous(raw) != current(raw):
+        print_row("parse + render", "MISMATCH")
+    else:
+        before, _ = timeit(lambda: previous(raw), repeat)
+        after, _ = timeit(lambda: current(raw), repeat)
+        print_row("parse + render", f"{before:.1f}", f"{after:.1f}", f"x{before / after:.1f}")
+    form, _ = timeit(lambda: client.post("/v1/xml", data={"metadata": raw}), repeat)
+    body, _ = timeit(lambda: client.post("/v1/xml/json", content=raw, headers={"content-type": "application/json"}), repeat)
+    print_row("/v1/xml -> /v1/xml/json", f"{form:.1f}", f"{body:.1f}", f"x{form / body:.1f}")
+
+
+def bench_batch(repeat: int):
+    import copy
+    import zipfile
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from tests.test_convert import METADATA
+    from tests.test_extract import create_dummy_pdf
+
+    count = 48
+    pdf = create_dummy_pdf()
+    invoices = [json.dumps(dict(copy.deepcopy(METADATA), invoice_number=f"B-{i:03d}")) for i in range(count)]
+    upload = BytesIO()
+    with zipfile.ZipFile(upload, "w") as archive:
+        for i, metadata in enumerate(invoices):
+            archive.writestr(f"B-{i:03d}.pdf", pdf)
+            archive.writestr(f"B-{i:03d}.json", metadata)
+    client = TestClient(app)
+
+    def one_by_one():
+        for metadata in invoices:
+            response = client.post("/v1/convert", files={"pdf": ("invoice.pdf", pdf, "application/pdf")},
+                                   data={"metadata": metadata})
+            assert response.status_code == 200
+
+    def batched():
+        response = client.post("/v1/convert/batch", files={"file": ("batch.zip", upload.getvalue())})
+        assert response.status_code == 200 and b'"status": "error"' not in response.content
+
+    batched()  # Start the process pools
+    repeat = max(1, repeat // 10)
+    print(f"\n[batch] {count} invoices: total median s")
+    print_row("mode", "sequential", "batch", "speedup", "batch inv/s")
+    before, _ = timeit(one_by_one, repeat)
+    after, _ = timeit(batched, repeat)
+    print_row("zip", f"{before / 1000:.2f}", f"{after / 1000:.2f}", f"x{before / after:.1f}", f"{count * 1000 / after:.0f}")
+
+
+def bench_codes(repeat: int):
+    import logging
+    from app.services.codelists import CodelistService
+    from app.services.generator import GeneratorService
+    from tests.test_extract import create_dummy_pdf
+
+    metadata = invoice_metadata(1000)
+    metadata.lines[-1].unit_code = "PIECE"  # BR-CL-23
+    pdf_content = create_dummy_pdf()
+
+    def quality_gate():
+        try:
+            GeneratorService.generate_facturx_pdf(pdf_content, metadata)
+        except ValueError:
+            return
+        raise AssertionError("invalid unit code accepted")
+
+    logging.disable(logging.ERROR)  # Every rejected invoice is logged at ERROR
+    quality_gate()  # Warm up (worker start-up, XSLT compilation)
+    print("\n[codes] rejecting an invalid unit code in a 1,000-line invoice: median ms")
+    print_row("path", "gate", "pre-check", "speedup")
+    gate, _ = timeit(quality_gate, repeat)
+    precheck, _ = timeit(lambda: CodelistService.check(metadata), repeat)
+    print_row("BR-CL-23", f"{gate:.3f}", f"{precheck:.3f}", f"x{gate / precheck:.0f}")
+
+
+def bench_totals(repeat: int):
+    import logging
+    from collections import defaultdict
+    from decimal import Decimal
+    from app.schemas.validation import InvoiceMetadata
+    from app.services.generator import GeneratorService
+    from app.services.totals import TotalsError, TotalsService
+    from tests.test_convert import invalid_metadata
+    from tests.test_extract import create_dummy_pdf
+
+    def per_value(metadata):
+        # Straightforward exact version: one Decimal per amount, as rendered
+        sums = defaultdict(Decimal)
+        for line in metadata.lines:
+            sums[(line.vat_category, Decimal("%.2f" % line.vat_rate))] += Decimal("%.2f" % line.net_total)
+        return sums
+
+    print("\n[totals] line totals + VAT breakdown median ms (Decimal per value -> integer columns)")
+    print_row("lines", "per value", "columns", "speedup")
+    for line_count in (10, 1000, 20000):
+        metadata = invoice_metadata(line_count)
+        before, _ = timeit(lambda: per_value(metadata), repeat)
+        after, _ = timeit(lambda: TotalsService.compute(metadata), repeat)
+        print_row(f"{line_count:,}", f"{before:.3f}", f"{after:.3f}", f"x{before / after:.1f}")
+
+    def strict_precheck(metadata):
+        try:
+            TotalsService.apply(metadata, mode="strict")
+        except TotalsError:
+            return
+        raise AssertionError("inconsistent totals accepted")
+
+    def quality_gate(pdf_content, metadata):
+        try:
+            GeneratorService.generate_facturx_pdf(pdf_content, metadata)
+        except ValueError:
+            return
+        raise AssertionError("inconsistent totals accepted")
+
+    logging.disable(logging.ERROR)  # Every rejected invoice is logged at ERROR
+    metadata, pdf_content = InvoiceMetadata(**invalid_metadata()), create_dummy_pdf()
+    quality_gate(pdf_content, metadata)  # Warm up (worker start-up, XSLT compilation)
+    gate, _ = timeit(lambda: quality_gate(pdf_content, metadata), repeat)
+    precheck, _ = timeit(lambda: strict_precheck(metadata), repeat)
+    print_row("reject BR-CO-15 (gate -> pre-check)", f"{gate:.3f}", f"{precheck:.3f}", f"x{gate / precheck:.0f}")
+
+
+def bench_schematron(repeat: int):
+    from lxml import etree
+    from saxonche import PySaxonProcessor
+    from app.services.hybrid_validation_service import SCH_PATH, XSLT_PATH
+    from app.services.hybrid_validator import HybridValidator
+    from app.services.generator import GeneratorService
+    from app.services.schematron import load_schematron
+
+    rules = load_schematron(str(SCH_PATH), str(XSLT_PATH))
+    native = sum(1 for a in rules.asserts if a.xpath is not None)
+    invoices = [(path.name, path.read_bytes()) for path in sorted(CORPUS_CII_DIR.glob("*.xml"))[:5]]
+    invoices.append(("1,000 lines", GeneratorService.generate_xml_bytes(invoice_metadata(1000))))
+
+    print(f"\n[schematron] {native} of {len(rules.asserts)} asserts native: median ms")
+    print("  HybridValidator.validate (XSD and stylesheets compiled once per process)")
+    print_row("invoice", "saxon", "native", "speedup")
+    saxon_only = HybridValidator(xslt_path=str(XSLT_PATH))
+    hybrid = HybridValidator(xslt_path=str(XSLT_PATH), sch_path=str(SCH_PATH))
+    for name, xml in invoices:
+        before, _ = timeit(lambda: saxon_only.validate(xml), repeat)
+        after, _ = timeit(lambda: hybrid.validate(xml), repeat)
+        print_row(name[:38], f"{before:.1f}", f"{after:.1f}", f"x{before / after:.1f}")
+
+    # Stylesheets compiled once: evaluation cost only
+    proc = PySaxonProcessor(license=False)
+    xsltproc = proc.new_xslt30_processor()
+    full = xsltproc.compile_stylesheet(stylesheet_file=str(XSLT_PATH))
+    reduced = xsltproc.compile_stylesheet(stylesheet_text=rules.saxon_stylesheet)
+
+    def transform(executable, xml):
+        return executable.transform_to_string(xdm_node=proc.parse_xml(xml_text=xml.decode("utf-8-sig")))
+
+    def native_and_reduced(xml):
+        root = etree.fromstring(xml)
+        rules.evaluate(root)
+        transform(reduced, xml)
+
+    print("  Precompiled stylesheets (transform only)")
+    print_row("invoice", "full XSLT", "native+reduced", "speedup")
+    for name, xml in invoices:
+        before, _ = timeit(lambda: transform(full, xml), repeat)
+        after, _ = timeit(lambda: native_and_reduced(xml), repeat)
+        print_row(name[:38], f"{before:.2f}", f"{after:.2f}", f"x{before / after:.1f}")
+
+
+def bench_failfast(repeat: int):
+    import logging
+    from lxml import etree
+    from app.services.hybrid_validation_service import SCH_PATH, XSD_PATH, XSLT_PATH
+    from app.services.hybrid_validator import HybridValidator
+    from app.services.generator import GeneratorService
+    from tools.schematron_parity import corpus_files
+
+    logging.disable(logging.ERROR)  # Saxon errors of the corpus files with a BOM
+    engines = {"native": HybridValidator(str(XSD_PATH), str(XSLT_PATH), sch_path=str(SCH_PATH)),
+               "saxon": HybridValidator(str(XSD_PATH), str(XSLT_PATH))}
+    invalid = [path.read_bytes() for path in corpus_files()]
+    invalid = [xml for xml in invalid if not engines["native"].validate(xml).is_valid]
+    metadata = invoice_metadata(1000)
+    metadata.lines[-1].unit_code = "PIECE"  # BR-CL-23, on the last line
+    bad_code = GeneratorService.generate_xml_bytes(metadata)
+    root = etree.fromstring(bad_code)
+    root.append(etree.Element(root[0].tag))  # XSD error
+    bad_structure = etree.tostring(root)
+
+    print("\n[failfast] Rejecting invalid invoices: median ms, full report vs max_errors=1")
+    print_row("invoice", "engine", "full", "failfast", "speedup")
+    for name, documents in ((f"{len(invalid)} invalid corpus files (total)", invalid),
+                            ("1,000 lines, BR-CL-23", [bad_code]),
+                            ("1,000 lines, XSD error", [bad_structure])):
+        for engine, validator in engines.items():
+            full, _ = timeit(lambda: [validator.validate(xml) for xml in documents], repeat)
+            failfast, _ = timeit(lambda: [validator.validate(xml, max_errors=1) for xml in documents], repeat)
+            print_row(name, engine, f"{full:.0f}", f"{failfast:.0f}", f"x{full / failfast:.1f}")
+
+
+def _load_schematron():
+    """Pool initializer: compile the Schematron rules before the first timed validation."""
+    from app.services.hybrid_validation_service import SCH_PATH, XSLT_PATH
+    from app.services.schematron import load_schematron
+    load_schematron(str(SCH_PATH), str(XSLT_PATH))
+
+
+def bench_shards(repeat: int):
+    from concurrent.futures import ProcessPoolExecutor
+    from app.services.hybrid_validation_service import (SCH_PATH, XSD_PATH, XSLT_PATH, _merge_shards,
+                                                        _run_hybrid_validation)
+    from app.services.generator import GeneratorService
+    from app.services.schematron import plan_shards
+
+    counts = [1, 2, 3]
+    plans = {count: plan_shards(str(XSLT_PATH), count) if count > 1 else [None] for count in counts}
+    print(f"\n[shards] Validation of one invoice split across pool workers ({os.cpu_count()} CPU): median ms")
+    for count in counts[1:]:
+        print(f"  {count} shards: {' | '.join(' '.join(modes) for modes in plans[count])}")
+    print_row("invoice", *(f"{count} shard{'s' if count > 1 else ''}" for count in counts))
+    with ProcessPoolExecutor(max_workers=max(counts), initializer=_load_schematron) as pool:
+        for lines in (1000, 4000, 10000):
+            xml = GeneratorService.generate_xml_bytes(invoice_metadata(lines))
+
+            def validate(count):
+                futures = [pool.submit(_run_hybrid_validation, xml, str(XSD_PATH) if index == 0 else None,
+                                       str(XSLT_PATH), str(SCH_PATH), modes)
+                           for index, modes in enumerate(plans[count])]
+                return _merge_shards([future.result() for future in futures])
+
+            def slowest_shard(count):
+                return max(timeit(lambda: pool.submit(_run_hybrid_validation, xml,
+                                                      str(XSD_PATH) if index == 0 else None,
+                                                      str(XSLT_PATH), str(SCH_PATH), modes).result(), repeat)[0]
+                           for index, modes in enumerate(plans[count]))
+
+            for count in counts:
+                validate(count)  # Warm-up: stylesheets of the shards
+            medians = [timeit(lambda: validate(count), repeat)[0] for count in counts]
+            print_row(f"{lines:,} lines ({len(xml) / 1e6:.1f} MB)", *(f"{median:.0f}" for median in medians))
+            # The latency with a free core per shard
+            print_row("  slowest shard alone", *(f"{slowest_shard(count):.0f}" for count in counts))
+
+
+def bench_profiles(repeat: int):
+    from app.services.hybrid_validation_service import EN16931_RULESET, _run_hybrid_validation, select_ruleset
+    from tools.schematron_parity import CORPUS_DIR
+
+    def validate(xml, ruleset):
+        return _run_hybrid_validation(xml, str(ruleset.xsd_path), str(ruleset.xslt_path),
+                                      str(ruleset.sch_path) if ruleset.sch_path else None)
+
+    print("\n[profiles] Per-profile rulesets (compiled once per worker): errors / median ms")
+    print_row("invoice", "en16931", "profile", "speedup")
+    for folder, profile in (("1. BASIC WL", "basicwl"), ("4. EXTENDED", "extended")):
+        for path in sorted(CORPUS_DIR.glob(f"ZUGFeRD-2.4-examples/*/{folder}/*/*.xml")):
+            xml = path.read_bytes()
+            results = [validate(xml, ruleset) for ruleset in (EN16931_RULESET, select_ruleset(profile))]
+            (before, _), (after, _) = (timeit(lambda: validate(xml, ruleset), repeat)
+                                       for ruleset in (EN16931_RULESET, select_ruleset(profile)))
+            print_row(path.stem[:38], f"{results[0]['error_count']} / {before:.1f}",
+                      f"{results[1]['error_count']} / {after:.1f}", f"x{before / after:.1f}")
+
+
+def bench_ubl(repeat: int):
+    from app.services.hybrid_validation_service import EN16931_RULESET, UBL_RULESET, _run_hybrid_validation
+    from tools.schematron_parity import CORPUS_DIR
+
+    pairs = [(path.read_bytes(), path.with_name(path.name.replace("_ubl.xml", "_uncefact.xml")).read_bytes())
+             for path in sorted(CORPUS_DIR.glob("xrechnung-*/instances/*/*_ubl.xml"))
+             if path.with_name(path.name.replace("_ubl.xml", "_uncefact.xml")).exists()]
+    runs = (("UBL, Schematron", 0, None, UBL_RULESET),
+            ("CII, Schematron", 1, None, EN16931_RULESET),
+            ("CII, XSD + Schematron", 1, str(EN16931_RULESET.xsd_path), EN16931_RULESET))
+
+    print(f"\n[ubl] XRechnung testsuite, {len(pairs)} UBL/CII pairs (rulesets compiled once per worker)")
+    print_row("syntax", "invalid", "ms/doc", "docs/s")
+    for name, side, xsd_path, ruleset in runs:
+        documents = [pair[side] for pair in pairs]
+
+        def validate_all():
+            return [_run_hybrid_validation(xml, xsd_path, str(ruleset.xslt_path), str(ruleset.sch_path))
+                    for xml in documents]
+
+        invalid = sum(1 for result in validate_all() if not result["is_valid"])
+        total, _ = timeit(validate_all, repeat)
+        print_row(name, str(invalid), f"{total / len(documents):.1f}", f"{len(documents) / total * 1000:.0f}")
+
+
+def bench_cdar(repeat: int):
+    from app.services.hybrid_validation_service import (CDAR_SCH_PATH, CDAR_XSLT_PATH, HybridValidationService,
+                                                        _run_cdar_validation)
+    from app.services.hybrid_validator import saxon_executable, saxon_processor
+
+    status = (PROJECT_ROOT / "examples" / "cdar_status_200.xml").read_bytes()
+    # One in four with an unknown acknowledgement type code (BR-FR-CDV warning)
+    messages = [status.replace(b">305<", b">999<") if index % 4 == 3 else status for index in range(2000)]
+    full = saxon_executable(stylesheet_file=str(CDAR_XSLT_PATH))
+
+    def full_stylesheet():
+        for xml in messages:
+            full.set_save_xsl_message(True, os.devnull)
+            full.clear_xsl_messages()
+            full.transform_to_string(xdm_node=saxon_processor().parse_xml(xml_text=xml.decode("utf-8-sig")))
+            full.get_xsl_messages()
+
+    runs = (("full stylesheet, in a worker", full_stylesheet),
+            ("targeted stylesheet, in a worker",
+             lambda: _run_cdar_validation(messages, str(CDAR_XSLT_PATH), str(CDAR_SCH_PATH))),
+            ("pool, one task per message",
+             lambda: [HybridValidationService.validate_cdar([xml]) for xml in messages[:200]]),
+            ("pool, validate_cdar (chunks)", lambda: HybridValidationService.validate_cdar(messages)))
+
+    print(f"\n[cdar] BR-FR-CDV validation of CDAR status messages ({os.cpu_count()} CPU)")
+    print_row("path", "messages", "us/msg", "msg/s")
+    for name, run in runs:
+        run()  # Warm-up: stylesheets compiled in this process and in the workers
+        count = 200 if "per message" in name else len(messages)
+        total, _ = timeit(run, repeat)
+        print_row(name, str(count), f"{total / count * 1000:.0f}", f"{count / total * 1000:.0f}")
+
+
+def bench_xsd(repeat: int):
+    from facturx import get_flavor, get_level, xml_check_xsd
+    from lxml import etree
+    from app.services.validator import ValidationService
+    from tools.schematron_parity import corpus_files
+
+    documents = []
+    for path in corpus_files():
+        xml = path.read_bytes()
+        tree = etree.fromstring(xml)
+        try:
+            documents.append((xml, tree, get_flavor(tree), get_level(tree)))
+        except Exception:
+            continue
+
+    def check(func):
+        for xml, tree, flavor, level in documents:
+            try:
+                func(xml, tree, flavor, level)
+            except Exception:
+                pass
+
+    print(f"\n[xsd] Lite validation XSD check, {len(documents)} corpus CII invoices: ms/doc")
+    print_row("path", "ms/doc", "docs/s")
+    for name, func in (("xml_check_xsd (compiled per call)", lambda xml, tree, flavor, level: xml_check_xsd(
+                            xml, flavor=flavor, level=level)),
+                       ("ValidationService._check_xsd (cached)", lambda xml, tree, flavor, level:
+                            ValidationService._check_xsd(tree, flavor, level))):
+        check(func)
+        total, _ = timeit(lambda: check(func), repeat)
+        print_row(name, f"{total / len(documents):.2f}", f"{len(documents) / total * 1000:.0f}")
+
+
+def bench_lite(repeat: int):
+    import logging
+    from concurrent.futures import ThreadPoolExecutor
+    from lxml import etree
+    from app.services.validator import ValidationService
+    from tools.schematron_parity import corpus_files
+
+    logging.disable(logging.WARNING)  # The rules log every warning they find
+    ValidationService._initialize_schematrons()
+    shared = etree.XSLT(etree.fromstring(ValidationService._CORE_SOURCE))
+    documents = [etree.fromstring(path.read_bytes()) for path in corpus_files()] * 4
+    expected = [ValidationService._check_schematron(tree, shared) for tree in documents]
+    runs = (("shared XSLT", lambda tree: ValidationService._check_schematron(tree, shared)),
+            ("XSLT per thread",
+             lambda tree: ValidationService._check_schematron(tree, ValidationService._core_validator())))
+
+    print(f"\n[lite] Business rules XSLT, {len(documents)} corpus CII invoices ({os.cpu_count()} CPU): docs/s (wrong reports)")
+    print_row("validator", *(f"{threads} thread{'s' if threads > 1 else ''}" for threads in (1, 8, 32)))
+    for name, check in runs:
+        columns = []
+        for threads in (1, 8, 32):
+            with ThreadPoolExecutor(threads) as pool:
+                list(pool.map(check, documents))  # Warm-up: validators of the threads
+                wrong = sum(errors != want for errors, want in zip(pool.map(check, documents), expected))
+                total, _ = timeit(lambda: list(pool.map(check, documents)), repeat)
+            columns.append(f"{len(documents) / total * 1000:.0f} ({wrong})")
+        print_row(name, *columns)
+    logging.disable(logging.INFO)
+
+
+def bench_engines(repeat: int):
+    from app.services import hybrid_validation_service
+    from app.services.generator import GeneratorService
+    from app.services.hybrid_validation_service import HybridValidationService
+
+    print(f"\n[engines] Sustained validation, one document at a time ({os.cpu_count()} CPU, "
+          f"{hybrid_validation_service.MAX_WORKERS} workers recycled every "
+          f"{hybrid_validation_service.MAX_TASKS_PER_CHILD} tasks): ms/doc")
+    print_row("invoice", "thread", "process", "faster")
+    engine = hybrid_validation_service.VALIDATION_ENGINE
+    crossover = None
+    try:
+        for lines, count in ((1, 300), (10, 200), (100, 60), (1000, 12)):
+            xml = GeneratorService.generate_xml_bytes(invoice_metadata(lines))
+            medians = {}
+            for name in ("thread", "process"):
+                hybrid_validation_service.VALIDATION_ENGINE = name
+                HybridValidationService.submit_xml(xml).result()  # Warm-up: rulesets of the engine
+                total, _ = timeit(lambda: [HybridValidationService.submit_xml(xml).result() for _ in range(count)],
+                                  max(1, repeat // 2))
+                medians[name] = total / count
+            faster = min(medians, key=medians.get)
+            if faster == "process" and crossover is None:
+                crossover = len(xml)
+            print_row(f"{lines:,} lines ({len(xml) / 1024:.0f} KB)", f"{medians['thread']:.1f}",
+                      f"{medians['process']:.1f}", faster)
+    finally:
+        hybrid_validation_service.VALIDATION_ENGINE = engine
+    print(f"  FX_THREAD_ENGINE_MAX_KB={hybrid_validation_service.THREAD_ENGINE_MAX_SIZE // 1024}, "
+          f"process pool faster from: {f'{crossover / 1024:.0f} KB' if crossover else 'never on this machine'}")
+
+
+SCENARIOS: Dict[str, Callable[[int], None]] = {
+    "locator": bench_locator,
+    "inspect": bench_inspect,
+    "convert": bench_convert,
+    "embed": bench_embed,
+    "assets": bench_assets,
+    "xml": bench_xml,
+    "stream": bench_stream,
+    "fragments": bench_fragments,
+    "batch": bench_batch,
+    "json": bench_json,
+    "codes": bench_codes,
+    "totals": bench_totals,
+    "schematron": bench_schematron,
+    "failfast": bench_failfast,
+    "shards": bench_shards,
+    "profiles": bench_profiles,
+    "ubl": bench_ubl,
+    "cdar": bench_cdar,
+    "xsd": bench_xsd,
+    "lite": bench_lite,
+    "engines": bench_engines,
+}
+
+
+def main():
+    import logging
+    logging.disable(logging.INFO)  # facturx logs every extraction at INFO
+
+    parser = argparse.ArgumentParser(description="Factur-X Engine benchmarks")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="Samples per measurement")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    for name in args.scenarios or SCENARIOS:
+        SCENARIOS[name](args.repeat)
+
+
+if __name__ == "__main__":
+    main()
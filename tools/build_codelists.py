@@ -0,0 +1,140 @@
+"""
+Code list build step: compiles the EN 16931 code lists into frozen lookup tables.
+
+Usage:
+    python -m tools.build_codelists [--check]
+
+Output:
+    app/services/codelist_tables.py (regenerate when the Schematron artifacts are updated)
+
+The tables hold the values accepted by the EN 16931 Schematron code list
+rules (BR-CL-*), which are what rejects an invoice: the CII D22B qualified
+data types declare these elements as plain xsd:token, so the D22B code list
+XSDs are not enforced. They are still read, to report where the two
+sources differ.
+
+--check exits with status 1 if the generated module is not up to date.
+"""
+import argparse
+import re
+import sys
+import textwrap
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from lxml import etree
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.services.hybrid_validation_service import DOCS_ROOT, XSLT_PATH  # noqa: E402
+
+D22B_XSD_DIR = DOCS_ROOT / "_CII_D22B_XSD"
+OUTPUT_PATH = PROJECT_ROOT / "app" / "services" / "codelist_tables.py"
+
+XSL_NS = {"xsl": "http://www.w3.org/1999/XSL/Transform"}
+XSD_NS = {"xsd": "http://www.w3.org/2001/XMLSchema"}
+# contains(' A B C ', concat(' ', normalize-space(.), ' '))
+_LIST_RE = re.compile(r"contains\('\s([^']*)\s',\s*concat\(")
+
+# Table name -> (Schematron rules using the list, D22B code list XSDs, description)
+TABLES: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...], str]] = {
+    "CURRENCY_CODES": (("BR-CL-03", "BR-CL-04", "BR-CL-05"), ("ISO_ISO3AlphaCurrencyCode_*",),
+                       "ISO 4217 alpha-3 currency codes"),
+    "COUNTRY_CODES": (("BR-CL-14", "BR-CL-15"), ("ISO_ISOTwo-letterCountryCode_*",),
+                      "ISO 3166-1 alpha-2 country codes"),
+    "PAYMENT_MEANS_CODES": (("BR-CL-16",), ("UNECE_PaymentMeansCode_*",), "UNTDID 4461 payment means codes"),
+    "VAT_CATEGORY_CODES": (("BR-CL-17", "BR-CL-18"), ("UNECE_DutyorTaxorFeeCategoryCode_*",),
+                           "UNTDID 5305 VAT category codes (EN 16931 subset)"),
+    "UNIT_CODES": (("BR-CL-23",), ("UNECE_MeasurementUnitCommonCode*",),
+                   "UN/ECE Recommendation 20 unit codes, with Rec 21 extension"),
+}
+
+
+def schematron_list(xslt: etree._ElementTree, rule_id: str) -> FrozenSet[str]:
+    """Values of the code list tested by a Schematron rule."""
+    attributes = xslt.xpath("//xsl:attribute[@name='id'][normalize-space(.)=$rule_id]", namespaces=XSL_NS, rule_id=rule_id)
+    if not attributes:
+        raise ValueError(f"{rule_id} not found in {XSLT_PATH.name}")
+    choose = attributes[0].xpath("ancestor::xsl:choose[1]", namespaces=XSL_NS)[0]
+    match = _LIST_RE.search(choose.xpath("string(xsl:when/@test)", namespaces=XSL_NS))
+    if match is None:
+        raise ValueError(f"{rule_id} does not test a code list")
+    return frozenset(match.group(1).split())
+
+
+def xsd_enumerations(patterns: Tuple[str, ...]) -> Optional[FrozenSet[str]]:
+    """Enumerated values of the D22B code list XSDs matching the patterns (None if none exist)."""
+    paths = [path for pattern in patterns for path in D22B_XSD_DIR.glob(f"*_codelist_standard_{pattern}.xsd")]
+    paths += [path for pattern in patterns for path in D22B_XSD_DIR.glob(f"*_identifierlist_standard_{pattern}.xsd")]
+    if not paths:
+        return None
+    return frozenset(value for path in paths
+                     for value in etree.parse(str(path)).xpath("//xsd:enumeration/@value", namespaces=XSD_NS))
+
+
+def build_tables() -> Tuple[Dict[str, FrozenSet[str]], List[str]]:
+    """Tables from the Schematron, and notes on how they differ from the D22B XSDs."""
+    xslt = etree.parse(str(XSLT_PATH))
+    tables, notes = {}, []
+    for name, (rule_ids, patterns, _) in TABLES.items():
+        lists = {rule_id: schematron_list(xslt, rule_id) for rule_id in rule_ids}
+        values = lists[rule_ids[0]]
+        if any(codes != values for codes in lists.values()):
+            raise ValueError(f"{name}: rules {', '.join(rule_ids)} use different code lists")
+        tables[name] = values
+
+        xsd_values = xsd_enumerations(patterns)
+        if xsd_values is None:
+            notes.append(f"{name}: no D22B code list XSD")
+            continue
+        only_schematron, only_xsd = sorted(values - xsd_values), sorted(xsd_values - values)
+        if only_schematron or only_xsd:
+            notes.append(f"{name}: {len(only_schematron)} codes only in the Schematron {only_schematron[:10]}, "
+                         f"{len(only_xsd)} only in the D22B XSD {only_xsd[:10]}")
+    return tables, notes
+
+
+def render_module(tables: Dict[str, FrozenSet[str]]) -> str:
+    lines = [
+        '"""',
+        "EN 16931 code lists as frozen lookup tables (see app/services/codelists.py).",
+        "",
+        f"Generated by tools/build_codelists.py from {XSLT_PATH.name}: do not edit.",
+        '"""',
+    ]
+    for name, values in tables.items():
+        rule_ids, _, description = TABLES[name]
+        words = textwrap.wrap(" ".join(sorted(values)), width=100, break_on_hyphens=False)
+        lines += [
+            "",
+            f"# {description} ({', '.join(rule_ids)}): {len(values)} codes",
+            f"{name} = frozenset((",
+            *(f'    "{chunk} "' for chunk in words[:-1]),
+            f'    "{words[-1]}"',
+            ").split())",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="Only check that the generated module is up to date")
+    args = parser.parse_args()
+
+    tables, notes = build_tables()
+    source = render_module(tables)
+    for note in notes:
+        print(f"  {note}")
+    if args.check:
+        if not OUTPUT_PATH.exists() or OUTPUT_PATH.read_text(encoding="utf-8") != source:
+            print(f"{OUTPUT_PATH.relative_to(PROJECT_ROOT)} is out of date: run python -m tools.build_codelists")
+            sys.exit(1)
+        print(f"{OUTPUT_PATH.relative_to(PROJECT_ROOT)} is up to date")
+        return
+    OUTPUT_PATH.write_text(source, encoding="utf-8")
+    print(f"Wrote {OUTPUT_PATH.relative_to(PROJECT_ROOT)} ({', '.join(f'{name}: {len(values)}' for name, values in tables.items())})")
+
+
+if __name__ == "__main__":
+    main()
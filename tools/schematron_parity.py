@@ -0,0 +1,160 @@
+"""
+Parity harness: native Schematron evaluation vs the full EN 16931 XSLT in SaxonC.
+
+Usage:
+    python -m tools.schematron_parity [FILE ...] [--syntax ubl] [--list] [--mutate N]
+
+Runs every CII invoice of the test corpus (or the given files) through both
+engines and compares the failed asserts (rule id, role, message, location)
+in SVRL order. The native side is what HybridValidator runs: XPath 1.0
+asserts on the lxml tree, plus the reduced stylesheet in SaxonC for the
+XPath 2.0 ones. A dynamic error (e.g. XPTY0004 on a duplicated element)
+must stop both engines.
+
+--syntax ubl compares the UBL Invoice/CreditNote documents against the EN 16931
+UBL rules instead.
+--list prints which asserts run in SaxonC, and why.
+--mutate N also compares N random mutations of the corpus invoices (elements
+removed or duplicated, values replaced), which fail far more rules.
+Exits with status 1 if any file differs.
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+from lxml import etree
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.services.hybrid_validation_service import EN16931_RULESET, UBL_RULESET  # noqa: E402
+from app.services.schematron import CompiledSchematron, load_schematron, parse_svrl  # noqa: E402
+from app.services.syntax import SYNTAX_CII, SYNTAX_UBL, detect_syntax  # noqa: E402
+
+CORPUS_DIR = PROJECT_ROOT / "tests" / "corpus"
+RULESETS = {SYNTAX_CII: EN16931_RULESET, SYNTAX_UBL: UBL_RULESET}
+
+Outcome = List[Tuple[str, str, str, str]]
+ENGINE_ERROR: Outcome = [("ENGINE-ERROR", "", "", "")]
+MUTATION_VALUES = ("", " ", "abc", "-1", "0", "1", "false", " true ", "VA", "vat", "S", "E", "20240101", "2024013",
+                   "1.234", "100.00", "EUR", "XX", "C62")
+
+
+def corpus_files(syntax: str = SYNTAX_CII) -> List[Path]:
+    """Invoices of the test corpus in the given syntax (CII by default)."""
+    files = []
+    for path in sorted(CORPUS_DIR.rglob("*.xml")):
+        if "__MACOSX" in path.parts:
+            continue
+        try:
+            if detect_syntax(next(etree.iterparse(str(path), events=("start",)))[1]) == syntax:
+                files.append(path)
+        except (etree.XMLSyntaxError, ValueError):
+            continue
+    return files
+
+
+class Parity:
+    """Both engines, compiled once."""
+
+    def __init__(self, syntax: str = SYNTAX_CII):
+        from saxonche import PySaxonProcessor
+
+        ruleset = RULESETS[syntax]
+        self.rules: CompiledSchematron = load_schematron(str(ruleset.sch_path), str(ruleset.xslt_path))
+        self.proc = PySaxonProcessor(license=False)
+        xsltproc = self.proc.new_xslt30_processor()
+        self.full = xsltproc.compile_stylesheet(stylesheet_file=str(ruleset.xslt_path))
+        self.reduced = (xsltproc.compile_stylesheet(stylesheet_text=self.rules.saxon_stylesheet)
+                        if self.rules.saxon_stylesheet is not None else None)
+
+    def _svrl(self, executable, xml: bytes):
+        node = self.proc.parse_xml(xml_text=xml.decode("utf-8-sig"))
+        return parse_svrl(executable.transform_to_string(xdm_node=node).encode("utf-8"))
+
+    def compare(self, xml: bytes) -> Tuple[Outcome, Outcome]:
+        """(full XSLT, native + reduced XSLT) failed asserts."""
+        try:
+            expected = [tuple(f[:4]) for f in self._svrl(self.full, xml)]
+        except Exception:
+            expected = ENGINE_ERROR
+        root = etree.fromstring(xml, etree.XMLParser(resolve_entities=False, no_network=True))
+        try:
+            failures = self.rules.evaluate(root)
+            if self.reduced is not None:
+                failures += self._svrl(self.reduced, xml)
+            actual = [tuple(f[:4]) for f in self.rules.sort(root, failures)]
+        except Exception:
+            actual = ENGINE_ERROR
+        return expected, actual
+
+
+def mutations(files: List[Path], count: int, seed: int = 0) -> Iterator[Tuple[str, bytes]]:
+    """Random mutations of the given invoices: (name, XML)."""
+    rng = random.Random(seed)
+    for index in range(count):
+        path = rng.choice(files)
+        root = etree.fromstring(path.read_bytes())
+        elements = list(root.iter(etree.Element))
+        for _ in range(rng.randint(1, 6)):
+            element, parent, action = rng.choice(elements), None, rng.random()
+            parent = element.getparent()
+            if action < 0.3 and parent is not None and parent.getparent() is not None:
+                parent.remove(element)
+            elif action < 0.5 and parent is not None:
+                element.addnext(etree.fromstring(etree.tostring(element)))
+            elif action < 0.6 and element.attrib:
+                element.set(rng.choice(list(element.attrib)), rng.choice(MUTATION_VALUES))
+            elif len(element) == 0:
+                element.text = rng.choice(MUTATION_VALUES)
+        yield f"{path.name} (mutation {index})", etree.tostring(root, xml_declaration=True, encoding="UTF-8")
+
+
+def differences(expected: Outcome, actual: Outcome) -> Iterator[str]:
+    for failure in expected:
+        if failure not in actual:
+            yield f"    only in SaxonC: {failure[0]} at {failure[3]}"
+    for failure in actual:
+        if failure not in expected:
+            yield f"    only native:    {failure[0]} at {failure[3]}"
+    if sorted(expected) == sorted(actual) and expected != actual:
+        yield "    same failures, different order"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", type=Path, help="XML files (default: the invoices of tests/corpus)")
+    parser.add_argument("--syntax", choices=("cii", "ubl"), default="cii", help="Rules to compare (default: cii)")
+    parser.add_argument("--list", action="store_true", help="List the asserts left to SaxonC")
+    parser.add_argument("--mutate", type=int, default=0, metavar="N", help="Also compare N random mutations")
+    args = parser.parse_args()
+
+    syntax = SYNTAX_UBL if args.syntax == "ubl" else SYNTAX_CII
+    parity = Parity(syntax)
+    asserts = parity.rules.asserts
+    saxon = [a for a in asserts if a.xpath is None]
+    print(f"{len(asserts) - len(saxon)} of {len(asserts)} asserts native, {len(saxon)} in SaxonC")
+    if args.list:
+        for a in saxon:
+            print(f"  {a.id:<12} {a.reason}")
+
+    files = args.files or corpus_files(syntax)
+    documents = [(str(path.relative_to(PROJECT_ROOT) if path.is_absolute() else path), path.read_bytes())
+                 for path in files]
+    documents += list(mutations(files, args.mutate))
+    failed = 0
+    for name, xml in documents:
+        expected, actual = parity.compare(xml)
+        if expected != actual:
+            failed += 1
+            print(f"  DIFF {name}")
+            for line in differences(expected, actual):
+                print(line)
+    print(f"{len(documents) - failed} of {len(documents)} documents identical")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()